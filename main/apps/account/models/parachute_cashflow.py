@@ -1,6 +1,6 @@
 import logging
 from abc import abstractmethod
-from typing import Optional, Sequence
+from typing import Iterable, Optional, Sequence
 
 import numpy as np
 from auditlog.registry import auditlog
@@ -137,6 +137,23 @@ class ParachuteCashFlow(TimeStampedModel):
                                                 initial_npv=initial_npv,
                                                 initial_spot=initial_spot)
 
+    @staticmethod
+    def get_accounts_cashflows(ref_date: Date,
+                               accounts: Iterable[Account],
+                               include_rolled_off: bool = False,
+                               allow_deactivated: bool = False,
+                               start_pay_date: Optional[Date] = None,
+                               end_pay_date: Optional[Date] = None) -> Sequence['ParachuteCashFlow']:
+        """
+        Get all cashflows for several accounts, in one query. See get_account_cashflows.
+        """
+        return ParachuteCashFlow._cashflows(ref_date=ref_date,
+                                            q_statement=Q(account__in=accounts),
+                                            include_rolled_off=include_rolled_off,
+                                            allow_deactivated=allow_deactivated,
+                                            start_pay_date=start_pay_date,
+                                            end_pay_date=end_pay_date)
+
     @staticmethod
     def get_account_cashflows(ref_date: Date,
                               account: Account,
@@ -148,7 +165,21 @@ class ParachuteCashFlow(TimeStampedModel):
         Get all cashflows for an account.
         TODO: Unit test.
         """
-        q_statement = Q(generation_time__lte=ref_date) & Q(account=account)
+        return ParachuteCashFlow._cashflows(ref_date=ref_date,
+                                            q_statement=Q(account=account),
+                                            include_rolled_off=include_rolled_off,
+                                            allow_deactivated=allow_deactivated,
+                                            start_pay_date=start_pay_date,
+                                            end_pay_date=end_pay_date)
+
+    @staticmethod
+    def _cashflows(ref_date: Date,
+                   q_statement: Q,
+                   include_rolled_off: bool,
+                   allow_deactivated: bool,
+                   start_pay_date: Optional[Date],
+                   end_pay_date: Optional[Date]) -> Sequence['ParachuteCashFlow']:
+        q_statement &= Q(generation_time__lte=ref_date)
 
         if include_rolled_off:
             # Only filter out things that were deactivated *not* by rolloff as of the ref_date.
@@ -1,4 +1,4 @@
-from typing import Union, Optional
+from typing import Dict, Iterable, Union, Optional
 
 from auditlog.registry import auditlog
 from django.db import models
@@ -48,6 +48,15 @@ class ParachuteData(models.Model):
             return None
         return q.first()
 
+    @staticmethod
+    def get_for_accounts(accounts: Iterable[Account]) -> Dict[int, 'ParachuteData']:
+        """ Get the parachute data of several accounts, by account id. """
+        data = {}
+        for obj in ParachuteData.objects.filter(account__in=accounts).order_by('-pk'):
+            # Match get_for_account, which takes the first one.
+            data[obj.account_id] = obj
+        return data
+
     @staticmethod
     def create_for_account(account: Account,
                            lower_limit: float,
@@ -6,6 +6,7 @@ from auditlog.models import LogEntry
 
 from main.apps.account.models import get_hdl_cashflows, CashFlow, iter_active_cashflows
 from main.apps.account.services.cashflow_provider import CashFlowProviderService
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models.fxpair import FxPair
 from main.apps.marketdata.services.data_cut_service import DataCutService
 from main.apps.marketdata.services.universe_provider import UniverseProvider, UniverseProviderService
@@ -37,11 +38,11 @@ class CashFlowPricerService(object):
     """
 
     def __init__(self,
-                 cashflow_provider: CashFlowProviderService = CashFlowProviderService(),
-                 universe_provider_service: UniverseProviderService = UniverseProviderService()):
-        self._cashflow_provider = cashflow_provider
-        self._universe_provider_service = universe_provider_service
-        self._fx_spot_provider = universe_provider_service.fx_spot_provider
+                 cashflow_provider: Optional[CashFlowProviderService] = None,
+                 universe_provider_service: Optional[UniverseProviderService] = None):
+        self._cashflow_provider = service_or_default(cashflow_provider, CashFlowProviderService)
+        self._universe_provider_service = service_or_default(universe_provider_service, UniverseProviderService)
+        self._fx_spot_provider = self._universe_provider_service.fx_spot_provider
 
     def get_changed_cashflows_as_of(self,
                                     time: Date,
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from main.apps.broker.models import Broker, BrokerCompany, BrokerCompanyInstrument, BrokerInstrument
+from main.apps.core.utils.cache import bump_cache_version, get_cache_versions
+
+logger = logging.getLogger(__name__)
+
+
+class BrokerCatalog:
+    """
+    The brokers and broker instruments, which are the same for every company. Loaded once per global version and
+    shared by the permission matrices of all companies.
+    """
+
+    def __init__(self, version: str):
+        self.version = version
+
+        self.brokers: Dict[str, List[Broker]] = defaultdict(list)
+        for broker in Broker.objects.all():
+            self.brokers[broker.broker_provider].append(broker)
+
+        # (broker id, instrument name) -> [(instrument type, broker instrument), ...]
+        self.broker_instruments: Dict[Tuple[int, str], List[Tuple[str, BrokerInstrument]]] = defaultdict(list)
+        for broker_instrument in BrokerInstrument.objects.select_related('instrument'):
+            instrument = broker_instrument.instrument
+            self.broker_instruments[(broker_instrument.broker_id, instrument.name)].append(
+                (instrument.instrument_type, broker_instrument))
+
+
+class BrokerPermissionMatrix:
+    """
+    In-memory broker x instrument x permission matrix of one company, i.e. everything the ticket validation needs
+    from Broker, BrokerCompany, BrokerInstrument and BrokerCompanyInstrument. Only the company rows are loaded here,
+    brokers and broker instruments come from the shared BrokerCatalog.
+
+    Lookups mirror the .get() calls they replace: they return None unless there is exactly one match.
+    """
+
+    def __init__(self, company_id: int, version: Tuple[str, str], catalog: BrokerCatalog):
+        self.company_id = company_id
+        self.version = version
+        self._catalog = catalog
+
+        self._broker_companies: Dict[str, int] = defaultdict(int)
+        for broker_key in BrokerCompany.objects.filter(company_id=company_id).values_list('broker', flat=True):
+            self._broker_companies[broker_key] += 1
+
+        self._permissions: Dict[int, List[BrokerCompanyInstrument]] = defaultdict(list)
+        for permission in BrokerCompanyInstrument.objects.filter(company_id=company_id):
+            self._permissions[permission.broker_instrument_id].append(permission)
+
+    def get_broker(self, broker_key: str) -> Optional[Broker]:
+        brokers = self._catalog.brokers.get(broker_key, [])
+        return brokers[0] if len(brokers) == 1 else None
+
+    def is_broker_configured(self, broker_key: str) -> bool:
+        return self._broker_companies.get(broker_key, 0) == 1
+
+    def get_broker_instrument(self, broker: Broker, instrument_name: str,
+                              instrument_type: Optional[str] = None) -> Optional[BrokerInstrument]:
+        matches = [bi for itype, bi in self._catalog.broker_instruments.get((broker.pk, instrument_name), [])
+                   if instrument_type is None or itype == instrument_type]
+        return matches[0] if len(matches) == 1 else None
+
+    def get_permission(self, broker_instrument: BrokerInstrument) -> Optional[BrokerCompanyInstrument]:
+        permissions = self._permissions.get(broker_instrument.pk, [])
+        return permissions[0] if len(permissions) == 1 else None
+
+
+class BrokerPermissionMatrixCache:
+    """
+    Process level cache of BrokerPermissionMatrix, built lazily per company.
+
+    Matrices are versioned: a global version (brokers and broker instruments) and a company version (broker
+    companies and company permissions), kept in the django cache so that all processes see them. The broker signal
+    handlers bump the versions when the underlying models change. Versions are re-read at most every
+    version_check_interval seconds, so a bulk validation does not hit the cache once per ticket.
+    """
+    key_prefix = "broker_permission_matrix"
+    version_check_interval = 5.
+
+    _catalog: Optional[BrokerCatalog] = None
+    _matrices: Dict[int, BrokerPermissionMatrix] = {}
+    _checked_at: Dict[int, float] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, company_id: int) -> BrokerPermissionMatrix:
+        matrix = cls._matrices.get(company_id)
+        now = time.monotonic()
+        if matrix is not None and now - cls._checked_at.get(company_id, 0.) < cls.version_check_interval:
+            return matrix
+
+        version = get_cache_versions("broker permission matrix", cls._global_version_key(),
+                                     cls._company_version_key(company_id))
+        if matrix is None or matrix.version != version:
+            logger.debug(f"Loading broker permission matrix of company {company_id}")
+            matrix = BrokerPermissionMatrix(company_id=company_id, version=version,
+                                            catalog=cls._get_catalog(version[0]))
+            with cls._lock:
+                cls._matrices[company_id] = matrix
+        cls._checked_at[company_id] = now
+        return matrix
+
+    @classmethod
+    def invalidate_company(cls, company_id: int):
+        bump_cache_version("broker permission matrix", cls._company_version_key(company_id))
+        with cls._lock:
+            cls._matrices.pop(company_id, None)
+
+    @classmethod
+    def invalidate_all(cls):
+        bump_cache_version("broker permission matrix", cls._global_version_key())
+        with cls._lock:
+            cls._catalog = None
+            cls._matrices.clear()
+
+    @classmethod
+    def clear(cls):
+        """ Drop the matrices of this process """
+        with cls._lock:
+            cls._catalog = None
+            cls._matrices.clear()
+            cls._checked_at.clear()
+
+    # ================
+    # Private
+    # ================
+
+    @classmethod
+    def _get_catalog(cls, version: str) -> BrokerCatalog:
+        catalog = cls._catalog
+        if catalog is None or catalog.version != version:
+            logger.debug("Loading brokers and broker instruments")
+            catalog = BrokerCatalog(version=version)
+            with cls._lock:
+                cls._catalog = catalog
+        return catalog
+
+    @classmethod
+    def _global_version_key(cls) -> str:
+        return f"{cls.key_prefix}:version"
+
+    @classmethod
+    def _company_version_key(cls, company_id: int) -> str:
+        return f"{cls.key_prefix}:version:{company_id}"
@@ -1,2 +1,20 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+
+from main.apps.broker.models import Broker, BrokerCompany, BrokerCompanyInstrument, BrokerInstrument
+from main.apps.broker.services.permission_matrix import BrokerPermissionMatrixCache
+from main.apps.marketdata.models import Instrument
+
+
+@receiver([post_save, post_delete], sender=Broker, dispatch_uid='broker_permission_matrix_broker')
+@receiver([post_save, post_delete], sender=BrokerInstrument, dispatch_uid='broker_permission_matrix_broker_instrument')
+@receiver([post_save, post_delete], sender=Instrument, dispatch_uid='broker_permission_matrix_instrument')
+def invalidate_permission_matrices(sender, instance, **kwargs):
+    BrokerPermissionMatrixCache.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=BrokerCompany, dispatch_uid='broker_permission_matrix_broker_company')
+@receiver([post_save, post_delete], sender=BrokerCompanyInstrument,
+          dispatch_uid='broker_permission_matrix_company_instrument')
+def invalidate_company_permission_matrix(sender, instance, **kwargs):
+    BrokerPermissionMatrixCache.invalidate_company(instance.company_id)
@@ -0,0 +1,63 @@
+from django.test import TestCase
+
+from main.apps.account.models.company import Company
+from main.apps.broker.models import Broker, BrokerCompany, BrokerCompanyInstrument, BrokerInstrument
+from main.apps.broker.models.constants import BrokerProviderOption
+from main.apps.broker.services.permission_matrix import BrokerPermissionMatrixCache
+from main.apps.currency.models.currency import Currency
+from main.apps.marketdata.models.ref.instrument import Instrument, InstrumentTypes
+
+
+class TestBrokerPermissionMatrix(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        BrokerPermissionMatrixCache.clear()
+
+        self.broker = Broker.objects.create(name="Monex", broker_provider=BrokerProviderOption.MONEX)
+        usd = Currency.objects.create(mnemonic='USD', name="US Dollar")
+        self.company = Company.objects.create(name="Test Company", currency=usd)
+        BrokerCompany.objects.create(broker=BrokerProviderOption.MONEX, company=self.company, enabled=True)
+
+        instrument = Instrument.objects.create(name='USDEUR-SPOT', instrument_type=InstrumentTypes.SPOT)
+        self.broker_instrument = BrokerInstrument.objects.create(broker=self.broker, instrument=instrument,
+                                                                 buy=True, sell=True)
+
+    def tearDown(self) -> None:
+        BrokerPermissionMatrixCache.clear()
+        super().tearDown()
+
+    def test_lookups(self):
+        matrix = BrokerPermissionMatrixCache.get(self.company.pk)
+
+        self.assertEqual(matrix.get_broker(BrokerProviderOption.MONEX), self.broker)
+        self.assertIsNone(matrix.get_broker(BrokerProviderOption.CORPAY))
+        self.assertTrue(matrix.is_broker_configured(BrokerProviderOption.MONEX))
+        self.assertFalse(matrix.is_broker_configured(BrokerProviderOption.CORPAY))
+        self.assertEqual(matrix.get_broker_instrument(self.broker, 'USDEUR-SPOT'), self.broker_instrument)
+        self.assertIsNone(matrix.get_broker_instrument(self.broker, 'USDEUR-SPOT',
+                                                       instrument_type=InstrumentTypes.NDF))
+        self.assertIsNone(matrix.get_permission(self.broker_instrument))
+
+        # served from memory until something changes
+        self.assertIs(BrokerPermissionMatrixCache.get(self.company.pk), matrix)
+
+    def test_brokers_are_loaded_once_for_all_companies(self):
+        BrokerPermissionMatrixCache.get(self.company.pk)
+        other_company = Company.objects.create(name="Other Company", currency=self.company.currency)
+
+        # only the broker companies and permissions of the other company
+        with self.assertNumQueries(2):
+            matrix = BrokerPermissionMatrixCache.get(other_company.pk)
+        self.assertEqual(matrix.get_broker(BrokerProviderOption.MONEX), self.broker)
+        self.assertFalse(matrix.is_broker_configured(BrokerProviderOption.MONEX))
+
+    def test_invalidated_on_permission_change(self):
+        matrix = BrokerPermissionMatrixCache.get(self.company.pk)
+        self.assertIsNone(matrix.get_permission(self.broker_instrument))
+
+        permission = BrokerCompanyInstrument.objects.create(company=self.company,
+                                                            broker_instrument=self.broker_instrument)
+
+        matrix = BrokerPermissionMatrixCache.get(self.company.pk)
+        self.assertEqual(matrix.get_permission(self.broker_instrument), permission)
@@ -1,50 +1,249 @@
-import redis
-from croniter import croniter
+import math
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
 import pytz
-from django.core.cache.backends.base import BaseCache
+import redis
+from croniter import croniter
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisSerializer
+
+
+@lru_cache(maxsize=1024)
+def _next_cron_time(cron_expression: str, timezone_name: str, minute: int) -> float:
+    """
+    Epoch of the next firing of a cron expression after the given minute (epoch // 60). Cron expressions have a one
+    minute resolution, so every set within the same minute shares one croniter evaluation.
+    """
+    start = datetime.fromtimestamp(minute * 60, pytz.timezone(timezone_name))
+    return croniter(cron_expression, start).get_next(float)
+
+
+class LocalTier:
+    """ Bounded, least recently used, in-process copy of cache entries, each with its own expiry """
+
+    def __init__(self, max_entries: int, max_age: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, expires_at: Optional[float], now: float):
+        if self.max_age is not None:
+            expires_at = now + self.max_age if expires_at is None else min(expires_at, now + self.max_age)
+        if expires_at is None:
+            expires_at = math.inf
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 
 class RedisCronCache(BaseCache):
     """
     This is a django-cache replacement that uses
     redis but also supports cron-syntax for setting
     expiry schedules.
+
+    A timeout can be a number of seconds, None (never expires) or a cron expression, e.g. cache.set(key, value,
+    timeout="0 17 * * 1-5"), in which case the entry expires at the next firing of the expression (in TIMEZONE, or in
+    the timezone passed to set). Keys are versioned and prefixed like any django cache, values are serialized like
+    django's RedisCache (ints as is, so that incr works, everything else pickled).
+
+    With L1_MAX_ENTRIES, the most recently used entries are also kept in process and expire with their redis entry
+    (or after L1_TIMEOUT seconds, if sooner), so hot lookups do not go to redis. Writes from other processes are not
+    seen until then: the L1 tier is meant for values that only change on their cron schedule.
     """
+
     def __init__(self, params):
         super().__init__(params)
         self.redis_url = params.get('REDIS_URL')
         self.redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(self.redis_url))
         self.default_ttl = params.get('DEFAULT_TIMEOUT', 300)  # default TTL in seconds
+        self.default_timeout = self.default_ttl
         self.default_timezone = pytz.timezone(params.get('TIMEZONE', 'UTC'))
+        self.serializer = RedisSerializer()
 
-    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
-        self.set(key, value, timeout, version)
+        l1_max_entries = params.get('L1_MAX_ENTRIES', 0)
+        self.l1 = LocalTier(max_entries=l1_max_entries, max_age=params.get('L1_TIMEOUT')) \
+            if l1_max_entries else None
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, timezone=None):
+        key = self.make_and_validate_key(key, version=version)
+        ttl = self._get_ttl(timeout, timezone)
+        if ttl is not None and ttl <= 0:
+            return False
+        data = self.serializer.dumps(value)
+        added = bool(self.redis_client.set(key, data, ex=ttl, nx=True))
+        if added:
+            self._set_local(key, data, ttl)
+        return added
 
-    # TODO: error handling
-    
     def get(self, key, default=None, version=None):
-        value = self.redis_client.get(key)
-        if value is None:
-            return default
-        return value
+        key = self.make_and_validate_key(key, version=version)
+        return self._get_many([key]).get(key, default)
 
-    def set(self, key, value, timeout=DEFAULT_TIMEOUT, timezone=None, version=None):
-        if isinstance(timeout, str):
-            timeout = self._calculate_ttl_from_cron(timeout, timezone or self.default_timezone)
-        if timeout is None:
-            timeout = self.default_ttl
-        self.redis_client.setex(key, timeout, value)
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, timezone=None):
+        key = self.make_and_validate_key(key, version=version)
+        ttl = self._get_ttl(timeout, timezone)
+        if ttl is not None and ttl <= 0:
+            self._delete([key])
+            return
+        data = self.serializer.dumps(value)
+        self.redis_client.set(key, data, ex=ttl)
+        self._set_local(key, data, ttl)
 
     def delete(self, key, version=None):
-        self.redis_client.delete(key)
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._delete([key]))
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self.l1 and self.l1.get(key, time.time()) is not None:
+            return True
+        return bool(self.redis_client.exists(key))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if not self.redis_client.exists(key):
+            raise ValueError("Key '%s' not found." % key)
+        if self.l1:
+            self.l1.delete(key)
+        return self.redis_client.incr(key, delta)
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        return {key_map[key]: value for key, value in self._get_many(list(key_map)).items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, timezone=None):
+        if not data:
+            return []
+        ttl = self._get_ttl(timeout, timezone)
+        if ttl is not None and ttl <= 0:
+            self.delete_many(data.keys(), version=version)
+            return []
+
+        serialized = {self.make_and_validate_key(key, version=version): self.serializer.dumps(value)
+                      for key, value in data.items()}
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key, value in serialized.items():
+            pipeline.set(key, value, ex=ttl)
+        pipeline.execute()
+        for key, value in serialized.items():
+            self._set_local(key, value, ttl)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            self._delete(keys)
 
     def clear(self):
         ... # do not allow this
 
-    def _calculate_ttl_from_cron(self, cron_expression, timezone):
-        now = datetime.now(timezone)
-        cron = croniter(cron_expression, now)
-        next_time = cron.get_next(datetime)
-        ttl = (next_time - now).total_seconds()
-        return int(ttl)
+    def clear_local(self):
+        """ Drop the L1 entries of this process """
+        if self.l1:
+            self.l1.clear()
 
+    # ================
+    # Private
+    # ================
+
+    def _get_many(self, keys: List[str]) -> Dict[str, object]:
+        now = time.time()
+        found, missing = {}, []
+        for key in keys:
+            data = self.l1.get(key, now) if self.l1 else None
+            if data is None:
+                missing.append(key)
+            else:
+                found[key] = self._loads(data)
+        if not missing:
+            return found
+
+        if self.l1:
+            # fetch the remaining ttl along with the values, in one round trip. MULTI/EXEC so a key can't expire
+            # between its GET and its PTTL
+            pipeline = self.redis_client.pipeline(transaction=True)
+            for key in missing:
+                pipeline.get(key)
+                pipeline.pttl(key)
+            replies = pipeline.execute()
+            for key, data, pttl in zip(missing, replies[0::2], replies[1::2]):
+                if data is None:
+                    continue
+                found[key] = self._loads(data)
+                if pttl == -2:
+                    # gone already, don't keep a copy
+                    continue
+                # -1: no expiry
+                self.l1.set(key, data, expires_at=now + pttl / 1000. if pttl >= 0 else None, now=now)
+        else:
+            values = self.redis_client.mget(missing) if len(missing) > 1 else [self.redis_client.get(missing[0])]
+            for key, data in zip(missing, values):
+                if data is not None:
+                    found[key] = self._loads(data)
+        return found
+
+    def _delete(self, keys: List[str]) -> int:
+        if self.l1:
+            for key in keys:
+                self.l1.delete(key)
+        return self.redis_client.delete(*keys)
+
+    def _loads(self, data: bytes):
+        try:
+            return self.serializer.loads(data)
+        except Exception:
+            # written before values were serialized
+            return data
+
+    def _set_local(self, key: str, data: bytes, ttl: Optional[int]):
+        if self.l1:
+            now = time.time()
+            self.l1.set(key, data, expires_at=None if ttl is None else now + ttl, now=now)
+
+    def _get_ttl(self, timeout, timezone=None) -> Optional[int]:
+        """ Seconds until expiry, None to never expire """
+        if isinstance(timeout, str):
+            return self._calculate_ttl_from_cron(timeout, timezone or self.default_timezone)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        return int(timeout)
+
+    def _calculate_ttl_from_cron(self, cron_expression, timezone):
+        now = time.time()
+        if len(cron_expression.split()) > 5:
+            # with a seconds field the next firing can't be shared within the minute
+            next_time = croniter(cron_expression, datetime.fromtimestamp(now, timezone)).get_next(float)
+        else:
+            next_time = _next_cron_time(cron_expression, str(timezone), int(now // 60))
+        return max(1, math.ceil(next_time - now))
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from main.apps.cache_backends.redis_cron_cache import RedisCronCache, _next_cron_time
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class RedisCronCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        if fakeredis is None:
+            self.skipTest("fakeredis is required, see requirements/tests.txt")
+        self.cache = self._cache()
+
+    def _cache(self, **params):
+        cache = RedisCronCache({'REDIS_URL': 'redis://localhost:6379/0', 'KEY_PREFIX': 'test', **params})
+        cache.redis_client = fakeredis.FakeRedis()
+        return cache
+
+    def test_values_are_serialized_and_keys_versioned(self):
+        self.cache.set('a', {'x': 1})
+        self.cache.set('a', 'other version', version=2)
+        self.cache.set('n', 1)
+
+        self.assertEqual({'x': 1}, self.cache.get('a'))
+        self.assertEqual('other version', self.cache.get('a', version=2))
+        self.assertEqual(3, self.cache.incr('n', 2))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_many(self):
+        self.cache.set_many({'a': 1, 'b': [2]}, timeout=60)
+        self.assertEqual({'a': 1, 'b': [2]}, self.cache.get_many(['a', 'b', 'c']))
+
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual({}, self.cache.get_many(['a', 'b']))
+
+    def test_timeouts(self):
+        self.cache.set('forever', 1, timeout=None)
+        self.cache.set('cron', 1, timeout='0 17 * * *')
+        redis_client = self.cache.redis_client
+
+        self.assertEqual(-1, redis_client.ttl(self.cache.make_key('forever')))
+        self.assertTrue(0 < redis_client.ttl(self.cache.make_key('cron')) <= 24 * 3600)
+        self.assertTrue(self.cache.add('new', 1, timeout='*/5 * * * *'))
+        self.assertFalse(self.cache.add('new', 2))
+
+    def test_cron_is_evaluated_once_per_minute(self):
+        _next_cron_time.cache_clear()
+        with mock.patch('time.time', return_value=1_700_000_000.):
+            self.cache.set('a', 1, timeout='0 * * * *')
+        with mock.patch('time.time', return_value=1_700_000_030.):
+            self.cache.set('b', 1, timeout='0 * * * *')
+        self.assertEqual(1, _next_cron_time.cache_info().misses)
+
+    def test_local_tier(self):
+        cache = self._cache(L1_MAX_ENTRIES=2)
+        cache.set('a', 1, timeout='0 17 * * *')
+        with mock.patch.object(cache.redis_client, 'get', side_effect=AssertionError), \
+                mock.patch.object(cache.redis_client, 'pipeline', side_effect=AssertionError):
+            self.assertEqual(1, cache.get('a'))
+
+        # entries written elsewhere are read through, with their remaining ttl
+        self.cache.redis_client = cache.redis_client
+        self.cache.set('b', 2, timeout=60)
+        self.cache.set('c', 3, timeout=60)
+        self.assertEqual({'b': 2, 'c': 3}, cache.get_many(['b', 'c']))
+        # bounded: 'a' was the least recently used
+        self.assertIsNone(cache.l1.get(cache.make_key('a'), 0))
+
+        cache.delete('b')
+        self.assertIsNone(cache.get('b'))
+
+    def test_local_tier_ttl_replies(self):
+        cache = self._cache(L1_MAX_ENTRIES=10)
+        gone, forever = cache.make_key('gone'), cache.make_key('forever')
+        data = cache.serializer.dumps(1)
+        with mock.patch.object(cache.redis_client, 'pipeline') as pipeline:
+            pipeline.return_value.execute.return_value = [data, -2, data, -1]
+            self.assertEqual({'gone': 1, 'forever': 1}, cache.get_many(['gone', 'forever']))
+
+        # GET and PTTL in one MULTI, a key already gone (-2) isn't kept, -1 never expires
+        pipeline.assert_called_once_with(transaction=True)
+        self.assertIsNone(cache.l1.get(gone, 0))
+        self.assertEqual(data, cache.l1.get(forever, 1e12))
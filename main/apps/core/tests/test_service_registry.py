@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from main.apps.core.utils.service_registry import get_service, register_service, reset_services, service_or_default
+
+
+class _CountingService(object):
+    instances = 0
+
+    def __init__(self):
+        _CountingService.instances += 1
+
+
+class ServiceRegistryTestCase(TestCase):
+
+    def setUp(self):
+        reset_services()
+        _CountingService.instances = 0
+
+    def tearDown(self):
+        reset_services()
+
+    def test_service_is_constructed_once_on_first_use(self):
+        self.assertEqual(_CountingService.instances, 0)
+        first = get_service(_CountingService)
+        second = get_service(_CountingService)
+        self.assertIs(first, second)
+        self.assertEqual(_CountingService.instances, 1)
+
+    def test_service_or_default(self):
+        supplied = _CountingService()
+        self.assertIs(service_or_default(supplied, _CountingService), supplied)
+        self.assertIs(service_or_default(None, _CountingService), get_service(_CountingService))
+
+    def test_register_service(self):
+        override = _CountingService()
+        register_service(_CountingService, override)
+        self.assertIs(get_service(_CountingService), override)
@@ -1,5 +1,7 @@
 import logging
+import time
 from functools import wraps
+from typing import Tuple
 
 from django.core.cache import cache
 
@@ -58,3 +60,32 @@ def redis_func_cache(key: str = None, timeout: int = None, delete: bool = False)
         return wrapper
 
     return decorator
+
+
+def get_cache_versions(name: str, *keys: str) -> Tuple[str, ...]:
+    """
+    Read the versions of a process level cache, kept in the django cache so that all processes see them. Missing
+    versions read as "0". If the cache can't be read, the first version is a fresh value, so that whatever was built
+    from it is reloaded on the next check rather than trusted indefinitely.
+
+    :param name: Name of the cached data, for logging
+    :param keys: The version keys
+    :return: The versions, in the order of the keys
+    """
+    try:
+        versions = cache.get_many(keys)
+    except Exception as e:
+        logger.warning(f"Unable to read {name} version: {e}")
+        versions = {keys[0]: time.monotonic()}
+    return tuple(str(versions.get(key, 0)) for key in keys)
+
+
+def bump_cache_version(name: str, key: str):
+    """ Bump a version read by get_cache_versions, e.g. from the signal handlers of the underlying models """
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+    except Exception as e:
+        logger.warning(f"Unable to bump {name} version {key}: {e}")
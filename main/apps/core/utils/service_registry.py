@@ -0,0 +1,55 @@
+import logging
+import threading
+from typing import Callable, Dict, Optional, Type, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_lock = threading.RLock()
+_services: Dict[type, object] = {}
+
+
+def get_service(cls: Type[T], factory: Optional[Callable[[], T]] = None) -> T:
+    """
+    Get the process wide instance of a service, constructing it on first use.
+
+    Services used to be constructed as default arguments, which meant that every process paid for the whole
+    construction chain at import time. Use this instead, so services are only built when (and if) they are needed,
+    and are then shared by everything in the process.
+
+    :param cls: The service class, also used as the registry key
+    :param factory: Optional callable used to construct the service, defaults to cls()
+    :return: The shared instance of the service
+    """
+    service = _services.get(cls, None)
+    if service is not None:
+        return service
+
+    with _lock:
+        service = _services.get(cls, None)
+        if service is None:
+            logger.debug(f"Constructing shared service {cls.__name__}")
+            service = factory() if factory is not None else cls()
+            _services[cls] = service
+    return service
+
+
+def service_or_default(service: Optional[T], cls: Type[T]) -> T:
+    """
+    Return the supplied service if there is one, else the shared instance of cls. Meant for constructors whose
+    service arguments default to None.
+    """
+    return service if service is not None else get_service(cls)
+
+
+def register_service(cls: Type[T], service: T):
+    """ Override the shared instance of a service (e.g. in tests or backtests) """
+    with _lock:
+        _services[cls] = service
+
+
+def reset_services():
+    """ Drop all shared services, they will be constructed again on next use """
+    with _lock:
+        _services.clear()
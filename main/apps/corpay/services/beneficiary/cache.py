@@ -1,5 +1,6 @@
 import logging
 from abc import ABC
+from datetime import datetime, timezone
 
 from main.apps.account.models import Company
 from main.apps.corpay.models import CorpaySettings, Beneficiary
@@ -11,6 +12,9 @@ logger = logging.getLogger(__name__)
 
 
 class CorPayBeneficiaryCacheService(ABC):
+    page_size = 100
+    cached_fields = ['delivery_method', 'corpay_id', 'client_code', 'currency']
+
     def __init__(self):
         self.corpay_service = CorPayService()
         self.currencies = {c.mnemonic: c for c in Currency.get_currencies()}
@@ -30,36 +34,65 @@ class CorPayBeneficiaryCacheService(ABC):
 
     def handle_single(self, company: Company):
         self.corpay_service.init_company(company)
-        logger.debug(f"Getting FXBalance accounts for company - {company.name} - ID: {company.pk}")
-        params = BeneficiaryListQueryParams()
-        response = self.corpay_service.list_beneficiary(params)
-        for row in response['data']['rows']:
-            self.cache_beneficiary(row, company)
+        logger.debug(f"Getting beneficiaries for company - {company.name} - ID: {company.pk}")
+        existing = {}
+        for beneficiary in Beneficiary.objects.filter(company=company, client_integration_id__isnull=False):
+            existing.setdefault(beneficiary.client_integration_id, beneficiary)
 
-    def cache_beneficiary(self, data: dict, company: Company):
-        client_integration_id = data.get('clientIntegrationId')
-        corpay_id = data.get('id')
-        client_code = data.get('clientCode')
-        currency_mnemonic = data.get('curr')
-        methods = data.get('methods', [])
-        delivery_method = None
-        if len(methods) > 0:
-            delivery_method = methods[0]['id']
+        to_create, to_update = [], []
+        for row in self.list_beneficiaries():
+            beneficiary = existing.get(row.get('clientIntegrationId'))
+            if beneficiary is None:
+                beneficiary = Beneficiary(client_integration_id=row.get('clientIntegrationId'), company=company)
+                if self.update_beneficiary(beneficiary, row):
+                    existing[beneficiary.client_integration_id] = beneficiary
+                    to_create.append(beneficiary)
+            elif self.update_beneficiary(beneficiary, row):
+                to_update.append(beneficiary)
+
+        Beneficiary.objects.bulk_create(to_create, batch_size=self.page_size)
+        Beneficiary.objects.bulk_update(to_update, fields=self.cached_fields + ['modified'],
+                                        batch_size=self.page_size)
+        logger.debug(f"Cached beneficiaries for company {company.pk}: {len(to_create)} created, "
+                     f"{len(to_update)} updated")
 
-        currency = self.currencies.get(currency_mnemonic)
+    def list_beneficiaries(self):
+        """ Page through the beneficiary list of the current company """
+        skip, seen = 0, set()
+        while True:
+            params = BeneficiaryListQueryParams(skip=skip, take=self.page_size)
+            rows = self.corpay_service.list_beneficiary(params)['data']['rows']
+            new_rows = [row for row in rows if row.get('clientIntegrationId') not in seen]
+            seen.update(row.get('clientIntegrationId') for row in new_rows)
+            yield from new_rows
+            # Stop on the last page, or if the broker ignores paging and keeps returning the same rows
+            if len(rows) < self.page_size or not new_rows:
+                return
+            skip += len(rows)
 
+    def update_beneficiary(self, beneficiary: Beneficiary, data: dict) -> bool:
+        """ Set the cached fields of a beneficiary from a row of the beneficiary list, True if anything changed """
+        methods = data.get('methods', [])
+        values = {
+            'delivery_method': methods[0]['id'] if len(methods) > 0 else None,
+            'corpay_id': data.get('id'),
+            'client_code': data.get('clientCode'),
+            'currency': self.currencies.get(data.get('curr')),
+        }
+        changed = False
+        for field, value in values.items():
+            current = beneficiary.currency_id if field == 'currency' else getattr(beneficiary, field)
+            if current != (value.pk if field == 'currency' and value is not None else value):
+                setattr(beneficiary, field, value)
+                changed = True
+        if changed:
+            beneficiary.modified = datetime.now(timezone.utc)
+        return changed or beneficiary.pk is None
+
+    def cache_beneficiary(self, data: dict, company: Company):
         beneficiary, _ = Beneficiary.objects.get_or_create(
-            client_integration_id=client_integration_id,
-            company=company,
-            defaults={
-                'corpay_id': corpay_id,
-                'client_code': client_code,
-                'currency': currency
-            }
+            client_integration_id=data.get('clientIntegrationId'),
+            company=company
         )
-
-        beneficiary.delivery_method = delivery_method
-        beneficiary.corpay_id = corpay_id
-        beneficiary.client_code = client_code
-        beneficiary.currency = currency
-        beneficiary.save()
+        if self.update_beneficiary(beneficiary, data):
+            beneficiary.save()
@@ -0,0 +1,65 @@
+import json
+import logging
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from main.apps.dataprovider.services.collectors.capture import TickReplay, read_ticks, synthetic_ticks
+from main.apps.dataprovider.services.collectors.collector import BaseCollector
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Replay captured ticks (or synthetic ones) through a collector pipeline and report ticks/sec, "
+            "per stage p50/p99 latencies and memory. Defaults to local stand-ins of Redis, PubSub and BigQuery.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='Capture written by BaseCollector(capture=...)')
+        parser.add_argument('--synthetic', type=int, default=50_000,
+                            help='Number of synthetic ticks to replay when no path is given')
+        parser.add_argument('--instruments', type=int, default=20)
+        parser.add_argument('--speed', type=float, default=None,
+                            help='Replay at the recorded pace times this factor, default as fast as possible')
+        parser.add_argument('--bucket-secs', type=int, default=60, help='0 to skip bucketing')
+        parser.add_argument('--cache', default='main.apps.dataprovider.services.collectors.local.FakeRedisCache')
+        parser.add_argument('--publisher',
+                            default='main.apps.dataprovider.services.collectors.local.MemoryPublisher')
+        parser.add_argument('--writer',
+                            default='main.apps.dataprovider.services.collectors.local.FileSinkBigQueryManager')
+        parser.add_argument('--trace-memory', action='store_true', help='Also report the peak traced memory')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['path']:
+            ticks = read_ticks(options['path'])
+        else:
+            instruments = [f'INSTR{i}-SPOT' for i in range(options['instruments'])]
+            ticks = synthetic_ticks(options['synthetic'], instruments)
+
+        # the storages log every record at INFO
+        logging.getLogger('main.apps.dataprovider.services.collectors').setLevel(logging.WARNING)
+
+        stages = {stage: import_string(options[stage]) if options[stage] else None
+                  for stage in ('cache', 'publisher', 'writer')}
+        with tempfile.TemporaryDirectory() as directory:
+            writer = stages['writer']
+            if writer is not None:
+                stages['writer'] = lambda: writer(directory=directory)
+            collector = BaseCollector('replay', 'REPLAY', **stages)
+            stats = TickReplay(collector, ticks, speed=options['speed'], bucket_secs=options['bucket_secs'] or None,
+                               trace_memory=options['trace_memory']).run()
+            collector.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        self.stdout.write(f"{stats['ticks']} ticks in {stats['seconds']:.3f}s "
+                          f"({stats['ticks_per_sec']:,.0f} ticks/s), max rss {stats['max_rss_mb']:.1f}MB")
+        if 'peak_traced_mb' in stats:
+            self.stdout.write(f"peak traced memory {stats['peak_traced_mb']:.1f}MB")
+        for stage, row in stats['stages'].items():
+            self.stdout.write(f"  {stage:<10} calls={row['calls']:<8} p50={row['p50_us']:.1f}us "
+                              f"p99={row['p99_us']:.1f}us")
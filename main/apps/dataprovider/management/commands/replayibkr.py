@@ -0,0 +1,38 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from main.apps.dataprovider.services.collectors.adapters.ibkr_collector import IbkrTickApi
+from main.apps.dataprovider.services.collectors.adapters.ibkr_replay import IbkrReplay, read_messages, \
+    synthetic_messages
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Replay a recorded IB message stream through the IBKR collector decode path and report its throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='Stream recorded with IbkrTickApi(record_path=...)')
+        parser.add_argument('--synthetic', type=int, default=100_000,
+                            help='Number of synthetic messages to replay when no path is given')
+        parser.add_argument('--markets', type=int, default=20, help='Number of reqIds in the synthetic stream')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--legacy', action='store_true', help='Also replay through the per-callback path')
+
+    def handle(self, *args, **options):
+        if options['path']:
+            texts = list(read_messages(options['path']))
+        else:
+            texts = synthetic_messages(list(range(1, options['markets'] + 1)), options['synthetic'])
+
+        # the per-callback path logs every tick at INFO
+        logging.getLogger(IbkrTickApi.__module__).setLevel(logging.WARNING)
+
+        modes = [True, False] if options['legacy'] else [True]
+        for batched in modes:
+            # a fresh api per mode, so both start from the same state
+            api = IbkrTickApi('127.0.0.1', 0, 0, 'replay', mkts=[], bucket_secs=60)
+            stats = IbkrReplay(api, texts).run(batched=batched, batch_size=options['batch_size'])
+            self.stdout.write(f"{stats['mode']}: {stats['messages']} messages, {stats['quotes']} quotes in "
+                              f"{stats['seconds']:.3f}s ({stats['messages_per_sec']:,.0f} messages/s)")
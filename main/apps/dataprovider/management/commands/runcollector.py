@@ -6,7 +6,7 @@ from django.core.management.base import BaseCommand
 from django.utils.module_loading import import_string
 
 from main.apps.dataprovider.models.collector_config import CollectorConfig
-from main.apps.dataprovider.services.collectors.runner import CollectorRunner
+from main.apps.dataprovider.services.collectors.runner import AsyncCollectorRunner, CollectorRunner
 
 # ======
 
@@ -27,6 +27,12 @@ class Command(TaskDefaultArgumentsMixin, BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--config-ids', nargs='+', default=None, help='Comma-separated list of collector configuration IDs')
         parser.add_argument('--log-level', default=None)
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help='Run the collectors on their own schedules from an event loop')
+        parser.add_argument('--max-concurrency', type=int, default=3,
+                            help='Number of collector cycles allowed to run at once with --async')
+        parser.add_argument('--jitter', type=float, default=0.,
+                            help='Delay every scheduled cycle by up to this many seconds with --async')
 
     def handle(self, *args, **options):
         if options['config_ids']:
@@ -57,5 +63,9 @@ class Command(TaskDefaultArgumentsMixin, BaseCommand):
             collectors.append(collector)
 
         if not collectors: raise ValueError
-        runner = CollectorRunner(*collectors)
+        if options['use_async']:
+            runner = AsyncCollectorRunner(*collectors, max_concurrency=options['max_concurrency'],
+                                          jitter=options['jitter'])
+        else:
+            runner = CollectorRunner(*collectors)
         runner.run_forever()
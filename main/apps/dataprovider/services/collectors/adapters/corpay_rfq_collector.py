@@ -61,6 +61,7 @@ class CorpayRfqCollector:
                                         tick_type=TICK_TYPES.QUOTE, quote_type=QUOTE_TYPE.RFQ,
                                         indicative=False, data_class=QuoteTick)
         self.max_workers = max_workers
+        self.executor = None
         self.collect_fwd_points = collect_fwd_points
 
         self.post_request_sleep = post_request_sleep
@@ -300,13 +301,19 @@ class CorpayRfqCollector:
                     self.collector.collect(factory=self.factory, **response)
 
     def rfq(self):
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            for instrument in self.mkts:
-                responses = list(executor.map(self.two_way_wrapper, product([instrument], self.tenors)))
-                try:
-                    self.handle_responses(instrument, responses)
-                except:
-                    traceback.print_exc()
+        # the pool is kept between cycles and every instrument is queued up front, so workers never idle between
+        # instruments
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {instrument: [self.executor.submit(self.two_way_wrapper, args)
+                                for args in product([instrument], self.tenors)]
+                   for instrument in self.mkts}
+        for instrument, pending in futures.items():
+            responses = [future.result() for future in pending]
+            try:
+                self.handle_responses(instrument, responses)
+            except:
+                traceback.print_exc()
 
     def cycle(self, now, flush=True):
         if now > self.next_update:
@@ -316,6 +323,9 @@ class CorpayRfqCollector:
             self.next_update = self.iter.get_next()
 
     def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
         if self.collector:
             self.collector.close()
 
@@ -27,8 +27,9 @@ from collections import defaultdict
 
 from ibapi import comm
 from ibapi.client import EClient
-from ibapi.common import MAX_MSG_LEN, TickerId, TickAttrib
+from ibapi.common import MAX_MSG_LEN, NO_VALID_ID, TickerId, TickAttrib
 from ibapi.contract import Contract
+from ibapi.errors import BAD_LENGTH
 from ibapi.ticktype import TickType, TickTypeEnum
 from ibapi.utils import BadMessage
 from ibapi.wrapper import EWrapper
@@ -56,6 +57,8 @@ from main.apps.dataprovider.services.collectors.cache import RedisCache
 from main.apps.dataprovider.services.collectors.writer import BucketManager
 from main.apps.dataprovider.services.collectors.publisher import BasePublisher, GcpPubSub
 from main.apps.dataprovider.services.collectors.bucketer import BidAskMidSpreadBucketer, Bucketer
+from main.apps.dataprovider.services.collectors.adapters.ibkr_decode import IbkrBatchDecoder, drain
+from main.apps.dataprovider.services.collectors.adapters.ibkr_replay import IbkrMessageRecorder
 
 # =============================================================================
 
@@ -69,7 +72,8 @@ class IbkrTickApi(EClient, EWrapper):
     def __init__(self, host, port, clientId: int, collector_nm,
                  mkts=None, futures=None, antispam=True, writer=None, cache=None, publisher=None,
                  disconnect=True, silent=True, limit=0, bucket_secs=60, collect_ticks=False,
-                 shutdown_time=None, shutdown_duration=None):
+                 shutdown_time=None, shutdown_duration=None, batch_decode=False, batch_size=1000,
+                 record_path=None):
 
         EClient.__init__(self, self)
 
@@ -104,6 +108,12 @@ class IbkrTickApi(EClient, EWrapper):
         self.connected = True
         self.do_exit = False
         self._next_bucket = None
+        # batched decode path: drain the message queue and coalesce top of book updates per reqId
+        self.batch_decode = batch_decode
+        self.batch_size = batch_size
+        self.batch_decoder = None
+        # raw message stream, for offline replay (see ibkr_replay)
+        self.recorder = IbkrMessageRecorder(record_path) if record_path else None
         atexit.register(self.close)
 
     @classmethod
@@ -239,6 +249,7 @@ class IbkrTickApi(EClient, EWrapper):
                     # this shouldn't happen
                     raise
                 else:
+                    if self.recorder: self.recorder.write((text,))
                     fields = comm.read_fields(text)
                     logging.debug("fields %s", fields)
                     self.decoder.interpret(fields)
@@ -261,6 +272,7 @@ class IbkrTickApi(EClient, EWrapper):
                 except queue.Empty:
                     logging.debug("queue.get: empty")
                 else:
+                    if self.recorder: self.recorder.write((text,))
                     fields = comm.read_fields(text)
                     logging.debug("fields %s", fields)
                     self.decoder.interpret(fields)
@@ -311,11 +323,58 @@ class IbkrTickApi(EClient, EWrapper):
         if self.working_exchanges:
             logger.info(f'exchanges received: {sorted(self.working_exchanges)}')
 
+        if self.recorder:
+            self.recorder.close()
+
         self.subscriptions.clear()
         self.blank_exchanges.clear()
         self.working_exchanges.clear()
 
+    def poll_batch(self, timeout=0.1):
+
+        if not self.reader.is_alive() or not self.isConnected():
+            return False
+        try:
+            texts = drain(self.msg_queue, self.batch_size)
+            if not texts:
+                try:
+                    texts = [self.msg_queue.get(block=True, timeout=timeout)]
+                except queue.Empty:
+                    logging.debug("queue.get: empty")
+                    return True
+                texts += drain(self.msg_queue, self.batch_size - 1)
+            for text in texts:
+                if len(text) > MAX_MSG_LEN:
+                    self.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(),
+                                       "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text))
+                    self.disconnect()
+                    return False
+            if self.recorder: self.recorder.write(texts)
+            self.process_messages(texts)
+        except (KeyboardInterrupt, SystemExit):
+            logging.info("detected KeyboardInterrupt, SystemExit")
+            self.keyboardInterrupt()
+            self.keyboardInterruptHard()
+            return None
+        except BadMessage:
+            logging.info("BadMessage")
+            self.conn.disconnect()
+        except Exception as e:
+            logging.warning('exception %s', e)
+            raise
+        return True
+
+    def process_messages(self, texts, cur_time=None):
+        """ decode a batch of raw messages, see ibkr_decode """
+        if self.batch_decoder is None:
+            self.batch_decoder = IbkrBatchDecoder(self.decoder.interpret)
+        updates = self.batch_decoder.decode(texts)
+        self.on_quote_updates(updates, cur_time or datetime.utcnow())
+        return len(updates)
+
     def cycle(self, timeout=1):
+        if self.batch_decode:
+            return self.poll_batch(timeout)
         result = self.poll(timeout)
         return result
 
@@ -501,12 +560,42 @@ class IbkrTickApi(EClient, EWrapper):
                 **bucket,
             )
 
+    def on_quote_updates(self, updates, cur_time):
+
+        for update in updates:
+
+            info = self.subscriptions.get(update.req_id)
+            if info is None:
+                continue
+
+            info['received_data'] = True
+            exchange = info['contract'].exchange
+            self.blank_exchanges.discard(exchange)
+            self.working_exchanges.add(exchange)
+
+            ticker = info['master_ticker']
+            row = self.market_data.get(ticker)
+            if row is None:
+                logger.info(f'unexpected onMktData {ticker} {update.fields}')
+                continue
+
+            mult = self.ib_mult[ticker]
+            for field, value in update.fields.items():
+                if field in ('BID', 'ASK', 'LAST'):
+                    row[field] = value * mult
+                    row[f'{field}_TIME'] = cur_time
+                else:
+                    row[field] = value
+
+            if update.sized and ('BID' in row or 'ASK' in row or 'LAST' in row):
+                self.emit_quote(info, ticker, row, cur_time)
+
     def tick(self, info, field, value):
 
         ticker = info['master_ticker']
 
         if ticker not in self.market_data:
-            logger.info(f'unexpected onMktData {ticket} {field} {value}')
+            logger.info(f'unexpected onMktData {ticker} {field} {value}')
             return
 
         non_price = any(x in field for x in _non_price_strings)
@@ -536,54 +625,56 @@ class IbkrTickApi(EClient, EWrapper):
             row['SETTLE_TIME'] = datetime.utcnow()
 
         if field in ('BID_SIZE','ASK_SIZE','LAST_SIZE') and ('BID' in row or 'ASK' in row or 'LAST' in row):
+            self.emit_quote(info, ticker, row, datetime.utcnow())
 
+    def emit_quote(self, info, ticker, row, cur_time):
 
-            bid = row.get('BID',None)
-            ask = row.get('ASK',None)
-            last = row.get('LAST',None)
+        bid = row.get('BID',None)
+        ask = row.get('ASK',None)
+        last = row.get('LAST',None)
 
-            key = (bid,ask,last)
+        key = (bid,ask,last)
 
-            if self.antispam and info['last'] == key:
-                return
+        if self.antispam and info['last'] == key:
+            return
 
-            info['last'] = key
+        info['last'] = key
 
-            # ======
+        # ======
 
-            bid_size = row.get('BID_SIZE',None)
-            ask_size = row.get('ASK_SIZE',None)
-            bid_time = row.get('BID_TIME',None)
-            ask_time = row.get('ASK_TIME',None)
-            last = row.get('LAST',None)
-            last_size = row.get('LAST_SIZE',None)
-            # settlement = None
-            # settle_time = row.get('SETTLE_TIME',None)
+        bid_size = row.get('BID_SIZE',None)
+        ask_size = row.get('ASK_SIZE',None)
+        bid_time = row.get('BID_TIME',None)
+        ask_time = row.get('ASK_TIME',None)
+        last = row.get('LAST',None)
+        last_size = row.get('LAST_SIZE',None)
+        # settlement = None
+        # settle_time = row.get('SETTLE_TIME',None)
 
-            try:
-                mid = (bid+ask)/2
-            except:
-                mid = None
-
-            # print( ticker, row )
-
-            if info['bucketer']:
-                bucket = info['bucketer'].add_tick( datetime.utcnow(), instrument=ticker, bid=bid, bid_size=bid_size, ask=ask, ask_size=ask_size, trade=last, trade_size=last_size)
-                if bucket:
-                    self.process_bucket( bucket )
-
-            if self.collector and self.collect_ticks:
-                self.collector.collect(
-                    factory=self.quote_factory,
-                    instrument=ticker,
-                    bid=bid,
-                    bid_size=bid_size,
-                    bid_time=bid_time,
-                    ask=ask,
-                    ask_size=ask_size,
-                    ask_time=ask_time,
-                    mid=mid,
-                )
+        try:
+            mid = (bid+ask)/2
+        except:
+            mid = None
+
+        # print( ticker, row )
+
+        if info['bucketer']:
+            bucket = info['bucketer'].add_tick( cur_time, instrument=ticker, bid=bid, bid_size=bid_size, ask=ask, ask_size=ask_size, trade=last, trade_size=last_size)
+            if bucket:
+                self.process_bucket( bucket )
+
+        if self.collector and self.collect_ticks:
+            self.collector.collect(
+                factory=self.quote_factory,
+                instrument=ticker,
+                bid=bid,
+                bid_size=bid_size,
+                bid_time=bid_time,
+                ask=ask,
+                ask_size=ask_size,
+                ask_time=ask_time,
+                mid=mid,
+            )
 
     # ==================================
 
@@ -606,6 +697,18 @@ class IbkrTickApi(EClient, EWrapper):
             print('unknown instrument', ref['MARKET'], ref['INSTR_TYPE'])
             return
 
+    def add_subscription(self, contract, master_ticker, sym, instr_type, tickid=None):
+
+        tickid = tickid or self.get_tick_id()
+        self.subscriptions[tickid] = {'sym': sym, 'contract': contract, 'master_ticker': master_ticker,
+                                      'received_data': False, 'last': None, 'type': instr_type,
+                                      'bucketer': BidAskMidSpreadBucketer(self.bucket_secs) if self.bucket_secs else None}
+
+        self.blank_exchanges.add(contract.exchange)
+        self.market_data[master_ticker] = {}
+
+        return tickid
+
     def req_fut_data(self, base_future, return_data=False):
 
         contracts = pangea_client.get_active_contracts_by_base( base_future)
@@ -632,14 +735,7 @@ class IbkrTickApi(EClient, EWrapper):
             self.ib_mult[master_ticker] = 1.0
             self.ib_mult[symbol] = 1.0
 
-            tickid = self.get_tick_id()
-            self.subscriptions[tickid] = {'sym': symbol, 'contract': ibc, 'master_ticker': master_ticker,
-                                          'received_data': False, 'last': None, 'type': 'FUT',
-                                          'bucketer': BidAskMidSpreadBucketer(self.bucket_secs) if self.bucket_secs else None}
-
-            self.blank_exchanges.add(ibc.exchange)
-            self.market_data[master_ticker] = {}
-
+            tickid = self.add_subscription(ibc, master_ticker, symbol, 'FUT')
             self.request_tick_data( tickid, ibc )
 
         return True
@@ -687,14 +783,7 @@ class IbkrTickApi(EClient, EWrapper):
                     'contract': contract,
                     'last': None, 'bucketer': BidAskMidSpreadBucketer(self.bucket_secs) if self.bucket_secs else None}
 
-        tickid = self.get_tick_id()
-        self.subscriptions[tickid] = {'sym': ticker, 'contract': contract, 'master_ticker': master_ticker,
-                                      'received_data': False, 'last': None, 'type': ref['INSTR_TYPE'],
-                                      'bucketer': BidAskMidSpreadBucketer(self.bucket_secs) if self.bucket_secs else None}
-
-        self.blank_exchanges.add(contract.exchange)
-        self.market_data[master_ticker] = {}
-
+        tickid = self.add_subscription(contract, master_ticker, ticker, ref['INSTR_TYPE'])
         self.request_tick_data( tickid, contract )
 
         return True
@@ -0,0 +1,114 @@
+"""
+
+Batched decode path for IB market data.
+
+TICK_PRICE and TICK_SIZE messages for the top of book (BID, ASK, LAST and their sizes) are decoded straight from the
+message fields, without going through the ibapi decoder and the per-field wrapper callbacks. Within a batch, the
+updates are coalesced per reqId: the last value of every field wins, and one QuoteUpdate is returned per reqId.
+Every other message is handed back to the regular ibapi decoder.
+
+TICK_PRICE  -> msgId, version, reqId, tickType, price, size, attrMask
+TICK_SIZE   -> msgId, version, reqId, tickType, size
+
+"""
+
+import logging
+import queue
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ibapi import comm
+from ibapi.ticktype import TickTypeEnum
+
+logger = logging.getLogger(__name__)
+
+_TICK_PRICE = b'1'
+_TICK_SIZE = b'2'
+
+# price tick type -> the size tick type that comes with it in a TICK_PRICE message
+_PRICE_FIELDS = {
+    TickTypeEnum.BID: TickTypeEnum.BID_SIZE,
+    TickTypeEnum.ASK: TickTypeEnum.ASK_SIZE,
+    TickTypeEnum.LAST: TickTypeEnum.LAST_SIZE,
+}
+_SIZE_FIELDS = frozenset(_PRICE_FIELDS.values())
+
+FIELD_NAMES = {tick_type: TickTypeEnum.to_str(tick_type) for tick_type in (*_PRICE_FIELDS, *_SIZE_FIELDS)}
+
+
+# =============================================================================
+
+class QuoteUpdate:
+    """ The coalesced top of book updates of one reqId within a batch """
+
+    __slots__ = ('req_id', 'fields', 'sized', 'messages')
+
+    def __init__(self, req_id: int):
+        self.req_id = req_id
+        # field name (BID, BID_SIZE, ...) -> last value received in the batch
+        self.fields: Dict[str, float] = {}
+        # True if a size was received, which is what triggers a quote in IbkrTickApi.tick
+        self.sized = False
+        self.messages = 0
+
+
+class IbkrBatchDecoder:
+
+    def __init__(self, interpret: Callable[[tuple], None]):
+        # fallback for every message the fast path does not handle, typically Decoder.interpret
+        self.interpret = interpret
+        self.decoded = 0
+        self.fallbacks = 0
+
+    def decode(self, texts: Iterable[bytes]) -> List[QuoteUpdate]:
+        updates: Dict[int, QuoteUpdate] = {}
+        for text in texts:
+            fields = comm.read_fields(text)
+            if not self._decode_tick(fields, updates):
+                self.fallbacks += 1
+                self.interpret(fields)
+        return list(updates.values())
+
+    def _decode_tick(self, fields: tuple, updates: Dict[int, QuoteUpdate]) -> bool:
+        msg_id = fields[0] if fields else None
+        try:
+            if msg_id == _TICK_PRICE:
+                tick_type = int(fields[3])
+                size_type = _PRICE_FIELDS.get(tick_type)
+                if size_type is None:
+                    return False
+                price, size = float(fields[4]), float(fields[5])
+            elif msg_id == _TICK_SIZE:
+                tick_type = int(fields[3])
+                if tick_type not in _SIZE_FIELDS:
+                    return False
+                price, size_type, size = None, tick_type, float(fields[4])
+            else:
+                return False
+            req_id = int(fields[2])
+        except (IndexError, ValueError):
+            return False
+
+        update = updates.get(req_id)
+        if update is None:
+            update = updates[req_id] = QuoteUpdate(req_id)
+
+        # non-positive prices are ignored, as in IbkrTickApi.tick
+        if price is not None and price > 0.0:
+            update.fields[FIELD_NAMES[tick_type]] = price
+        update.fields[FIELD_NAMES[size_type]] = size
+        update.sized = True
+        update.messages += 1
+        self.decoded += 1
+        return True
+
+
+def drain(msg_queue, limit: Optional[int] = None) -> List[bytes]:
+    """ Everything currently in the queue, up to limit messages, without blocking """
+    texts = []
+    get = msg_queue.get_nowait
+    try:
+        while not limit or len(texts) < limit:
+            texts.append(get())
+    except queue.Empty:
+        pass
+    return texts
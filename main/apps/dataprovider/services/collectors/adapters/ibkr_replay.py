@@ -0,0 +1,146 @@
+"""
+
+Record and replay raw IB message streams, to measure the market data decode path offline.
+
+Streams are stored with the same framing as the TWS socket: every message is prefixed with its length
+(as read by ibapi.comm.read_msg). IbkrTickApi(record_path=...) records what it receives; synthetic_messages() generates a
+stream of top of book ticks when no recording is at hand.
+
+"""
+
+import random
+import struct
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from ibapi import comm
+from ibapi.contract import Contract
+from ibapi.decoder import Decoder
+from ibapi.server_versions import MAX_CLIENT_VER
+from ibapi.ticktype import TickTypeEnum
+
+_TICK_MESSAGES = (b'1', b'2')
+
+
+# =============================================================================
+
+class IbkrMessageRecorder:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'ab')
+
+    def write(self, texts: Iterable[bytes]):
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        for text in texts:
+            if isinstance(text, str):
+                text = text.encode()
+            self.file.write(struct.pack('!I', len(text)))
+            self.file.write(text)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_messages(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        buf = f.read()
+    # walk the buffer by offset, comm.read_msg copies the rest of the buffer on every message
+    offset = 0
+    while offset + 4 <= len(buf):
+        size = struct.unpack_from('!I', buf, offset)[0]
+        offset += 4
+        if offset + size > len(buf):
+            break
+        yield buf[offset:offset + size]
+        offset += size
+
+
+def synthetic_messages(req_ids: List[int], n: int, seed: int = 0) -> List[bytes]:
+    """ n top of book messages over req_ids, in the shape TWS sends them (a TICK_PRICE, then the sizes) """
+    rng = random.Random(seed)
+    mids = {req_id: rng.uniform(0.5, 150.) for req_id in req_ids}
+    texts = []
+    while len(texts) < n:
+        req_id = rng.choice(req_ids)
+        mids[req_id] *= 1 + rng.gauss(0, 1e-5)
+        tick_type = rng.choice((TickTypeEnum.BID, TickTypeEnum.ASK))
+        price = mids[req_id] * (0.9999 if tick_type == TickTypeEnum.BID else 1.0001)
+        size = rng.randint(1, 50) * 100_000
+        texts.append(make_message(1, 6, req_id, tick_type, f'{price:.5f}', size, 0))
+        size_type = TickTypeEnum.BID_SIZE if tick_type == TickTypeEnum.BID else TickTypeEnum.ASK_SIZE
+        texts.append(make_message(2, 6, req_id, size_type, size))
+    return texts[:n]
+
+
+def make_message(*fields) -> bytes:
+    """ The text of a message, as read off the socket """
+    return ''.join(comm.make_field(field) for field in fields).encode()
+
+
+# =============================================================================
+
+class IbkrReplay:
+    """
+    Feeds a recorded stream to an IbkrTickApi that is not connected to TWS, either through the batched decode path
+    or, with batched=False, message by message through the ibapi decoder and the wrapper callbacks.
+    Every reqId found in the stream gets a subscription, named after it unless tickers are given.
+    """
+
+    def __init__(self, api, texts: List[bytes], tickers: Optional[Dict[int, str]] = None):
+        self.api = api
+        self.texts = texts
+        self.quotes = 0
+
+        if getattr(api, 'decoder', None) is None:
+            api.decoder = Decoder(api, MAX_CLIENT_VER)
+
+        tickers = tickers or {}
+        for req_id in sorted(self._req_ids(texts)):
+            if req_id in api.subscriptions:
+                continue
+            contract = Contract()
+            contract.exchange = 'IDEALPRO'
+            ticker = tickers.get(req_id, f'REQ{req_id}')
+            api.ib_mult[ticker] = 1.0
+            api.add_subscription(contract, ticker, ticker, 'FX', tickid=req_id)
+
+        emit_quote = api.emit_quote
+
+        def _count(*args, **kwargs):
+            self.quotes += 1
+            return emit_quote(*args, **kwargs)
+
+        api.emit_quote = _count
+
+    @staticmethod
+    def _req_ids(texts: List[bytes]) -> set:
+        req_ids = set()
+        for text in texts:
+            fields = comm.read_fields(text)
+            if len(fields) > 2 and fields[0] in _TICK_MESSAGES:
+                req_ids.add(int(fields[2]))
+        return req_ids
+
+    def run(self, batched: bool = True, batch_size: int = 1000) -> Dict:
+        self.quotes = 0
+        start = time.perf_counter()
+        if batched:
+            for i in range(0, len(self.texts), batch_size):
+                self.api.process_messages(self.texts[i:i + batch_size])
+        else:
+            interpret = self.api.decoder.interpret
+            for text in self.texts:
+                interpret(comm.read_fields(text))
+        elapsed = time.perf_counter() - start
+
+        return dict(
+            mode='batched' if batched else 'legacy',
+            messages=len(self.texts),
+            quotes=self.quotes,
+            seconds=elapsed,
+            messages_per_sec=len(self.texts) / elapsed if elapsed else None,
+        )
@@ -1,6 +1,6 @@
 import json
 from abc import ABC
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from asgiref.sync import async_to_sync
 from django.conf import settings
@@ -11,7 +11,7 @@ from main.apps.dataprovider.services.collectors.client import PubSubSubscriber
 from main.apps.dataprovider.services.collectors.collector import BaseCollector
 from main.apps.dataprovider.services.collectors.quote_tick import QuoteTickFactory, QuoteTick
 from main.apps.marketdata.services.fx.fx_provider import CachedFxSpotProvider, FxForwardProvider
-from main.apps.oems.backend.order_book import OrderBook
+from main.apps.oems.backend.order_book import LpOrderBook
 from main.apps.pricing.models import Feed
 
 try:
@@ -81,12 +81,11 @@ class PriceFeed(ABC):
         return int(total_subscriber)
 
     def get_order_book(self, instrument):
-        if instrument in self.order_books:
-            return self.order_books[instrument]
-        else:
-            ob = OrderBook()
-            self.order_books[instrument] = instrument
-            return ob
+        ob = self.order_books.get(instrument)
+        if ob is None:
+            ob = LpOrderBook()
+            self.order_books[instrument] = ob
+        return ob
 
     def check_anti_spam(self, instrument, *args):
         return (instrument in self.check_last and self.check_last[instrument] == args)
@@ -150,8 +149,12 @@ class PriceFeed(ABC):
 
 class BboPriceFeed(PriceFeed):
 
+    # seconds without a new quote after which an LP is dropped from the book, config.raw["max_quote_age"]
+    MAX_QUOTE_AGE = 5.0
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.max_quote_age = timedelta(seconds=self.config.raw.get("max_quote_age", self.MAX_QUOTE_AGE))
 
     def on_tick(self, message, data, *args, **kwargs):
 
@@ -170,10 +173,16 @@ class BboPriceFeed(PriceFeed):
             ob.store_bid(data['source'], data['bid'], data['bid_size'], bid_time)
 
         if isinstance(data['ask'], float):
-            ob.store_ask(data['source'], data['ask'], data['ask_size'], bid_time)
+            ob.store_ask(data['source'], data['ask'], data['ask_size'], ask_time)
+
+        # an LP that stopped quoting must not stay on the published bbo
+        ob.evict(bid_time - self.max_quote_age)
 
         best_bid, best_ask = ob.bbo()
 
+        if best_bid is None or best_ask is None:
+            return  # one sided book
+
         if self.check_anti_spam(instrument, best_bid, best_ask):
             return  # anti-spam
 
@@ -0,0 +1,245 @@
+"""
+
+Capture of raw inbound ticks, and a replay driver to benchmark the collector pipeline offline.
+
+A capture is a JSON lines file, one tick per line, as it was handed to BaseCollector.collect:
+
+    {"ts": 1718000000.123, "source": "IBKR", "collector": "dev1",
+     "factory": {"type": "quote", "tick_type": "quote", "quote_type": "rfs", "indicative": false},
+     "tick": {"instrument": "EURUSD-SPOT", "bid": 1.0712, "bid_time": {"$dt": "2024-06-10T06:13:20.123000"}, ...}}
+
+Collectors capture their ticks with BaseCollector(capture='/path/to/file.jsonl'). TickReplay pushes a capture through
+a BaseCollector and its cache/writer/publisher, as fast as possible or at the recorded pace, bucketing quotes on the
+way as the IBKR collector does. It reports ticks/sec, the p50/p99 latency of every stage and the memory used.
+See local.py for stand-ins of Redis, PubSub and BigQuery, and the benchcollector command.
+
+"""
+
+import json
+import random
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from main.apps.dataprovider.services.collectors.bucketer import BidAskMidSpreadBucketer
+from main.apps.dataprovider.services.collectors.quote_tick import BucketFactory, QuoteTickFactory
+
+_DT = '$dt'
+
+
+# ==================
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {_DT: value.isoformat()}
+    raise TypeError(f'cannot capture {type(value).__name__}')
+
+
+def _decode(obj):
+    if len(obj) == 1 and _DT in obj:
+        return datetime.fromisoformat(obj[_DT])
+    return obj
+
+
+def factory_spec(factory) -> Dict:
+    if isinstance(factory, QuoteTickFactory):
+        return dict(type='quote', tick_type=factory.tick_type, quote_type=factory.quote_type,
+                    indicative=factory.indicative)
+    if isinstance(factory, BucketFactory):
+        return dict(type='bucket', indicative=factory.indicative)
+    return dict(type=type(factory).__name__)
+
+
+class TickCapture:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'a')
+
+    def write(self, collector: str, source: str, factory, tick: Dict, ts: Optional[float] = None):
+        line = dict(ts=time.time() if ts is None else ts, source=source, collector=collector,
+                    factory=factory_spec(factory), tick=tick)
+        self.file.write(json.dumps(line, default=_encode))
+        self.file.write('\n')
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_ticks(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line, object_hook=_decode)
+
+
+def synthetic_ticks(n: int, instruments: List[str], source: str = 'SYNTHETIC', start: Optional[float] = None,
+                    ticks_per_sec: float = 100., seed: int = 0) -> List[Dict]:
+    """ A capture of n random walk quotes over instruments, to benchmark without a recorded capture """
+    rng = random.Random(seed)
+    start = time.time() if start is None else start
+    mids = {instrument: rng.uniform(0.5, 150.) for instrument in instruments}
+    factory = dict(type='quote', tick_type='quote', quote_type='rfs', indicative=False)
+    ticks = []
+    for i in range(n):
+        instrument = rng.choice(instruments)
+        mid = mids[instrument] = mids[instrument] * (1 + rng.gauss(0, 1e-5))
+        ts = start + i / ticks_per_sec
+        tick_time = datetime.utcfromtimestamp(ts)
+        ticks.append(dict(ts=ts, source=source, collector='replay', factory=factory, tick=dict(
+            instrument=instrument, bid=mid * 0.9999, ask=mid * 1.0001, mid=mid,
+            bid_size=rng.randint(1, 50) * 100_000., ask_size=rng.randint(1, 50) * 100_000.,
+            bid_time=tick_time, ask_time=tick_time)))
+    return ticks
+
+
+# ==================
+
+class _TimedStage:
+    """ Proxy of a cache/writer/publisher that records the latency of every write """
+
+    def __init__(self, target, latencies: List[float]):
+        self.target = target
+        self.latencies = latencies
+
+    def write_record(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.target.write_record(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def __getattr__(self, item):
+        return getattr(self.target, item)
+
+
+class _TimedFactory:
+
+    def __init__(self, factory, latencies: List[float]):
+        self.factory = factory
+        self.latencies = latencies
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.factory(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+class TickReplay:
+    """
+    Replays ticks through a BaseCollector. speed=None replays as fast as possible, otherwise ticks are spaced as
+    recorded, sped up by that factor. With bucket_secs, quotes are also bucketed per instrument and the buckets
+    collected (captured buckets are then skipped, as they are recomputed).
+    """
+
+    stages = ('factory', 'bucketer', 'cache', 'writer', 'publisher')
+
+    def __init__(self, collector, ticks: Iterable[Dict], speed: Optional[float] = None,
+                 bucket_secs: Optional[int] = None, trace_memory: bool = False):
+        self.collector = collector
+        self.ticks = ticks
+        self.speed = speed
+        self.bucket_secs = bucket_secs
+        self.trace_memory = trace_memory
+
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in self.stages}
+        self.factories = {}
+        self.bucketers = defaultdict(self._bucketer)
+
+        for stage in ('cache', 'writer', 'publisher'):
+            target = getattr(collector, stage)
+            if target is not None:
+                setattr(collector, stage, _TimedStage(target, self.latencies[stage]))
+
+    def _bucketer(self):
+        return BidAskMidSpreadBucketer(self.bucket_secs)
+
+    def _factory(self, line: Dict):
+        spec = line['factory']
+        key = (line['source'], tuple(sorted(spec.items())))
+        factory = self.factories.get(key)
+        if factory is None:
+            if spec['type'] == 'quote':
+                factory = QuoteTickFactory(collector=self.collector.collector, source=line['source'],
+                                           tick_type=spec['tick_type'], quote_type=spec['quote_type'],
+                                           indicative=spec['indicative'])
+            elif spec['type'] == 'bucket':
+                factory = BucketFactory(collector=self.collector.collector, source=line['source'],
+                                        indicative=spec['indicative'])
+            else:
+                raise ValueError(f"cannot replay ticks of {spec['type']}")
+            factory = self.factories[key] = _TimedFactory(factory, self.latencies['factory'])
+        return factory
+
+    def _bucket_factory(self, source: str):
+        key = (source, 'bucket')
+        if key not in self.factories:
+            suffix = '1MIN' if self.bucket_secs == 60 else f'{self.bucket_secs}S'
+            self.factories[key] = _TimedFactory(BucketFactory(collector=self.collector.collector,
+                                                              source=f'{source}_{suffix}'),
+                                                self.latencies['factory'])
+        return self.factories[key]
+
+    def _pace(self, ts: float, first_ts: float, start: float):
+        delay = (ts - first_ts) / self.speed - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self) -> Dict:
+        if self.trace_memory:
+            tracemalloc.start()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        count = 0
+        first_ts = None
+        start = time.perf_counter()
+        for line in self.ticks:
+            tick, factory = line['tick'], line['factory']
+            if factory['type'] == 'bucket' and self.bucket_secs:
+                continue
+            if self.speed:
+                first_ts = line['ts'] if first_ts is None else first_ts
+                self._pace(line['ts'], first_ts, start)
+
+            self.collector.collect(factory=self._factory(line), **tick)
+            count += 1
+
+            if self.bucket_secs and factory['type'] == 'quote':
+                bucket_start = time.perf_counter()
+                bucket = self.bucketers[tick['instrument']].add_tick(
+                    datetime.utcfromtimestamp(line['ts']), instrument=tick['instrument'],
+                    bid=tick.get('bid'), bid_size=tick.get('bid_size'),
+                    ask=tick.get('ask'), ask_size=tick.get('ask_size'))
+                self.latencies['bucketer'].append(time.perf_counter() - bucket_start)
+                if bucket:
+                    self.collector.collect(factory=self._bucket_factory(line['source']), **bucket)
+
+        self.collector.flush()
+        elapsed = time.perf_counter() - start
+
+        stats = dict(ticks=count, seconds=elapsed, ticks_per_sec=count / elapsed if elapsed else None,
+                     max_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                     rss_growth_mb=(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024)
+        if self.trace_memory:
+            stats['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+
+        stats['stages'] = {}
+        for stage, latencies in self.latencies.items():
+            if latencies:
+                p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+                stats['stages'][stage] = dict(calls=len(latencies), p50_us=p50, p99_us=p99)
+        return stats
@@ -1,17 +1,21 @@
 from random import randint, uniform
 
+from main.apps.dataprovider.services.collectors.capture import TickCapture
+
 
 # =====================================
 
 class BaseCollector:
 
-    def __init__(self, collector, source, cache=None, publisher=None, writer=None, **kwargs):
+    def __init__(self, collector, source, cache=None, publisher=None, writer=None, capture=None, **kwargs):
 
         self.collector = collector
         self.source = source
         self.cache = cache() if cache else None
         self.publisher = publisher() if publisher else None
         self.writer = writer() if writer else None
+        # path of a file to capture the inbound ticks to, for offline replay (see capture.py)
+        self.capture = TickCapture(capture) if capture else None
 
         # local caches
         self.factories = {}
@@ -48,9 +52,11 @@ class BaseCollector:
     def flush(self):
         # could flush self.last as well
         if self.writer: self.writer.flush()
+        if self.capture: self.capture.flush()
 
     def close(self):
         if self.writer: self.writer.close()
+        if self.capture: self.capture.close()
 
     # close the other services here
 
@@ -70,6 +76,7 @@ class BaseCollector:
             return
 
         factory = factory or self.factories[factory_key]
+        if self.capture: self.capture.write(self.collector, self.source, factory, kwargs)
         record, bucket, key = factory(*args, **kwargs)
 
         # save last for flushing
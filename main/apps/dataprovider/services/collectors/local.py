@@ -0,0 +1,85 @@
+"""
+
+Local stand-ins for the remote collector storages, to run the collector pipeline without Redis, PubSub or BigQuery
+(see capture.py and the benchcollector command). They do the same serialization work as the real ones.
+
+"""
+
+import json
+import logging
+import os
+import tempfile
+from collections import defaultdict, deque
+
+from main.apps.dataprovider.services.collectors.cache import CACHE_FORMATS, RedisCache
+from main.apps.dataprovider.services.collectors.publisher import BasePublisher, PUB_FORMATS
+from main.apps.dataprovider.services.collectors.writer import BigQueryManager
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+logger = logging.getLogger(__name__)
+
+
+# ==================
+
+class FakeRedisCache(RedisCache):
+
+    def __init__(self, cache_endpoint='fakeredis://local', data_type=CACHE_FORMATS.JSON, **kwargs):
+        if fakeredis is None:
+            raise ImportError('fakeredis is required for FakeRedisCache, see requirements/tests.txt')
+        super().__init__(cache_endpoint=cache_endpoint, data_type=data_type)
+
+    def ensure_conn(self):
+        try:
+            return self.conn[self.cache_endpoint]
+        except KeyError:
+            lconn = fakeredis.FakeRedis()
+            RedisCache.conn[self.cache_endpoint] = lconn
+            return lconn
+
+
+class MemoryPublisher(BasePublisher):
+    """ Keeps the last max_messages published messages in memory, by topic """
+
+    def __init__(self, data_type=PUB_FORMATS.JSON, max_messages=10_000):
+        super().__init__(data_type=data_type)
+        self.messages = defaultdict(lambda: deque(maxlen=max_messages))
+
+    def write_record(self, record, bucket, key, data=None, content_type=None):
+        if not data:
+            if self.data_type == PUB_FORMATS.JSON:
+                data = record.export_to_json().encode()
+            else:
+                raise ValueError('Unknown data data')
+        self.messages[bucket].append(data)
+
+
+class FileSinkBigQueryManager(BigQueryManager):
+    """ BigQueryManager that appends the rows it would insert to one JSON lines file per table """
+
+    def __init__(self, directory=None, dataset_id='marketdata', batch_size=100, flush_on_close=True, **kwargs):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'bq-sink')
+        self.dataset_id = dataset_id
+        self.batch_size = batch_size
+        self.flush_on_close = flush_on_close
+        self.rows = defaultdict(deque)
+        self.ensure = set()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_table_name(self, record):
+        return f'{self.dataset_id}.{record.__class__.__name__}'
+
+    def ensure_table(self, record, bucket, key):
+        pass
+
+    def flush(self):
+        for table_id, rows in self.rows.items():
+            if rows:
+                with open(os.path.join(self.directory, f'{table_id}.jsonl'), 'a') as f:
+                    for row in rows:
+                        f.write(json.dumps(row))
+                        f.write('\n')
+                rows.clear()
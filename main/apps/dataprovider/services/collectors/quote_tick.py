@@ -247,6 +247,14 @@ class Bucket:
     def export_to_row(self):
         return self.__slots__
 
+    def export_bq(self):
+        data = asdict(self)
+        # Convert datetime fields to ISO format
+        for key, value in data.items():
+            if isinstance(value, datetime):
+                data[key] = value.isoformat()
+        return data
+
     @classmethod
     def get_avro_schema(cls):
         # Define your Avro schema. This could also be loaded from a .avsc file if you prefer.
@@ -1,9 +1,17 @@
+import asyncio
+import logging
+import random
 import time
 from itertools import product
+from typing import Dict, List, Optional
 
 from concurrent.futures import ThreadPoolExecutor
+from croniter import croniter
+
 from main.apps.oems.backend.utils import sleep_for
 
+logger = logging.getLogger(__name__)
+
 
 # ==============
 
@@ -13,6 +21,7 @@ class CollectorRunner:
 
         self.cache = []
         self.max_workers = 3
+        self.executor = None
 
         for collector in args:
             self.cache.append(collector)
@@ -25,13 +34,18 @@ class CollectorRunner:
 
     def cycle(self, now):
         if self.max_workers > 1 and len(self.cache) > 1:
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                responses = list(executor.map(self.cycle_, product([now], self.cache)))
+            # the pool is kept for the lifetime of the runner instead of being rebuilt every cycle
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            responses = list(self.executor.map(self.cycle_, product([now], self.cache)))
         else:
             for collector in self.cache:
                 collector.cycle(now)
 
     def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
         for collector in self.cache:
             collector.close()
 
@@ -47,5 +61,200 @@ class CollectorRunner:
             self.close()
 
 
+# ==============
+
+class CollectorSchedule:
+    """
+    When a collector should cycle: on a cron schedule, on a fixed interval, or (by default) whenever the
+    collector says it is due through its next_update timestamp. Jitter delays every run by up to that many seconds,
+    so that collectors sharing a schedule do not all hit their sources at the same instant.
+    """
+
+    def __init__(self, cron: Optional[str] = None, interval: Optional[float] = None, jitter: float = 0.):
+        if cron is not None and interval is not None:
+            raise ValueError('a schedule is either a cron or an interval')
+        self.cron = cron
+        self.interval = interval
+        self.jitter = jitter
+        self.iter = None
+
+    @classmethod
+    def for_collector(cls, collector, interval: float = 0.5, jitter: float = 0.) -> 'CollectorSchedule':
+        if hasattr(collector, 'next_update'):
+            return cls(jitter=jitter)
+        return cls(interval=interval, jitter=jitter)
+
+    def next_run(self, collector, now: float) -> float:
+        if self.cron is not None:
+            if self.iter is None:
+                self.iter = croniter(self.cron, now)
+            due = self.iter.get_next()
+            # skip the runs that were missed while the collector was busy
+            while due < now:
+                due = self.iter.get_next()
+        elif self.interval is not None:
+            due = now + self.interval
+        else:
+            # never before now, so a collector that did not move its next_update does not spin
+            due = max(getattr(collector, 'next_update', now), now + 0.01)
+        if self.jitter:
+            due += random.uniform(0., self.jitter)
+        return due
+
+
+class CollectorStats:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.cycles = 0
+        self.errors = 0
+        self.last_latency = 0.
+        self.max_latency = 0.
+        self.total_latency = 0.
+        self.lag = 0.
+        self.waiting = False
+        self.running = False
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.cycles if self.cycles else 0.
+
+    def record(self, latency: float, error: bool = False):
+        self.cycles += 1
+        self.errors += error
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    def to_dict(self) -> Dict:
+        return dict(name=self.name, cycles=self.cycles, errors=self.errors, last_latency=self.last_latency,
+                    avg_latency=self.avg_latency, max_latency=self.max_latency, lag=self.lag,
+                    waiting=self.waiting, running=self.running)
+
+
+class AsyncCollectorRunner:
+    """
+    Runs collectors from a single, persistent event loop. Every collector gets its own task and schedule, and
+    the blocking collector cycles run on a thread pool that lives as long as the runner. A collector only has one
+    cycle in flight, and all collectors share a budget of max_concurrency concurrent cycles, handed out in the order
+    they became due, so one slow collector cannot starve the others.
+
+    Per collector, stats() reports the cycle latency, the lag between when a cycle was due and when it started,
+    and whether the collector is waiting on the budget (the backlog).
+    """
+
+    def __init__(self, *args, max_concurrency: int = 3, interval: float = 0.5, jitter: float = 0.,
+                 stats_interval: float = 60.):
+        self.max_concurrency = max_concurrency
+        self.interval = interval
+        self.jitter = jitter
+        self.stats_interval = stats_interval
+
+        self.cache = []
+        self.schedules: List[CollectorSchedule] = []
+        self._stats: List[CollectorStats] = []
+        self._due: List[Optional[float]] = []
+
+        self.loop = None
+        self.executor = None
+        self._budget = None
+        self._stop = None
+
+        for collector in args:
+            self.register_collector(collector)
+
+    def register_collector(self, collector, schedule: Optional[CollectorSchedule] = None):
+        self.cache.append(collector)
+        self.schedules.append(
+            schedule or CollectorSchedule.for_collector(collector, interval=self.interval, jitter=self.jitter))
+        self._stats.append(CollectorStats(f'{type(collector).__name__}-{len(self.cache)}'))
+        self._due.append(None)
+
+    def stats(self) -> List[Dict]:
+        now = time.time()
+        ret = []
+        for stats, due in zip(self._stats, self._due):
+            row = stats.to_dict()
+            # a collector is backlogged when it is due but has not started its cycle yet
+            row['backlog'] = int(not stats.running and due is not None and due <= now)
+            ret.append(row)
+        return ret
+
+    # ================
+
+    async def _run_collector(self, index: int):
+        collector, schedule, stats = self.cache[index], self.schedules[index], self._stats[index]
+        due = schedule.next_run(collector, time.time())
+        while not self._stop.is_set():
+            self._due[index] = due
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+            stats.waiting = True
+            async with self._budget:
+                stats.waiting, stats.running = False, True
+                start = time.time()
+                stats.lag = max(0., start - due)
+                error = False
+                try:
+                    await self.loop.run_in_executor(self.executor, collector.cycle, start)
+                except Exception:
+                    error = True
+                    logger.exception(f'collector {stats.name} failed')
+                stats.running = False
+                stats.record(time.time() - start, error=error)
+
+            due = schedule.next_run(collector, time.time())
+        self._due[index] = None
+
+    async def _report(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.stats_interval)
+            except asyncio.TimeoutError:
+                for row in self.stats():
+                    logger.info(f"collector {row['name']}: cycles={row['cycles']} errors={row['errors']} "
+                                f"latency={row['last_latency']:.3f}s avg={row['avg_latency']:.3f}s "
+                                f"max={row['max_latency']:.3f}s lag={row['lag']:.3f}s backlog={row['backlog']}")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='collector')
+        self._budget = asyncio.Semaphore(self.max_concurrency)
+        self._stop = asyncio.Event()
+
+        tasks = [asyncio.create_task(self._run_collector(i)) for i in range(len(self.cache))]
+        if self.stats_interval:
+            tasks.append(asyncio.create_task(self._report()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def stop(self):
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    def close(self):
+        for collector in self.cache:
+            collector.close()
+
+    def run_forever(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+
 if __name__ == "__main__":
     pass
@@ -7,6 +7,7 @@ import pandas as pd
 
 from main.apps.dataprovider.services.importer.provider_handler.ibkr.html.base import IbkrHtmlHandler
 from main.apps.margin.models import FxSpotMargin
+from main.apps.margin.services.margin_rates import BrokerMarginRatesCache
 
 
 class IbkrFxSpotMarginHandler(IbkrHtmlHandler, ABC):
@@ -55,6 +56,11 @@ class IbkrFxSpotMarginHandler(IbkrHtmlHandler, ABC):
             for index, row in self.df.iterrows() if row['pair_id'] > 0
         ]
 
+    def after_handle(self) -> pd.DataFrame:
+        # the rates are bulk upserted, which does not send the FxSpotMargin signals
+        BrokerMarginRatesCache.invalidate_broker(self.broker.id)
+        return super().after_handle()
+
     def get_pk_field_names(self) -> Optional[Sequence[str]]:
         return [
             'data_cut_id',
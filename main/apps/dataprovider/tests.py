@@ -1,3 +1,157 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from main.apps.dataprovider.services.collectors.adapters.ibkr_decode import IbkrBatchDecoder
+from main.apps.dataprovider.services.collectors.adapters.price_feed import BboPriceFeed
+from main.apps.dataprovider.services.collectors.adapters.ibkr_replay import make_message
+from main.apps.dataprovider.services.collectors.capture import TickReplay, read_ticks, synthetic_ticks
+from main.apps.dataprovider.services.collectors.collector import BaseCollector
+from main.apps.dataprovider.services.collectors.local import FileSinkBigQueryManager, MemoryPublisher
+from main.apps.dataprovider.services.collectors.quote_tick import QuoteTickFactory
+from main.apps.dataprovider.services.collectors.runner import AsyncCollectorRunner, CollectorSchedule
+
+
+class FakeCollector:
+
+    def __init__(self, duration=0., error=False):
+        self.duration = duration
+        self.error = error
+        self.cycles = 0
+        self.closed = False
+
+    def cycle(self, now):
+        self.cycles += 1
+        time.sleep(self.duration)
+        if self.error:
+            raise ValueError
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncCollectorRunnerTestCase(SimpleTestCase):
+
+    def _run(self, runner, seconds):
+        threading.Timer(seconds, runner.stop).start()
+        runner.run_forever()
+
+    def test_slow_collectors_do_not_starve_others(self):
+        slow, fast, failing = FakeCollector(duration=0.2), FakeCollector(), FakeCollector(error=True)
+        runner = AsyncCollectorRunner(slow, fast, failing, max_concurrency=2, interval=0.02, stats_interval=0)
+        self._run(runner, 0.6)
+
+        stats = {row['name']: row for row in runner.stats()}
+        self.assertGreater(fast.cycles, slow.cycles)
+        self.assertGreater(failing.cycles, 1)
+        self.assertEqual(stats['FakeCollector-3']['errors'], failing.cycles)
+        self.assertGreaterEqual(stats['FakeCollector-1']['max_latency'], 0.2)
+        self.assertTrue(all(collector.closed for collector in (slow, fast, failing)))
+
+    def test_cron_schedule_skips_missed_runs(self):
+        schedule = CollectorSchedule(cron='* * * * *')
+        now = 1_700_000_000.
+        self.assertEqual(schedule.next_run(None, now) % 60, 0)
+        self.assertGreater(schedule.next_run(None, now + 600), now + 600)
+
+    def test_next_update_schedule(self):
+        collector = FakeCollector()
+        collector.next_update = 100.
+        schedule = CollectorSchedule.for_collector(collector)
+        self.assertEqual(schedule.next_run(collector, now=50.), 100.)
+        self.assertGreater(schedule.next_run(collector, now=150.), 150.)
+
+
+class IbkrBatchDecoderTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.fallback = []
+        self.decoder = IbkrBatchDecoder(self.fallback.append)
+
+    def test_updates_are_coalesced_per_req_id(self):
+        texts = [
+            make_message(1, 6, 7, 1, '1.1', 100, 0),  # BID 1.1, BID_SIZE 100
+            make_message(2, 6, 7, 3, 200),  # ASK_SIZE 200
+            make_message(1, 6, 7, 1, '1.2', 300, 0),  # BID 1.2, BID_SIZE 300
+            make_message(1, 6, 8, 2, '0', 50, 0),  # ASK ignored, ASK_SIZE 50
+        ]
+        updates = {update.req_id: update for update in self.decoder.decode(texts)}
+
+        self.assertEqual(updates[7].fields, {'BID': 1.2, 'BID_SIZE': 300., 'ASK_SIZE': 200.})
+        self.assertEqual(updates[7].messages, 3)
+        self.assertEqual(updates[8].fields, {'ASK_SIZE': 50.})
+        self.assertTrue(updates[8].sized)
+        self.assertEqual(self.fallback, [])
+
+    def test_other_messages_fall_back(self):
+        texts = [make_message(1, 6, 7, 9, '1.3', 0, 0), make_message(4, 2, -1, 2104, 'farm ok')]
+        self.assertEqual(self.decoder.decode(texts), [])
+        self.assertEqual(len(self.fallback), 2)
+
+
+class TickReplayTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_capture_round_trip(self):
+        path = os.path.join(self.directory.name, 'capture.jsonl')
+        collector = BaseCollector('test', 'CORPAY', capture=path)
+        factory = QuoteTickFactory(collector='test', source='CORPAY')
+        bid_time = datetime(2024, 6, 10, 6, 13, 20)
+        collector.collect(factory=factory, instrument='EURUSD-SPOT', bid=1.07, bid_time=bid_time)
+        collector.close()
+
+        (line,) = read_ticks(path)
+        self.assertEqual(line['source'], 'CORPAY')
+        self.assertEqual(line['factory']['quote_type'], factory.quote_type)
+        self.assertEqual(line['tick'], {'instrument': 'EURUSD-SPOT', 'bid': 1.07, 'bid_time': bid_time})
+
+    def test_replay_through_local_pipeline(self):
+        ticks = synthetic_ticks(600, ['EURUSD-SPOT', 'USDJPY-SPOT'], start=1_699_999_980., ticks_per_sec=2.)
+        collector = BaseCollector('test', 'REPLAY', publisher=MemoryPublisher,
+                                  writer=lambda: FileSinkBigQueryManager(directory=self.directory.name))
+
+        stats = TickReplay(collector, ticks, bucket_secs=60).run()
+        collector.close()
+
+        self.assertEqual(stats['ticks'], 600)
+        self.assertEqual(stats['stages']['publisher']['calls'], stats['stages']['factory']['calls'])
+        # 5 minutes of ticks from the start of a minute: the buckets of the first 4 minutes are closed, per instrument
+        self.assertEqual(stats['stages']['factory']['calls'], 600 + 8)
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'marketdata.Bucket.jsonl')))
+
+
+class BboPriceFeedTestCase(SimpleTestCase):
+
+    def _feed(self):
+        # without the pubsub subscriptions of __init__
+        feed = BboPriceFeed.__new__(BboPriceFeed)
+        feed.order_books, feed.check_last = {}, {}
+        feed.bid_markup = feed.ask_markup = 0.
+        feed.max_quote_age = timedelta(seconds=BboPriceFeed.MAX_QUOTE_AGE)
+        feed.collector, feed.factory, feed.django_channel_group = mock.Mock(), None, None
+        return feed
+
+    def test_lp_that_stops_quoting_leaves_the_bbo(self):
+        feed = self._feed()
+        t0 = datetime(2024, 1, 2, 12)
+
+        def tick(seconds, source, bid, ask):
+            with mock.patch('main.apps.dataprovider.services.collectors.adapters.price_feed.datetime') as dt:
+                dt.utcnow.return_value = t0 + timedelta(seconds=seconds)
+                feed.on_tick(None, {'instrument': 'EURUSD', 'source': source, 'bid': bid, 'bid_size': 1.,
+                                    'ask': ask, 'ask_size': 1.})
+            kwargs = feed.collector.collect.call_args.kwargs
+            return kwargs['bid'], kwargs['ask']
+
+        self.assertEqual((1.10, 1.11), tick(0, 'LP1', 1.10, 1.11))
+        self.assertEqual((1.10, 1.11), tick(1, 'LP2', 1.09, 1.12))
+        # LP1 has been silent for more than MAX_QUOTE_AGE
+        self.assertEqual((1.095, 1.115), tick(7, 'LP2', 1.095, 1.115))
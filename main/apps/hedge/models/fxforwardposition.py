@@ -134,6 +134,15 @@ class FxForwardPosition(TimeStampedModel, FxForwardInstrument):
                                                 delivery_time__gt=current_time,
                                                 )
 
+    @staticmethod
+    def get_forwards_for_accounts(current_time: Date, accounts: Iterable[Account]) -> Sequence['FxForwardPosition']:
+        """ Get the forwards of several accounts, in one query. See get_forwards_for_account. """
+        return FxForwardPosition.objects.filter(Q(unwind_time__isnull=True) | Q(unwind_time__lt=current_time),
+                                                account__in=accounts,
+                                                enter_time__lte=current_time,
+                                                delivery_time__gt=current_time,
+                                                )
+
     @staticmethod
     def get_forwards_for_company(current_time: Date,
                                  company: CompanyTypes,
@@ -1,4 +1,5 @@
 from main.apps.account.services.cashflow_pricer import CashFlowPricerService
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.hedge.models.hedgesettings import HedgeAccountSettings_DB
 from main.apps.hedge.services.hedge_position import HedgePositionService
 from main.apps.hedge.services.pnl import PnLProviderService
@@ -13,13 +14,13 @@ from typing import Optional, Tuple
 class CashPnLAccountHistoryProvider_DB(CashPnLAccountHistoryProvider):
     def __init__(self,
                  settings: HedgeAccountSettings_DB,
-                 cashflow_pricer: CashFlowPricerService = CashFlowPricerService(),
-                 pnl_provider: PnLProviderService() = PnLProviderService(),
-                 hedge_position_service: HedgePositionService = HedgePositionService()):
+                 cashflow_pricer: Optional[CashFlowPricerService] = None,
+                 pnl_provider: Optional[PnLProviderService] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None):
         self._settings = settings
-        self._cashflow_pricer = cashflow_pricer
-        self._pnl_provider = pnl_provider
-        self._hedge_position_service = hedge_position_service
+        self._cashflow_pricer = service_or_default(cashflow_pricer, CashFlowPricerService)
+        self._pnl_provider = service_or_default(pnl_provider, PnLProviderService)
+        self._hedge_position_service = service_or_default(hedge_position_service, HedgePositionService)
 
     def get_pnl_and_initial_exposure(self,
                                      start_date: Optional[Date],
@@ -2,6 +2,7 @@ from abc import ABCMeta, abstractmethod
 
 from django.db import transaction
 
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import CurrencyTypes
 from main.apps.hedge.models import HedgeSettings, CompanyHedgeAction
 from main.apps.hedge.services.account_hedge_request import AccountHedgeRequestService
@@ -82,12 +83,12 @@ class AccountManagerService(AccountManagerInterface):
     """
 
     def __init__(self,
-                 oms_hedge_service: OMSHedgeServiceInterface = OMSHedgeService(),
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService()):
-        self._oms_hedge_service = oms_hedge_service
-        self._hedge_position_service = hedge_position_service
-        self._hedge_request_service = hedge_request_service
+                 oms_hedge_service: Optional[OMSHedgeServiceInterface] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 hedge_request_service: Optional[AccountHedgeRequestService] = None):
+        self._oms_hedge_service = service_or_default(oms_hedge_service, OMSHedgeService)
+        self._hedge_position_service = service_or_default(hedge_position_service, HedgePositionService)
+        self._hedge_request_service = service_or_default(hedge_request_service, AccountHedgeRequestService)
 
 
     def create_account(self,
@@ -365,10 +366,10 @@ class AccountManagerService(AccountManagerInterface):
 
 class BacktestAccountManagerService(AccountManagerService):
     def __init__(self,
-                 oms_hedge_service: OMSHedgeServiceInterface = BacktestOMSHedgeService(),
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService()):
-        super().__init__(oms_hedge_service=oms_hedge_service,
+                 oms_hedge_service: Optional[OMSHedgeServiceInterface] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 hedge_request_service: Optional[AccountHedgeRequestService] = None):
+        super().__init__(oms_hedge_service=service_or_default(oms_hedge_service, BacktestOMSHedgeService),
                          hedge_position_service=hedge_position_service,
                          hedge_request_service=hedge_request_service)
 
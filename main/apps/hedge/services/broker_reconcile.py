@@ -9,6 +9,7 @@ from hdlib.Core.FxPairInterface import FxPairInterface
 from hdlib.DateTime import Date
 from hdlib.Hedge.Fx.Util.FxMarketConventionConverter import SpotFxCache
 
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.account.models import Account, Company
 from main.apps.broker.models import BrokerAccount
 from main.apps.currency.models import FxPair
@@ -144,10 +145,10 @@ class BrokerReconcileService(BrokerReconcileServiceInterface):
     """
 
     def __init__(self,
-                 broker_service: BrokerServiceInterface = BrokerService(),
-                 oms_hedge_service: OMSHedgeServiceInterface = OMSHedgeService()):
-        self._broker_service = broker_service
-        self._oms_hedge_service = oms_hedge_service
+                 broker_service: Optional[BrokerServiceInterface] = None,
+                 oms_hedge_service: Optional[OMSHedgeServiceInterface] = None):
+        self._broker_service = service_or_default(broker_service, BrokerService)
+        self._oms_hedge_service = service_or_default(oms_hedge_service, OMSHedgeService)
 
     def create_company_positions(self, time: Date, company: Company, spot_fx_cache: SpotFxCache) -> CompanyEvent:
         """
@@ -10,6 +10,7 @@ from hdlib.Universe.Universe import Universe
 
 from main.apps.account.models import Company, Currency
 from main.apps.broker.models import Broker
+from main.apps.core.utils.service_registry import get_service, service_or_default
 from main.apps.account.models import Company, Currency, CashFlow, Account, iter_active_cashflows, \
     ParachuteCashFlow
 from main.apps.currency.models import FxPair
@@ -48,26 +49,31 @@ class EodAndIntraService:
 
     def __init__(self,
                  ref_date: Date,
-                 fx_provider: FxSpotProvider = FxSpotProvider(),
-                 margin_provider: MarginProviderServiceInterface = DefaultMarginProviderService(),
-                 oms_hedge_service: OMSHedgeServiceInterface = OMSHedgeService(),
-                 account_manager: AccountManagerInterface = AccountManagerService(),
-                 broker_reconcile_service: BrokerReconcileService = BrokerReconcileService(),
-                 universe_provider_service: UniverseProviderService = UniverseProviderService(),
-                 cost_provider_service: CostProviderService = CostProviderService(),
-                 market_convention_service: FxMarketConventionService = FxMarketConventionService(),
-                 order_service: OrderServiceInterface = OrderService(),
-                 broker_service: BrokerService = BrokerService()):
+                 fx_provider: Optional[FxSpotProvider] = None,
+                 margin_provider: Optional[MarginProviderServiceInterface] = None,
+                 oms_hedge_service: Optional[OMSHedgeServiceInterface] = None,
+                 account_manager: Optional[AccountManagerInterface] = None,
+                 broker_reconcile_service: Optional[BrokerReconcileService] = None,
+                 universe_provider_service: Optional[UniverseProviderService] = None,
+                 cost_provider_service: Optional[CostProviderService] = None,
+                 market_convention_service: Optional[FxMarketConventionService] = None,
+                 order_service: Optional[OrderServiceInterface] = None,
+                 broker_service: Optional[BrokerService] = None):
 
         self._ref_date = Date.to_date(ref_date)  # This must be enforced as an hdlib date
 
-        self._margin_provider = margin_provider
-        self._oms_hedge_service = oms_hedge_service
-        self._account_manager = account_manager
-        self._broker_reconcile_service = broker_reconcile_service
-        self._cost_provider_service = cost_provider_service
-        self._order_service = order_service
-        self._market_convention_service = market_convention_service
+        # Services not supplied are the shared, lazily constructed, instances for this process
+        fx_provider = service_or_default(fx_provider, FxSpotProvider)
+        universe_provider_service = service_or_default(universe_provider_service, UniverseProviderService)
+        broker_service = service_or_default(broker_service, BrokerService)
+
+        self._margin_provider = service_or_default(margin_provider, DefaultMarginProviderService)
+        self._oms_hedge_service = service_or_default(oms_hedge_service, OMSHedgeService)
+        self._account_manager = service_or_default(account_manager, AccountManagerService)
+        self._broker_reconcile_service = service_or_default(broker_reconcile_service, BrokerReconcileService)
+        self._cost_provider_service = service_or_default(cost_provider_service, CostProviderService)
+        self._order_service = service_or_default(order_service, OrderService)
+        self._market_convention_service = service_or_default(market_convention_service, FxMarketConventionService)
 
         try:
             self._spot_cache = fx_provider.get_spot_cache(time=self._ref_date)
@@ -445,8 +451,8 @@ class BacktestEodAndIntraService(EodAndIntraService):
         broker_service = BacktestingBrokerService(order_service)
         broker_reconcile_service = BacktestBrokerReconcileService(broker_service=broker_service,
                                                                   oms_hedge_service=oms_hedge_service)
-        universe_provider_service: UniverseProviderService = UniverseProviderService()
-        cost_provider_service: CostProviderService = CostProviderService()
+        universe_provider_service = get_service(UniverseProviderService)
+        cost_provider_service = get_service(CostProviderService)
 
         margin_provider_service = BacktestMarginProviderService()
         super().__init__(ref_date=ref_date,
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 
 import numpy as np
 import scipy.stats
@@ -15,6 +15,7 @@ from hdlib.Hedge.Fx.HedgeAccount import HedgeAccountSettings
 from hdlib.Hedge.Fx.HedgeAccount import CashExposures
 
 from main.apps.core.utils.cache import redis_func_cache
+from main.apps.core.utils.service_registry import get_service, service_or_default
 from main.apps.currency.models import Currency, FxPair
 from main.apps.hedge.calculators.company_hedge import CompanyHedgeCalculator, AccountPositionsProviderStored, \
     CompanyHedgeCallback
@@ -48,26 +49,27 @@ def caching_make_cntr_currency_universe(
     ref_date: Date,
     bypass_errors: bool = True,
 ):
-    return UniverseProviderService().make_cntr_currency_universe(domestic=domestic,
-                                                                 ref_date=ref_date,
-                                                                 bypass_errors=bypass_errors)
+    return get_service(UniverseProviderService).make_cntr_currency_universe(domestic=domestic,
+                                                                            ref_date=ref_date,
+                                                                            bypass_errors=bypass_errors)
 
 
 class CompanyHedgerFactory(object):
     def __init__(self,
-                 fx_market_convention_service: FxMarketConventionService = FxMarketConventionService(),
-                 cashflow_provider: CashFlowProviderInterface = CashFlowProviderService(),
-                 margin_provider: MarginProviderService = DefaultMarginProviderService(),
-                 universe_provider_service: UniverseProviderService = UniverseProviderService(),
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 cost_provider: CostProviderService = CostProviderService()
+                 fx_market_convention_service: Optional[FxMarketConventionService] = None,
+                 cashflow_provider: Optional[CashFlowProviderInterface] = None,
+                 margin_provider: Optional[MarginProviderService] = None,
+                 universe_provider_service: Optional[UniverseProviderService] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 cost_provider: Optional[CostProviderService] = None
                  ):
-        self._fx_market_convention_service = fx_market_convention_service
-        self._cashflow_provider = cashflow_provider
-        self._margin_provider = margin_provider
-        self._universe_provider_service = universe_provider_service
-        self._hedge_position_service = hedge_position_service
-        self._cost_provider = cost_provider
+        self._fx_market_convention_service = service_or_default(fx_market_convention_service,
+                                                                FxMarketConventionService)
+        self._cashflow_provider = service_or_default(cashflow_provider, CashFlowProviderService)
+        self._margin_provider = service_or_default(margin_provider, DefaultMarginProviderService)
+        self._universe_provider_service = service_or_default(universe_provider_service, UniverseProviderService)
+        self._hedge_position_service = service_or_default(hedge_position_service, HedgePositionService)
+        self._cost_provider = service_or_default(cost_provider, CostProviderService)
 
     def create(self,
                company: Company,
@@ -5,6 +5,7 @@ import numpy as np
 import pandas as pd
 
 from hdlib.Core.FxPairInterface import FxPairInterface
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models.fxpair import FxPair
 from main.apps.account.models import CompanyTypes, Account
 from main.apps.broker.models import BrokerAccount
@@ -117,16 +118,17 @@ class OMSHedgeService(OMSHedgeServiceInterface):
     """
 
     def __init__(self,
-                 reconcilation: Reconciliation = Reconciliation(),
-                 account_hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService(),
-                 calendar_service: CalendarService = CalendarService(),
-                 convention_service: FxMarketConventionService = FxMarketConventionService(),
-                 order_service: OrderServiceInterface = OrderService()):
-        self._reconciliation = reconcilation
-        self._account_hedge_request_service = account_hedge_request_service
-        self._calendar_service = calendar_service
-        self._convention_service = convention_service
-        self._order_service = order_service
+                 reconcilation: Optional[Reconciliation] = None,
+                 account_hedge_request_service: Optional[AccountHedgeRequestService] = None,
+                 calendar_service: Optional[CalendarService] = None,
+                 convention_service: Optional[FxMarketConventionService] = None,
+                 order_service: Optional[OrderServiceInterface] = None):
+        self._reconciliation = service_or_default(reconcilation, Reconciliation)
+        self._account_hedge_request_service = service_or_default(account_hedge_request_service,
+                                                                 AccountHedgeRequestService)
+        self._calendar_service = service_or_default(calendar_service, CalendarService)
+        self._convention_service = service_or_default(convention_service, FxMarketConventionService)
+        self._order_service = service_or_default(order_service, OrderService)
 
     # All types of hedgable accounts.
     hedgeable_account_types = (Account.AccountType.LIVE, Account.AccountType.DEMO)
@@ -408,15 +410,15 @@ class OMSHedgeService(OMSHedgeServiceInterface):
 class BacktestOMSHedgeService(OMSHedgeService):
 
     def __init__(self,
-                 reconcilation: Reconciliation = Reconciliation(),
-                 account_hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService(),
-                 calendar_service: CalendarService = CalendarService(),
-                 convention_service: FxMarketConventionService = FxMarketConventionService(),
-                 order_service: OrderServiceInterface = BacktestOrderService()):
+                 reconcilation: Optional[Reconciliation] = None,
+                 account_hedge_request_service: Optional[AccountHedgeRequestService] = None,
+                 calendar_service: Optional[CalendarService] = None,
+                 convention_service: Optional[FxMarketConventionService] = None,
+                 order_service: Optional[OrderServiceInterface] = None):
         super().__init__(reconcilation=reconcilation,
                          account_hedge_request_service=account_hedge_request_service,
                          calendar_service=calendar_service,
                          convention_service=convention_service,
-                         order_service=order_service)
+                         order_service=service_or_default(order_service, BacktestOrderService))
 
 
@@ -1,4 +1,4 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterable, Sequence
 
 import numpy as np
 import scipy.stats
@@ -144,6 +144,24 @@ class ParachuteMonth:
         """ Get the net exposure for a specific Fx pair, including the value of rolled-off cashflows. """
         return self._fx_buckets_net_exposure.get(fx_pair, 0.)
 
+    @property
+    def fx_net_exposures(self) -> Dict[FxPairInterface, float]:
+        """ Net cashflow, forward and spot exposure per Fx pair, see get_fx_exposure. """
+        return self._fx_buckets_net_exposure
+
+    @property
+    def fx_cashflow_exposures(self) -> Dict[FxPairInterface, float]:
+        """ Cashflow exposure (amounts of the cashflows that did not roll off) per Fx pair. """
+        return self._fx_bucket_cashflow_exposure
+
+    @property
+    def fx_forward_amounts(self) -> Dict[FxPairInterface, float]:
+        return self._fx_buckets_forward_amounts
+
+    @property
+    def allow_unwind(self) -> bool:
+        return self._allow_unwind
+
     @property
     def initial_sum_abs_npv(self) -> float:
         """ Get the initial sum of the absolute NPVs of the cashflows, in domestic. """
@@ -215,60 +233,6 @@ class ParachuteMonth:
             if np.isnan(spot):
                 raise RuntimeError(f"Fx spot vol for {fx_pair} is NaN")
 
-    def get_fractional_hedge(self, fraction: float) -> Tuple[Dict[FxPairInterface, float], float]:
-        """
-        Given a hedge fraction in the range [0, 1], return the futures position needed to hedge the remaining exposure
-        by that amount.
-        """
-        logger.debug(f"Getting hedge for fraction {fraction}, allow unwind = {self._allow_unwind}.")
-
-        if fraction <= 0:
-            fraction = 0.
-
-        # At most, we fully hedge, or fully unwind.
-        if 1. < fraction:
-            fraction = 1.
-        if fraction < -1.:
-            fraction = -1.
-
-        sub_abs_remaining = 0.
-        hedge = {}
-
-        if self._allow_unwind:
-            # Hedging against the exposures instead of the residual exposures, minus the forwards, allows us to unwind
-            # forwards as well as take out new forwards. This is important for the case where we are hedging a bucket
-            # where (as will commonly happen, at least in the most general case) not all cashflows roll off on the same
-            # pay date. Currently, we target a particular date, the end of the month, for forwards, so we can net. But as
-            # cashflows roll off, this actually leaves us directional, via holding the forwards. This is not a problem in
-            # and of itself, but we need to carry through with the general parachute logic, and hedge (in this case,
-            # by unwinding forwards) when we have too high a probability of breaching.
-            for fx, exposure in self._fx_buckets_net_exposure.items():
-                hedge[fx] = fraction * exposure
-                logger.debug(f"  >> {fx} exposure = {exposure}, hedge = {hedge[fx]}.")
-                # This won't mean the exact same thing as in the no-unwinding case, but we do have to return this to
-                # keep the logic consistent, and to let the caller known how much hedgeable exposure is remaining.
-                sub_abs_remaining += np.abs(exposure)
-        else:
-            # If not allowed to unwind forwards, we hedge against the residual exposures, i.e. the cashflow exposures
-            # minus the forwards. We make sure we never take out a position larger than the residual exposure, and
-            # cannot unwind forwards.
-            for fx, amount in self._fx_bucket_cashflow_exposure.items():
-                current_fwd_amount = self._fx_buckets_forward_amounts.get(fx, 0.)
-
-                # Note that forward amount will be in the opposite direction of the exposure.
-                sg = np.sign(amount)
-                # Here, we are not allowing forwards positions to be larger than the Fx exposure
-                # (but in the opposite direction).
-                remainder = sg * np.maximum(0., sg * (amount + current_fwd_amount))
-
-                logger.debug(f"  >> {fx} exposure = {amount}, current fwd amount = {current_fwd_amount}, "
-                             f"remainder = {remainder}.")
-
-                sub_abs_remaining += np.abs(remainder)
-                hedge[fx] = fraction * remainder
-
-        return hedge, sub_abs_remaining
-
     def get_fwd_point_data(self, universe: Universe, fx_pair: FxPairInterface):
         last_of_month = Date.create(year=self._year, month=self._month, day=1).last_day_of_month()
         fwd_price = universe.get_forward(fx_pair=fx_pair, date=last_of_month)
@@ -369,151 +333,304 @@ class ParachuteMonth:
             return universe.get_forward(fx_pair=forward.fxpair, date=delivery)
 
 
-def bucket_account_cashflows(hedge_time: Date,
-                             account: Account,
-                             buckets: Dict[Tuple[int, int], ParachuteMonth]) -> bool:
-    # Note that since there is only one account, there will be just one event in the "events" set.
-    positions, events = FxPosition.get_positions_for_accounts(time=hedge_time,
-                                                              accounts=[account])
-    had_spot = 0 < len(positions)
-
-    # Group positions by Fx.
-    positions_by_fx = {}
-    for position in positions:
-        positions_by_fx.setdefault(position.fxpair, []).append(position)
-
-    logger.debug(f"Found {len(positions)} positions for account {account}.")
+class ParachuteCompanyExposures:
+    """
+    Dense (account x month x Fx pair) view of the exposures of the parachute buckets of a company, so that the spot
+    allocation and the fractional hedges of all the buckets are computed at once, rather than pair by pair and bucket
+    by bucket.
+    """
 
-    # Get all FX from all buckets and positions.
-    fx_pairs = set()
-    for key, bucket in buckets.items():
-        fx_pairs.update(bucket.get_all_fx_pairs())  # All Fx pairs from buckets.
-    for fx_pair, positions in positions_by_fx.items():
-        fx_pairs.add(fx_pair)  # All Fx pairs from positions.
-
-    # Bucket the positions by month.
-    for fx_pair in fx_pairs:
-        position = positions_by_fx.get(fx_pair, None)
-        # TODO(Nate): There is a bug here - position is a list of positions, not a single position.
-        spot_fx_amount = 0. if position is None else position.amount
-
-        # Sum up all the exposures in this currency for all buckets, and track the net positive and negative exposures
-        # separately.
-        net_fx_exposure, abs_positive_exposure, abs_negative_exposure = 0., 0., 0.
-        for key, bucket in buckets.items():
-            exposure = bucket.get_fx_exposure(fx_pair)
-            net_fx_exposure += exposure
-            if 0. < exposure:
-                abs_positive_exposure += exposure
-            else:
-                abs_negative_exposure -= exposure
+    def __init__(self, buckets_by_account: Dict[Account, Dict[Tuple[int, int], ParachuteMonth]]):
+        self.accounts = list(buckets_by_account.keys())
+        self.months = sorted({key for buckets in buckets_by_account.values() for key in buckets.keys()})
+
+        fx_pairs = set()
+        for buckets in buckets_by_account.values():
+            for bucket in buckets.values():
+                fx_pairs.update(bucket.fx_net_exposures.keys())
+                fx_pairs.update(bucket.fx_cashflow_exposures.keys())
+        self.fx_pairs = sorted(fx_pairs, key=str)
+
+        self._account_index = {account: i for i, account in enumerate(self.accounts)}
+        self._month_index = {key: i for i, key in enumerate(self.months)}
+        self._fx_index = {fx_pair: i for i, fx_pair in enumerate(self.fx_pairs)}
+
+        shape = (len(self.accounts), len(self.months), len(self.fx_pairs))
+        # Net exposure of each bucket per Fx pair, and which (bucket, Fx pair) the bucket has an exposure for.
+        self.net_exposures = np.zeros(shape)
+        self.has_net_exposure = np.zeros(shape, dtype=bool)
+        # Cashflow exposure and forward amounts of each bucket per Fx pair, for buckets that can't unwind forwards.
+        self.cashflow_exposures = np.zeros(shape)
+        self.has_cashflow_exposure = np.zeros(shape, dtype=bool)
+        self.forward_amounts = np.zeros(shape)
+        # Buckets that can unwind forwards.
+        self.allow_unwind = np.ones(shape[:2], dtype=bool)
+
+        for account, buckets in buckets_by_account.items():
+            a = self._account_index[account]
+            for key, bucket in buckets.items():
+                m = self._month_index[key]
+                self.allow_unwind[a, m] = bucket.allow_unwind
+                for fx_pair, exposure in bucket.fx_net_exposures.items():
+                    self.net_exposures[a, m, self._fx_index[fx_pair]] = exposure
+                    self.has_net_exposure[a, m, self._fx_index[fx_pair]] = True
+                for fx_pair, amount in bucket.fx_cashflow_exposures.items():
+                    self.cashflow_exposures[a, m, self._fx_index[fx_pair]] = amount
+                    self.has_cashflow_exposure[a, m, self._fx_index[fx_pair]] = True
+                for fx_pair, amount in (bucket.fx_forward_amounts or {}).items():
+                    if fx_pair in self._fx_index:
+                        self.forward_amounts[a, m, self._fx_index[fx_pair]] = amount
+
+    def index(self, account: Account, key: Tuple[int, int]) -> Tuple[int, int]:
+        return self._account_index[account], self._month_index[key]
+
+    def spot_array(self, positions_by_account: Dict[Account, Dict[FxPairInterface, float]]) -> np.ndarray:
+        """ The (account x Fx pair) array of spot positions. """
+        spot = np.zeros((len(self.accounts), len(self.fx_pairs)))
+        for account, positions in positions_by_account.items():
+            if account not in self._account_index:
+                continue
+            for fx_pair, amount in positions.items():
+                if fx_pair in self._fx_index:
+                    spot[self._account_index[account], self._fx_index[fx_pair]] += amount
+        return spot
 
-        # Presumably, the spot position should be smaller in magnitude, and in the opposite direction of the net
-        # exposure. If not, we have over-hedged.
-        if np.sign(spot_fx_amount) == np.sign(net_fx_exposure):
-            logger.warning(
-                f"For {fx_pair}, the spot position ({spot_fx_amount}) is in the same direction as the net exposure.")
-        if np.abs(spot_fx_amount) > np.abs(net_fx_exposure):
-            logger.warning(f"For {fx_pair}, the spot position ({spot_fx_amount}) is larger than the net exposure.")
+    @staticmethod
+    def allocate_spot(exposures: np.ndarray, spot: np.ndarray) -> np.ndarray:
+        """
+        Allocate the spot position of each account and Fx pair to the month buckets of the account.
+
+        Rule for allocating spot positions:
+        - If the exposure of a bucket is 0, nothing is allocated to it.
+        - If the spot position is in the same direction as the net exposure (i.e. we have over-hedged), every bucket
+            gets perfectly spot hedged.
+        - Otherwise, the fraction of the exposure of a bucket that does *not* get hedged is proportional to the ratio
+            of its exposure to the total exposure in the same direction.
+
+        :param exposures: The (account x month x Fx pair) net exposures of the buckets
+        :param spot: The (account x Fx pair) spot positions
+        :return: The (account x month x Fx pair) spot positions attributed to the buckets
+        """
+        net_exposure = exposures.sum(axis=1)
+        abs_positive_exposure = np.where(0. < exposures, exposures, 0.).sum(axis=1)
+        abs_negative_exposure = -np.where(0. < exposures, 0., exposures).sum(axis=1)
 
         # True net exposure: net exposure from cashflows and forwards PLUS exposure from spot.
-        total_exposure = net_fx_exposure + spot_fx_amount
-        logger.debug(
-            f"Total exposure for {fx_pair} is {total_exposure} (cashflow + forward exposure {net_fx_exposure}, "
-            f"spot exposure {spot_fx_amount}).")
-
-        # Rule for allocating spot positions:
-        # - If the net exposure is 0, we don't need to do anything.
-        # - If your exposure is in the opposite direction of the spot exposure, you get perfectly spot hedged (since
-        #       there will always be enough exposure in the opposite direction from other buckets to offset you)
-        # - If your exposure is in the same direction as the net exposure, the fraction of your exposure that you will
-        #       *not* get hedged is proportional to the ratio of your exposure to the total exposure in the same
-        #       direction.
-
-        # Allocate the spot position to each bucket, in proportion to the net exposure.
-        net_spot_position = 0.
-        for key, bucket in buckets.items():
-            # For type hinting.
-            bucket: ParachuteMonth
-            exposure = bucket.get_fx_exposure(fx_pair)
+        total_exposure = net_exposure + spot
+        same_direction = np.sign(spot) == np.sign(net_exposure)
+
+        same_side_exposure = np.where(0. < exposures, abs_positive_exposure[:, None, :],
+                                      abs_negative_exposure[:, None, :])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(same_side_exposure != 0, exposures / same_side_exposure, 0.)
+        bucket_fx_amount = np.where(same_direction[:, None, :], exposures,
+                                    exposures + fraction * total_exposure[:, None, :])
+        return np.where(exposures != 0, -bucket_fx_amount, 0.)
+
+    def fractional_hedges(self, fractions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The hedges of every bucket, given the (account x month) hedge fractions in [0, 1]: the futures positions that
+        hedge that fraction of the bucket's remaining exposure.
 
-            # If the net exposure is 0, we don't need to do anything.
-            if exposure == 0:
-                continue
+        :return: The (account x month x Fx pair) hedges and the (account x month) sums of the absolute remaining
+            exposures
+        """
+        # At most, we fully hedge.
+        fractions = np.clip(fractions, 0., 1.)
 
-            # If your exposure is in the same direction of the net exposure, you get perfectly spot hedged (since
-            # there will always be enough exposure in the opposite direction from other buckets to offset you)
-            if np.sign(spot_fx_amount) == np.sign(net_fx_exposure):
-                net_spot_position -= exposure
-                bucket.add_fx_spot(fx_pair=fx_pair, amount=-exposure)
-            # If your exposure is in the same direction as the spot exposure, the fraction of your exposure that you
-            # will *not* get hedged is proportional to the ratio of your exposure to the total exposure in the same
-            # direction.
-            else:
-                fraction = exposure / abs_positive_exposure if 0. < exposure else exposure / abs_negative_exposure
-                bucket_fx_amount = exposure + fraction * total_exposure
-                net_spot_position -= bucket_fx_amount
-                bucket.add_fx_spot(fx_pair=fx_pair, amount=-bucket_fx_amount)
+        # Buckets that can unwind forwards hedge against their exposures, the others against their residual exposures
+        # (the cashflow exposures minus the forwards), never taking out a position larger than the residual exposure.
+        sg = np.sign(self.cashflow_exposures)
+        residual = sg * np.maximum(0., sg * (self.cashflow_exposures + self.forward_amounts))
 
-        logger.debug(
-            f"Net spot position for {fx_pair} is {net_spot_position}, compared to the expected {spot_fx_amount}.")
-    # There were spot positions.
-    return had_spot
+        unwind = self.allow_unwind[:, :, None]
+        remaining = np.where(unwind, self.net_exposures, residual)
+        mask = np.where(unwind, self.has_net_exposure, self.has_cashflow_exposure)
 
+        hedges = np.where(mask, fractions[:, :, None] * remaining, 0.)
+        sum_abs_remaining = np.where(mask, np.abs(remaining), 0.).sum(axis=2)
+        return hedges, sum_abs_remaining
 
-def hedge_parachute_account(account: Account, hedge_time: Date, company_hedge_action: CompanyHedgeAction,
-                            universe: Universe, currency: Currency):
-    # Get the parachute account data.
-    data = ParachuteData.get_for_account(account)
-    if not data:
-        logger.error(f"Could not find parachute data for account {account}. Cannot do parachute hedge.")
-        return
-    lower_limit = data.lower_limit
+    def bucket_hedge(self, hedges: np.ndarray, account: Account, key: Tuple[int, int]) -> Dict[FxPairInterface, float]:
+        """ The hedge of one bucket, by Fx pair. """
+        a, m = self.index(account, key)
+        mask = self.has_net_exposure[a, m] if self.allow_unwind[a, m] else self.has_cashflow_exposure[a, m]
+        return {fx_pair: hedges[a, m, p] for p, fx_pair in enumerate(self.fx_pairs) if mask[p]}
 
-    company_config = ParachuteForwardConfiguration.create_company_parachute_forward_configuration(
-        company=account.company)
 
-    # Get all cashflows for the parachute account, bucket by month.
-    start_time = hedge_time.first_day_of_month()
-    cashflows = ParachuteCashFlow.get_account_cashflows(ref_date=hedge_time, account=account, include_rolled_off=True,
-                                                        start_pay_date=start_time)
+def _bucket_account(account: Account, data: ParachuteData, currency: Currency,
+                    cashflows: Iterable[ParachuteCashFlow],
+                    forwards: Iterable[FxForwardPosition]) -> Dict[Tuple[int, int], ParachuteMonth]:
+    # Bucket the cashflows and forwards of the parachute account by month.
+    lower_limit = data.lower_limit
     buckets = {}
     for cashflow in cashflows:
         key = (cashflow.pay_date.year, cashflow.pay_date.month)
         buckets.setdefault(key, ParachuteMonth(domestic=currency, year=key[0], month=key[1],
                                                parachute_threshold=lower_limit)).add_cashflow(cashflow)
 
-    # Get all forwards for the parachute account, bucket by month.
-    forwards = FxForwardPosition.get_forwards_for_account(current_time=hedge_time, account=account)
     logger.debug(f"Found {len(forwards)} forwards for account {account}.")
     for forward in forwards:
         key = (forward.delivery_time.year, forward.delivery_time.month)
         buckets.setdefault(key, ParachuteMonth(domestic=currency, year=key[0], month=key[1],
                                                parachute_threshold=lower_limit)).add_forward(forward)
+    return buckets
 
+
+def _compute_buckets(account: Account, buckets: Dict[Tuple[int, int], ParachuteMonth], universe: Universe) -> bool:
     try:
         for key, bucket in buckets.items():
             bucket.compute(universe=universe)
     except Exception as ex:
-        logger.error(f"Could not compute buckets, cannot do parachute hedge. Error: {ex}")
+        logger.error(f"Could not compute buckets of account {account}, cannot do parachute hedge. Error: {ex}")
+        return False
+    return True
+
+
+def attribute_spot_positions(hedge_time: Date,
+                             buckets_by_account: Dict[Account, Dict[Tuple[int, int], ParachuteMonth]],
+                             exposures: ParachuteCompanyExposures) -> bool:
+    """
+    Attribute the spot positions of the accounts to their buckets, see ParachuteCompanyExposures.allocate_spot.
+    Returns whether there were spot positions.
+    """
+    positions, events = FxPosition.get_positions_for_accounts(time=hedge_time, accounts=exposures.accounts)
+    accounts = {account.pk: account for account in exposures.accounts}
+    positions_by_account = {}
+    for position in positions:
+        account = accounts.get(position.account_id)
+        if account is not None:
+            positions_by_account.setdefault(account, {}).setdefault(position.fxpair, 0.)
+            positions_by_account[account][position.fxpair] += position.amount
+    if not positions_by_account:
+        return False
+
+    spot = exposures.spot_array(positions_by_account)
+    net_exposure = exposures.net_exposures.sum(axis=1)
+    for a, p in zip(*np.nonzero(np.sign(spot) == np.sign(net_exposure))):
+        logger.warning(f"For {exposures.fx_pairs[p]}, the spot position ({spot[a, p]}) of account "
+                       f"{exposures.accounts[a]} is in the same direction as the net exposure.")
+    for a, p in zip(*np.nonzero(np.abs(spot) > np.abs(net_exposure))):
+        logger.warning(f"For {exposures.fx_pairs[p]}, the spot position ({spot[a, p]}) of account "
+                       f"{exposures.accounts[a]} is larger than the net exposure.")
+
+    attributed = exposures.allocate_spot(exposures.net_exposures, spot)
+    for account, buckets in buckets_by_account.items():
+        for key, bucket in buckets.items():
+            a, m = exposures.index(account, key)
+            for p in np.nonzero(attributed[a, m])[0]:
+                bucket.add_fx_spot(fx_pair=exposures.fx_pairs[p], amount=attributed[a, m, p])
+    return True
+
+
+def hedge_parachute_accounts(accounts: Sequence[Account], hedge_time: Date,
+                             company_hedge_action: CompanyHedgeAction, universe: Universe, currency: Currency):
+    """
+    Run the parachute hedge of several accounts of a company. The data, cashflows and forwards of all the accounts
+    are loaded at once, and the spot allocation and hedges of all their buckets are computed at once (see
+    ParachuteCompanyExposures). The results of each account are the same as when hedging it on its own.
+    """
+    if not accounts:
         return
+    company = accounts[0].company
+
+    data_by_account = ParachuteData.get_for_accounts(accounts)
+
+    # Get all cashflows and forwards for the parachute accounts.
+    start_time = hedge_time.first_day_of_month()
+    cashflows_by_account, forwards_by_account = {}, {}
+    for cashflow in ParachuteCashFlow.get_accounts_cashflows(ref_date=hedge_time, accounts=accounts,
+                                                             include_rolled_off=True, start_pay_date=start_time):
+        cashflows_by_account.setdefault(cashflow.account_id, []).append(cashflow)
+    for forward in FxForwardPosition.get_forwards_for_accounts(current_time=hedge_time, accounts=accounts):
+        forwards_by_account.setdefault(forward.account_id, []).append(forward)
+
+    buckets_by_account = {}
+    for account in accounts:
+        data = data_by_account.get(account.pk)
+        if not data:
+            logger.error(f"Could not find parachute data for account {account}. Cannot do parachute hedge.")
+            continue
+        buckets = _bucket_account(account=account, data=data, currency=currency,
+                                  cashflows=cashflows_by_account.get(account.pk, []),
+                                  forwards=forwards_by_account.get(account.pk, []))
+        if _compute_buckets(account=account, buckets=buckets, universe=universe):
+            buckets_by_account[account] = buckets
+    if not buckets_by_account:
+        return
+
+    exposures = ParachuteCompanyExposures(buckets_by_account)
 
     # NOTE(Nate): For now, we are hard-coding-off having spot work with parachute accounts.
     handle_fx_spot = False
     if handle_fx_spot:
         # In cases like hard limits, there may be spot positions. We don't want to over-hedge, so we need to assign spot
         # positions to each bucket, and hedge in the presence of the buckets.
-        had_spot = bucket_account_cashflows(account=account, hedge_time=hedge_time, buckets=buckets)
+        had_spot = attribute_spot_positions(hedge_time=hedge_time, buckets_by_account=buckets_by_account,
+                                            exposures=exposures)
         if had_spot:
             # The buckets now contain their spot positions.
             # Recompute buckets.
-            try:
-                for key, bucket in buckets.items():
-                    bucket.compute(universe=universe)
-            except Exception as ex:
-                logger.error(f"Could not compute buckets, cannot do parachute hedge. Error: {ex}")
-                return
+            for account in list(buckets_by_account.keys()):
+                if not _compute_buckets(account=account, buckets=buckets_by_account[account], universe=universe):
+                    del buckets_by_account[account]
+            exposures = ParachuteCompanyExposures(buckets_by_account)
+
+    company_config = ParachuteForwardConfiguration.create_company_parachute_forward_configuration(company=company)
+
+    # The sums of the absolute remaining exposures do not depend on the hedge fractions.
+    _, sum_abs_remaining = exposures.fractional_hedges(np.zeros(exposures.allow_unwind.shape))
+
+    # Create the records of all the buckets, and find their hedge fractions.
+    fractions = np.zeros(exposures.allow_unwind.shape)
+    records = []
+    for account, buckets in buckets_by_account.items():
+        for key, bucket, record, fraction in _record_account_buckets(account=account,
+                                                                     buckets=buckets,
+                                                                     data=data_by_account[account.pk],
+                                                                     exposures=exposures,
+                                                                     sum_abs_remaining=sum_abs_remaining,
+                                                                     hedge_time=hedge_time,
+                                                                     company_hedge_action=company_hedge_action,
+                                                                     universe=universe,
+                                                                     currency=currency):
+            fractions[exposures.index(account, key)] = fraction
+            records.append((account, key, bucket, record, fraction))
+
+    # Calculate the necessary hedges (maybe none).
+    hedges, _ = exposures.fractional_hedges(fractions)
+
+    for account, key, bucket, record, fraction in records:
+        if 0. < fraction:
+            _take_out_forwards(account=account,
+                               bucket=bucket,
+                               needed_hedge=exposures.bucket_hedge(hedges, account=account, key=key),
+                               company_config=company_config,
+                               hedge_time=hedge_time,
+                               universe=universe,
+                               currency=currency)
+        record.save()
+
 
+def hedge_parachute_account(account: Account, hedge_time: Date, company_hedge_action: CompanyHedgeAction,
+                            universe: Universe, currency: Currency):
+    hedge_parachute_accounts(accounts=[account], hedge_time=hedge_time, company_hedge_action=company_hedge_action,
+                             universe=universe, currency=currency)
+
+
+def _record_account_buckets(account: Account,
+                            buckets: Dict[Tuple[int, int], ParachuteMonth],
+                            data: ParachuteData,
+                            exposures: ParachuteCompanyExposures,
+                            sum_abs_remaining: np.ndarray,
+                            hedge_time: Date,
+                            company_hedge_action: CompanyHedgeAction,
+                            universe: Universe,
+                            currency: Currency):
+    """
+    Set the spot positions of the buckets of an account and create their parachute records, yields
+    (key, bucket, record, fraction to hedge) for each bucket.
+    """
     # Find all positions from last time. Collect all Fx pairs for positions that were not set to 0. These are the
     # Fx pairs for which we need to create a ParachuteSpotPosition with amount 0 if they do not have an amount.
     last_spot_positions = ParachuteSpotPositions.get_all_last_records(parachute_account=account, time=hedge_time)
@@ -644,12 +761,6 @@ def hedge_parachute_account(account: Account, hedge_time: Date, company_hedge_ac
             logger.debug(f"Locking lower limit for bucket ({bucket.year}, {bucket.month}).")
             fraction = 1.
 
-        # Calculate the necessary hedge (maybe none) and the sum of the absolute remaining exposures in each currency.
-        needed_hedge, sum_abs_remaining = bucket.get_fractional_hedge(fraction)
-
-        if sum_abs_remaining == 0:
-            pass
-
         # Fill in some data.
         record.cashflows_npv = bucket.cashflows_npv
         record.forwards_pnl = bucket.forwards_pnl
@@ -658,55 +769,57 @@ def hedge_parachute_account(account: Account, hedge_time: Date, company_hedge_ac
         record.p_no_breach = p
         record.time_horizon = time_horizon
         record.fraction_to_hedge = fraction
-        record.sum_abs_remaining = sum_abs_remaining
+        record.sum_abs_remaining = sum_abs_remaining[exposures.index(account, key)]
         record.max_pnl = max(last_record.max_pnl, account_pnl) if last_record else 0.
         record.save()
 
-        if 0. < fraction:
-            for fx_pair, amount in needed_hedge.items():
-                if amount != 0:
-                    # The amount is the amount *in domestic* of the hedge. We have to convert it to the base currency.
-                    fwd_amount = universe.convert_value(value=amount, from_currency=currency,
-                                                        to_currency=fx_pair.get_base_currency())
-
-                    representative_time, fwd_price = bucket.get_fwd_point_data(universe, fx_pair=fx_pair)
-
-                    # Round or otherwise normalize the order size.
-                    config = company_config.get_data_for_fxpair(fxpair=fx_pair)
-
-                    if config is None:
-                        # TODO: Decide what config = None means, e.g. it could mean "you are not allowed to trade this pair."
-                        #   This is what I intend it to mean, that way you can control which forwards a company can trade.
-                        logger.warning(
-                            f"No forward configuration for {fx_pair}, not trading (requested order size was {fwd_amount}).")
-                        continue
-                    else:
-                        min_amount, do_multiples = config
-                        if do_multiples:
-                            # Round towards zero.
-                            normalized_amount = np.fix(fwd_amount / 1000) * 1000
-                        else:
-                            normalized_amount = 0. if np.abs(fwd_amount) < min_amount else fwd_amount
-                    logger.debug(f"Raw forward amount was {fwd_amount}, normalized amount was {normalized_amount}.")
-
-                    if normalized_amount != 0:
-                        # TODO: Use forward order service.
-                        forward = FxForwardPosition.add_forward_to_account(account=account,
-                                                                           fxpair=fx_pair,
-                                                                           enter_time=hedge_time,
-                                                                           delivery_time=representative_time,
-                                                                           amount=-normalized_amount,
-                                                                           forward_price=fwd_price,
-                                                                           spot_price=universe.get_spot(
-                                                                               fx_pair=fx_pair))
-                        logger.debug(
-                            f"  >> Taking out a {forward.fxpair} forward for {forward.amount} at price "
-                            f"{forward.forward_price}")
-                    else:
-                        logger.debug(
-                            f"  >> Not taking out a forward for {fx_pair} since the rounded amount is too small.")
+        yield key, bucket, record, fraction
 
-        record.save()
+
+def _take_out_forwards(account: Account, bucket: ParachuteMonth, needed_hedge: Dict[FxPairInterface, float],
+                       company_config, hedge_time: Date, universe: Universe, currency: Currency):
+    for fx_pair, amount in needed_hedge.items():
+        if amount != 0:
+            # The amount is the amount *in domestic* of the hedge. We have to convert it to the base currency.
+            fwd_amount = universe.convert_value(value=amount, from_currency=currency,
+                                                to_currency=fx_pair.get_base_currency())
+
+            representative_time, fwd_price = bucket.get_fwd_point_data(universe, fx_pair=fx_pair)
+
+            # Round or otherwise normalize the order size.
+            config = company_config.get_data_for_fxpair(fxpair=fx_pair)
+
+            if config is None:
+                # TODO: Decide what config = None means, e.g. it could mean "you are not allowed to trade this pair."
+                #   This is what I intend it to mean, that way you can control which forwards a company can trade.
+                logger.warning(
+                    f"No forward configuration for {fx_pair}, not trading (requested order size was {fwd_amount}).")
+                continue
+            else:
+                min_amount, do_multiples = config
+                if do_multiples:
+                    # Round towards zero.
+                    normalized_amount = np.fix(fwd_amount / 1000) * 1000
+                else:
+                    normalized_amount = 0. if np.abs(fwd_amount) < min_amount else fwd_amount
+            logger.debug(f"Raw forward amount was {fwd_amount}, normalized amount was {normalized_amount}.")
+
+            if normalized_amount != 0:
+                # TODO: Use forward order service.
+                forward = FxForwardPosition.add_forward_to_account(account=account,
+                                                                   fxpair=fx_pair,
+                                                                   enter_time=hedge_time,
+                                                                   delivery_time=representative_time,
+                                                                   amount=-normalized_amount,
+                                                                   forward_price=fwd_price,
+                                                                   spot_price=universe.get_spot(
+                                                                       fx_pair=fx_pair))
+                logger.debug(
+                    f"  >> Taking out a {forward.fxpair} forward for {forward.amount} at price "
+                    f"{forward.forward_price}")
+            else:
+                logger.debug(
+                    f"  >> Not taking out a forward for {fx_pair} since the rounded amount is too small.")
 
 
 def _set_position(fx_pair, amount, account: Account, hedge_time: Date, company_hedge_action: CompanyHedgeAction,
@@ -807,7 +920,5 @@ def hedge_parachute(hedge_time: Date, company_hedge_action: CompanyHedgeAction,
         logger.debug(f"No parachute accounts for company {company}.")
         return
 
-    for account in parachute_accounts:
-        logger.debug(f"Hedging parachute account {account}.")
-        hedge_parachute_account(account=account, hedge_time=hedge_time, company_hedge_action=company_hedge_action,
-                                universe=universe, currency=currency)
+    hedge_parachute_accounts(accounts=list(parachute_accounts), hedge_time=hedge_time,
+                             company_hedge_action=company_hedge_action, universe=universe, currency=currency)
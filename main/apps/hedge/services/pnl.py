@@ -4,6 +4,7 @@ from typing import Optional, Sequence, Tuple, Iterable, Dict
 import numpy as np
 from hdlib.Universe.Universe import Universe
 
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import FxPair, FxPairName, Currency
 from main.apps.hedge.models import FxPosition, AccountHedgeRequest
 from main.apps.account.models.account import Account, AccountTypes
@@ -66,11 +67,11 @@ class PnLProviderService(object):
     """
 
     def __init__(self,
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider(),
-                 universe_provider: UniverseProviderService = UniverseProviderService()):
-        self._fx_spot_provider = fx_spot_provider
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 universe_provider: Optional[UniverseProviderService] = None):
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
         self._pnl_calculator = FxPnLCalculator()
-        self._universe_provider = universe_provider
+        self._universe_provider = service_or_default(universe_provider, UniverseProviderService)
 
     def get_hedge_position_value(self,
                                  account: Optional[AccountTypes] = None,
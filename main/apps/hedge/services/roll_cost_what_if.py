@@ -3,6 +3,7 @@ from hdlib.DateTime.Date import Date
 from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache
 from hdlib.Core.FxPair import FxPair as FxPairHDL
 
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.account.models import Account, CashFlow, iter_active_cashflows
 from main.apps.account.models.company import Company
 from main.apps.hedge.calculators.cost import RollCostCalculator, StandardRollCostCalculator
@@ -40,13 +41,13 @@ class RollCostWhatIfService(object):
     dc = DayCounter_HD()  # TODO: update to pass include_end_date = True
 
     def __init__(self,
-                 cost_calculator: RollCostCalculator = StandardRollCostCalculator(),
-                 cost_provider: CostProviderService = CostProviderService()):
+                 cost_calculator: Optional[RollCostCalculator] = None,
+                 cost_provider: Optional[CostProviderService] = None):
         """
         :param cost_calculator: CostCalculator, used to estiamte roll costs
         """
-        self._cost_calculator = cost_calculator
-        self._cost_provider = cost_provider
+        self._cost_calculator = service_or_default(cost_calculator, StandardRollCostCalculator)
+        self._cost_provider = service_or_default(cost_provider, CostProviderService)
 
     def get_roll_cost_estimate_what_if_after_trades(self,
                                                     date: Date,
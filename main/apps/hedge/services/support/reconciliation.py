@@ -2,7 +2,7 @@
 Contains some common reconciliation functionality.
 
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import numpy as np
 from hdlib.Core.FxPairInterface import FxPairInterface
@@ -10,6 +10,7 @@ from hdlib.Core.FxPairInterface import FxPairInterface
 from hdlib.Hedge.Fx.Util.FxMarketConventionConverter import SpotFxCache
 
 from main.apps.account.models import Account
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import FxPairTypes
 from main.apps.hedge.models import CompanyHedgeAction, AccountHedgeRequest
 from main.apps.hedge.services.account_hedge_request import AccountHedgeRequestService
@@ -30,12 +31,13 @@ class Reconciliation:
     """
 
     def __init__(self,
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 account_hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService(),
-                 fx_provider: FxVolAndCorrelationProvider = FxVolAndCorrelationProvider()):
-        self._hedge_position_service = hedge_position_service
-        self._fx_provider = fx_provider
-        self._account_hedge_request_service = account_hedge_request_service
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 account_hedge_request_service: Optional[AccountHedgeRequestService] = None,
+                 fx_provider: Optional[FxVolAndCorrelationProvider] = None):
+        self._hedge_position_service = service_or_default(hedge_position_service, HedgePositionService)
+        self._fx_provider = service_or_default(fx_provider, FxVolAndCorrelationProvider)
+        self._account_hedge_request_service = service_or_default(account_hedge_request_service,
+                                                                 AccountHedgeRequestService)
 
     @staticmethod
     def compute_effective_filled_amounts(old_positions: Dict[FxPairTypes, float],
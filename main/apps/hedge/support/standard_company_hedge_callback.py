@@ -9,6 +9,7 @@ from hdlib.Universe.Universe import Universe
 from hdlib.Hedge.Fx.Util.PositionChange import PositionChange
 
 from main.apps.account.models import Account, Company
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import FxPair
 from main.apps.hedge.calculators.company_hedge import CompanyHedgeCallback
 from main.apps.hedge.calculators.liquidity_adjust import get_liquidity_adjusted_positions
@@ -39,15 +40,16 @@ class StandardCompanyHedgeCallback(CompanyHedgeCallback):
     def __init__(self,
                  company_hedge_action: CompanyHedgeAction,
                  universe: Universe,
-                 account_hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService(),
-                 oms_hedge_service: OMSHedgeServiceInterface = OMSHedgeService(),
-                 margin_provider_service: MarginProviderServiceInterface = DefaultMarginProviderService(),
+                 account_hedge_request_service: Optional[AccountHedgeRequestService] = None,
+                 oms_hedge_service: Optional[OMSHedgeServiceInterface] = None,
+                 margin_provider_service: Optional[MarginProviderServiceInterface] = None,
                  ):
         self._company_hedge_action = company_hedge_action
         self._universe = universe
-        self._account_hedge_request_service = account_hedge_request_service
-        self._oms_hedge_service = oms_hedge_service
-        self._margin_provider_service = margin_provider_service
+        self._account_hedge_request_service = service_or_default(account_hedge_request_service,
+                                                                 AccountHedgeRequestService)
+        self._oms_hedge_service = service_or_default(oms_hedge_service, OMSHedgeService)
+        self._margin_provider_service = service_or_default(margin_provider_service, DefaultMarginProviderService)
 
     @property
     def company(self):
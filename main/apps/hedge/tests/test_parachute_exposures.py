@@ -0,0 +1,51 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from main.apps.hedge.services.parachute_hedger import ParachuteCompanyExposures
+
+
+def make_bucket(net, cashflow=None, forwards=None, allow_unwind=True):
+    return SimpleNamespace(fx_net_exposures=net, fx_cashflow_exposures=cashflow or {},
+                           fx_forward_amounts=forwards or {}, allow_unwind=allow_unwind)
+
+
+class ParachuteCompanyExposuresTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.buckets = {
+            'account_1': {(2024, 1): make_bucket({'EURUSD': 100., 'GBPUSD': -50.}),
+                          (2024, 2): make_bucket({'EURUSD': -30.})},
+            'account_2': {(2024, 2): make_bucket({}, cashflow={'EURUSD': 80.}, forwards={'EURUSD': -60.},
+                                                 allow_unwind=False)},
+        }
+        self.exposures = ParachuteCompanyExposures(self.buckets)
+
+    def test_dense_exposures(self):
+        self.assertEqual(self.exposures.fx_pairs, ['EURUSD', 'GBPUSD'])
+        self.assertEqual(self.exposures.months, [(2024, 1), (2024, 2)])
+        np.testing.assert_array_equal(self.exposures.net_exposures[0], [[100., -50.], [-30., 0.]])
+        np.testing.assert_array_equal(self.exposures.net_exposures[1], [[0., 0.], [0., 0.]])
+
+    def test_fractional_hedges(self):
+        fractions = np.array([[0.5, 2.], [0., 0.5]])
+        hedges, sum_abs_remaining = self.exposures.fractional_hedges(fractions)
+
+        self.assertEqual(self.exposures.bucket_hedge(hedges, 'account_1', (2024, 1)), {'EURUSD': 50., 'GBPUSD': -25.})
+        # Fractions are capped at a full hedge.
+        self.assertEqual(self.exposures.bucket_hedge(hedges, 'account_1', (2024, 2)), {'EURUSD': -30.})
+        # Without unwinding, only the residual exposure (net of forwards) is hedged.
+        self.assertEqual(self.exposures.bucket_hedge(hedges, 'account_2', (2024, 2)), {'EURUSD': 10.})
+        np.testing.assert_array_equal(sum_abs_remaining, [[150., 30.], [0., 20.]])
+
+    def test_allocate_spot(self):
+        exposures = np.array([[[100.], [-40.], [0.]]])
+
+        # Spot in the opposite direction to the net exposure: allocated in proportion to the same side exposure.
+        attributed = ParachuteCompanyExposures.allocate_spot(exposures, spot=np.array([[-50.]]))
+        np.testing.assert_allclose(attributed[0, :, 0], [-110., 50., 0.])
+
+        # Spot in the same direction as the net exposure: every bucket is fully hedged.
+        attributed = ParachuteCompanyExposures.allocate_spot(exposures, spot=np.array([[10.]]))
+        np.testing.assert_allclose(attributed[0, :, 0], [-100., 40., 0.])
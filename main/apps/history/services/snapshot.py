@@ -13,6 +13,7 @@ from hdlib.Hedge.Fx.Util.FxMarketConventionConverter import SpotFxCache
 
 from main.apps.account.models import Company, Account, Currency, CashFlow
 from main.apps.broker.models import BrokerAccount
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.account.services.cashflow_pricer import CashFlowPricerService, CashflowValueSummary
 from main.apps.hedge.calculators.RatesCache import BrokerRatesCaches
 from main.apps.hedge.calculators.cost import RollCostCalculator, StandardRollCostCalculator
@@ -35,13 +36,13 @@ class SnapshotCreatorService(object):
     def __init__(self,
                  universes: Dict[Currency, Universe],
                  rates_caches: BrokerRatesCaches,
-                 snapshot_provider: SnapshotProvider = SnapshotProvider(),
-                 account_hedge_request_service: AccountHedgeRequestService = AccountHedgeRequestService(),
-                 broker_service: BrokerService = BrokerService(),
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 universe_provider_service: UniverseProviderService = UniverseProviderService(),
-                 roll_cost_calculator: RollCostCalculator = StandardRollCostCalculator(),
-                 cost_provider_service: CostProviderService = CostProviderService()
+                 snapshot_provider: Optional[SnapshotProvider] = None,
+                 account_hedge_request_service: Optional[AccountHedgeRequestService] = None,
+                 broker_service: Optional[BrokerService] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 universe_provider_service: Optional[UniverseProviderService] = None,
+                 roll_cost_calculator: Optional[RollCostCalculator] = None,
+                 cost_provider_service: Optional[CostProviderService] = None
                  ):
         """
         Service for Creating Company and account snapshots
@@ -52,15 +53,16 @@ class SnapshotCreatorService(object):
         self._last_universes = {}
         self._rates_caches = rates_caches
 
-        self._snapshot_provider = snapshot_provider
-        self._account_hedge_request_service = account_hedge_request_service
-        self._broker_service = broker_service
-        self._hedge_position_service = hedge_position_service
-        self._universe_provider_service = universe_provider_service
+        self._snapshot_provider = service_or_default(snapshot_provider, SnapshotProvider)
+        self._account_hedge_request_service = service_or_default(account_hedge_request_service,
+                                                                 AccountHedgeRequestService)
+        self._broker_service = service_or_default(broker_service, BrokerService)
+        self._hedge_position_service = service_or_default(hedge_position_service, HedgePositionService)
+        self._universe_provider_service = service_or_default(universe_provider_service, UniverseProviderService)
         self._pnl_provider = PnLProviderService(fx_spot_provider=self._universe_provider_service.fx_spot_provider)
         self._cashflow_pricer = CashFlowPricerService(universe_provider_service=self._universe_provider_service)
-        self._roll_cost_calculator = roll_cost_calculator
-        self._cost_provider_service = cost_provider_service
+        self._roll_cost_calculator = service_or_default(roll_cost_calculator, StandardRollCostCalculator)
+        self._cost_provider_service = service_or_default(cost_provider_service, CostProviderService)
 
         self._dc = DayCounter_HD()
 
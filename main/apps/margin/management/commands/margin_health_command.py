@@ -2,8 +2,10 @@ import logging
 
 from django.core.management.base import BaseCommand
 
+from main.apps.account.models import Company
 from main.apps.core.utils.slack import decorator_to_post_exception_message_on_slack
 from main.apps.margin.services.margin_health import MarginHealthService
+from main.apps.margin.services.margin_health_batch import BatchMarginHealthService
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +16,15 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--company_id', type=int)
         parser.add_argument('--deposit_required_level', type=float, default=0.5)
+        parser.add_argument('--all', action='store_true',
+                            help="Compute today's margin health of all active companies in one batch")
 
     @decorator_to_post_exception_message_on_slack()
     def handle(self, *args, **options):
         try:
+            if options['all']:
+                self.sweep()
+                return
             margin_health = MarginHealthService(company_id=options['company_id'],
                                                 deposit_required_level=options['deposit_required_level'])
             margin_health.execute()
@@ -27,3 +34,14 @@ class Command(BaseCommand):
         except Exception as e:
             logging.error(e)
             raise Exception(e)
+
+    def sweep(self):
+        company_ids = Company.objects.filter(status=Company.CompanyStatus.ACTIVE).values_list('id', flat=True)
+        sweep = BatchMarginHealthService().compute_margin_health(company_ids=company_ids)
+        for company_id, health in sorted(sweep.health.items(), key=lambda item: item[1].health_score):
+            self.stdout.write(f"{health.company.name} ({company_id}): health={health.health_score:.3f} "
+                              f"margin={health.margin_detail.margin_requirement:.2f} "
+                              f"excess={health.margin_detail.excess_liquidity:.2f}")
+        for company_id, error in sweep.errors.items():
+            self.stderr.write(f"Company {company_id}: {error}")
+        self.stdout.write(", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in sweep.timings.items()))
@@ -1,8 +1,9 @@
-from typing import Iterable
+from typing import Iterable, Optional
 
 from hdlib.DateTime.Date import Date
 
 from main.apps.account.models import Company, Account
+from main.apps.core.utils.service_registry import service_or_default
 
 from main.apps.hedge.services.broker import BrokerService
 from main.apps.margin.models import Deposit
@@ -10,8 +11,8 @@ from main.apps.margin.models import Deposit
 
 class DepositService:
 
-    def __init__(self, broker_service: BrokerService = BrokerService()):
-        self._broker_service = broker_service
+    def __init__(self, broker_service: Optional[BrokerService] = None):
+        self._broker_service = service_or_default(broker_service, BrokerService)
 
     def get_pending_deposits(self, company: Company, date: Date) -> float:
         broker_account = self._broker_service.get_broker_for_company(
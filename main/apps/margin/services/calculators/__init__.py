@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Tuple
-from typing import Iterable
+from typing import Iterable, List
 
+import numpy as np
 import scipy.optimize
 from hdlib.Core.Currency import Currency as CurrencyHDL
 from hdlib.Hedge.Cash.CashPositions import CashPositions, VirtualFxPosition
@@ -25,9 +26,10 @@ class MarginRatesCache:
     def __call__(self, base: CurrencyHDL, quote: CurrencyHDL) -> float:
         """ Get the margin per unit Fx spot for an Fx pair, in domestic. """
         margin_rate = self.margin.get((base.get_mnemonic(), quote.get_mnemonic()), None)
-        if not margin_rate:
+        if margin_rate is None:
             return self.default_margin_rate
-        return margin_rate.rate
+        # Rates are either plain floats or FxSpotMargin objects.
+        return getattr(margin_rate, 'rate', margin_rate)
 
     def get_rate_for_pair(self, fxpair: FxPair) -> float:
         """ Get the margin per unit Fx spot for an Fx pair, in domestic. """
@@ -36,6 +38,9 @@ class MarginRatesCache:
     def get_rate_for_currency(self, currency: Currency, quote: Currency) -> float:
         return self(currency, quote)
 
+    def get_rates_for_currencies(self, currencies: Iterable[Currency], quote: Currency) -> np.ndarray:
+        return np.array([self(currency, quote) for currency in currencies], dtype=float)
+
 
 class MarginCalculator(ABC):
 
@@ -117,3 +122,26 @@ class MarginCalculator(ABC):
                                    spot_fx_cache=spot_fx_cache,
                                    margin_rates=margin_rates,
                                    multiplier=multiplier)
+
+    def compute_margin_matrix(self,
+                              cash: np.ndarray,
+                              currencies: List[Currency],
+                              domestic: Currency,
+                              spot_fx_cache: SpotFxCache,
+                              margin_rates: MarginRatesCache,
+                              multiplier=2.0) -> np.ndarray:
+        """
+        Compute the margin of each row of a matrix of cash amounts, whose columns are in the given currencies.
+        Calculators able to do it on the whole matrix at once should override this.
+        """
+        margins = np.zeros(len(cash))
+        for row, amounts in enumerate(cash):
+            cash_positions = CashPositions()
+            for currency, amount in zip(currencies, amounts):
+                cash_positions.add_cash(currency=currency, amount=amount)
+            margins[row] = self.compute_margin(cash_positions=cash_positions,
+                                               domestic=domestic,
+                                               spot_fx_cache=spot_fx_cache,
+                                               margin_rates=margin_rates,
+                                               multiplier=multiplier)
+        return margins
@@ -1,3 +1,5 @@
+from typing import List
+
 import numpy as np
 from hdlib.Hedge.Cash.CashPositions import CashPositions
 from hdlib.Hedge.Fx.Util.FxMarketConventionConverter import SpotFxCache
@@ -72,3 +74,37 @@ class IBMarginCalculator(MarginCalculator):
                     it += 1
 
         return margin * multiplier
+
+    def compute_margin_matrix(self,
+                              cash: np.ndarray,
+                              currencies: List[Currency],
+                              domestic: Currency,
+                              spot_fx_cache: SpotFxCache,
+                              margin_rates: MarginRatesCache,
+                              multiplier=2.0) -> np.ndarray:
+        """
+        Same as compute_margin, for every row of a matrix of cash amounts at once. The currencies, and so their
+        conversion to domestic and their margin rates, are the same on every row.
+
+        Covering the negative positions by the positive positions with the smallest rates first, the margin of a row
+        is the sum over its positive positions, sorted by rate, of rate * the part of the position that is used, i.e.
+        min(position, max(0, negatives - positions with a smaller rate)).
+        """
+        cash = np.asarray(cash, dtype=float)
+        to_domestic = np.array([spot_fx_cache.convert_value(value=1.0, from_currency=currency, to_currency=domestic)
+                                for currency in currencies], dtype=float)
+        rates = margin_rates.get_rates_for_currencies(currencies=currencies, quote=domestic)
+
+        held = (np.abs(cash) >= 1e-6) & ~np.isnan(cash)
+        unconvertible = np.isnan(to_domestic) & held.any(axis=0)
+        if unconvertible.any():
+            raise ValueError(f"could not convert from {currencies[int(np.argmax(unconvertible))]} to {domestic}")
+
+        values = np.where(held, cash * to_domestic, 0.)
+        negatives = np.where(cash < 0, -values, 0.).sum(axis=1)
+
+        by_rate = np.argsort(rates, kind='stable')
+        positives = np.where(cash > 0, values, 0.)[:, by_rate]
+        covered_before = np.cumsum(positives, axis=1) - positives
+        used = np.clip(negatives[:, None] - covered_before, 0., positives)
+        return used @ rates[by_rate] * multiplier
@@ -1,3 +1,6 @@
+from typing import List
+
+import numpy as np
 from hdlib.Hedge.Cash.CashPositions import CashPositions
 from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache
 
@@ -9,3 +12,8 @@ class MarginCalculator_NoMargin(MarginCalculator):
     def compute_margin(self, cash_positions: CashPositions, domestic: Currency, spot_fx_cache: SpotFxCache,
                        margin_rates: MarginRatesCache, multiplier=2.0) -> float:
         return 0
+
+    def compute_margin_matrix(self, cash: np.ndarray, currencies: List[Currency], domestic: Currency,
+                              spot_fx_cache: SpotFxCache, margin_rates: MarginRatesCache,
+                              multiplier=2.0) -> np.ndarray:
+        return np.zeros(len(cash))
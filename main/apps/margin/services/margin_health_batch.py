@@ -0,0 +1,237 @@
+"""
+Margin health of many companies at once, for the EOD / alerting sweep.
+
+MarginProviderService.get_margin_detail loads the broker summary, the positions, the spot rates and the margin rates
+of one company per call. BatchMarginHealthService loads them for every company of the sweep with a handful of
+set-based queries, shares one spot cache and the margin rates of each broker, and computes the margins of all the
+companies with one MarginCalculator.compute_margin_matrix call per (domestic currency, broker). Results match
+get_margin_detail company by company.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+from hdlib.DateTime.Date import Date
+from hdlib.Hedge.Cash.CashPositions import CashPositions, VirtualFxPosition
+from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache
+
+from main.apps.account.models import Account, Company
+from main.apps.broker.models import BrokerAccount
+from main.apps.core.utils.service_registry import service_or_default
+from main.apps.hedge.models import CompanyEvent, FxPosition
+from main.apps.ibkr.models import IbkrAccountSummary
+from main.apps.margin.models.margin import MarginDetail
+from main.apps.margin.services.calculators import MarginCalculator
+from main.apps.margin.services.calculators.ibkr import IBMarginCalculator
+from main.apps.margin.services.margin_service import DBMarginRatesCashProvider, MarginRatesCacheProvider
+from main.apps.marketdata.services.fx.fx_provider import FxSpotProvider
+
+logger = logging.getLogger(__name__)
+
+
+class CompanyMarginInputs(NamedTuple):
+    company: Company
+    has_live_accounts: bool
+    broker_account: Optional[BrokerAccount]
+    summary: Optional[IbkrAccountSummary]
+    positions: List[FxPosition]
+
+
+class CompanyMarginHealth(NamedTuple):
+    company: Company
+    margin_detail: MarginDetail
+    # excess liquidity / (multiplier * margin requirement), 1.0 without margin requirement
+    health_score: float
+    virtual_fx: List[VirtualFxPosition]
+
+
+class MarginHealthSweep:
+    def __init__(self):
+        self.health: Dict[int, CompanyMarginHealth] = {}
+        self.errors: Dict[int, str] = {}
+        # seconds spent in each stage, in order
+        self.timings: Dict[str, float] = {}
+
+    def worst(self) -> Optional[CompanyMarginHealth]:
+        if not self.health:
+            return None
+        return min(self.health.values(), key=lambda h: h.health_score)
+
+
+class BatchMarginHealthService:
+
+    def __init__(self,
+                 margin_calculator: Optional[MarginCalculator] = None,
+                 margin_rates_cache_provider: Optional[MarginRatesCacheProvider] = None,
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 margin_multiplier=2.0):
+        self._margin_calculator = service_or_default(margin_calculator, IBMarginCalculator)
+        self._margin_rates_cache_provider = service_or_default(margin_rates_cache_provider,
+                                                               DBMarginRatesCashProvider)
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
+        self._multiplier = margin_multiplier
+
+    def compute_margin_health(self, company_ids: Iterable[int], date: Optional[Date] = None) -> MarginHealthSweep:
+        date = date or Date.now()
+        sweep = MarginHealthSweep()
+
+        with self._stage(sweep, "load"):
+            inputs = self.load_inputs(company_ids=company_ids, date=date)
+        with self._stage(sweep, "spots"):
+            spot_fx_cache = self._fx_spot_provider.get_spot_cache(time=date)
+        with self._stage(sweep, "margin"):
+            details = self.compute_margin_details(inputs=inputs, date=date, spot_fx_cache=spot_fx_cache,
+                                                  errors=sweep.errors)
+        with self._stage(sweep, "health"):
+            company_ids = list(details)
+            margins = np.array([details[company_id].margin_requirement for company_id in company_ids], dtype=float)
+            excess = np.array([details[company_id].excess_liquidity for company_id in company_ids], dtype=float)
+            scores = np.divide(excess, self._multiplier * margins, out=np.ones_like(excess), where=margins > 0)
+            for company_id, score in zip(company_ids, scores):
+                company_inputs = inputs[company_id]
+                virtual_fx = [VirtualFxPosition(fxpair=position.fxpair,
+                                                amount=position.amount,
+                                                ave_price=position.average_price[0])
+                              for position in company_inputs.positions]
+                sweep.health[company_id] = CompanyMarginHealth(company=company_inputs.company,
+                                                               margin_detail=details[company_id],
+                                                               health_score=float(score),
+                                                               virtual_fx=virtual_fx)
+
+        logger.debug(f"Computed margin health of {len(sweep.health)} companies "
+                     f"({len(sweep.errors)} errors): {sweep.timings}")
+        return sweep
+
+    def load_inputs(self, company_ids: Iterable[int], date: Date,
+                    account_type: Account.AccountType = Account.AccountType.LIVE) -> Dict[int, CompanyMarginInputs]:
+        """ Everything get_margin_detail needs for every company, in a fixed number of queries """
+        company_ids = list(company_ids)
+        companies = Company.objects.filter(pk__in=company_ids).select_related('currency')
+
+        live_company_ids = set(Account.objects.filter(company_id__in=company_ids, type__in=[account_type.value],
+                                                      is_active=True).values_list('company_id', flat=True))
+
+        broker_account_type = BrokerAccount.AccountType.PAPER if account_type == Account.AccountType.DEMO \
+            else BrokerAccount.AccountType.LIVE
+        broker_accounts = {}
+        for broker_account in BrokerAccount.objects.filter(company_id__in=company_ids,
+                                                           account_type=broker_account_type) \
+                .select_related('broker').order_by('company_id', 'pk'):
+            broker_accounts.setdefault(broker_account.company_id, broker_account)
+
+        # Most recent summary of each broker account, and most recent positions snapshot of each company.
+        summaries = {summary.broker_account_id: summary for summary in IbkrAccountSummary.objects
+                     .filter(broker_account__in=broker_accounts.values(), created__lte=date)
+                     .order_by('broker_account_id', '-created')
+                     .distinct('broker_account_id')}
+        events = CompanyEvent.objects.filter(company_id__in=company_ids, has_account_fx_snapshot=True,
+                                             time__lte=date) \
+            .order_by('company_id', '-time') \
+            .distinct('company_id')
+        positions = defaultdict(list)
+        for position in FxPosition.objects.filter(company_event__in=events) \
+                .select_related('fxpair__base_currency', 'fxpair__quote_currency', 'company_event'):
+            positions[position.company_event.company_id].append(position)
+
+        inputs = {}
+        for company in companies:
+            broker_account = broker_accounts.get(company.pk)
+            inputs[company.pk] = CompanyMarginInputs(
+                company=company,
+                has_live_accounts=company.pk in live_company_ids,
+                broker_account=broker_account,
+                summary=summaries.get(broker_account.pk) if broker_account else None,
+                positions=positions.get(company.pk, []))
+        return inputs
+
+    def compute_margin_details(self,
+                               inputs: Dict[int, CompanyMarginInputs],
+                               date: Date,
+                               spot_fx_cache: SpotFxCache,
+                               errors: Optional[Dict[int, str]] = None) -> Dict[int, MarginDetail]:
+        """ Same as get_margin_detail for every company, with the margins computed one matrix per group """
+        errors = {} if errors is None else errors
+        details = {}
+        groups = defaultdict(list)
+        for company_id, company_inputs in inputs.items():
+            company = company_inputs.company
+            if not company_inputs.broker_account or not company_inputs.has_live_accounts:
+                details[company_id] = MarginDetail(company=company, date=date, margin_requirement=0,
+                                                   excess_liquidity=0)
+                continue
+            summary = company_inputs.summary
+            if not summary:
+                errors[company_id] = f'None broker account summary for company {company.name}'
+                continue
+
+            cp = CashPositions()
+            for position in company_inputs.positions:
+                cp.add_cash_from_single_fx_spot(fxpair=position.fxpair.to_FxPairHDL(),
+                                                amount=position.amount,
+                                                ave_price=position.average_price[0])
+            if cp.empty:
+                details[company_id] = MarginDetail(company=company, date=date,
+                                                   margin_requirement=summary.full_maint_margin_req,
+                                                   excess_liquidity=summary.full_excess_liquidity)
+                continue
+            cp.add_cash(company.currency, summary.available_funds)
+            groups[(company.currency, company_inputs.broker_account.broker)].append((company_id, cp))
+
+        for (domestic, broker), rows in groups.items():
+            margin_rates = self._margin_rates_cache_provider.get_margin_rates_cache(broker=broker)
+            for company_id, margin in self._compute_margins(rows, domestic, spot_fx_cache, margin_rates, errors):
+                company_inputs = inputs[company_id]
+                details[company_id] = MarginDetail(
+                    company=company_inputs.company,
+                    date=date,
+                    margin_requirement=margin,
+                    excess_liquidity=company_inputs.summary.equity_with_loan_value - margin)
+        return details
+
+    # ================
+    # Private
+    # ================
+
+    def _compute_margins(self, rows, domestic, spot_fx_cache, margin_rates, errors):
+        currencies = list({currency: None for _, cp in rows for currency in cp.cash_by_currency})
+        column = {currency: i for i, currency in enumerate(currencies)}
+        cash = np.zeros((len(rows), len(currencies)))
+        for i, (_, cp) in enumerate(rows):
+            for currency, amount in cp.cash_by_currency.items():
+                cash[i, column[currency]] = amount
+        try:
+            margins = self._margin_calculator.compute_margin_matrix(cash=cash,
+                                                                    currencies=currencies,
+                                                                    domestic=domestic,
+                                                                    spot_fx_cache=spot_fx_cache,
+                                                                    margin_rates=margin_rates,
+                                                                    multiplier=self._multiplier)
+            return [(company_id, float(margin)) for (company_id, _), margin in zip(rows, margins)]
+        except ValueError as e:
+            # One company holds something that can't be valued, find out which one(s).
+            logger.warning(f"Unable to compute the margins of {len(rows)} companies in {domestic} at once: {e}")
+
+        results = []
+        for company_id, cp in rows:
+            try:
+                results.append((company_id, self._margin_calculator.compute_margin(cash_positions=cp,
+                                                                                   domestic=domestic,
+                                                                                   spot_fx_cache=spot_fx_cache,
+                                                                                   margin_rates=margin_rates,
+                                                                                   multiplier=self._multiplier)))
+            except ValueError as e:
+                errors[company_id] = str(e)
+        return results
+
+    @staticmethod
+    @contextmanager
+    def _stage(sweep: MarginHealthSweep, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sweep.timings[name] = time.perf_counter() - start
+            logger.debug(f"Margin health sweep: {name} took {sweep.timings[name]:.3f}s")
@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+
+from main.apps.broker.models import Broker
+from main.apps.core.utils.cache import bump_cache_version, get_cache_versions
+from main.apps.margin.models.margin import FxSpotMargin
+from main.apps.margin.services.calculators import MarginRatesCache
+
+logger = logging.getLogger(__name__)
+
+
+def load_margin_rates_cache(broker: Broker) -> MarginRatesCache:
+    """
+    Load the spot margin rates of a broker from FxSpotMargin, as a MarginRatesCache of plain rates keyed by
+    (base mnemonic, quote mnemonic). When a pair has rates for several data cuts, the latest cut wins.
+    """
+    margin = {}
+    rows = FxSpotMargin.objects.filter(broker=broker) \
+        .order_by('data_cut__cut_time', 'pk') \
+        .values_list('pair__base_currency__mnemonic', 'pair__quote_currency__mnemonic', 'rate')
+    for base, quote, rate in rows:
+        margin[(base, quote)] = rate
+    return MarginRatesCache(broker=broker, margin=margin)
+
+
+class BrokerMarginRatesCache:
+    """
+    Process level cache of the MarginRatesCache of each broker, so that margin computations do not reload
+    FxSpotMargin on every call.
+
+    Versioned per broker, the version is bumped when the margin rates of the broker change (FxSpotMargin signals and
+    the margin rates importer). Versions are re-read at most every version_check_interval seconds.
+
+    The MarginRatesCache returned is shared, it must not be modified.
+    """
+    key_prefix = "margin_rates"
+    version_check_interval = 5.
+
+    _caches: Dict[int, Tuple[str, MarginRatesCache]] = {}
+    _checked_at: Dict[int, float] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, broker: Broker) -> MarginRatesCache:
+        entry = cls._caches.get(broker.pk)
+        now = time.monotonic()
+        if entry is not None and now - cls._checked_at.get(broker.pk, 0.) < cls.version_check_interval:
+            return entry[1]
+
+        version, = get_cache_versions("margin rates", cls._version_key(broker.pk))
+        if entry is None or entry[0] != version:
+            logger.debug(f"Loading margin rates of broker {broker}")
+            entry = (version, load_margin_rates_cache(broker))
+            with cls._lock:
+                cls._caches[broker.pk] = entry
+        cls._checked_at[broker.pk] = now
+        return entry[1]
+
+    @classmethod
+    def invalidate_broker(cls, broker_id: int):
+        bump_cache_version("margin rates", cls._version_key(broker_id))
+        with cls._lock:
+            cls._caches.pop(broker_id, None)
+
+    @classmethod
+    def clear(cls):
+        """ Drop the margin rates of this process """
+        with cls._lock:
+            cls._caches.clear()
+            cls._checked_at.clear()
+
+    # ================
+    # Private
+    # ================
+
+    @classmethod
+    def _version_key(cls, broker_id: int) -> str:
+        return f"{cls.key_prefix}:version:{broker_id}"
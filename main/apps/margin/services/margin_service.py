@@ -4,7 +4,7 @@ from abc import ABCMeta, abstractmethod
 from typing import Dict, Iterable, List, Tuple, Optional
 
 from hdlib.Hedge.Fx.Util.PositionChange import PositionChange
-from hdlib.Core.FxPair import FxPair as FxPairHDL, FxPair
+from hdlib.Core.FxPair import FxPair
 from hdlib.DateTime.Date import Date
 from hdlib.Hedge.Cash.CashPositions import VirtualFxPosition, CashPositions
 from hdlib.Hedge.Fx.Util.FxPnLCalculator import FxPnLCalculator
@@ -13,16 +13,19 @@ from hdlib.Utils import PnLCalculator
 
 from main.apps.account.models import Company, Account
 from main.apps.broker.models import Broker
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.account.services.cashflow_provider import CashFlowProviderInterface, CashFlowProviderService
 from main.apps.currency.models import Currency
 from main.apps.hedge.models import FxPosition
 from main.apps.hedge.services.hedge_position import HedgePositionService
-from main.apps.margin.models.margin import FxSpotMargin, MarginDetail
+from main.apps.margin.models.margin import MarginDetail
 from main.apps.margin.services.DepositService import DepositService
 from main.apps.margin.services.broker_margin_service import BrokerMarginServiceInterface, DbBrokerMarginService
 from main.apps.margin.services.calculators import MarginRatesCache, MarginCalculator
 from main.apps.margin.services.calculators.ibkr import IBMarginCalculator
 from main.apps.margin.services.margin_detail_service import MarginDetailServiceInterface, DbMarginDetailService
+from main.apps.margin.services.margin_rates import BrokerMarginRatesCache
+from main.apps.margin.services.projected_margin import ProjectedExposureMatrix
 from main.apps.marketdata.services.fx.fx_provider import FxSpotProvider
 
 logger = logging.getLogger(__name__)
@@ -139,11 +142,7 @@ class DBMarginRatesCashProvider(MarginRatesCacheProvider):
         NOTE(Nate): For now, we only store the current margin rates, and therefore do not have a concept of
         there being "historical margin."
         """
-        cache = MarginRatesCache(broker=broker)
-        for margin_detail in FxSpotMargin.objects.filter(broker=broker).prefetch_related().select_related():
-            fx_pair = margin_detail.pair
-            cache.margin[(fx_pair.base_currency.mnemonic, fx_pair.quote_currency.mnemonic)] = margin_detail
-        return cache
+        return BrokerMarginRatesCache.get(broker)
 
 
 class MarginProviderServiceInterface(IBMarginCalculator, metaclass=ABCMeta):
@@ -274,11 +273,7 @@ class MarginProviderService(MarginProviderServiceInterface):
         NOTE(Nate): For now, we only store the current margin rates, and therefore do not have a concept of
         there being "historical margin."
         """
-        cache = MarginRatesCache(broker=broker)
-        for margin_detail in FxSpotMargin.objects.filter(broker=broker):
-            fx_pair = margin_detail.pair
-            cache.margin[fx_pair] = margin_detail
-        return cache
+        return BrokerMarginRatesCache.get(broker)
 
     def compute_projected_margin(self,
                                  date: Date,
@@ -320,8 +315,7 @@ class MarginProviderService(MarginProviderServiceInterface):
         # settings.
         all_accounts = company.acct_company.filter(type=account_type).all()
         data_by_account = {}
-        all_dates = set({})
-        exposures_in_domestic = {}
+        vol_reduction_by_account = {}
         for account in all_accounts:
             if not account.has_hedge_settings():
                 continue
@@ -330,101 +324,68 @@ class MarginProviderService(MarginProviderServiceInterface):
             exposures = self._cash_provider_service.get_projected_raw_cash_exposures(account=account,
                                                                                      start_date=date,
                                                                                      end_date=end_date)
-            logger.debug(f"  ** Converting exposure to domestic currency for account %s on date %s", account, date)
-            for d, exposure in exposures:
-                for currency, amount in exposure:
-                    if currency == domestic:
-                        exposures_in_domestic[d] = exposures_in_domestic.get(date, 0) + abs(amount)
-                    else:
-                        fx = spot_fx_cache.get_fx(fx_pair=FxPairHDL(currency, domestic))
-                        if not fx:
-                            raise ValueError("No FX rate found for %s" % FxPairHDL(currency, domestic))
-                        exposures_in_domestic[d] = exposures_in_domestic.get(d, 0) + abs(amount) * fx
-                all_dates.add(d)
             if len(exposures) > 0:
                 data_by_account[account] = exposures
+                # TODO: Do this better. First approximation: take some proportional position in each currency.
+                settings = account.hedge_settings
+                vol_reduction_by_account[account] = settings.custom.get('VolTargetReduction', 1.0) \
+                    if settings.custom else 1.0
         logger.debug(f"  ** Finished computing exposure for company %s on date %s", company, date)
         # This would happen if there were no cashflows.
         if len(data_by_account) == 0:
             return []
-        iter_by_account = {account: 0 for account in all_accounts}
+
+        # Lay out the positions the hedge would take on every date as one dates x currencies matrix, so that the
+        # margin of all the dates is computed in one pass.
+        matrix = ProjectedExposureMatrix.build(domestic=domestic,
+                                               exposures_by_account=data_by_account,
+                                               vol_reduction_by_account=vol_reduction_by_account,
+                                               spot_fx_cache=spot_fx_cache)
 
         # Create a universe. We will assume that the universe is the same on ever date.
         logger.debug(f"  ** Getting margin rates cache for broker %s", broker)
         margin_rates = self._margin_rates_cache_provider.get_margin_rates_cache(broker=broker)
 
-        logger.debug(f"  ** Computing projected margin for company %s on date %s for %s dates", company, date, len(all_dates))
-        # Compute the margin for each date.
-        projected_margins = []
-        for it, date in enumerate(sorted(all_dates)):
-            # Get the cash exposures for the accounts
-            all_positions = []
-            for account in all_accounts:
-                iter = iter_by_account[account]
-                data = data_by_account.get(account, None)
-                if not data:
-                    continue
-                settings = account.hedge_settings
-                # Increment counter if necessary.
-                if iter < len(data) - 1 and data[iter + 1][0] <= date:
-                    iter_by_account[account] += 1
-                    iter += 1
-                # Get raw cash exposures.
-                _, exposures = data[iter]
-
-                # Compute some approximations of what positions the hedge would take.
-                # settings.custom_settings
+        logger.debug(f"  ** Computing projected margin for company %s on date %s for %s dates", company, date,
+                     len(matrix.dates))
+        if isinstance(self._margin_calculator, MarginCalculator):
+            cash, currencies = matrix.cash(additional_domestic_cash=summary.additional_cash)
+            margins = self._margin_calculator.compute_margin_matrix(cash=cash,
+                                                                    currencies=currencies,
+                                                                    domestic=domestic,
+                                                                    spot_fx_cache=spot_fx_cache,
+                                                                    margin_rates=margin_rates)
+        else:
+            margins = [self._margin_calculator.compute_margin_from_vfx(
+                virtual_fx=matrix.positions(row),
+                domestic=domestic,
+                spot_fx_cache=spot_fx_cache,
+                margin_rates=margin_rates,
+                additional_cash={domestic: summary.additional_cash}) if has_positions else 0.0
+                for row, has_positions in enumerate(matrix.has_positions)]
 
-                # TODO: Do this better. First approximation: take some proportional position in each currency.
-                target_vol_reduction = settings.custom.get('VolTargetReduction', 1.0) if settings.custom else 1.0
-                for currency, amount in exposures:
-                    if currency == domestic:
-                        continue
-                    fxpair = FxPairHDL(base=currency, quote=domestic)
-                    amount *= target_vol_reduction  # Proportional position.
-                    fx = VirtualFxPosition(fxpair=fxpair, amount=amount, ave_price=spot_fx_cache.get_fx(fxpair))
-                    all_positions.append(fx)
+        projected_margins = []
+        for row, date in enumerate(matrix.dates):
             # No positions => no margin.
-            if len(all_positions) == 0:
+            if not matrix.has_positions[row]:
                 projected_margins.append(ProjectedMargin(date=date,
                                                          amount_before_deposit=0.0,
                                                          amount_after_deposit=0.0,
                                                          excess=summary.equity_with_loan_value,
-                                                         total_hedge=exposures_in_domestic[date],
+                                                         total_hedge=float(matrix.total_hedge[row]),
                                                          positions=[]))
                 continue
 
-            logger.debug(f"  ** Computing margin for company %s on date %s from VFX positions", company, date)
-            # Compute approximate margin.
-            margin_before_additional_cash = self._margin_calculator.compute_margin_from_vfx(
-                virtual_fx=all_positions,
-                domestic=domestic,
-                spot_fx_cache=spot_fx_cache,
-                margin_rates=margin_rates,
-                additional_cash={domestic: summary.additional_cash})
-
-            excess = summary.additional_cash + additional_cash.get(domestic, 0) - margin_before_additional_cash
-            if additional_cash.get(domestic, None):
-                margin_after_additional_cash = margin_before_additional_cash
-            else:
+            margin = float(margins[row])
+            excess = summary.additional_cash + additional_cash.get(domestic, 0) - margin
+            if not additional_cash.get(domestic, None):
                 additional_cash[domestic] = additional_cash.get(domestic, 0) + summary.additional_cash
-                margin_after_additional_cash = self._margin_calculator.compute_margin_from_vfx(
-                    virtual_fx=all_positions,
-                    domestic=domestic,
-                    spot_fx_cache=spot_fx_cache,
-                    margin_rates=margin_rates,
-                    additional_cash={domestic: additional_cash[domestic]})
-            cash_positions = CashPositions()
-            # Add cash from virtual Fx positions.
-            for v_fx in all_positions:
-                cash_positions.add_cash_from_virtual_fx(v_fx)
-
             projected_margins.append(ProjectedMargin(date=date,
-                                                     amount_before_deposit=margin_before_additional_cash,
-                                                     amount_after_deposit=margin_after_additional_cash,
+                                                     amount_before_deposit=margin,
+                                                     amount_after_deposit=margin,
                                                      excess=excess,
-                                                     total_hedge=exposures_in_domestic[date],
-                                                     positions=all_positions))
+                                                     total_hedge=float(matrix.total_hedge[row]),
+                                                     positions=matrix.positions(row)))
 
         return projected_margins
 
@@ -617,30 +578,29 @@ class MarginProviderService(MarginProviderServiceInterface):
 
 class DefaultMarginProviderService(MarginProviderService):
     def __init__(self,
-                 margin_calculator: MarginCalculator = IBMarginCalculator(),
-                 broker_service: BrokerMarginServiceInterface = DbBrokerMarginService(),
-                 margin_rates_cache_provider: MarginRatesCacheProvider = DBMarginRatesCashProvider(),
-                 cash_provider_service: CashFlowProviderInterface = CashFlowProviderService(),
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider(),
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 margin_detail_service: MarginDetailServiceInterface = DbMarginDetailService(),
-                 pnl_calculator: PnLCalculator = FxPnLCalculator(),
-                 deposit_service: DepositService = DepositService(),
+                 margin_calculator: Optional[MarginCalculator] = None,
+                 broker_service: Optional[BrokerMarginServiceInterface] = None,
+                 margin_rates_cache_provider: Optional[MarginRatesCacheProvider] = None,
+                 cash_provider_service: Optional[CashFlowProviderInterface] = None,
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 margin_detail_service: Optional[MarginDetailServiceInterface] = None,
+                 pnl_calculator: Optional[PnLCalculator] = None,
+                 deposit_service: Optional[DepositService] = None,
                  margin_multiplier=2.0):
-        super().__init__(margin_calculator=margin_calculator,
-                         broker_service=broker_service,
-                         margin_rates_cache_provider=margin_rates_cache_provider,
-                         cash_provider_service=cash_provider_service,
-                         fx_spot_provider=fx_spot_provider,
-                         hedge_position_service=hedge_position_service,
-                         margin_detail_service=margin_detail_service,
-                         pnl_calculator=pnl_calculator,
-                         deposit_service=deposit_service,
+        super().__init__(margin_calculator=service_or_default(margin_calculator, IBMarginCalculator),
+                         broker_service=service_or_default(broker_service, DbBrokerMarginService),
+                         margin_rates_cache_provider=service_or_default(margin_rates_cache_provider,
+                                                                        DBMarginRatesCashProvider),
+                         cash_provider_service=service_or_default(cash_provider_service, CashFlowProviderService),
+                         fx_spot_provider=service_or_default(fx_spot_provider, FxSpotProvider),
+                         hedge_position_service=service_or_default(hedge_position_service, HedgePositionService),
+                         margin_detail_service=service_or_default(margin_detail_service, DbMarginDetailService),
+                         pnl_calculator=service_or_default(pnl_calculator, FxPnLCalculator),
+                         deposit_service=service_or_default(deposit_service, DepositService),
                          margin_multiplier=margin_multiplier)
 
 
-service = DefaultMarginProviderService()
-
 class BacktestMarginProviderService(MarginProviderServiceInterface):
     def get_recommended_and_minimum_deposit(self, company: Company, date: Date, account_type: Account.AccountType,
                                             additional_cash: Optional[Dict[Currency, float]] = None,
@@ -0,0 +1,124 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from hdlib.Core.FxPair import FxPair as FxPairHDL
+from hdlib.DateTime.Date import Date
+from hdlib.Hedge.Cash.CashPositions import VirtualFxPosition
+from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache
+
+from main.apps.account.models import Account
+from main.apps.currency.models import Currency
+
+# (date, [(currency, amount), ...]) as returned by CashFlowProviderInterface.get_projected_raw_cash_exposures
+RawExposures = List[Tuple[Date, List[Tuple[Currency, float]]]]
+
+
+class ProjectedExposureMatrix:
+    """
+    The projected hedge positions of all the accounts of a company, as a dates x currencies matrix.
+
+    The exposures of every account are laid out once in an (exposure dates x currencies) matrix, each projection date
+    picks the row of every account that is in effect on that date, scaled by the account's VolTargetReduction. Rows
+    are in the order of dates, columns in the order of foreign_currencies.
+    """
+
+    def __init__(self,
+                 domestic: Currency,
+                 dates: List[Date],
+                 foreign_currencies: List[Currency],
+                 hedge: np.ndarray,
+                 has_positions: np.ndarray,
+                 total_hedge: np.ndarray,
+                 spots: np.ndarray):
+        self.domestic = domestic
+        self.dates = dates
+        self.foreign_currencies = foreign_currencies
+        # Amount of each foreign currency held on each date.
+        self.hedge = hedge
+        # Whether any account has a foreign exposure on each date.
+        self.has_positions = has_positions
+        # Absolute value of the exposures falling on each date, in domestic.
+        self.total_hedge = total_hedge
+        self.spots = spots
+
+    @staticmethod
+    def build(domestic: Currency,
+              exposures_by_account: Dict[Account, RawExposures],
+              vol_reduction_by_account: Dict[Account, float],
+              spot_fx_cache: SpotFxCache) -> 'ProjectedExposureMatrix':
+        dates = sorted({d for exposures in exposures_by_account.values() for d, _ in exposures})
+        date_index = {d: i for i, d in enumerate(dates)}
+
+        currency_index = {}
+        for exposures in exposures_by_account.values():
+            for _, exposure in exposures:
+                for currency, _ in exposure:
+                    if currency != domestic and currency not in currency_index:
+                        currency_index[currency] = len(currency_index)
+        foreign_currencies = list(currency_index)
+
+        spots = np.empty(len(foreign_currencies))
+        for currency, i in currency_index.items():
+            fx = spot_fx_cache.get_fx(fx_pair=FxPairHDL(currency, domestic))
+            if not fx:
+                raise ValueError("No FX rate found for %s" % FxPairHDL(currency, domestic))
+            spots[i] = fx
+
+        num_dates, num_currencies = len(dates), len(foreign_currencies)
+        hedge = np.zeros((num_dates, num_currencies))
+        num_positions = np.zeros(num_dates, dtype=int)
+        total_hedge = np.zeros(num_dates)
+        for account, exposures in exposures_by_account.items():
+            amounts = np.zeros((len(exposures), num_currencies))
+            absolute_amounts = np.zeros(len(exposures))
+            counts = np.zeros(len(exposures), dtype=int)
+            for row, (_, exposure) in enumerate(exposures):
+                for currency, amount in exposure:
+                    if currency == domestic:
+                        absolute_amounts[row] += abs(amount)
+                    else:
+                        amounts[row, currency_index[currency]] += amount
+                        absolute_amounts[row] += abs(amount) * spots[currency_index[currency]]
+                        counts[row] += 1
+
+            rows = [date_index[d] for d, _ in exposures]
+            np.add.at(total_hedge, rows, absolute_amounts)
+
+            effective = ProjectedExposureMatrix._effective_rows([d for d, _ in exposures], dates)
+            hedge += vol_reduction_by_account[account] * amounts[effective]
+            num_positions += counts[effective]
+
+        return ProjectedExposureMatrix(domestic=domestic,
+                                       dates=dates,
+                                       foreign_currencies=foreign_currencies,
+                                       hedge=hedge,
+                                       has_positions=num_positions > 0,
+                                       total_hedge=total_hedge,
+                                       spots=spots)
+
+    def cash(self, additional_domestic_cash: float = 0.) -> Tuple[np.ndarray, List[Currency]]:
+        """
+        The cash each date's hedge positions amount to, bought at spot and funded in domestic: a dates x currencies
+        matrix whose last column is the domestic currency.
+        """
+        domestic_cash = additional_domestic_cash - self.hedge @ self.spots
+        return np.column_stack([self.hedge, domestic_cash]), self.foreign_currencies + [self.domestic]
+
+    def positions(self, row: int) -> List[VirtualFxPosition]:
+        return [VirtualFxPosition(fxpair=FxPairHDL(base=currency, quote=self.domestic),
+                                  amount=self.hedge[row, i],
+                                  ave_price=self.spots[i])
+                for i, currency in enumerate(self.foreign_currencies) if self.hedge[row, i] != 0]
+
+    @staticmethod
+    def _effective_rows(exposure_dates: Sequence[Date], dates: Sequence[Date]) -> List[int]:
+        """
+        Index of the exposure in effect on each date. An account starts on its first exposure, and moves on to its
+        next exposure at most once per date, once that exposure's date is reached.
+        """
+        rows, row, last = [], 0, len(exposure_dates) - 1
+        for date in dates:
+            if row < last and exposure_dates[row + 1] <= date:
+                row += 1
+            rows.append(row)
+        return rows
@@ -9,6 +9,7 @@ from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache
 from hdlib.Utils import PnLCalculator
 
 from main.apps.account.models import Company, Account, CashFlow, iter_active_cashflows
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.hedge.calculators.company_hedge import AccountPositionsProviderStored
 from main.apps.hedge.models import FxPosition
 from main.apps.hedge.services.hedge_position import HedgePositionService
@@ -175,20 +176,26 @@ class WhatIfMarginService(object):
 
 class DefaultWhatIfMarginInterface(WhatIfMarginService):
     def __init__(self,
-                 margin_calculator: MarginCalculator = IBMarginCalculator(),
-                 broker_service: BrokerMarginServiceInterface = DbBrokerMarginService(),
-                 margin_rates_cache_provider: MarginRatesCacheProvider = DBMarginRatesCashProvider(),
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider(),
-                 hedge_position_service: HedgePositionService = HedgePositionService(),
-                 pnl_calculator: PnLCalculator = FxPnLCalculator(),
-                 hedger_factory: CompanyHedgerFactory = CompanyHedgerFactory()):
+                 margin_calculator: Optional[MarginCalculator] = None,
+                 broker_service: Optional[BrokerMarginServiceInterface] = None,
+                 margin_rates_cache_provider: Optional[MarginRatesCacheProvider] = None,
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 hedge_position_service: Optional[HedgePositionService] = None,
+                 pnl_calculator: Optional[PnLCalculator] = None,
+                 hedger_factory: Optional[CompanyHedgerFactory] = None):
+        margin_calculator = service_or_default(margin_calculator, IBMarginCalculator)
+        broker_service = service_or_default(broker_service, DbBrokerMarginService)
+        margin_rates_cache_provider = service_or_default(margin_rates_cache_provider, DBMarginRatesCashProvider)
+        fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
+        hedge_position_service = service_or_default(hedge_position_service, HedgePositionService)
+        pnl_calculator = service_or_default(pnl_calculator, FxPnLCalculator)
         super().__init__(margin_calculator=margin_calculator,
                          broker_service=broker_service,
                          margin_rates_cache_provider=margin_rates_cache_provider,
                          fx_spot_provider=fx_spot_provider,
                          hedge_position_service=hedge_position_service,
                          pnl_calculator=pnl_calculator,
-                         hedger_factory=hedger_factory,
+                         hedger_factory=service_or_default(hedger_factory, CompanyHedgerFactory),
                          margin_provider_service=DefaultMarginProviderService(
                              margin_calculator=margin_calculator,
                              broker_service=broker_service,
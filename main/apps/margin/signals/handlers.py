@@ -1,11 +1,14 @@
 import logging
 
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from hdlib.DateTime.Date import Date
 
 from main.apps.account.models import CashFlow
 from main.apps.ibkr.models import DepositResult
 from main.apps.ibkr.signals import ibkr_deposit_processed
+from main.apps.margin.models.margin import FxSpotMargin
+from main.apps.margin.services.margin_rates import BrokerMarginRatesCache
 from main.apps.margin.services.what_if import DefaultWhatIfMarginInterface
 
 
@@ -27,3 +30,7 @@ def update_pending_margin_cashflows_handler(sender, instance: DepositResult, **k
     else:
         logger.debug(f"Company {instance.funding_request.broker_account.company} is still not healthy after deposit {instance}")
 
+
+@receiver([post_save, post_delete], sender=FxSpotMargin, dispatch_uid='margin_rates_fx_spot_margin')
+def invalidate_margin_rates(sender, instance: FxSpotMargin, **kwargs):
+    BrokerMarginRatesCache.invalidate_broker(instance.broker_id)
@@ -1,7 +1,9 @@
 import unittest
+from types import SimpleNamespace
 
+import numpy as np
 from django.test import testcases
-from hdlib.Core.Currency import USD, EUR
+from hdlib.Core.Currency import USD, EUR, GBP
 from hdlib.DateTime.Date import Date
 from hdlib.Hedge.Cash.CashPositions import CashPositions
 from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache, DictSpotFxCache
@@ -48,6 +50,30 @@ class MarginCalculatorTest(testcases.TestCase):
             target_health=0.5)
         self.assertEqual(required_deposit, 90000)
 
+    def test_compute_margin_matrix(self):
+        date = Date.today()
+        spot_fx_cache = DictSpotFxCache(date, {"EUR/USD": 1.2, "USD/EUR": 1 / 1.2, "GBP/USD": 1.3, "USD/GBP": 1 / 1.3})
+        margin_rates = MarginRatesCache(broker=Broker(), spot_fx_cache=spot_fx_cache,
+                                        margin={("EUR", "USD"): SimpleNamespace(rate=0.03),
+                                                ("GBP", "USD"): SimpleNamespace(rate=0.05)})
+        currencies = [EUR, GBP, USD]
+        cash = np.array([[100000, -50000, 20000],
+                         [-100000, 50000, 90000],
+                         [250000, 100000, -480000],
+                         [0, 1e-9, 0],
+                         [-10000, -20000, 5000]])
+
+        margin_calculator = IBMarginCalculator()
+        margins = margin_calculator.compute_margin_matrix(cash=cash, currencies=currencies, domestic=USD,
+                                                          spot_fx_cache=spot_fx_cache, margin_rates=margin_rates)
+        for amounts, margin in zip(cash, margins):
+            cash_positions = CashPositions()
+            for currency, amount in zip(currencies, amounts):
+                cash_positions.add_cash(currency=currency, amount=amount)
+            expected = margin_calculator.compute_margin(cash_positions=cash_positions, domestic=USD,
+                                                        spot_fx_cache=spot_fx_cache, margin_rates=margin_rates)
+            self.assertAlmostEqual(expected, margin, places=6)
+
 
 if __name__ == '__main__':
     unittest.main()
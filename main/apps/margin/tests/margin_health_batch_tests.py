@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from hdlib.Core.FxPair import FxPair as FxPairHDL
+from hdlib.DateTime.Date import Date
+from hdlib.Hedge.Cash.CashPositions import CashPositions
+from hdlib.Hedge.Fx.Util.SpotFxCache import DictSpotFxCache
+
+from main.apps.account.models import Company
+from main.apps.currency.models import Currency
+from main.apps.margin.services.calculators import MarginRatesCache
+from main.apps.margin.services.calculators.ibkr import IBMarginCalculator
+from main.apps.margin.services.margin_health_batch import BatchMarginHealthService, CompanyMarginInputs
+
+
+class BatchMarginHealthServiceTest(SimpleTestCase):
+
+    def setUp(self):
+        self.date = Date.today()
+        self.usd, self.eur, self.gbp = (Currency(mnemonic=mnemonic) for mnemonic in ('USD', 'EUR', 'GBP'))
+        self.spot_fx_cache = DictSpotFxCache(date=self.date, spots={"EUR/USD": 1.1, "GBP/USD": 1.3})
+        self.margin_rates = MarginRatesCache(broker=None, margin={("EUR", "USD"): 0.03, ("GBP", "USD"): 0.05})
+        self.broker = object()
+        self.service = BatchMarginHealthService(
+            margin_calculator=IBMarginCalculator(),
+            margin_rates_cache_provider=mock.Mock(get_margin_rates_cache=lambda broker: self.margin_rates),
+            fx_spot_provider=mock.Mock())
+
+    def _position(self, base, amount, price):
+        fxpair = SimpleNamespace(to_FxPairHDL=lambda: FxPairHDL(base=base, quote=self.usd))
+        return SimpleNamespace(fxpair=fxpair, amount=amount, average_price=(price, self.usd))
+
+    def _inputs(self, pk, positions, summary=True, has_live_accounts=True):
+        company = Company(pk=pk, name=f"Company {pk}", currency=self.usd)
+        summary = SimpleNamespace(available_funds=1000., equity_with_loan_value=50000., full_maint_margin_req=10.,
+                                  full_excess_liquidity=20.) if summary else None
+        return CompanyMarginInputs(company=company, has_live_accounts=has_live_accounts,
+                                   broker_account=SimpleNamespace(broker=self.broker), summary=summary,
+                                   positions=positions)
+
+    def test_margins_match_single_company_computation(self):
+        inputs = {
+            1: self._inputs(1, [self._position(self.eur, 100000., 1.1)]),
+            2: self._inputs(2, [self._position(self.eur, -50000., 1.05), self._position(self.gbp, 80000., 1.25)]),
+            3: self._inputs(3, []),
+            4: self._inputs(4, [self._position(self.eur, 10., 1.1)], summary=False),
+            5: self._inputs(5, [self._position(self.eur, 10., 1.1)], has_live_accounts=False),
+        }
+        errors = {}
+        details = self.service.compute_margin_details(inputs=inputs, date=self.date,
+                                                      spot_fx_cache=self.spot_fx_cache, errors=errors)
+
+        for company_id in (1, 2):
+            cp = CashPositions()
+            for position in inputs[company_id].positions:
+                cp.add_cash_from_single_fx_spot(fxpair=position.fxpair.to_FxPairHDL(), amount=position.amount,
+                                                ave_price=position.average_price[0])
+            cp.add_cash(self.usd, 1000.)
+            margin = IBMarginCalculator().compute_margin(cash_positions=cp, domestic=self.usd,
+                                                         spot_fx_cache=self.spot_fx_cache,
+                                                         margin_rates=self.margin_rates)
+            self.assertGreater(margin, 0)
+            self.assertAlmostEqual(margin, details[company_id].margin_requirement, places=6)
+            self.assertAlmostEqual(50000. - margin, details[company_id].excess_liquidity, places=6)
+
+        # no positions: the broker's figures
+        self.assertEqual((10., 20.), (details[3].margin_requirement, details[3].excess_liquidity))
+        self.assertEqual(['None broker account summary for company Company 4'], list(errors.values()))
+        self.assertEqual((0, 0), (details[5].margin_requirement, details[5].excess_liquidity))
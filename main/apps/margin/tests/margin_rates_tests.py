@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from hdlib.Core.Currency import USD, EUR, GBP
+
+from main.apps.margin.services.calculators import MarginRatesCache
+from main.apps.margin.services.margin_rates import BrokerMarginRatesCache
+
+
+class MarginRatesCacheTest(SimpleTestCase):
+
+    def test_rates(self):
+        margin_rates = MarginRatesCache(broker=None, margin={("EUR", "USD"): 0.03,
+                                                             ("GBP", "USD"): SimpleNamespace(rate=0.05)})
+        self.assertEqual(0.03, margin_rates(EUR, USD))
+        self.assertEqual(0.05, margin_rates(GBP, USD))
+        self.assertEqual(0.10, margin_rates(USD, EUR))
+        self.assertEqual([0.03, 0.05, 0.10],
+                         margin_rates.get_rates_for_currencies(currencies=[EUR, GBP, USD], quote=USD).tolist())
+
+
+class BrokerMarginRatesCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        BrokerMarginRatesCache.clear()
+        patcher = mock.patch('main.apps.margin.services.margin_rates.load_margin_rates_cache',
+                             side_effect=lambda broker: MarginRatesCache(broker=broker))
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(BrokerMarginRatesCache.clear)
+
+    def test_rates_are_loaded_once_per_broker(self):
+        broker1, broker2 = SimpleNamespace(pk=1), SimpleNamespace(pk=2)
+
+        rates = BrokerMarginRatesCache.get(broker1)
+        self.assertIs(rates, BrokerMarginRatesCache.get(broker1))
+        self.assertIsNot(rates, BrokerMarginRatesCache.get(broker2))
+        self.assertEqual(2, self.load.call_count)
+
+    def test_invalidate_broker(self):
+        broker = SimpleNamespace(pk=1)
+
+        rates = BrokerMarginRatesCache.get(broker)
+        BrokerMarginRatesCache.invalidate_broker(broker.pk)
+        self.assertIsNot(rates, BrokerMarginRatesCache.get(broker))
+        self.assertEqual(2, self.load.call_count)
@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase
+from hdlib.Core.Currency import USD, EUR, GBP
+from hdlib.DateTime.Date import Date
+from hdlib.Hedge.Fx.Util.SpotFxCache import DictSpotFxCache
+
+from main.apps.margin.services.projected_margin import ProjectedExposureMatrix
+
+
+class ProjectedExposureMatrixTest(SimpleTestCase):
+
+    def setUp(self):
+        self.date = Date.today()
+        self.spot_fx_cache = DictSpotFxCache(date=self.date, spots={"EUR/USD": 1.2, "GBP/USD": 1.5})
+
+    def test_build(self):
+        d1, d2, d3 = self.date + 1, self.date + 2, self.date + 3
+        exposures_by_account = {
+            "a": [(d1, [(EUR, 100.), (USD, -50.)]), (d3, [(EUR, -200.)])],
+            "b": [(d2, [(GBP, 10.)])],
+        }
+        matrix = ProjectedExposureMatrix.build(domestic=USD,
+                                               exposures_by_account=exposures_by_account,
+                                               vol_reduction_by_account={"a": 1.0, "b": 0.5},
+                                               spot_fx_cache=self.spot_fx_cache)
+
+        self.assertEqual([d1, d2, d3], matrix.dates)
+        self.assertEqual([EUR, GBP], matrix.foreign_currencies)
+        # An account holds its first exposure until its next one, b holds its only one on every date.
+        self.assertEqual([[100., 5.], [100., 5.], [-200., 5.]], matrix.hedge.tolist())
+        self.assertEqual([170., 15., 240.], matrix.total_hedge.tolist())
+        self.assertTrue(matrix.has_positions.all())
+
+        cash, currencies = matrix.cash(additional_domestic_cash=1000.)
+        self.assertEqual([EUR, GBP, USD], currencies)
+        self.assertEqual([100., 5., 1000. - 120. - 7.5], cash[0].tolist())
+
+        positions = matrix.positions(2)
+        self.assertEqual([-200., 5.], [position.amount for position in positions])
+
+    def test_missing_spot(self):
+        exposures_by_account = {"a": [(self.date + 1, [(EUR, 100.)])]}
+        with self.assertRaises(ValueError):
+            ProjectedExposureMatrix.build(domestic=GBP,
+                                          exposures_by_account=exposures_by_account,
+                                          vol_reduction_by_account={"a": 1.0},
+                                          spot_fx_cache=self.spot_fx_cache)
@@ -2,6 +2,7 @@ from typing import Optional, Tuple, List
 
 from hdlib.DateTime.Date import Date
 
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import FxPair, FxPairTypes
 from main.apps.marketdata.models import TradingCalendar
 from main.apps.marketdata.services.fx.fx_provider import FxSpotProvider
@@ -13,8 +14,8 @@ class CalendarService:
     # calendar_starts = Date.from_int(20210802)
     calendar_starts = Date.from_int(20220816)
 
-    def __init__(self, fx_spot_provider: FxSpotProvider = FxSpotProvider()):
-        self._fx_spot_provider = fx_spot_provider
+    def __init__(self, fx_spot_provider: Optional[FxSpotProvider] = None):
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
 
     def can_trade_fx_on_date(self, fx_pair: FxPair, date: Date) -> bool:
         # Fallback for when date is before we started scraping calendars.
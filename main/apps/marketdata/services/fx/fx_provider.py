@@ -4,6 +4,7 @@ from collections import defaultdict
 
 from hdlib.Core.Currency import Currency
 from hdlib.Hedge.Fx.Util.SpotFxCache import SpotFxCache, DictSpotFxCache
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models.fxpair import FxPair, FxPairId, FxPairName, FxPairTypes
 from main.apps.marketdata.models import DataCut
 from main.apps.marketdata.models.fx.rate import FxForward, FxSpot, FxTypes, FxSpotRange
@@ -511,11 +512,11 @@ class FxForwardProvider(object):
 
     # DEFAULT_TENORS = ['SN','1W','2W','3W','1M','2M','3M','4M','5M','6M','9M','1Y']
 
-    def __init__(self, fx_spot_provider: FxSpotProvider = FxSpotProvider()):
+    def __init__(self, fx_spot_provider: Optional[FxSpotProvider] = None):
         """
         Data provider which provides FxForward data (points, forward curves, etc)
         """
-        self._fx_spot_provider = fx_spot_provider
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
 
     # =====================================================================================
     #  Forward Values.
@@ -968,10 +969,10 @@ class FxVolAndCorrelationProvider(object):
     day_counter = DayCounter_HD()
 
     def __init__(self,
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider(),
-                 fx_forward_provider: FxForwardProvider = FxForwardProvider()):
-        self._fx_spot_provider = fx_spot_provider
-        self._fx_forward_provider = fx_forward_provider
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 fx_forward_provider: Optional[FxForwardProvider] = None):
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
+        self._fx_forward_provider = service_or_default(fx_forward_provider, FxForwardProvider)
 
     # =====================================================================================
     #  Spot Volatilities
@@ -12,6 +12,7 @@ from hdlib.Universe.Universe import Universe, Date, DayCounter, DayCounter_HD
 from hdlib.Core.Currency import Currency
 from hdlib.Core.FxPair import FxPair as FxPairHDL
 
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.core.utils.cache import redis_func_cache
 from main.apps.hedge.models import HedgeAccountSettings_DB
 from main.apps.marketdata.models import DataCut
@@ -40,9 +41,9 @@ class UniverseProvider(HistUniverseProvider):
                  fx_pairs: Sequence[FxPair] = None,
                  fx_names: Sequence[FxPairName] = None,
                  dc=DayCounter_HD(),
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider(),
-                 fx_forward_provider: FxForwardProvider = FxForwardProvider(),
-                 fx_vol_and_corr_provider: FxVolAndCorrelationProvider = FxVolAndCorrelationProvider()):
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 fx_forward_provider: Optional[FxForwardProvider] = None,
+                 fx_vol_and_corr_provider: Optional[FxVolAndCorrelationProvider] = None):
         """
         Create a historical universe provider.
         """
@@ -70,9 +71,9 @@ class UniverseProvider(HistUniverseProvider):
             raise RuntimeError("Error getting the OIS curve ids by currency")
         self._dc = dc
 
-        self._fx_spot_provider = fx_spot_provider
-        self._fx_forward_provider = fx_forward_provider
-        self._fx_vol_and_corr_provider = fx_vol_and_corr_provider
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
+        self._fx_forward_provider = service_or_default(fx_forward_provider, FxForwardProvider)
+        self._fx_vol_and_corr_provider = service_or_default(fx_vol_and_corr_provider, FxVolAndCorrelationProvider)
 
     def make_universe(self,
                       ref_date: Date,
@@ -280,14 +281,14 @@ class UniverseProviderService(object):
     """
 
     def __init__(self,
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider(),
-                 fx_forward_provider: FxForwardProvider = FxForwardProvider(),
-                 fx_vol_and_corr_provider: FxVolAndCorrelationProvider = FxVolAndCorrelationProvider(),
-                 fx_option_strategy_provider: FxOptionStrategyProvider = FxOptionStrategyProvider()):
-        self._fx_spot_provider = fx_spot_provider
-        self._fx_forward_provider = fx_forward_provider
-        self._fx_vol_and_corr_provider = fx_vol_and_corr_provider
-        self._fx_option_strategy_provider = fx_option_strategy_provider
+                 fx_spot_provider: Optional[FxSpotProvider] = None,
+                 fx_forward_provider: Optional[FxForwardProvider] = None,
+                 fx_vol_and_corr_provider: Optional[FxVolAndCorrelationProvider] = None,
+                 fx_option_strategy_provider: Optional[FxOptionStrategyProvider] = None):
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
+        self._fx_forward_provider = service_or_default(fx_forward_provider, FxForwardProvider)
+        self._fx_vol_and_corr_provider = service_or_default(fx_vol_and_corr_provider, FxVolAndCorrelationProvider)
+        self._fx_option_strategy_provider = service_or_default(fx_option_strategy_provider, FxOptionStrategyProvider)
 
     @property
     def fx_spot_provider(self) -> FxSpotProvider:
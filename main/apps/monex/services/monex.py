@@ -1,12 +1,13 @@
 import atexit
 import logging
+import threading
 from abc import ABC
 from datetime import datetime, date, timedelta
 from typing import Any, Union, Optional, Dict
 
 import pytz
+import requests
 from django.conf import settings
-from django.core.cache import cache
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -16,6 +17,7 @@ from main.apps.core.services.http_request import ApiBase
 from main.apps.currency.models import Currency
 from main.apps.monex.models import MonexCompanySettings
 from main.apps.monex.services.api.exceptions import *
+from main.apps.monex.services.session_pool import MonexSession, MonexSessionPool
 from main.apps.settlement.models import BeneficiaryBroker, Wallet
 from main.apps.settlement.models.beneficiary import Beneficiary
 
@@ -44,28 +46,18 @@ class MonexApi(ApiBase):
     account_type_map = {}
     rev_account_type_map = {}
 
-    SESSION_CACHE_KEY = 'monex_session_id'
     SESSION_TIMEOUT = 600  # 10 minutes
 
+    # sessions are shared by all instances, one per (client, customer id)
+    _session_pool = None
+    _session_pool_lock = threading.Lock()
+
     def __init__(self, url_base=settings.MONEX_API_BASE,
                  clientId=settings.MONEX_CLIENT_ID, apiKey=settings.MONEX_API_KEY,
                  client_type='trusted', retries=1, auto=False):
 
         self.url_base = url_base
-        self.session = self.get_session()
-
-        retry_strategy = Retry(
-            total=retries,  # Total number of retries to allow
-            # A set of HTTP status codes that we want to retry
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "POST",
-                             "PUT", "DELETE", "OPTIONS", "TRACE"],
-            # Allow retries on these methods
-            backoff_factor=1,  # Backoff factor to apply between attempts
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount(self.url_base, adapter)
-
+        self.retries = retries
         self.clientId = clientId
         self.apiKey = apiKey
         self.client_type = client_type
@@ -91,31 +83,68 @@ class MonexApi(ApiBase):
     104.198.39.18
     """
 
+    # ===============================
+    # Sessions
+    #
+    # Every customer gets its own monex session (cookie jar), logged in once into that customer's context, so
+    # requests for different companies run in parallel and never call /login/changeCustomerId back and forth.
+    # ===============================
+
+    @property
+    def session_pool(self) -> MonexSessionPool:
+        if MonexApi._session_pool is None:
+            with MonexApi._session_pool_lock:
+                if MonexApi._session_pool is None:
+                    MonexApi._session_pool = MonexSessionPool(http_factory=self._new_http_session,
+                                                              ttl=self.SESSION_TIMEOUT)
+        return MonexApi._session_pool
+
+    def _new_http_session(self) -> requests.Session:
+        session = requests.Session()
+        retry_strategy = Retry(
+            total=self.retries,  # Total number of retries to allow
+            # A set of HTTP status codes that we want to retry
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "POST",
+                             "PUT", "DELETE", "OPTIONS", "TRACE"],
+            # Allow retries on these methods
+            backoff_factor=1,  # Backoff factor to apply between attempts
+        )
+        session.mount(self.url_base, HTTPAdapter(max_retries=retry_strategy))
+        return session
+
+    def _session_key(self, customer_id=None):
+        return self.clientId, customer_id
+
+    def _customer_id_or_none(self, company):
+        return self.get_customer_id(company) if company is not None else None
+
+    def _http_for(self, headers) -> requests.Session:
+        customer_id = headers.get('X-Customer-ID') if headers else None
+        session = self.session_pool.get(self._session_key(customer_id))
+        session.touch()
+        return session.http
+
+    def get(self, *args, **kwargs):
+        return self._http_for(kwargs.get('headers')).get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self._http_for(kwargs.get('headers')).post(*args, **kwargs)
+
+    def invalidate_session(self, company=None):
+        """ Drop the login state of the session of a company, it logs in again on next use """
+        self.session_pool.invalidate(self._session_key(self._customer_id_or_none(company)))
+        self.session_id = None
+
     def login(self, company=None):
-        self.session_id = cache.get(self.SESSION_CACHE_KEY)
-        if self.session_id:
-            if company:
-                try:
-                    self._update_customer_id_if_needed(company)
-                except Exception as e:
-                    if 'ErrNotLoggedIn' in str(e):
-                        self._perform_login(company)
-                        self._update_customer_id_if_needed(company)
-                    else:
-                        raise
-            return self.session_id
-
-        self._perform_login(company)
-
-    def _update_customer_id_if_needed(self, company):
-        customer_id = self.get_customer_id(company)
-        if self.customer_id is None:
-            # no customer id yet, continue with login
-            return
-        if self.customer_id != customer_id:
-            self.change_customer_id(customer_id)
-
-    def _perform_login(self, company):
+        customer_id = self._customer_id_or_none(company)
+        self.session_pool.acquire(self._session_key(customer_id),
+                                  login=lambda session: self._perform_login(session, customer_id))
+        self.session_id = True
+        self.customer_id = customer_id
+        return self.session_id
+
+    def _perform_login(self, session: MonexSession, customer_id=None):
         data = {
             "publicKey": self.clientId,
             "secretKey": self.apiKey,
@@ -123,8 +152,11 @@ class MonexApi(ApiBase):
         headers = self._get_login_headers()
         url = f'{self.url_base}/login/submitApiClientKeys'
         logger.info(f'{url} :: {headers} :: {data}')
-        response = self.post(url, headers=headers, json=data)
-        self._handle_login_response(response, company)
+        response = session.http.post(url, headers=headers, json=data)
+        self._handle_login_response(response)
+        if customer_id:
+            # once per login, each session stays in its customer's context
+            self._change_customer_id(session, customer_id)
 
     def _get_login_headers(self):
         return {
@@ -133,59 +165,45 @@ class MonexApi(ApiBase):
             'Authorization': f'Bearer {self.apiKey}',
         }
 
-    def _handle_login_response(self, response, company):
+    def _handle_login_response(self, response):
         if response.status_code == 200:
             data = response.json()
             if 'err' in data:
-                self.session_id = False
                 raise Exception(str(data))
-            self.session_id = True
-            cache.set(self.SESSION_CACHE_KEY,
-                      self.session_id, self.SESSION_TIMEOUT)
-            if company:
-                self.customer_id = self.get_customer_id(company)
         else:
-            self.session_id = False
+            raise Exception(f'monex login failed with status code {response.status_code}')
 
     def logout(self):
-        self.session_id = cache.get(self.SESSION_CACHE_KEY)
-        if not self.session_id:
-            return
-        headers = {
-            'X-API-Client': self.client_type,
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.apiKey}',
-        }
+        self.session_pool.close(logout=self._perform_logout)
+        self.session_id = False
+
+    def _perform_logout(self, session: MonexSession):
+        headers = self._get_login_headers()
         url = f'{self.url_base}/login/logout'
         logger.info(f'{url} :: {headers}')
-        response = self.post(url, headers=headers)
+        response = session.http.post(url, headers=headers)
         if response.status_code == 200:
             data = response.json()
             if 'err' in data:
-                self.session_id = False
                 raise Exception(str(data))
-            self.session_id = False
 
     def change_customer_id(self, customer_id):
-        if not self.session_id:
-            return
-        headers = {
-            'X-API-Client': self.client_type,
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.apiKey}',
-        }
+        """ Make sure the session of a customer is logged in, sessions are never switched between customers """
+        self.session_pool.acquire(self._session_key(customer_id),
+                                  login=lambda session: self._perform_login(session, customer_id))
+        self.customer_id = customer_id
+
+    def _change_customer_id(self, session: MonexSession, customer_id):
+        headers = self._get_login_headers()
         url = f'{self.url_base}/login/changeCustomerId'
         logger.info(f'{url} :: {headers} :: {customer_id}')
-        response = self.post(url, headers=headers, json={
-                             'customerId': customer_id})
+        response = session.http.post(url, headers=headers, json={
+                                     'customerId': customer_id})
         if response.status_code == 200:
             data = response.json()
             if 'err' in data:
-                self.customer_id = False
                 raise Exception(str(data))
-            self.customer_id = customer_id
         else:
-            self.customer_id = False
             raise Exception(str(response.json()))
 
     # =================
@@ -302,8 +320,7 @@ class MonexApi(ApiBase):
             if 'ErrNotLoggedIn' in str(e) or 'sessionExpired' in str(e):
                 logger.info(
                     "Session expired or not logged in. Attempting to re-login.")
-                self.session_id = None
-                cache.delete(self.SESSION_CACHE_KEY)
+                self.invalidate_session(company)
                 self.login(company)
                 logger.info("Re-login completed. Retrying original request.")
                 response = method(url, **kwargs)
@@ -750,8 +767,7 @@ class MonexApi(ApiBase):
             if 'ErrNotLoggedIn' in str(e) or 'sessionExpired' in str(e):
                 logger.info(
                     "Session expired or not logged in. Attempting to re-login.")
-                self.session_id = None
-                cache.delete(self.SESSION_CACHE_KEY)
+                self.invalidate_session(company)
                 self.login(company)
                 logger.info(
                     "Re-login completed. Retrying get_payment_value_dates.")
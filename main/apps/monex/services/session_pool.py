@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class MonexSession:
+    """
+    Login state of one Monex customer context. Each session has its own cookie jar (requests.Session), so sessions
+    for different customers are independent and never need to switch customer.
+    """
+
+    def __init__(self, key: Hashable, http: requests.Session, ttl: float, refresh_margin: float = 30):
+        self.key = key
+        self.http = http
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.lock = threading.RLock()
+        self.logged_in = False
+        self.last_used: Optional[float] = None
+
+    def is_valid(self, now: Optional[float] = None) -> bool:
+        """ True if the session is logged in and not about to expire (Monex sessions expire when idle) """
+        if not self.logged_in or self.last_used is None:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self.last_used < self.ttl - self.refresh_margin
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def invalidate(self):
+        self.logged_in = False
+        self.last_used = None
+
+
+class MonexSessionPool:
+    """
+    Thread safe pool of Monex sessions, one per key (e.g. per customer id). Logins of different keys proceed in
+    parallel, concurrent callers of the same key wait for a single login.
+    """
+
+    def __init__(self, http_factory: Callable[[], requests.Session], ttl: float, refresh_margin: float = 30):
+        self._http_factory = http_factory
+        self._ttl = ttl
+        self._refresh_margin = refresh_margin
+        self._sessions: Dict[Hashable, MonexSession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> MonexSession:
+        """ Get the session of a key, creating it (not logged in) if needed """
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = MonexSession(key=key, http=self._http_factory(), ttl=self._ttl,
+                                       refresh_margin=self._refresh_margin)
+                self._sessions[key] = session
+        return session
+
+    def acquire(self, key: Hashable, login: Callable[[MonexSession], None]) -> MonexSession:
+        """
+        Get a logged in session of a key, logging in (again) if the session is new, was invalidated or is close to
+        expiring.
+
+        :param key: The key of the session
+        :param login: Called with the session to log it in, raises on failure
+        """
+        session = self.get(key)
+        if session.is_valid():
+            return session
+        with session.lock:
+            if not session.is_valid():
+                logger.info(f"Logging in monex session {key}")
+                session.invalidate()
+                login(session)
+                session.logged_in = True
+                session.touch()
+        return session
+
+    def invalidate(self, key: Hashable):
+        session = self._sessions.get(key)
+        if session is not None:
+            with session.lock:
+                session.invalidate()
+
+    def sessions(self) -> List[MonexSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def close(self, logout: Optional[Callable[[MonexSession], None]] = None):
+        """ Log out (if a logout function is given) and close every session """
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            try:
+                if logout is not None and session.logged_in:
+                    logout(session)
+            except Exception as e:
+                logger.warning(f"Unable to log out monex session {session.key}: {e}")
+            finally:
+                session.invalidate()
+                session.http.close()
@@ -1,3 +1,53 @@
-from django.test import TestCase
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from main.apps.monex.services.session_pool import MonexSessionPool
+
+
+class MonexSessionPoolTest(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = MonexSessionPool(http_factory=mock.MagicMock, ttl=600, refresh_margin=30)
+        self.logins = []
+        self.lock = threading.Lock()
+
+    def login(self, session):
+        time.sleep(0.01)
+        with self.lock:
+            self.logins.append(session.key)
+
+    def test_one_login_per_key(self):
+        threads = [threading.Thread(target=self.pool.acquire, args=(key, self.login))
+                   for key in ('A', 'B') for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(self.logins), ['A', 'B'])
+        self.assertIsNot(self.pool.get('A').http, self.pool.get('B').http)
+
+    def test_relogin_after_invalidate_or_expiry(self):
+        session = self.pool.acquire('A', self.login)
+        self.pool.acquire('A', self.login)
+        self.assertEqual(self.logins, ['A'])
+
+        self.pool.invalidate('A')
+        self.pool.acquire('A', self.login)
+        self.assertEqual(self.logins, ['A', 'A'])
+
+        # idle for longer than the ttl, less the refresh margin
+        session.last_used -= 580
+        self.pool.acquire('A', self.login)
+        self.assertEqual(self.logins, ['A', 'A', 'A'])
+
+    def test_failed_login_is_retried(self):
+        with self.assertRaises(ValueError):
+            self.pool.acquire('A', mock.Mock(side_effect=ValueError('ErrLogin')))
+        self.assertFalse(self.pool.get('A').logged_in)
+
+        self.pool.acquire('A', self.login)
+        self.assertEqual(self.logins, ['A'])
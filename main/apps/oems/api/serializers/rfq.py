@@ -105,7 +105,11 @@ class RfqSerializer(serializers.ModelSerializer):
 
         return attrs
 
-    def save(self):
+    def save(self, deferred=None):
+        """
+        Create the ticket and RFQ it. With a deferred list, the ticket is quoted without being saved and appended to
+        it, for the caller to save (and then publish) after the broker round trip.
+        """
         from main.apps.oems.backend.rfq_utils import do_api_rfq, do_indicative_rfq
         valid = self.validated_data
 
@@ -114,22 +118,35 @@ class RfqSerializer(serializers.ModelSerializer):
         valid['external_state'] = EXTERNAL_STATES.PENDING
         valid['phase'] = PHASES.PRETRADE
 
-        ticket = super().save()
+        if deferred is None:
+            ticket = super().save()
+        else:
+            ticket = self.instance = Ticket(**valid)
 
         rfq_type = ticket.rfq_type
 
         if rfq_type == Ticket.RfqType.API:
             # TODO: check if client is eligible for mass payments. route accordingly.
-            if do_api_rfq(ticket):
+            if do_api_rfq(ticket) and deferred is None:
                 ticket.save()
         elif rfq_type == Ticket.RfqType.INDICATIVE:
-            if do_indicative_rfq(ticket):
+            if do_indicative_rfq(ticket) and deferred is None:
                 ticket.save()
         elif rfq_type == Ticket.RfqType.NORFQ or rfq_type == Ticket.RfqType.UNSUPPORTED:
             raise serializers.ValidationError("This market does not support RFQ.")
 
         logger.info( f'creating rfq ticket: {ticket.export()}')
 
+        if deferred is None:
+            self.publish(ticket)
+        else:
+            deferred.append(ticket)
+
+        return ticket
+
+    @staticmethod
+    def publish(ticket):
+        # hand the ticket to the OMS unless the RFQ finished it, and notify the webhooks
         if ticket.internal_state != INTERNAL_STATES.RFQ_DONE and ticket.internal_state not in INTERNAL_STATES.OMS_TERMINAL_STATES:
             data = ticket.export()
             topic = f'api2oms_{settings.APP_ENVIRONMENT}'
@@ -139,8 +156,6 @@ class RfqSerializer(serializers.ModelSerializer):
 
         ticket.dispatch_event(WEBHOOK_EVENTS.TICKET_CREATED)
 
-        return ticket
-
     class Meta:
         model = Ticket
         # These are the fields we want to expose publicly via the API
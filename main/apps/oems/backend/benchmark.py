@@ -0,0 +1,390 @@
+"""
+Throughput benchmark of the OMS / EMS cycles.
+
+OemsBenchmark seeds the database with a mix of tickets, enqueues their messages on a dedicated queue table, and drives
+an OmsBase and the RfqEms / CorpayEms it routes to, in process, phase by phase, until every ticket is through. Broker
+calls go to StubRfqInterface (registered under its own broker name) with a configurable latency per call, trade
+confirmations are stubbed the same way. The report has the tickets per second, a latency histogram of each phase and
+the SQL each phase issues per cycle: statements and round trips through the OEMS DbAdaptor, statements through the
+django ORM.
+
+It writes tickets, life cycle events and queue messages: run it against a local database (see the oems_benchmark
+command), never against production.
+"""
+import bisect
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, List, Optional
+from unittest import mock
+
+from django.db import connection
+
+from main.apps.oems.backend.corpay_ems import CorpayEms
+from main.apps.oems.backend.date_utils import now, add_time
+from main.apps.oems.backend.db import DbAdaptor
+from main.apps.oems.backend.oms import OmsBase, ENV
+from main.apps.oems.backend.rfq_ems import RfqEms
+from main.apps.oems.backend.rfq_utils import RfqInterface
+from main.apps.oems.backend.states import INTERNAL_STATES, EXTERNAL_STATES, OMS_API_ACTIONS, PHASES
+from main.apps.oems.backend.ticket import Ticket
+from main.apps.oems.models.cny import CnyExecution
+from main.apps.oems.models.life_cycle import LifeCycleEvent
+from main.apps.oems.models.ticket import Ticket as DjangoTicket
+
+logger = logging.getLogger(__name__)
+
+
+# ==================
+
+class StubRfqInterface(RfqInterface):
+    """ A broker that quotes and fills everything at a fixed rate, after latency[call] seconds """
+
+    broker = 'BENCHMARK'
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None, rate=1.1, quote_life=3600):
+        super().__init__()
+        self.latency = latency or {}
+        self.rate = rate
+        self.quote_life = quote_life
+        self.calls = Counter()
+
+    def call(self, name):
+        self.calls[name] += 1
+        delay = self.latency.get(name)
+        if delay:
+            time.sleep(delay)
+
+    def rfq(self, ticket, *args, internal_only=False, **kwargs):
+        self.call('rfq')
+        ticket.quote_source = self.broker
+        ticket.internal_quote_id = str(uuid.uuid4())
+        ticket.internal_quote = self.rate
+        ticket.internal_quote_expiry = add_time(now(), seconds=self.quote_life)
+        if not internal_only:
+            ticket.external_quote_id = str(uuid.uuid4())
+            ticket.external_quote = self.rate
+            ticket.external_quote_expiry = add_time(now(), seconds=self.quote_life)
+        ticket.rate = ticket.all_in_rate = self.rate
+        ticket.change_internal_state(INTERNAL_STATES.RFQ_DONE)
+        if ticket.action == DjangoTicket.Actions.RFQ:
+            ticket.change_external_state(EXTERNAL_STATES.DONE)
+        return True
+
+    def execute(self, ticket, *args, **kwargs):
+        self.call('execute')
+        ticket.broker_id = str(uuid.uuid4())
+        ticket.done = ticket.all_in_done = ticket.amount
+        ticket.cntr_done = ticket.all_in_cntr_done = ticket.amount * self.rate
+        ticket.change_internal_state(INTERNAL_STATES.FILLED)
+        # like the broker interfaces: False once booked, the ems hands the ticket back to the oms
+        return False
+
+    def complete(self, ticket, *args, **kwargs):
+        self.call('complete')
+        return True
+
+    def settle(self, ticket, *args, **kwargs):
+        self.call('settle')
+        return True
+
+    def time_to_settle(self, ticket, *args, **kwargs):
+        self.call('time_to_settle')
+        return True
+
+    def pre_exec_check(self, ticket, *args, **kwargs):
+        self.call('pre_exec_check')
+        return True
+
+
+# ==================
+
+class LatencyHistogram:
+    """ Durations in power of two millisecond buckets, with exact percentiles """
+
+    BUCKETS_MS = [2 ** i for i in range(-2, 14)]  # 0.25ms .. 8s
+
+    def __init__(self):
+        self.samples: List[float] = []
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, q: float) -> float:
+        """ q-th percentile in milliseconds (nearest rank) """
+        if not self.samples:
+            return 0.
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100. * len(ordered)))] * 1000.
+
+    def buckets(self) -> Dict[str, int]:
+        """ Count of the samples below each bucket bound, only the non empty buckets """
+        counts = Counter(bisect.bisect_right(self.BUCKETS_MS, sample * 1000.) for sample in self.samples)
+        labels = [f'<{bound:g}ms' for bound in self.BUCKETS_MS] + [f'>={self.BUCKETS_MS[-1]:g}ms']
+        return {labels[i]: counts[i] for i in sorted(counts)}
+
+
+class SqlCounter:
+    """
+    Statements and round trips through the OEMS DbAdaptor, and statements through the django ORM, by phase. The
+    statements DbAdaptor.execute_many_and_commit joins into one round trip count one by one.
+    """
+
+    def __init__(self):
+        self.db = Counter()
+        self.db_round_trips = Counter()
+        self.orm = Counter()
+        self.phase = None
+        self._in_batch = False
+
+    @contextmanager
+    def count(self):
+        counter = self
+        execute = DbAdaptor.execute
+        execute_many_and_commit = DbAdaptor.execute_many_and_commit
+
+        def counting_execute(db, *args, **kwargs):
+            counter.db_round_trips[counter.phase] += 1
+            if not counter._in_batch:
+                counter.db[counter.phase] += 1
+            return execute(db, *args, **kwargs)
+
+        def counting_execute_many_and_commit(db, sqls):
+            counter.db[counter.phase] += len(sqls)
+            counter._in_batch = True
+            try:
+                return execute_many_and_commit(db, sqls)
+            finally:
+                counter._in_batch = False
+
+        def orm_wrapper(execute, sql, params, many, context):
+            counter.orm[counter.phase] += 1
+            return execute(sql, params, many, context)
+
+        with mock.patch.object(DbAdaptor, 'execute', counting_execute), \
+                mock.patch.object(DbAdaptor, 'execute_many_and_commit', counting_execute_many_and_commit), \
+                connection.execute_wrapper(orm_wrapper):
+            yield self
+
+
+class BenchmarkReport:
+
+    def __init__(self, tickets: int, finished: int, cycles: int, elapsed: float,
+                 phases: Dict[str, LatencyHistogram], ticket_latency: LatencyHistogram,
+                 sql: SqlCounter, broker_calls: Counter, states: Counter):
+        self.tickets = tickets
+        self.finished = finished
+        self.cycles = cycles
+        self.elapsed = elapsed
+        self.phases = phases
+        self.ticket_latency = ticket_latency
+        self.sql = sql
+        self.broker_calls = broker_calls
+        self.states = states
+
+    @property
+    def throughput(self) -> float:
+        return self.finished / self.elapsed if self.elapsed else 0.
+
+    def format(self) -> str:
+        lines = [f'{self.finished}/{self.tickets} tickets through in {self.elapsed:.2f}s over {self.cycles} cycles: '
+                 f'{self.throughput:.1f} tickets/s',
+                 f'ticket latency ms: p50={self.ticket_latency.percentile(50):.1f} '
+                 f'p95={self.ticket_latency.percentile(95):.1f} p99={self.ticket_latency.percentile(99):.1f}',
+                 f'final states: {dict(self.states)}',
+                 f'broker calls: {dict(self.broker_calls)}',
+                 '',
+                 f'{"phase":<24}{"calls":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}'
+                 f'{"db/cycle":>10}{"trips/cycle":>12}{"orm/cycle":>10}']
+        for name, histogram in self.phases.items():
+            calls = len(histogram) or 1
+            lines.append(f'{name:<24}{len(histogram):>8}{histogram.percentile(50):>9.2f}'
+                         f'{histogram.percentile(95):>9.2f}{histogram.percentile(99):>9.2f}'
+                         f'{histogram.percentile(100):>9.2f}{self.sql.db[name] / calls:>10.2f}'
+                         f'{self.sql.db_round_trips[name] / calls:>12.2f}{self.sql.orm[name] / calls:>10.2f}')
+        lines.append('')
+        for name, histogram in self.phases.items():
+            lines.append(f'{name}: ' + ' '.join(f'{label}={n}' for label, n in histogram.buckets().items()))
+        return '\n'.join(lines)
+
+
+# ==================
+
+class OemsBenchmark:
+    """
+    mix: relative weights of the kinds of tickets to seed
+        rfq     - quoted by the RfqEms, done once the quote is back
+        execute - quoted and filled by the CorpayEms, then completed and settled by the oms
+        cancel  - drafts, cancelled by an api message once the oms holds them
+    """
+
+    KINDS = ('rfq', 'execute', 'cancel')
+    # the oms keeps PENDRECON tickets until the value date, they are through as far as the hot path is concerned
+    FINISHED_STATES = INTERNAL_STATES.OMS_TERMINAL_STATES | {INTERNAL_STATES.PENDRECON}
+
+    def __init__(self, company, sell_currency, buy_currency, fxpair, n_tickets=100, mix=None, latency=None,
+                 queue_name='oems_benchmark', batch_size=10):
+        self.company = company
+        self.sell_currency = sell_currency
+        self.buy_currency = buy_currency
+        self.fxpair = fxpair
+        self.n_tickets = n_tickets
+        self.mix = mix or {'rfq': 1, 'execute': 1, 'cancel': 1}
+        if set(self.mix) - set(self.KINDS):
+            raise ValueError(f'unknown ticket kinds: {set(self.mix) - set(self.KINDS)}')
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.interface = StubRfqInterface(latency=latency)
+
+        self.tickets: Dict[int, DjangoTicket] = {}
+        self.kinds: Dict[int, str] = {}
+        self.seeded_at: Dict[int, float] = {}
+
+    # ==================
+
+    def seed(self):
+        """ Tickets in the database and their CREATE messages on the api queue """
+        kinds = self._kinds()
+        tickets = DjangoTicket.objects.bulk_create([self._ticket(kind) for kind in kinds])
+        Ticket.ensure_db()
+        db = Ticket._db
+        db.ensure_queue([], queue_table=self.queue_name)
+        for ticket, kind in zip(tickets, kinds):
+            self.tickets[ticket.id] = ticket
+            self.kinds[ticket.id] = kind
+            self.seeded_at[ticket.id] = time.perf_counter()
+            db.enqueue(f'api2oms_{ENV}', ticket.export(), uid=ticket.id, action=OMS_API_ACTIONS.CREATE,
+                       source='BENCHMARK', queue_table=self.queue_name)
+        return tickets
+
+    def run(self, max_cycles=100000, timeout=600.) -> BenchmarkReport:
+        oms = OmsBase('BENCH', 'MARK', regen=True, queue_name=self.queue_name, batch_size=self.batch_size,
+                      timeout=None, child=True)
+        rfq_ems = RfqEms('BENCH', f'{self.interface.broker}_RFQ', regen=True, queue_name=self.queue_name,
+                         batch_size=self.batch_size, timeout=None, child=True)
+        corpay_ems = CorpayEms('BENCH', self.interface.broker, regen=True, queue_name=self.queue_name,
+                               batch_size=self.batch_size, timeout=None, child=True)
+        phases = [
+            ('oms.internal_queue', lambda: oms.cycle_internal_queue(oms._ems_queue_name)),
+            ('oms.api_queue', lambda: oms.cycle_api_queue(oms._api_queue_name)),
+            ('oms.new_api_queue', lambda: oms.cycle_api_queue(oms.API_QUEUE_NAME)),
+            ('oms.tickets', oms.cycle_tickets),
+            ('rfq_ems.queues', rfq_ems.cycle_queues),
+            ('rfq_ems.tickets', rfq_ems.cycle_tickets),
+            ('corpay_ems.queues', corpay_ems.cycle_queues),
+            ('corpay_ems.tickets', corpay_ems.cycle_tickets),
+        ]
+        histograms = {name: LatencyHistogram() for name, _ in phases}
+        ticket_latency = LatencyHistogram()
+        sql = SqlCounter()
+
+        seen, finished, cancels_sent = set(), set(), set()
+        start = time.perf_counter()
+        cycles = 0
+        with self.stubs(), sql.count():
+            while len(finished) < len(self.tickets) and cycles < max_cycles \
+                    and time.perf_counter() - start < timeout:
+                cycles += 1
+                for name, phase in phases:
+                    sql.phase = name
+                    phase_start = time.perf_counter()
+                    phase()
+                    histograms[name].record(time.perf_counter() - phase_start)
+                sql.phase = None
+
+                for ticket_id in self.tickets.keys() - finished:
+                    ticket = oms.tickets.get(ticket_id)
+                    if ticket is not None:
+                        seen.add(ticket_id)
+                        if self.kinds[ticket_id] == 'cancel' and ticket_id not in cancels_sent:
+                            # the oms only takes api actions for the tickets it holds
+                            cancels_sent.add(ticket_id)
+                            Ticket._db.enqueue(oms._api_queue_name, {'id': ticket_id}, uid=ticket_id,
+                                               action=OMS_API_ACTIONS.CANCEL, source='BENCHMARK',
+                                               queue_table=self.queue_name)
+                    if ticket_id in seen and (ticket is None or ticket.internal_state in self.FINISHED_STATES):
+                        finished.add(ticket_id)
+                        ticket_latency.record(time.perf_counter() - self.seeded_at[ticket_id])
+        elapsed = time.perf_counter() - start
+
+        states = Counter(DjangoTicket.objects.filter(pk__in=self.tickets).values_list('internal_state', flat=True))
+        return BenchmarkReport(tickets=len(self.tickets), finished=len(finished), cycles=cycles, elapsed=elapsed,
+                               phases=histograms, ticket_latency=ticket_latency, sql=sql,
+                               broker_calls=self.interface.calls, states=states)
+
+    def clean_up(self):
+        """ Remove the seeded tickets, their life cycle events and the benchmark queue """
+        ticket_ids = [ticket.ticket_id for ticket in self.tickets.values()]
+        LifeCycleEvent.objects.filter(ticket_id__in=ticket_ids).delete()
+        DjangoTicket.objects.filter(pk__in=self.tickets).delete()
+        Ticket._db.drop_queue(queue_table=self.queue_name)
+
+    @contextmanager
+    def stubs(self):
+        """ The stub broker, and no trade confirmations """
+        key = self.interface.broker
+        previous = RfqInterface.broker_interfaces.get(key)
+        RfqInterface.register(self.interface, key=key)
+        try:
+            with mock.patch.object(Ticket, 'send_confirm',
+                                   lambda ticket, *args, **kwargs: self.interface.call('confirm')):
+                yield
+        finally:
+            if previous is None:
+                RfqInterface.broker_interfaces.pop(key, None)
+            else:
+                RfqInterface.broker_interfaces[key] = previous
+
+    # ==================
+    # Private
+    # ==================
+
+    def _kinds(self) -> List[str]:
+        # deterministic interleaving of the mix (smooth weighted round robin), e.g. rfq, execute, cancel, rfq, ...
+        total = sum(self.mix.values())
+        kinds, credit = [], defaultdict(float)
+        for _ in range(self.n_tickets):
+            for kind, weight in self.mix.items():
+                credit[kind] += weight
+            kind = max(credit, key=credit.get)
+            credit[kind] -= total
+            kinds.append(kind)
+        return kinds
+
+    def _ticket(self, kind: str) -> DjangoTicket:
+        action = DjangoTicket.Actions.RFQ if kind == 'rfq' else DjangoTicket.Actions.EXECUTE
+        return DjangoTicket(
+            company=self.company,
+            sell_currency=self.sell_currency,
+            buy_currency=self.buy_currency,
+            lock_side=self.sell_currency,
+            amount=10000.,
+            tenor=DjangoTicket.Tenors.SPOT,
+            value_date=date.today(),
+            draft=kind == 'cancel',
+            time_in_force=DjangoTicket.TimeInForces._1HR,
+            ticket_type=DjangoTicket.TicketTypes.PAYMENT,
+            transaction_id=f'benchmark-{uuid.uuid4()}',
+            action=action,
+            execution_strategy=DjangoTicket.ExecutionStrategies.MARKET,
+            instrument_type=DjangoTicket.InstrumentTypes.SPOT,
+            market_name=self.fxpair.market,
+            fxpair=self.fxpair,
+            side=DjangoTicket.Sides.SELL,
+            trader='benchmark',
+            auth_user='benchmark',
+            broker=self.interface.broker,
+            destination=f'{self.interface.broker}_RFQ' if kind == 'rfq' else self.interface.broker,
+            rfq_type=CnyExecution.RfqTypes.API,
+            beneficiaries=[{'beneficiary_id': 'benchmark', 'method': 'swift', 'amount': 10000.}]
+            if kind == 'execute' else None,
+            internal_state=INTERNAL_STATES.DRAFT if kind == 'cancel' else INTERNAL_STATES.NEW,
+            external_state=EXTERNAL_STATES.NEW,
+            phase=PHASES.PRETRADE,
+        )
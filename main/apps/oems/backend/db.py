@@ -3,7 +3,7 @@ import socket
 import sqlite3
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from math import isnan
 from uuid import uuid4, UUID
 
@@ -26,6 +26,7 @@ except ImportError:
 
 # ======================================
 
+from main.apps.oems.backend.states import INTERNAL_STATES
 from main.apps.oems.backend.utils import jsonify
 
 # build a db connection class that handles connects, cursor, and reconnects.
@@ -235,6 +236,7 @@ class DbAdaptor:
         self.connection = connection
         self.cursor = None
         self.in_tran = False
+        self.column_type_cache = {}
 
         if dbtype == 'POSTGRES':
 
@@ -331,6 +333,54 @@ class DbAdaptor:
         else:
             return f'select {columns} from {full_table}'
 
+    def select_where_in(self, schema, table, key, values, columns=None):
+        columns = '*' if columns is None else ','.join(f'"{k}"' for k in columns)
+        full_table = f'"{schema}"."{table}"' if schema and self.dbtype == 'POSTGRES' else f'"{table}"'
+        values = ','.join(self.pytype(value) for value in values)
+        return f'select {columns} from {full_table} where "{key}" in ({values})'
+
+    def update_many_sql(self, schema, table, rows, key_fld):
+        """
+        UPDATE statements for many rows, given as {key: {column: value}}. On postgres, rows that update the same
+        columns share a single UPDATE ... FROM (VALUES ...), with the values cast to the column types.
+        """
+        if self.dbtype != 'POSTGRES':
+            return [self.update_sql(schema, table, params, key_fld, key) for key, params in rows.items()]
+
+        groups = {}
+        for key, params in rows.items():
+            columns = tuple(sorted(k for k in params if k != key_fld))
+            if columns:
+                groups.setdefault(columns, []).append((key, params))
+
+        types = self.column_types(schema, table)
+        full_table = f'"{schema}"."{table}"' if schema else f'"{table}"'
+
+        def cast(column, value):
+            typ = types.get(column)
+            return f'{self.escape(value)}::{typ}' if typ else self.escape(value)
+
+        sqls = []
+        for columns, group in groups.items():
+            values = ','.join(
+                '(' + ','.join([cast(key_fld, key)] + [cast(k, params[k]) for k in columns]) + ')'
+                for key, params in group
+            )
+            alias = ','.join(f'"{k}"' for k in (key_fld, *columns))
+            set_clause = ','.join(f'"{k}"=v."{k}"' for k in columns)
+            sqls.append(f'UPDATE {full_table} AS t SET {set_clause} FROM (VALUES {values}) AS v({alias}) '
+                        f'WHERE t."{key_fld}" = v."{key_fld}"')
+        return sqls
+
+    def column_types(self, schema, table):
+        """ column name -> postgres type name, cached per table """
+        cache = self.column_type_cache
+        if (schema, table) not in cache:
+            sql = (f"select column_name, udt_name from information_schema.columns "
+                   f"where table_name = {self.escape(table)} and table_schema = {self.escape(schema or 'public')}")
+            cache[(schema, table)] = {row['column_name']: row['udt_name'] for row in self.fetch_and_commit(sql)}
+        return cache[(schema, table)]
+
     # ======================
 
     @open_transaction
@@ -421,6 +471,17 @@ class DbAdaptor:
         self.execute(*args, **kwargs)
         self.commit()
 
+    @rollback_transaction
+    def execute_many_and_commit(self, sqls):
+        # one round-trip and one commit for all the statements
+        if not sqls: return
+        if self.dbtype == 'POSTGRES':
+            self.execute(';'.join(sqls))
+        else:
+            for sql in sqls:
+                self.execute(sql)
+        self.commit()
+
     # =========================================================================
 
     def ensure_db_objects(self, config, sync_schema=True, drop=False, truncate=False, dry_run=False):
@@ -701,6 +762,135 @@ FROM selected"""
         sql = self.delete_sql(queue_schema, queue_table, 'topic', topic)
         return self.execute_and_commit(sql)
 
+    # =========================================================================
+    # Queue maintenance: completed messages are moved to {queue_table}_archive in bounded batches, so the queue only
+    # holds live messages and the dequeue scan does not grow with history. The archive is range partitioned on the day
+    # a message was archived, old history is dropped one partition at a time.
+
+    def ensure_queue_archive(self, queue_schema=None, queue_table='global1', days_ahead=2, return_cmd=False):
+
+        full_table = f'"{queue_schema}"."{queue_table}"' if queue_schema else f'"{queue_table}"'
+        archive_table = f'{queue_table}_archive'
+        full_archive = f'"{queue_schema}"."{archive_table}"' if queue_schema else f'"{archive_table}"'
+
+        sql = [f"""create index if not exists done_idx_{queue_table} on {full_table} (id)
+where dequeued_at is not null;""",
+               f"""create table if not exists {full_archive} (
+  id          bigint       NOT NULL,
+  eid         uuid NOT NULL,
+  enqueued_at timestamp  NOT NULL,
+  dequeued_at timestamp,
+  action text,
+  source text,
+  topic       text         NOT NULL,
+  uid         bigint       NOT NULL,
+  data        jsonb        NOT NULL,
+  resp        jsonb,
+  resp_at     timestamp,
+  archived_at timestamp  NOT NULL DEFAULT localtimestamp
+) partition by range (archived_at);""",
+               f"""create index if not exists {archive_table}_id_idx on {full_archive} (id);"""]
+
+        # yesterday as well, the session time zone of the database may be behind utc
+        today = datetime.utcnow().date()
+        for i in range(-1, days_ahead + 1):
+            day = today + timedelta(days=i)
+            partition = f'{archive_table}_p{day:%Y%m%d}'
+            full_partition = f'"{queue_schema}"."{partition}"' if queue_schema else f'"{partition}"'
+            sql.append(f"""create table if not exists {full_partition} partition of {full_archive}
+  for values from ('{day.isoformat()}') to ('{(day + timedelta(days=1)).isoformat()}');""")
+        sql = ''.join(sql)
+
+        if return_cmd:
+            return sql
+
+        return self.execute_and_commit(sql)
+
+    def archive_queue(self, min_age=3600, batch_size=1000, queue_schema=None, queue_table='global1',
+                      ticket_table='oems_ticket', return_cmd=False):
+        # move one batch of messages dequeued (and answered, if answered) more than min_age seconds ago.
+        # returns the number of messages moved, fewer than batch_size when the backlog is drained.
+        # a restart replays a ticket's messages from its last_message_id on, dequeued or not: only the messages
+        # its ticket has moved past, or of a terminal (or no) ticket, are archived.
+        # = ANY(ARRAY(...)) so the delete looks the batch up by primary key instead of scanning the queue
+        full_table = f'"{queue_schema}"."{queue_table}"' if queue_schema else f'"{queue_table}"'
+        archive_table = f'{queue_table}_archive'
+        full_archive = f'"{queue_schema}"."{archive_table}"' if queue_schema else f'"{archive_table}"'
+        terminal_states = ','.join(f"'{state}'" for state in sorted(INTERNAL_STATES.OMS_TERMINAL_STATES))
+        columns = 'id, eid, enqueued_at, dequeued_at, action, source, topic, uid, data, resp, resp_at'
+        sql = f"""WITH
+  moved AS (
+    DELETE FROM {full_table}
+    WHERE id = ANY(ARRAY(
+      SELECT q.id FROM {full_table} q
+      LEFT JOIN "{ticket_table}" t ON t.id = q.uid
+      WHERE
+        q.dequeued_at IS NOT NULL AND
+        coalesce(q.resp_at, q.dequeued_at) < localtimestamp - interval '{int(min_age)} seconds' AND
+        (t.id IS NULL OR q.id < t.last_message_id OR t.internal_state IN ({terminal_states}))
+      ORDER BY q.id
+      LIMIT {int(batch_size)}
+      FOR UPDATE OF q SKIP LOCKED
+    ))
+    RETURNING {columns}
+  ),
+  archived AS (
+    INSERT INTO {full_archive} ({columns})
+    SELECT {columns} FROM moved
+    RETURNING id
+  )
+SELECT count(*) AS n FROM archived"""
+        if return_cmd: return sql
+        ret = self.fetch_and_commit(sql)
+        return ret[0]['n'] if ret else 0
+
+    def drop_queue_archive_partitions(self, keep_days, queue_schema=None, queue_table='global1'):
+        # drop the archive partitions of days older than keep_days ago, returns the names of the dropped partitions
+        archive_table = f'{queue_table}_archive'
+        full_archive = f'"{queue_schema}"."{archive_table}"' if queue_schema else f'"{archive_table}"'
+        sql = f"""select c.relname from pg_inherits i join pg_class c on c.oid = i.inhrelid
+where i.inhparent = to_regclass('{full_archive}')"""
+        cutoff = f'{archive_table}_p{datetime.utcnow().date() - timedelta(days=keep_days):%Y%m%d}'
+        # partition names sort by day
+        dropped = sorted(row['relname'] for row in self.fetch_and_commit(sql)
+                         if row['relname'].startswith(f'{archive_table}_p') and row['relname'] < cutoff)
+        if dropped:
+            self.execute_and_commit(';'.join(
+                f'drop table if exists "{queue_schema}"."{partition}"' if queue_schema else
+                f'drop table if exists "{partition}"' for partition in dropped))
+        return dropped
+
+    def queue_stats(self, queue_schema=None, queue_table='global1', return_cmd=False):
+        # depth and age (in seconds) of the messages of each topic: pending are waiting to be dequeued, in_flight were
+        # dequeued and neither deleted nor answered yet, answered hold a response until archived
+        full_table = f'"{queue_schema}"."{queue_table}"' if queue_schema else f'"{queue_table}"'
+        sql = f"""SELECT
+  topic,
+  count(*) FILTER (WHERE dequeued_at IS NULL AND resp IS NULL) AS pending,
+  count(*) FILTER (WHERE dequeued_at IS NOT NULL AND resp IS NULL) AS in_flight,
+  count(*) FILTER (WHERE resp IS NOT NULL) AS answered,
+  extract(epoch FROM localtimestamp - min(enqueued_at) FILTER (WHERE dequeued_at IS NULL AND resp IS NULL))
+    AS oldest_pending_age,
+  extract(epoch FROM localtimestamp - min(dequeued_at) FILTER (WHERE dequeued_at IS NOT NULL AND resp IS NULL))
+    AS oldest_in_flight_age
+FROM {full_table}
+GROUP BY topic
+ORDER BY topic"""
+        if return_cmd: return sql
+        return self.fetch_and_commit(sql)
+
+    def queue_table_stats(self, queue_schema=None, queue_table='global1', return_cmd=False):
+        # live / dead tuples and size of the queue table, dead tuples are what the dequeue scan and vacuum pay for
+        full_table = f'"{queue_schema}"."{queue_table}"' if queue_schema else f'"{queue_table}"'
+        sql = f"""SELECT
+  n_live_tup, n_dead_tup, last_vacuum, last_autovacuum,
+  pg_total_relation_size(relid) AS total_bytes
+FROM pg_stat_user_tables
+WHERE relid = to_regclass('{full_table}')"""
+        if return_cmd: return sql
+        ret = self.fetch_and_commit(sql)
+        return ret[0] if ret else None
+
     # select from queue for responses or deadletter
 
 
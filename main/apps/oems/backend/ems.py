@@ -135,7 +135,8 @@ class EmsBase:
 
     def enqueue_oms(self, ticket, action):
         topic = f'ems2oms_{ENV}_{ticket.oms_owner}'
-        ticket.save()
+        # the row must be written before the message is visible to the other side
+        ticket.save(force=True)
         self.log("INFO", "ENQUEUE", topic, ticket.id, now().isoformat())
         ret = self._db.enqueue(topic, ticket.export(), action=action, source=self.ems_id, uid=ticket.id,
                                queue_table=self._queue_table)
@@ -344,13 +345,15 @@ class EmsBase:
 
         curtime = now()
 
-        for ticket in self.tickets.values():
-            try:
-                if curtime < ticket._next_update:
-                    continue
-            except:
-                pass
-            self.cycle_ticket(ticket)
+        # ticket saves are flushed together at the end of the cycle
+        with Ticket.write_behind():
+            for ticket in self.tickets.values():
+                try:
+                    if curtime < ticket._next_update:
+                        continue
+                except:
+                    pass
+                self.cycle_ticket(ticket)
 
         self.clean_up()
         self.save()
@@ -1,12 +1,19 @@
+import logging
 import traceback
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 from django.conf import settings
+from django.db import connection
+from hdlib.DateTime.Date import Date
 
 from main.apps.account.models.company import Company
+from main.apps.marketdata.models import IrCurve
+from main.apps.marketdata.services.ir.ir_provider import MdIrProviderService
 from main.apps.notification.services.email_service import send_email
 from main.apps.oems.backend.db import init_db
 from main.apps.oems.backend.states import INTERNAL_STATES
@@ -14,15 +21,142 @@ from main.apps.oems.backend.ticket import Ticket
 from main.apps.oems.backend.webhook import WEBHOOK_EVENTS
 from main.apps.oems.models.ticket import Ticket as DjangoTicket
 
+logger = logging.getLogger(__name__)
+
+
+# =================
+
+class BatchMarkToMarket:
+    """
+    Vectorized mark to market of forwards and NDFs, with the same results as Ticket.do_mark_to_market.
+
+    Tickets are grouped by market: the forward curve of each market is fetched once, and evaluated once per value
+    date. Discount curves are fetched once per currency. The NPVs and MTMs of all the tickets of a market are then
+    computed at once.
+    """
+
+    def __init__(self, ref_date=None, tenors=None):
+        self.ref_date = ref_date or Date.now()
+        self.tenors = tenors or Ticket.DEFAULT_TENORS
+        self._discount_curves = {}
+
+    def mark(self, tickets):
+        """ MTM payloads of the tickets, in order, None for the tickets that could not be marked """
+        results = [None] * len(tickets)
+
+        by_market = defaultdict(list)
+        for i, ticket in enumerate(tickets):
+            by_market[ticket.market_name].append(i)
+
+        for market_name, indices in by_market.items():
+            try:
+                payloads = self.mark_market(market_name, [tickets[i] for i in indices])
+            except Exception as e:
+                logger.exception(f"Unable to mark {market_name} tickets to market: {e}")
+                continue
+            for i, payload in zip(indices, payloads):
+                results[i] = payload
+
+        return results
+
+    def mark_market(self, market_name, tickets):
+
+        domestic = market_name[:3]
+        ref_date = self.ref_date
+
+        curve = Ticket.get_fwd_provider().get_forward_bid_ask_curve(
+            pair=market_name, date=ref_date, tenors=self.tenors, spot=None)
+        spot_rate = curve.spot()
+
+        value_dates = [self._to_date(ticket.value_date) for ticket in tickets]
+        fixing_dates = [self._to_date(ticket.fixing_date) for ticket in tickets]
+
+        fwd_rates = {}
+        discounts = {}
+        fwd = np.empty(len(tickets))
+        disc = np.ones(len(tickets))
+        for i, (value_date, fixing_date) in enumerate(zip(value_dates, fixing_dates)):
+            if value_date not in fwd_rates:
+                fwd_rates[value_date] = curve.at_D(date=value_date)
+            fwd[i] = fwd_rates[value_date]
+            # before the fixing date (or value date if there is none), discount to today
+            if (fixing_date and ref_date < fixing_date) or (not fixing_date and ref_date < value_date):
+                if value_date not in discounts:
+                    discounts[value_date] = self._discount_curve(domestic).at_D(date=value_date)
+                disc[i] = discounts[value_date]
+
+        amount = np.array([self._to_float(ticket.all_in_done) for ticket in tickets])
+        cntr_amount = np.array([self._to_float(ticket.all_in_cntr_done) for ticket in tickets])
+        side = np.array([1. if ticket.side == 'Buy' else -1. for ticket in tickets])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            npv = cntr_amount / fwd * disc
+            mtm = (amount - npv) * side
+
+        payloads = []
+        for i, ticket in enumerate(tickets):
+            if not np.isfinite(mtm[i]):
+                logger.warning(f"Unable to mark ticket {ticket.ticket_id} to market")
+                payloads.append(None)
+                continue
+            payloads.append({
+                'market_name': ticket.market_name,
+                'mark_type': 'open',
+                'transaction_date': ticket.transaction_time,
+                'value_date': value_dates[i],
+                'fixing_date': ticket.fixing_date,
+                'all_in_rate': ticket.all_in_rate,
+                'amount': amount[i].item(),
+                'cntr_amount': cntr_amount[i].item(),
+                'current_fwd_rate': fwd[i].item(),
+                'current_spot_rate': spot_rate,
+                'current_fwd_points': (fwd[i] - spot_rate).item(),
+                'discount_factor': disc[i].item(),
+                'npv': npv[i].item(),
+                'mark_to_market': mtm[i].item(),
+                'mtm_currency': domestic,
+            })
+        return payloads
+
+    # ================
+
+    def _discount_curve(self, currency):
+        if currency not in self._discount_curves:
+            ois_curve_id = IrCurve.get_ois_curve_id_for_currency(currency=currency)
+            self._discount_curves[currency] = MdIrProviderService.get_discount_curve(
+                ir_curve=ois_curve_id, date=self.ref_date)
+        return self._discount_curves[currency]
+
+    @staticmethod
+    def _to_date(value):
+        if isinstance(value, date) and not isinstance(value, Date):
+            return Date.from_datetime_date(value)
+        return value
+
+    @staticmethod
+    def _to_float(value):
+        return np.nan if value is None else float(value)
+
 
 # =================
 
 class MarkToMarket:
 
-    def __init__(self, companies=None, dry_run=False):
+    def __init__(self, companies=None, dry_run=False, workers=1, shard=None, num_shards=None):
+        """
+        :param companies: Only mark the tickets of these companies
+        :param dry_run: Compute the MTMs without saving or sending them
+        :param workers: Number of threads sending the MTM statements, one company at a time per thread
+        :param shard: With num_shards, only mark the companies for which company_id % num_shards == shard, so that
+            the MTM of all companies can be split across processes
+        """
 
         self._db = init_db()
+        self.companies = companies
         self.dry_run = dry_run
+        self.workers = workers
+        self.shard = shard
+        self.num_shards = num_shards
         self.tdy = date.today()
         self.tickets = self.load()
 
@@ -31,6 +165,13 @@ class MarkToMarket:
         states = ','.join(map(self._db.pytype, INTERNAL_STATES.MTM_STATES))
         sql = f"select * from \"{Ticket.DJANGO_MODEL_NAME}\" where \"internal_state\" in ({states}) and \"instrument_type\" != 'spot' and \"value_date\" >= '{self.tdy.isoformat()}'"
 
+        if self.companies:
+            company_ids = ','.join(str(int(company_id)) for company_id in self.companies)
+            sql += f" and \"company_id\" in ({company_ids})"
+
+        if self.num_shards:
+            sql += f" and \"company_id\" % {int(self.num_shards)} = {int(self.shard or 0)}"
+
         # TODO: filter spot
 
         try:
@@ -126,30 +267,49 @@ class MarkToMarket:
 
         self.send_ticket_market_to_market(ticket, payload)
 
+    def bulk_update_ticket_mtm(self, marked):
+
+        last_mark_time = datetime.utcnow()
+        updates = []
+        for ticket, payload in marked:
+            ticket.mark_to_market = payload.get('mark_to_market')
+            ticket.last_mark_time = last_mark_time
+            ticket.mtm_info = payload
+            updates.append(DjangoTicket(id=ticket.id, mark_to_market=ticket.mark_to_market,
+                                        last_mark_time=last_mark_time, mtm_info=payload))
+
+        if not self.dry_run and updates:
+            DjangoTicket.objects.bulk_update(updates, fields=['mark_to_market', 'last_mark_time', 'mtm_info'],
+                                             batch_size=500)
+
     def mark_to_market(self):
 
+        tickets = [Ticket(**row) for row in self.tickets]
+        tickets = [ticket for ticket in tickets if ticket.instrument_type in (DjangoTicket.InstrumentTypes.FWD,
+                                                                             DjangoTicket.InstrumentTypes.NDF)]
+
+        payloads = BatchMarkToMarket().mark(tickets)
+        marked = [(ticket, payload) for ticket, payload in zip(tickets, payloads) if payload]
+        self.bulk_update_ticket_mtm(marked)
+
         by_company = defaultdict(list)
+        for ticket, payload in marked:
+            by_company[ticket.company_id].append((ticket, payload))
 
-        # TODO: Not a great way to do this. better to load by company and parallelize
-        for row in self.tickets:
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(lambda item: self.send_company_mark_to_market(*item), by_company.items()))
+        else:
+            for company_id, company_marked in by_company.items():
+                self.send_company_mark_to_market(company_id, company_marked)
 
-            ticket = Ticket(**row)
+    def send_company_mark_to_market(self, company_id, marked):
 
-            if ticket.instrument_type == DjangoTicket.InstrumentTypes.SPOT:
-                continue
+        try:
+            for ticket, payload in marked:
+                self.send_ticket_market_to_market(ticket, payload)
 
-            if ticket.instrument_type == DjangoTicket.InstrumentTypes.FWD:
-                table_row = self.mark_fwd(ticket)
-                if table_row:
-                    self.update_ticket_mtm(ticket, table_row)
-                    by_company[ticket.company_id].append(table_row)
-            elif ticket.instrument_type == DjangoTicket.InstrumentTypes.NDF:
-                table_row = self.mark_ndf(ticket)
-                if table_row:
-                    self.update_ticket_mtm(ticket, table_row)
-                    by_company[ticket.company_id].append(table_row)
-
-        for company_id, table in by_company.items():
+            table = [payload for _, payload in marked]
             empty_row = dict.fromkeys(table[0].keys())
 
             table.append(empty_row)
@@ -162,6 +322,11 @@ class MarkToMarket:
             table.append(empty_row)
 
             self.send_mark_to_market(company_id, table)
+        except Exception as e:
+            logger.exception(f"Unable to send the MTM statement of company {company_id}: {e}")
+        finally:
+            if self.workers > 1:
+                connection.close()
 
 
 # ==============
@@ -1,92 +1,261 @@
 import uuid
+from collections import defaultdict
+
+from main.apps.oems.backend.ccy_utils import CCY_RANKS
 
 # ==================
 
+# maximum number of payouts a broker takes on one mass payment, None if unlimited
+MASS_PAYMENT_LIMITS = {
+	'CORPAY': 500,
+	'CORPAY_MP': 500,
+}
+
+BATCH_INFO_FLDS = ('amount','company','cashflow_id','transaction_id','customer_id','beneficiary_id','settle_account_id','beneficiaries','settlement_info')
+
+# the fields an order of several requests (possibly of several companies) takes from them, when they all agree
+MARKET_FLDS = ('destination','buy_currency','sell_currency','lock_side','value_date','transaction_group','tenor','date_conversion','time_in_force','execution_strategy','ticket_type','action','instrument_type')
+
+def ccy_rank( ccy ):
+	try:
+		return CCY_RANKS.index(ccy)
+	except ValueError:
+		return 100000
+
+def get_market_side( buy_currency, sell_currency ):
+	# same convention as ccy_utils.determine_rate_side, without the db
+	if ccy_rank(buy_currency) < ccy_rank(sell_currency):
+		return f'{buy_currency}{sell_currency}', 'Buy'
+	return f'{sell_currency}{buy_currency}', 'Sell'
+
 def get_netting_key( request ):
-	return (request['buy_currency'], request['sell_currency'], request['lock_side'],request['value_date'],request.get('transaction_group'))
+	# buys and sells of a market net together, per broker, value date, amount currency and transaction group
+	market, side = get_market_side( request['buy_currency'], request['sell_currency'] )
+	return (request.get('destination'), market, request['value_date'], request['lock_side'], request.get('transaction_group'))
 
 def get_batch_info( request ):
-	return { fld: request.get(fld) for fld in ('amount','cashflow_id','transaction_id','customer_id','beneficiary_id','settle_account_id','beneficiaries','settlement_info') }
+	return { fld: request.get(fld) for fld in BATCH_INFO_FLDS }
+
+def count_payouts( request ):
+	return max(len(request.get('beneficiaries') or []), 1)
+
+def scale_payouts( request, amount ):
+	# the beneficiaries of a request, paid pro-rata out of amount (of the request amount)
+	ratio = amount / request['amount'] if request['amount'] else 0.0
+	payouts = []
+	for bene in request.get('beneficiaries') or []:
+		bene = dict(bene)
+		bene['amount'] = bene.get('amount', request['amount']) * ratio
+		bene['amount_pct'] = bene['amount'] / amount if amount else 0.0
+		payouts.append( bene )
+	return payouts
 
 # ==================
 
-def process_net_requests( net_requests ):
+class NettedRequests(list):
+	"""
+	What batch_and_net returns, with or without netting: the requests to execute, with the amounts crossed internally
+	(still to be booked and paid out to their beneficiaries) in crossed, and the full NettingResult in result.
+	"""
+
+	def __init__( self, requests=(), crossed=None, result=None ):
+		super().__init__( requests )
+		self.crossed = [] if crossed is None else crossed
+		self.result  = result
 
-	# if 1 request, no netting necessary
-	# if multiple, track the info and send one net order for disbursement
-	ret = []
+class NettingResult:
 
-	for key, value in net_requests.values():
+	def __init__( self ):
+		self.orders      = [] # the market orders to execute
+		self.crossed     = [] # the amounts of the requests crossed internally, to book and settle, in request order
+		self.allocations = [] # one per request, in request order
 
-		net_req, batch_tracking = value
+	@property
+	def gross_amount( self ):
+		return sum( alloc['amount'] for alloc in self.allocations )
 
-		if len(batch_tracking) == 1:
-			ret.append(net_req)
-			continue
+	@property
+	def external_amount( self ):
+		return sum( order['amount'] for order in self.orders )
 
-		for fld in ('cashflow_id','transaction_id','customer_id','beneficiary_id','settle_account_id','beneficiaries','settlement_info'):
-			net_req[fld] = None
+	def stats( self ):
+		gross = self.gross_amount
+		return {
+			'requests': len(self.allocations),
+			'orders': len(self.orders),
+			'gross_amount': gross,
+			'external_amount': self.external_amount,
+			'netting_ratio': (1.0 - self.external_amount / gross) if gross else 0.0,
+		}
 
-		net_req['beneficiaries'] = []
-		net_req['settlement_info'] = []
+	def allocate_fills( self, order_prices, reference_prices ):
+		"""
+		Fill price of every request: the crossed part fills at the reference price of its market (usually mid), the
+		part executed externally at the fill price of its order.
 
-		for row in batch_tracking:
-			for bene in row['beneficiaries']:
-				if 'amount' not in bene:
-					bene['amount'] = row['amount']
-				if 'amount_pct' not in bene:
-					bene['amount_pct'] = (row['amount']/net_req['amount'])
-				net_req['beneficiaries'].append(bene)
+		:param order_prices: net_id -> fill price of the market order
+		:param reference_prices: market -> reference price used for the crossed amounts
+		"""
+		for alloc in self.allocations:
+			ref_px = reference_prices.get(alloc['market_name'])
+			ext_px = order_prices.get(alloc['net_id']) if alloc['net_id'] else None
+			if alloc['external_amount'] and ext_px is None:
+				alloc['fill_price'] = None
+			elif alloc['internal_amount'] and ref_px is None:
+				alloc['fill_price'] = None
+			else:
+				notional = alloc['internal_amount'] * (ref_px or 0.0) + alloc['external_amount'] * (ext_px or 0.0)
+				alloc['fill_price'] = notional / alloc['amount'] if alloc['amount'] else None
+		return self.allocations
 
-		# put net information somewhere (most likely beneficiaries)
-		net_req.mass_payment_info = batch_tracking
+class NettingEngine:
+	"""
+	Nets opposing buy and sell requests of a market, across customers, per broker, value date and amount currency.
 
-		ret.append(net_req)
+	Every group gives at most one market order for the net amount, split when its payouts exceed the broker mass payment
+	limit. Requests on the net side are executed pro-rata: each crosses amount * offset / gross internally and sends
+	the rest to the market order. Requests on the other side cross fully. Amounts are in the lock_side currency of the
+	group, rounded to round_digits, and the external amounts of an order always add up to the order amount. An order of
+	one request keeps the ticket fields of that request. An order of several requests, which may belong to different
+	companies, only takes the MARKET_FLDS they agree on. The crossed amounts come back as requests of their own in
+	result.crossed, with their share of the beneficiary payouts.
+	"""
 
-	return ret
+	def __init__( self, mass_payment_limits=None, round_digits=2 ):
+		self.mass_payment_limits = MASS_PAYMENT_LIMITS if mass_payment_limits is None else mass_payment_limits
+		self.round_digits        = round_digits
 
-def batch_and_net( requests, do_netting=False ):
+	def net( self, requests ):
 
-	# TODO: net transactions by currency, side, and transaction_group??
-	# if no transaction_group provided net those together?
-	# while netting, keep track of settle_account_id and beneficiary_id
+		result = NettingResult()
+		groups = defaultdict(list)
 
-	# figure out what you do with transactions that net off
-	# do we generate fake fills? we still have to move money
-	# so we need to test that
+		for i, req in enumerate(requests):
+			market, side = get_market_side( req['buy_currency'], req['sell_currency'] )
+			alloc = {
+				'index': i,
+				'market_name': market,
+				'side': side,
+				'amount': req['amount'],
+				'internal_amount': 0.0,
+				'external_amount': 0.0,
+				'net_id': None,
+				'fill_price': None,
+				**get_batch_info( req ),
+			}
+			result.allocations.append( alloc )
+			groups[get_netting_key( req )].append( (req, alloc) )
 
-	if not do_netting:
-		return requests
+		for key, rows in groups.items():
+			self.net_group( key, rows, result )
+
+		for req, alloc in zip(requests, result.allocations):
+			if alloc['internal_amount']:
+				result.crossed.append( self.crossed_request( req, alloc ) )
 
-	# TODO: pull out bene_id and settle_account_id and add to beneficiaries/settlement_info
-	# do we validate the orders now?
+		return result
 
-	net_requests = {}
+	def crossed_request( self, req, alloc ):
+		# the request, for its crossed amount, filled at the reference price of its market
+		return {
+			**req,
+			'index': alloc['index'],
+			'net_id': None,
+			'market_name': alloc['market_name'],
+			'amount': alloc['internal_amount'],
+			'beneficiaries': scale_payouts( req, alloc['internal_amount'] ),
+		}
 
-	# TODO: maximum requests
-	# Do we want to net by settlement_account_id or allow multi-payins?
-	
-	for req in requests:
+	def net_group( self, key, rows, result ):
 
-		key = get_netting_key( req )
+		destination, market, value_date, lock_side, transaction_group = key
 
-		if key in net_requests:
-			net_req, batch_tracking = net_requests[key]
-			info = get_batch_info( req )
-			if len(batch_tracking) >= 500: # corpay max mass payouts
-				old_batch = net_requests.pop(key)
-				new_key = f'{key}-{uuid.uuid4()}'
-				net_requests[new_key] = old_batch
-				net_requests[key] = (req, [info])
+		buys  = sum( alloc['amount'] for req, alloc in rows if alloc['side'] == 'Buy' )
+		sells = sum( alloc['amount'] for req, alloc in rows if alloc['side'] == 'Sell' )
+		net   = round( buys - sells, self.round_digits )
+
+		if net == 0:
+			for req, alloc in rows:
+				alloc['internal_amount'] = alloc['amount']
+			return
+
+		net_side = 'Buy' if net > 0 else 'Sell'
+		gross    = buys if net > 0 else sells
+		ext_rows = []
+
+		for req, alloc in rows:
+			if alloc['side'] != net_side:
+				alloc['internal_amount'] = alloc['amount']
 			else:
-				batch_tracking.append(info)
-				net_req['amount'] += req['amount']
-		else:
-			info = get_batch_info( req )
-			batch_tracking = [info]
-			net_requests[key] = (req, batch_tracking)
+				alloc['external_amount'] = round( alloc['amount'] * abs(net) / gross, self.round_digits )
+				alloc['internal_amount'] = round( alloc['amount'] - alloc['external_amount'], self.round_digits )
+				ext_rows.append( (req, alloc) )
+
+		# the rounding residual goes to the largest allocation
+		residual = round( abs(net) - sum( alloc['external_amount'] for req, alloc in ext_rows ), self.round_digits )
+		if residual:
+			req, alloc = max( ext_rows, key=lambda row: row[1]['amount'] )
+			alloc['external_amount'] = round( alloc['external_amount'] + residual, self.round_digits )
+			alloc['internal_amount'] = round( alloc['internal_amount'] - residual, self.round_digits )
+
+		for chunk in self.split_payouts( destination, ext_rows ):
+			net_id = str(uuid.uuid4())
+			order  = self.order_fields( [req for req, alloc in chunk] )
+			order.update({
+				'net_id': net_id,
+				'destination': destination,
+				'market_name': market,
+				'side': net_side,
+				'lock_side': lock_side,
+				'value_date': value_date,
+				'amount': round( sum( alloc['external_amount'] for req, alloc in chunk ), self.round_digits ),
+				'beneficiaries': [],
+				'mass_payment_info': [],
+			})
+			for req, alloc in chunk:
+				alloc['net_id'] = net_id
+				order['beneficiaries'].extend( scale_payouts( req, alloc['external_amount'] ) )
+				order['mass_payment_info'].append( alloc )
+			result.orders.append( order )
+
+	def order_fields( self, reqs ):
+		# the whole request for an order of one request, else only the market fields all the requests agree on
+		if len(reqs) == 1:
+			return dict(reqs[0])
+		order = { fld: reqs[0][fld] for fld in MARKET_FLDS
+				  if fld in reqs[0] and all( req.get(fld) == reqs[0][fld] for req in reqs ) }
+		order['settlement_info'] = [req['settlement_info'] for req in reqs if req.get('settlement_info')]
+		return order
 
-	ret = process_net_requests( net_requests )
+	def split_payouts( self, destination, rows ):
+		limit = self.mass_payment_limits.get(destination)
+		if not limit:
+			return [rows] if rows else []
+		chunks, chunk, payouts = [], [], 0
+		for row in rows:
+			n = count_payouts( row[0] )
+			if chunk and payouts + n > limit:
+				chunks.append( chunk )
+				chunk, payouts = [], 0
+			chunk.append( row )
+			payouts += n
+		if chunk:
+			chunks.append( chunk )
+		return chunks
 
-	return ret
+# ==================
+
+def net_requests( requests, mass_payment_limits=None ):
+	return NettingEngine( mass_payment_limits=mass_payment_limits ).net( requests )
+
+def batch_and_net( requests, do_netting=False, mass_payment_limits=None ):
+
+	# the requests to execute, as NettedRequests in both modes: without netting the requests as they are, with netting
+	# the market orders (with the allocations they carry in mass_payment_info), and in .crossed the amounts crossed
+	# internally, which still have to be booked and paid out to their beneficiaries
+
+	if not do_netting:
+		return NettedRequests( requests )
 
+	result = net_requests( requests, mass_payment_limits=mass_payment_limits )
+	return NettedRequests( result.orders, crossed=result.crossed, result=result )
@@ -143,7 +143,8 @@ class OmsBase:
                 if not dest: return False
                 topic = f'oms2ems_{ENV}_{dest}'
         self.log("INFO", "ENQUEUE", topic, now().isoformat())
-        ticket.save()
+        # the row must be written before the message is visible to the other side
+        ticket.save(force=True)
         ret = self._db.enqueue(topic, ticket.export(), action=action, source=self.oms_id, uid=ticket.id,
                                queue_table=self._queue_table)
         if isinstance(ret, int):
@@ -804,17 +805,19 @@ class OmsBase:
 
         curtime = now()
 
-        for ticket in self.tickets.values():
-            try:
-                if ticket._next_update and curtime < ticket._next_update:
-                    continue
-            except Exception as e:
-                pass
-            try:
-                self.cycle_ticket(ticket)
-            except Exception as e:
-                self._logger.error(f"Cycling ticket {ticket.ticket_id} id")
-                self._logger.exception(e)
+        # ticket saves are flushed together at the end of the cycle
+        with Ticket.write_behind():
+            for ticket in self.tickets.values():
+                try:
+                    if ticket._next_update and curtime < ticket._next_update:
+                        continue
+                except Exception as e:
+                    pass
+                try:
+                    self.cycle_ticket(ticket)
+                except Exception as e:
+                    self._logger.error(f"Cycling ticket {ticket.ticket_id} id")
+                    self._logger.exception(e)
 
         self.clean_up()
         self.save()
@@ -1,3 +1,4 @@
+import heapq
 import operator
 
 from collections.abc import MutableSequence
@@ -243,9 +244,162 @@ class OrderBook:
 
 # ==========
 
+class _Quote:
+
+	__slots__ = ('key', 'price', 'size', 'dt', 'seq')
+
+	def __init__(self, key, price, size, dt, seq):
+		self.key = key
+		self.price = price
+		self.size = size
+		self.dt = dt
+		self.seq = seq
+
+	def __repr__(self):
+		return f"Quote(key={self.key}, price={self.price}, size={self.size}, seq={self.seq})"
+
+class LpBookSide:
+
+	"""
+	One side of a book with (at most) one live quote per key (source/LP).
+
+	Quotes are held in a dict by key, and ordered by a heap of (signed price, seq, key) entries. Replacing or
+	removing a quote leaves its old heap entry behind, which is discarded once it reaches the top, so the top of
+	the heap is always the best live quote: O(1) best price and O(log n) updates. Ties on price go to the quote
+	stored first.
+
+	# direction is a boolean (0/1, False/True, etc.) where:
+	# 0/False is ascending - lowest first - ask side
+	# 1/True is descending - highest first - bid side
+	"""
+
+	__slots__ = ('direction', 'quotes', '_heap', '_mult', '_seq')
+
+	def __init__(self, direction=0):
+		self.direction = direction
+		self.quotes = {}
+		self._heap = []
+		self._mult = 1.0 if direction == 0 else -1.0
+		self._seq = 0
+
+	def __len__(self):
+		return len(self.quotes)
+
+	def store(self, key, price, size, dt=None):
+		if price is None:
+			return self.remove(key)
+		self._seq += 1
+		quote = _Quote(key, float(price), size, dt, self._seq)
+		self.quotes[key] = quote
+		heapq.heappush(self._heap, (self._mult * quote.price, quote.seq, key))
+		self._clean()
+
+	def remove(self, key):
+		if self.quotes.pop(key, None) is None:
+			return False
+		self._clean()
+		return True
+
+	def evict(self, before):
+		""" Remove the quotes stored before the datetime before (quotes stored without one are kept) """
+		stale = [key for key, q in self.quotes.items() if q.dt is not None and q.dt < before]
+		for key in stale:
+			del self.quotes[key]
+		if stale:
+			self._clean()
+		return stale
+
+	def clear(self):
+		self.quotes.clear()
+		self._heap.clear()
+
+	def peek(self):
+		return self.quotes[self._heap[0][2]] if self._heap else None
+
+	def top_of_book(self):
+		return self._heap[0][0] * self._mult if self._heap else None
+
+	def get_volume_at(self, price, aggregate=True):
+		if aggregate:
+			op = operator.ge if self.direction == 1 else operator.le
+		else:
+			op = operator.eq
+		return sum(q.size for q in self.quotes.values() if op(q.price, price))
+
+	def depth(self, levels=None):
+		""" Aggregated depth, best price first: [(price, total size, number of quotes), ...] """
+		agg = {}
+		for q in self.quotes.values():
+			lvl = agg.get(q.price)
+			if lvl is None:
+				agg[q.price] = [q.size, 1]
+			else:
+				lvl[0] += q.size
+				lvl[1] += 1
+		prices = sorted(agg, reverse=(self.direction == 1))
+		if levels is not None:
+			prices = prices[:levels]
+		return [(p, agg[p][0], agg[p][1]) for p in prices]
+
+	def _clean(self):
+		heap, quotes = self._heap, self.quotes
+		# drop stale entries at the top so that the top is always live
+		while heap:
+			_, seq, key = heap[0]
+			quote = quotes.get(key)
+			if quote is not None and quote.seq == seq:
+				break
+			heapq.heappop(heap)
+		# stale entries below the top are only dropped when they surface, rebuild if they pile up
+		if len(heap) > 2 * len(quotes) + 16:
+			self._heap = [(self._mult * q.price, q.seq, q.key) for q in quotes.values()]
+			heapq.heapify(self._heap)
+
+class LpOrderBook:
+
+	"""
+	Per instrument book of the latest quote of each source/LP. Drop in replacement for OrderBook in price feeds,
+	cheap enough to aggregate on every tick.
+	"""
+
+	__slots__ = ('bids', 'asks')
+
+	def __init__( self ):
+		self.bids = LpBookSide(direction=1)
+		self.asks = LpBookSide(direction=0)
+
+	def store_bid( self, key, price, size, dt=None):
+		self.bids.store(key, price, size, dt)
+
+	def store_ask( self, key, price, size, dt=None):
+		self.asks.store(key, price, size, dt)
+
+	def remove( self, key ):
+		# e.g. when a source goes stale
+		removed_bid = self.bids.remove(key)
+		removed_ask = self.asks.remove(key)
+		return removed_bid or removed_ask
+
+	def evict( self, before ):
+		# drop the quotes of the sources that stopped quoting
+		return self.bids.evict(before) + self.asks.evict(before)
+
+	def bbo( self ):
+		return self.bids.top_of_book(), self.asks.top_of_book()
+
+	def depth( self, levels=None ):
+		return {'bids': self.bids.depth(levels), 'asks': self.asks.depth(levels)}
+
+# ==========
+
 if __name__ == "__main__":
 	ob = OrderBook()
 	ob.store_bid( 'test1', 100.0, 1, datetime.now() )
 	ob.store_bid( 'test2', 99.0, 1, datetime.now() )
 	ob.store_ask( 'test1', 101.0, 1, datetime.now() )
 	ob.store_ask( 'test2', 102.0, 1, datetime.now() )
+
+	lob = LpOrderBook()
+	lob.store_bid( 'LP1', 100.0, 1 )
+	lob.store_bid( 'LP2', 100.0, 2 )
+	lob.store_ask( 'LP1', 101.0, 1 )
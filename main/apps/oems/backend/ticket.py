@@ -1,5 +1,6 @@
 import traceback
 import sys
+from contextlib import contextmanager
 
 from main.apps.oems.backend.date_utils import now, parse_datetime
 from main.apps.oems.backend.states import INTERNAL_STATES, EXTERNAL_STATES, PHASES
@@ -17,6 +18,8 @@ class Ticket(TicketBase):
     DATETIME_FLDS        = { 'start_time','end_time','external_quote_expiry','internal_quote_expiry', 'trigger_time', 'funding_deadline', 'transaction_time' } # value_date, internal_state_start, external_state_start
     _db = None
     _next_update         = None
+    _pending             = None # id -> (ticket, dirty fields) while in write_behind
+    _write_behind_depth  = 0
 
     def __init__( self, **kwargs ):
         self.ensure_db()
@@ -40,6 +43,7 @@ class Ticket(TicketBase):
         self.mark_clean()
 
     def as_django_model( self ) -> DjangoTicket:
+        self.flush()
         return DjangoTicket.objects.get(pk=self.id)
 
     # ========
@@ -60,6 +64,16 @@ class Ticket(TicketBase):
 
     def save( self, force=False ):
 
+        # inside write_behind, defer to the flush at the end of the cycle unless forced
+        if self._pending is not None:
+            ticket, pending = self._pending.pop(self.id, (self, {}))
+            if not force:
+                if self._dirty or pending:
+                    self._pending[self.id] = (self, {**pending, **self._dirty})
+                    self.mark_clean()
+                return
+            self._dirty = {**pending, **self._dirty}
+
         if not self._dirty: return
 
         sql = self._db.update_sql( None, self.DJANGO_MODEL_NAME, self._dirty, 'id', self.id )
@@ -75,8 +89,51 @@ class Ticket(TicketBase):
 
         self.mark_clean()
 
+    # ========
+
+    @classmethod
+    @contextmanager
+    def write_behind( cls ):
+        # gather the saves of a cycle and flush them in one multi-row UPDATE and one commit
+        if Ticket._write_behind_depth == 0:
+            Ticket._pending = {}
+        Ticket._write_behind_depth += 1
+        try:
+            yield
+        finally:
+            Ticket._write_behind_depth -= 1
+            if Ticket._write_behind_depth == 0:
+                try:
+                    cls.flush()
+                finally:
+                    Ticket._pending = None
+
+    @classmethod
+    def flush( cls ):
+
+        if not cls._pending: return
+
+        pending, Ticket._pending = Ticket._pending, {}
+        rows = { id: fields for id, (ticket, fields) in pending.items() }
+        sqls = cls._db.update_many_sql( None, cls.DJANGO_MODEL_NAME, rows, 'id' )
+
+        try:
+            cls._db.execute_many_and_commit( sqls )
+        except:
+            print(f'ERROR: sql failure - batched update of {len(rows)} tickets')
+            traceback.print_exc(file=sys.stdout)
+            # fall back to one update per ticket so one bad row does not lose the others
+            for ticket, fields in pending.values():
+                ticket._dirty = {**fields, **ticket._dirty}
+                ticket.save( force=True )
+
+    # ========
+
     def refresh_from_db( self, sync_flds=SYNC_FLDS ):
 
+        # read your own deferred writes
+        self.flush()
+
         # sync fields with database
         sql = self._db.select_where( None, self.DJANGO_MODEL_NAME, columns=sync_flds, key='id', value=self.id )
 
@@ -93,6 +150,32 @@ class Ticket(TicketBase):
 
         self.mark_clean()
 
+    @classmethod
+    def refresh_many( cls, tickets, sync_flds=SYNC_FLDS ):
+
+        # sync many tickets with the database in one query
+        if not tickets: return
+
+        cls.ensure_db()
+        cls.flush()
+
+        columns = None if sync_flds is None else ['id', *sync_flds]
+        sql = cls._db.select_where_in( None, cls.DJANGO_MODEL_NAME, 'id', [ticket.id for ticket in tickets], columns=columns )
+
+        try:
+            rows = { row['id']: row for row in cls._db.fetch_and_commit( sql ) }
+        except:
+            print(f'ERROR: sql failure - {sql}')
+            traceback.print_exc(file=sys.stdout)
+            return
+
+        for ticket in tickets:
+            row = rows.get(ticket.id)
+            if row:
+                for k, v in row.items():
+                    setattr(ticket, k, v)
+                ticket.mark_clean()
+
     # =========================================================================
 
     def set_error( self, error_msg ):
@@ -104,7 +187,16 @@ class Ticket(TicketBase):
     @classmethod
     def fetch(cls, id):
         cls.ensure_db()
+        cls.flush()
         sql = cls._db.select_where( None, cls.DJANGO_MODEL_NAME, key='id', value=id )
         ret = cls._db.fetch_and_commit(sql)
         return cls(**ret[0])
 
+    @classmethod
+    def fetch_many(cls, ids):
+        # id -> Ticket for all the ids found, in one query
+        if not ids: return {}
+        cls.ensure_db()
+        cls.flush()
+        sql = cls._db.select_where_in( None, cls.DJANGO_MODEL_NAME, 'id', ids )
+        return { row['id']: cls(**row) for row in cls._db.fetch_and_commit(sql) }
@@ -235,10 +235,8 @@ class TicketBase:
                 payload = self.export_fields(fields)
 
         if payload:
-            if hasattr(self, 'company'):
-                company = self.company
-            else:
-                company = Company.objects.get(pk=self.company_id)
+            # subscriptions are resolved by company id, no need to load the company
+            company = self.company if hasattr(self, 'company') else self.company_id
             Webhook.dispatch_event(company, event_type, payload, user=user)
 
     # ==============================
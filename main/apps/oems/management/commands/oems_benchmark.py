@@ -0,0 +1,67 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# ======
+
+from main.apps.account.models import Company
+from main.apps.currency.models import Currency
+from main.apps.currency.models.fxpair import FxPair
+from main.apps.oems.backend.benchmark import OemsBenchmark
+
+# ======
+
+logger = logging.getLogger(__name__)
+
+
+def parse_weights(value):
+    # "rfq=2,execute=1" -> {'rfq': 2.0, 'execute': 1.0}
+    return {key.strip(): float(weight) for key, weight in (item.split('=') for item in value.split(',') if item)}
+
+
+class Command(BaseCommand):
+    help = "Seed a local database with tickets and measure the throughput of the OMS / EMS cycles against a stub broker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, default=None, help="Company id, the first company by default")
+        parser.add_argument('--from-ccy', default='USD')
+        parser.add_argument('--to-ccy', default='EUR')
+        parser.add_argument('--tickets', type=int, default=100)
+        parser.add_argument('--mix', type=parse_weights, default='rfq=1,execute=1,cancel=1',
+                            help="Relative weights of the ticket kinds: rfq, execute, cancel")
+        parser.add_argument('--latency', type=parse_weights, default='',
+                            help="Seconds per stub broker call, e.g. rfq=0.2,execute=0.5,confirm=0.05")
+        parser.add_argument('--queue-name', default='oems_benchmark')
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--max-cycles', type=int, default=100000)
+        parser.add_argument('--timeout', type=float, default=600.)
+        parser.add_argument('--keep', action='store_true', default=False,
+                            help="Keep the seeded tickets and the benchmark queue")
+
+    def handle(self, *args, **options):
+
+        if settings.APP_ENVIRONMENT == 'production':
+            raise CommandError("the benchmark writes tickets, run it against a local database")
+        if settings.OEMS_NO_TRADING:
+            raise CommandError("OEMS_NO_TRADING is set, the stub broker would refuse every ticket")
+
+        company = Company.objects.filter(pk=options['company']).first() if options['company'] \
+            else Company.objects.order_by('pk').first()
+        if not company:
+            raise CommandError("no company to seed tickets for")
+        from_ccy = Currency.get_currency(options['from_ccy'])
+        to_ccy = Currency.get_currency(options['to_ccy'])
+        fxpair = FxPair.get_pair_from_currency(from_ccy, to_ccy)
+
+        benchmark = OemsBenchmark(company=company, sell_currency=from_ccy, buy_currency=to_ccy, fxpair=fxpair,
+                                  n_tickets=options['tickets'], mix=options['mix'], latency=options['latency'],
+                                  queue_name=options['queue_name'], batch_size=options['batch_size'])
+        benchmark.seed()
+        try:
+            report = benchmark.run(max_cycles=options['max_cycles'], timeout=options['timeout'])
+        finally:
+            if not options['keep']:
+                benchmark.clean_up()
+
+        self.stdout.write(report.format())
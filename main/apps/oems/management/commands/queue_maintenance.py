@@ -0,0 +1,60 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+# ======
+
+from main.apps.oems.backend.db import init_db
+
+# ======
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Archive completed OEMS queue messages, drop old archive partitions and report queue depth and age."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue-name', default='global1')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help="Seconds since a message was dequeued (or answered) before it is archived")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=100,
+                            help="Stop after this many batches, the rest is archived on the next run")
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches")
+        parser.add_argument('--keep-days', type=int, default=30,
+                            help="Days of archive to keep, 0 to keep everything")
+        parser.add_argument('--stats-only', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        db = init_db()
+        queue_table = options['queue_name']
+
+        if not options['stats_only']:
+            db.ensure_queue_archive(queue_table=queue_table)
+
+            moved = 0
+            for i in range(options['max_batches']):
+                n = db.archive_queue(min_age=options['min_age'], batch_size=options['batch_size'],
+                                     queue_table=queue_table)
+                moved += n
+                if n < options['batch_size']:
+                    break
+                # short transactions, give the dequeuers and autovacuum room between batches
+                time.sleep(options['pause'])
+            logger.info(f"archived {moved} messages of {queue_table}")
+
+            if options['keep_days'] > 0:
+                dropped = db.drop_queue_archive_partitions(options['keep_days'], queue_table=queue_table)
+                if dropped:
+                    logger.info(f"dropped archive partitions {', '.join(dropped)}")
+
+        for row in db.queue_stats(queue_table=queue_table):
+            self.stdout.write(f"{row['topic']}: pending={row['pending']} in_flight={row['in_flight']} "
+                              f"answered={row['answered']} oldest_pending_age={row['oldest_pending_age']} "
+                              f"oldest_in_flight_age={row['oldest_in_flight_age']}")
+        table_stats = db.queue_table_stats(queue_table=queue_table)
+        if table_stats:
+            self.stdout.write(f"{queue_table}: live={table_stats['n_live_tup']} dead={table_stats['n_dead_tup']} "
+                              f"bytes={table_stats['total_bytes']} last_autovacuum={table_stats['last_autovacuum']}")
@@ -22,12 +22,17 @@ class Command(TaskDefaultArgumentsMixin, BaseCommand):
         self.add_default_arguments(parser)
         parser.add_argument('--company-ids', nargs='+', default=None)
         parser.add_argument('--dry-run', action='store_true', default=False)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--shard', type=int, default=None)
+        parser.add_argument('--num-shards', type=int, default=None)
 
     def handle(self, *args, **options):
 
         print('running mtm server with options:', options)
 
-        server = MarkToMarket(companies=options['company_ids'], dry_run=options['dry_run'])
+        server = MarkToMarket(companies=options['company_ids'], dry_run=options['dry_run'],
+                              workers=options['workers'], shard=options['shard'],
+                              num_shards=options['num_shards'])
         server.mark_to_market()
 
         
@@ -6,6 +6,7 @@ from hdlib.Core import FxPairInterface
 from hdlib.Core.FxPair import FxPair as FxPairHDL
 
 from main.apps.account.models import Company
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import Currency
 from main.apps.hedge.models import CompanyHedgeAction, OMSOrderRequest
 from main.apps.marketdata.services.fx.fx_provider import FxSpotProvider
@@ -283,10 +284,10 @@ class OrderService(OrderServiceInterface):
 class BacktestOrderService(OrderServiceInterface):
 
     def __init__(self,
-                 fx_spot_provider: FxSpotProvider = FxSpotProvider()):
+                 fx_spot_provider: Optional[FxSpotProvider] = None):
         self._orders: Dict[int, List[OMSOrderTicket]] = dict()
         self._cash_position: Dict[Currency, float] = dict()
-        self._fx_spot_provider = fx_spot_provider
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
 
     def get_orders_from_hedge_action(self, company_hedge_action: CompanyHedgeAction) -> List[OMSOrderTicket]:
         return self._orders.get(company_hedge_action.id, [])
@@ -8,6 +8,7 @@ from itertools import repeat
 from typing import Optional, Union
 
 from django.conf import settings
+from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 
@@ -59,6 +60,8 @@ def exception_handler_decorator(func):
 class RfqExecutionProvider:
     queryset = Ticket.objects.all()
     MAX_WORKERS = 4
+    # net batches of requests before execution; the amounts crossed internally come back in net_data.crossed
+    DO_NETTING = False
 
     def __init__(self):
         ...
@@ -91,7 +94,7 @@ class RfqExecutionProvider:
 
         return obj
 
-    def refresh_rfq(self, instance, data, user):
+    def refresh_rfq(self, instance, data, user, deferred=None):
 
         for k, v in data.items():
             print(k, v, getattr(instance, k), type(v), type(getattr(instance, k)))
@@ -111,24 +114,50 @@ class RfqExecutionProvider:
         instance.change_external_state(EXTERNAL_STATES.PENDING)
         instance.change_phase(PHASES.PRETRADE)
 
+        quoted = False
         if instance.rfq_type == Ticket.RfqType.API:  # TODO: check if market needs a manual rfq
-            if do_api_rfq(instance):
-                instance.save()
+            quoted = do_api_rfq(instance)
         elif instance.rfq_type == Ticket.RfqType.INDICATIVE:
-            if do_indicative_rfq(instance):
+            quoted = do_indicative_rfq(instance)
+
+        if quoted:
+            if deferred is None:
                 instance.save()
+            else:
+                deferred.append((instance, False))
 
         return instance
 
-    def create_rfq(self, serializer):
+    def create_rfq(self, serializer, deferred=None):
+        if deferred is not None:
+            quoted = []
+            ticket = serializer.save(deferred=quoted)
+            deferred.extend((ticket, True) for ticket in quoted)
+            return ticket
         ticket = serializer.save()
+        self.rfq_created(ticket)
+        return ticket
+
+    def rfq_created(self, ticket):
         ticket.life_cycle_event(f'rfq created :: {ticket.market_name} {ticket.side} {ticket.amount}')
         if ticket.cashflow_id:
             update_cashflow_ticket_id_task(ticket_id=str(ticket.ticket_id), cashflow_id=str(ticket.cashflow_id))
-        return ticket
+
+    def save_rfqs(self, deferred):
+        """
+        Save the tickets quoted by rfq(..., deferred=...) in one transaction, once their broker round trips are
+        over. New tickets are handed to the OMS when it commits.
+        """
+        created = [ticket for ticket, is_new in deferred if is_new]
+        with transaction.atomic():
+            for ticket, _ in deferred:
+                ticket.save()
+            for ticket in created:
+                self.rfq_created(ticket)
+            transaction.on_commit(lambda: [RfqSerializer.publish(ticket) for ticket in created])
 
     @exception_handler_decorator
-    def do_rfq(self, user, request):
+    def do_rfq(self, user, request, deferred=None):
 
         request['company'] = user.company.pk
         request['trader'] = user.id
@@ -151,7 +180,7 @@ class RfqExecutionProvider:
             # ticket_id, transaction_id, company -> company_id
             ticket = self.get_rfq_ticket(user, serializer.data)
 
-            if not self.refresh_rfq(ticket, serializer.data, user):
+            if not self.refresh_rfq(ticket, serializer.data, user, deferred=deferred):
                 return ErrorResponse('Duplicate Transaction ID used with different parameters',
                                      status=status.HTTP_409_CONFLICT)
         else:
@@ -170,7 +199,7 @@ class RfqExecutionProvider:
                 return ErrorResponse(emsg, status=status.HTTP_400_BAD_REQUEST, code=e.status_code, extra_data=e.detail)
 
             try:
-                ticket = self.create_rfq(serializer)
+                ticket = self.create_rfq(serializer, deferred=deferred)
             except serializers.ValidationError as e:
                 try:
                     emsg = e.detail['non_field_errors'][0]
@@ -197,21 +226,22 @@ class RfqExecutionProvider:
         else:
             return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
-    def rfq(self, user, request):
+    def rfq(self, user, request, deferred=None):
+        # with a deferred list, the quoted tickets are collected in it rather than saved, see save_rfqs
 
         if isinstance(request, list):
-            net_data = batch_and_net(request)
+            net_data = batch_and_net(request, do_netting=self.DO_NETTING)
             if len(net_data) > 1:
                 with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
-                    ret = list(executor.map(self.do_rfq, repeat(user), net_data))
+                    ret = list(executor.map(self.do_rfq, repeat(user), net_data, repeat(deferred)))
             else:
                 ret = []
                 for req in net_data:
-                    response = self.do_rfq(user, req)
+                    response = self.do_rfq(user, req, deferred=deferred)
                     ret.append(response)
             return MultiResponse(ret)
         else:
-            return self.do_rfq(user, request)
+            return self.do_rfq(user, request, deferred=deferred)
 
     # ============
 
@@ -397,7 +427,7 @@ class RfqExecutionProvider:
     def execute(self, user, request):
 
         if isinstance(request, list):
-            net_data = batch_and_net(request)
+            net_data = batch_and_net(request, do_netting=self.DO_NETTING)
             if len(net_data) > 1:
                 with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
                     ret = list(executor.map(self.do_execute, repeat(user), net_data))
@@ -441,7 +471,7 @@ class RfqExecutionProvider:
 
     def validate(self, user, request, basic=False, soft=False):
         if isinstance(request, list):
-            net_data = batch_and_net(request)
+            net_data = batch_and_net(request, do_netting=self.DO_NETTING)
             if len(net_data) > 1:
                 with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
                     ret = list(executor.map(self.do_validate, repeat(user), net_data, repeat(basic), repeat(soft)))
@@ -0,0 +1,85 @@
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from hdlib.DateTime.Date import Date
+
+from main.apps.oems.backend.mtm import BatchMarkToMarket
+from main.apps.oems.backend.ticket import Ticket
+
+
+class FakeCurve:
+
+    def __init__(self, spot, points_per_day):
+        self._spot = spot
+        self.points_per_day = points_per_day
+        self.calls = 0
+
+    def spot(self):
+        return self._spot
+
+    def at_D(self, date):
+        self.calls += 1
+        return self._spot + self.points_per_day * (date.toordinal() - Date.create(2024, 1, 2).toordinal())
+
+
+class FakeDiscountCurve:
+
+    def at_D(self, date):
+        return 0.99
+
+
+class BatchMarkToMarketTest(SimpleTestCase):
+
+    def setUp(self):
+        self.curve = FakeCurve(spot=1.1, points_per_day=0.001)
+        provider = mock.Mock()
+        provider.get_forward_bid_ask_curve.return_value = self.curve
+        patches = [
+            mock.patch.object(Ticket, 'get_fwd_provider', return_value=provider),
+            mock.patch('main.apps.oems.backend.mtm.IrCurve.get_ois_curve_id_for_currency', return_value=1),
+            mock.patch('main.apps.oems.backend.mtm.MdIrProviderService.get_discount_curve',
+                       return_value=FakeDiscountCurve()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.provider = provider
+
+    def _ticket(self, side='Buy', value_date=date(2024, 1, 12), amount=1000., cntr_amount=1150., **kwargs):
+        return SimpleNamespace(ticket_id='t', market_name=kwargs.get('market_name', 'USDEUR'), side=side,
+                               value_date=value_date, fixing_date=None, all_in_done=amount,
+                               all_in_cntr_done=cntr_amount, transaction_time=None, all_in_rate=1.15)
+
+    def test_mark_matches_ticket_formula(self):
+        engine = BatchMarkToMarket(ref_date=Date.create(2024, 1, 2))
+        buy, sell = self._ticket(side='Buy'), self._ticket(side='Sell')
+
+        payloads = engine.mark([buy, sell])
+
+        fwd = 1.1 + 0.001 * 10
+        npv = 1150. / fwd * 0.99
+        self.assertAlmostEqual(payloads[0]['mark_to_market'], 1000. - npv)
+        self.assertAlmostEqual(payloads[1]['mark_to_market'], npv - 1000.)
+        self.assertAlmostEqual(payloads[0]['current_fwd_points'], fwd - 1.1)
+        self.assertEqual(payloads[0]['mtm_currency'], 'USD')
+
+    def test_one_curve_per_market_and_one_rate_per_value_date(self):
+        engine = BatchMarkToMarket(ref_date=Date.create(2024, 1, 2))
+        tickets = [self._ticket() for _ in range(5)] + [self._ticket(value_date=date(2024, 2, 1))]
+
+        payloads = engine.mark(tickets)
+
+        self.assertTrue(all(payloads))
+        self.assertEqual(self.provider.get_forward_bid_ask_curve.call_count, 1)
+        self.assertEqual(self.curve.calls, 2)
+
+    def test_unmarkable_tickets_are_skipped(self):
+        engine = BatchMarkToMarket(ref_date=Date.create(2024, 1, 2))
+        payloads = engine.mark([self._ticket(amount=None), self._ticket()])
+        self.assertIsNone(payloads[0])
+        self.assertIsNotNone(payloads[1])
+
+        self.provider.get_forward_bid_ask_curve.side_effect = ValueError
+        self.assertEqual(engine.mark([self._ticket()]), [None])
@@ -0,0 +1,161 @@
+import random
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from main.apps.oems.backend.netting import NettingEngine, batch_and_net, get_market_side
+from main.apps.oems.services.trading import RfqExecutionProvider
+
+VALUE_DATE = date(2024, 6, 12)
+
+
+def make_request(buy, sell, amount, lock_side=None, destination='CORPAY', beneficiaries=None, **kwargs):
+    return dict(buy_currency=buy, sell_currency=sell, amount=amount, lock_side=lock_side or buy,
+                value_date=VALUE_DATE, destination=destination, beneficiaries=beneficiaries or [], **kwargs)
+
+
+class NettingEngineTest(SimpleTestCase):
+
+    def test_market_side(self):
+        self.assertEqual(get_market_side('EUR', 'USD'), ('EURUSD', 'Buy'))
+        self.assertEqual(get_market_side('USD', 'EUR'), ('EURUSD', 'Sell'))
+        self.assertEqual(get_market_side('JPY', 'USD'), ('USDJPY', 'Sell'))
+
+    def test_opposing_flows_net(self):
+        requests = [
+            make_request('EUR', 'USD', 100., lock_side='EUR', customer_id=1),
+            make_request('EUR', 'USD', 300., lock_side='EUR', customer_id=2),
+            make_request('USD', 'EUR', 200., lock_side='EUR', customer_id=3),
+        ]
+        result = NettingEngine().net(requests)
+
+        (order,) = result.orders
+        self.assertEqual((order['market_name'], order['side'], order['amount']), ('EURUSD', 'Buy', 200.))
+        self.assertEqual([a['external_amount'] for a in result.allocations], [50., 150., 0.])
+        self.assertEqual([a['internal_amount'] for a in result.allocations], [50., 150., 200.])
+        self.assertEqual([a['customer_id'] for a in order['mass_payment_info']], [1, 2])
+        self.assertEqual(result.stats()['netting_ratio'], 1 - 200. / 600.)
+
+        result.allocate_fills({order['net_id']: 1.1010}, {'EURUSD': 1.1000})
+        self.assertAlmostEqual(result.allocations[0]['fill_price'], 1.1005)
+        self.assertAlmostEqual(result.allocations[2]['fill_price'], 1.1000)
+
+    def test_full_offset_has_no_order(self):
+        result = NettingEngine().net([make_request('EUR', 'USD', 100.), make_request('USD', 'EUR', 100., 'EUR')])
+        self.assertEqual(result.orders, [])
+        self.assertEqual([a['internal_amount'] for a in result.allocations], [100., 100.])
+
+    def test_groups_do_not_mix(self):
+        requests = [
+            make_request('EUR', 'USD', 100.),
+            make_request('USD', 'EUR', 100., lock_side='USD'),  # other amount currency
+            make_request('USD', 'EUR', 100., lock_side='EUR', destination='MONEX'),  # other broker
+        ]
+        self.assertEqual(len(batch_and_net(requests, do_netting=True)), 3)
+        self.assertEqual(batch_and_net(requests), requests)
+        self.assertEqual(batch_and_net(requests).crossed, [])
+
+    def test_transaction_groups_do_not_mix(self):
+        requests = [make_request('EUR', 'USD', 100., transaction_group='a'),
+                    make_request('USD', 'EUR', 100., lock_side='EUR', transaction_group='b')]
+        self.assertEqual(len(NettingEngine().net(requests).orders), 2)
+
+    def test_fully_crossed_pair_is_returned(self):
+        requests = [
+            make_request('EUR', 'USD', 100., customer_id=1, company=7, tenor='spot',
+                         beneficiaries=[{'beneficiary_id': 'a', 'amount': 60.}, {'beneficiary_id': 'b', 'amount': 40.}]),
+            make_request('USD', 'EUR', 100., lock_side='EUR', customer_id=2, company=8, tenor='spot',
+                         beneficiaries=[{'beneficiary_id': 'c'}]),
+        ]
+        result = batch_and_net(requests, do_netting=True)
+
+        self.assertEqual(list(result), [])
+        first, second = result.crossed
+        self.assertEqual((first['customer_id'], first['company'], first['tenor'], first['amount']), (1, 7, 'spot', 100.))
+        self.assertEqual([(b['beneficiary_id'], b['amount']) for b in first['beneficiaries']], [('a', 60.), ('b', 40.)])
+        self.assertEqual([(b['beneficiary_id'], b['amount']) for b in second['beneficiaries']], [('c', 100.)])
+
+    def test_orders_keep_the_request_fields(self):
+        requests = [
+            make_request('EUR', 'USD', 100., customer_id=1, company=7, tenor='spot', cashflow_id='cf1',
+                         beneficiaries=[{'beneficiary_id': 'a'}]),
+            make_request('USD', 'EUR', 40., lock_side='EUR', customer_id=2, company=7, tenor='spot',
+                         beneficiaries=[{'beneficiary_id': 'b'}]),
+        ]
+        result = NettingEngine().net(requests)
+
+        (order,) = result.orders
+        self.assertEqual((order['company'], order['tenor'], order['cashflow_id'], order['amount']),
+                         (7, 'spot', 'cf1', 60.))
+        self.assertEqual([(b['beneficiary_id'], b['amount']) for b in order['beneficiaries']], [('a', 60.)])
+        # the crossed part of the first request and all of the second
+        self.assertEqual([(r['customer_id'], r['amount']) for r in result.crossed], [(1, 40.), (2, 40.)])
+        self.assertEqual([(b['beneficiary_id'], b['amount']) for b in result.crossed[0]['beneficiaries']],
+                         [('a', 40.)])
+
+    def test_orders_of_several_companies_only_keep_market_fields(self):
+        requests = [
+            make_request('EUR', 'USD', 100., customer_id=1, company=7, auth_user=70, ticket_id='t1', tenor='spot',
+                         settlement_info={'account': 'a'}),
+            make_request('EUR', 'USD', 50., customer_id=2, company=8, auth_user=80, ticket_id='t2', tenor='1M',
+                         settlement_info={'account': 'b'}),
+        ]
+        (order,) = NettingEngine().net(requests).orders
+
+        for fld in ('company', 'auth_user', 'ticket_id', 'customer_id', 'tenor'):
+            self.assertNotIn(fld, order)
+        self.assertEqual((order['buy_currency'], order['sell_currency'], order['amount']), ('EUR', 'USD', 150.))
+        self.assertEqual(order['settlement_info'], [{'account': 'a'}, {'account': 'b'}])
+        self.assertEqual([(a['customer_id'], a['company']) for a in order['mass_payment_info']], [(1, 7), (2, 8)])
+
+    def test_mass_payment_limit(self):
+        requests = [make_request('EUR', 'USD', 10., beneficiaries=[{}, {}]) for _ in range(5)]
+        orders = NettingEngine(mass_payment_limits={'CORPAY': 4}).net(requests).orders
+        self.assertEqual([len(order['mass_payment_info']) for order in orders], [2, 2, 1])
+        self.assertEqual(sum(order['amount'] for order in orders), 50.)
+
+    def test_synthetic_requests_conserve_amounts(self):
+        rng = random.Random(7)
+        pairs = [('EUR', 'USD'), ('USD', 'EUR'), ('USD', 'JPY'), ('JPY', 'USD'), ('GBP', 'USD'), ('USD', 'GBP')]
+        requests = []
+        for _ in range(2000):
+            buy, sell = rng.choice(pairs)
+            requests.append(make_request(buy, sell, round(rng.uniform(1, 1e6), 2), lock_side=rng.choice([buy, sell])))
+
+        result = NettingEngine().net(requests)
+
+        self.assertLessEqual(len(result.orders), 6)
+        for alloc in result.allocations:
+            self.assertAlmostEqual(alloc['internal_amount'] + alloc['external_amount'], alloc['amount'], places=6)
+        for order in result.orders:
+            self.assertAlmostEqual(sum(a['external_amount'] for a in order['mass_payment_info']), order['amount'],
+                                   places=6)
+
+
+class NettedExecutionTest(SimpleTestCase):
+
+    def test_execute_runs_the_netted_orders(self):
+        requests = [
+            make_request('EUR', 'USD', 100., customer_id=1),
+            make_request('EUR', 'USD', 300., customer_id=2),
+            make_request('USD', 'EUR', 200., lock_side='EUR', customer_id=3),
+            make_request('USD', 'JPY', 100., customer_id=4),
+        ]
+        provider = RfqExecutionProvider()
+        provider.DO_NETTING = True
+        user = SimpleNamespace(pk=1)
+
+        with mock.patch.object(provider, 'do_execute', side_effect=lambda user, req: mock.Mock(status=200, data=req)) as do_execute:
+            provider.execute(user, requests)
+
+        orders = sorted((call.args[1] for call in do_execute.call_args_list), key=lambda req: req['market_name'])
+        self.assertEqual([(o['market_name'], o['side'], o['amount']) for o in orders],
+                         [('EURUSD', 'Buy', 200.), ('USDJPY', 'Buy', 100.)])
+
+        validated = lambda user, req, *args, **kwargs: mock.Mock(status=200, data=req)
+        with mock.patch.object(provider, 'do_validate', side_effect=validated) as do_validate:
+            provider.validate(user, requests[:2])
+        (order,) = (call.args[1] for call in do_validate.call_args_list)
+        self.assertEqual(order['amount'], 400.)
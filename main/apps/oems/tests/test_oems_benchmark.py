@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from main.apps.account.models import Company
+from main.apps.currency.models import Currency
+from main.apps.currency.models.fxpair import FxPair
+from main.apps.oems.backend.benchmark import LatencyHistogram, OemsBenchmark, SqlCounter, StubRfqInterface
+from main.apps.oems.backend.db import DbAdaptor
+from main.apps.oems.backend.rfq_utils import RfqInterface
+from main.apps.oems.backend.states import INTERNAL_STATES
+
+
+class LatencyHistogramTest(SimpleTestCase):
+
+    def test_percentiles_and_buckets(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.record(ms / 1000.)
+
+        self.assertEqual(100, len(histogram))
+        self.assertAlmostEqual(51., histogram.percentile(50))
+        self.assertAlmostEqual(100., histogram.percentile(99))
+        self.assertAlmostEqual(100., histogram.percentile(100))
+        self.assertEqual({'<2ms': 1, '<4ms': 2, '<8ms': 4, '<16ms': 8, '<32ms': 16, '<64ms': 32, '<128ms': 37},
+                         histogram.buckets())
+        self.assertEqual(0., LatencyHistogram().percentile(50))
+
+
+class SqlCounterTest(SimpleTestCase):
+
+    def test_batched_statements_count_one_by_one(self):
+        db = DbAdaptor(dbtype='POSTGRES', autoconnect=False)
+        counter = SqlCounter()
+        with mock.patch.object(DbAdaptor, 'execute') as execute, mock.patch.object(DbAdaptor, 'commit'), \
+                counter.count():
+            counter.phase = 'oms.tickets'
+            db.execute_many_and_commit(['update a', 'update b', 'update c'])
+            db.execute('select 1')
+
+        self.assertEqual(2, execute.call_count)
+        self.assertEqual(4, counter.db['oms.tickets'])
+        self.assertEqual(2, counter.db_round_trips['oms.tickets'])
+
+
+class OemsBenchmarkTest(SimpleTestCase):
+
+    def benchmark(self, **kwargs):
+        return OemsBenchmark(company=None, sell_currency=None, buy_currency=None, fxpair=None, **kwargs)
+
+    def test_mix_is_interleaved(self):
+        self.assertEqual(['rfq', 'execute', 'cancel'] * 2, self.benchmark(n_tickets=6)._kinds())
+
+        kinds = self.benchmark(n_tickets=8, mix={'execute': 3, 'cancel': 1})._kinds()
+        self.assertEqual(6, kinds.count('execute'))
+        self.assertEqual(2, kinds.count('cancel'))
+        self.assertNotEqual(['cancel', 'cancel'], kinds[-2:])
+
+        with self.assertRaises(ValueError):
+            self.benchmark(mix={'fwd': 1})
+
+    def test_stub_broker(self):
+        interface = StubRfqInterface(latency={'execute': 0.5})
+        ticket = mock.MagicMock(amount=100.)
+        with mock.patch('main.apps.oems.backend.benchmark.time.sleep') as sleep:
+            self.assertTrue(interface.rfq(ticket))
+            self.assertFalse(interface.execute(ticket))
+
+        sleep.assert_called_once_with(0.5)
+        self.assertEqual({'rfq': 1, 'execute': 1}, dict(interface.calls))
+        ticket.change_internal_state.assert_has_calls([mock.call(INTERNAL_STATES.RFQ_DONE),
+                                                       mock.call(INTERNAL_STATES.FILLED)])
+        self.assertAlmostEqual(110., ticket.cntr_done)
+
+    def test_stub_broker_is_registered_for_the_run_only(self):
+        benchmark = self.benchmark()
+        with benchmark.stubs():
+            self.assertIs(benchmark.interface, RfqInterface.broker_interfaces['BENCHMARK'])
+        self.assertNotIn('BENCHMARK', RfqInterface.broker_interfaces)
+
+
+@override_settings(OEMS_NO_TRADING=False)
+class OemsBenchmarkRunTest(TransactionTestCase):
+    """ A small seeded run against the test database """
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("the oems queues need postgres")
+        _, usd = Currency.create_currency('USD', 'USD', 'USD')
+        _, eur = Currency.create_currency('EUR', 'EUR', 'EUR')
+        _, fxpair = FxPair.create_fxpair(usd, eur)
+        company = Company.objects.create(name='Benchmark Company', currency=usd, status=Company.CompanyStatus.ACTIVE)
+        self.benchmark = OemsBenchmark(company=company, sell_currency=usd, buy_currency=eur, fxpair=fxpair,
+                                       n_tickets=9, queue_name='test_oems_benchmark', batch_size=4)
+
+    def test_every_ticket_finishes(self):
+        self.benchmark.seed()
+        self.addCleanup(self.benchmark.clean_up)
+
+        report = self.benchmark.run(max_cycles=200, timeout=120.)
+
+        self.assertEqual((9, 9), (report.tickets, report.finished))
+        self.assertEqual(9, sum(report.states.values()))
+        self.assertTrue(set(report.states) <= OemsBenchmark.FINISHED_STATES)
+        self.assertGreaterEqual(sum(report.sql.db.values()), sum(report.sql.db_round_trips.values()))
+        self.assertIn('trips/cycle', report.format())
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+
+from main.apps.oems.backend.order_book import LpOrderBook
+
+
+class LpOrderBookTest(SimpleTestCase):
+
+    def test_bbo_tracks_latest_quote_per_source(self):
+        ob = LpOrderBook()
+        ob.store_bid('LP1', 100.0, 1)
+        ob.store_bid('LP2', 99.5, 1)
+        ob.store_ask('LP1', 101.0, 1)
+        ob.store_ask('LP2', 100.5, 1)
+        self.assertEqual(ob.bbo(), (100.0, 100.5))
+
+        # LP1 requotes lower, its old bid must not be the best anymore
+        ob.store_bid('LP1', 99.0, 1)
+        self.assertEqual(ob.bbo(), (99.5, 100.5))
+
+        ob.remove('LP2')
+        self.assertEqual(ob.bbo(), (99.0, 101.0))
+
+        ob.remove('LP1')
+        self.assertEqual(ob.bbo(), (None, None))
+
+    def test_depth_aggregates_by_price(self):
+        ob = LpOrderBook()
+        ob.store_bid('LP1', 100.0, 1)
+        ob.store_bid('LP2', 100.0, 2)
+        ob.store_bid('LP3', 99.0, 5)
+        ob.store_ask('LP1', 101.0, 3)
+
+        depth = ob.depth()
+        self.assertEqual(depth['bids'], [(100.0, 3, 2), (99.0, 5, 1)])
+        self.assertEqual(depth['asks'], [(101.0, 3, 1)])
+        self.assertEqual(ob.depth(levels=1)['bids'], [(100.0, 3, 2)])
+        self.assertEqual(ob.bids.get_volume_at(99.0), 8)
+
+    def test_stale_quotes_are_evicted(self):
+        t0 = datetime(2024, 1, 2, 12)
+        ob = LpOrderBook()
+        ob.store_bid('LP1', 100.0, 1, t0)
+        ob.store_ask('LP1', 100.5, 1, t0)
+        ob.store_bid('LP2', 99.5, 1, t0 + timedelta(seconds=3))
+        ob.store_ask('LP2', 101.0, 1, t0 + timedelta(seconds=3))
+        ob.store_bid('LP3', 99.0, 1)
+
+        self.assertEqual(['LP1', 'LP1'], ob.evict(t0 + timedelta(seconds=1)))
+        self.assertEqual(ob.bbo(), (99.5, 101.0))
+        self.assertEqual([], ob.evict(t0 + timedelta(seconds=1)))
+
+        # quotes without a time are kept
+        ob.evict(t0 + timedelta(seconds=10))
+        self.assertEqual(ob.bbo(), (99.0, None))
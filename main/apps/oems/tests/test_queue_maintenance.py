@@ -0,0 +1,121 @@
+from datetime import date
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+
+from main.apps.oems.backend.db import DbAdaptor
+from main.apps.oems.backend.states import INTERNAL_STATES
+
+
+class QueueMaintenanceSqlTest(SimpleTestCase):
+
+    def setUp(self):
+        self.db = DbAdaptor(dbtype='POSTGRES', autoconnect=False)
+
+    def test_archive_moves_one_bounded_batch_of_completed_messages(self):
+        sql = self.db.archive_queue(min_age=600, batch_size=500, queue_schema='oems', return_cmd=True)
+
+        self.assertIn('DELETE FROM "oems"."global1"', sql)
+        self.assertIn('INSERT INTO "oems"."global1_archive"', sql)
+        self.assertIn("q.dequeued_at IS NOT NULL AND\n        coalesce(q.resp_at, q.dequeued_at) < localtimestamp - "
+                      "interval '600 seconds'", sql)
+        # the messages a restart would replay stay
+        self.assertIn('LEFT JOIN "oems_ticket" t ON t.id = q.uid', sql)
+        self.assertIn("(t.id IS NULL OR q.id < t.last_message_id OR t.internal_state IN (", sql)
+        self.assertIn('LIMIT 500\n      FOR UPDATE OF q SKIP LOCKED', sql)
+
+    def test_archive_is_partitioned_by_day(self):
+        sql = self.db.ensure_queue_archive(days_ahead=1, return_cmd=True)
+
+        self.assertIn('partition by range (archived_at)', sql)
+        # yesterday, today and tomorrow
+        self.assertEqual(3, sql.count('partition of "global1_archive"'))
+
+    def test_old_partitions_are_dropped(self):
+        partitions = ['global1_archive_p20240101', 'global1_archive_p20240102', 'global1_archive_p20240103']
+        with mock.patch.object(self.db, 'fetch_and_commit', return_value=[{'relname': p} for p in partitions]), \
+                mock.patch.object(self.db, 'execute_and_commit') as execute, \
+                mock.patch('main.apps.oems.backend.db.datetime') as datetime_mock:
+            datetime_mock.utcnow.return_value.date.return_value = date(2024, 1, 4)
+            dropped = self.db.drop_queue_archive_partitions(keep_days=2)
+
+        self.assertEqual(['global1_archive_p20240101'], dropped)
+        execute.assert_called_once_with('drop table if exists "global1_archive_p20240101"')
+
+
+class QueueMaintenanceTest(TransactionTestCase):
+    """ Against the test database, with a synthetic backlog """
+
+    queue_table = 'test_queue_maintenance'
+    ticket_table = 'test_queue_maintenance_ticket'
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("queue maintenance needs postgres")
+        settings_dict = connection.settings_dict
+        self.db = DbAdaptor(host=settings_dict['HOST'], port=settings_dict['PORT'], database=settings_dict['NAME'],
+                            username=settings_dict['USER'], password=settings_dict['PASSWORD'])
+        self.addCleanup(self.db.close)
+        self.addCleanup(self.db.execute_and_commit,
+                        f'drop table if exists "{self.queue_table}", "{self.queue_table}_archive", '
+                        f'"{self.ticket_table}" cascade')
+        self.db.ensure_queue(['a', 'b'], queue_table=self.queue_table)
+        self.db.ensure_queue_archive(queue_table=self.queue_table)
+
+        # 1000 answered messages from a day ago, 500 dequeued but unanswered of a live ticket (1) which has moved
+        # past the first 300, 100 dequeued but unanswered of a canceled ticket (2), 200 pending and 10 answered
+        # a moment ago
+        self.db.execute_and_commit(f"""
+create table "{self.ticket_table}" (id bigint primary key, internal_state text, last_message_id bigint);
+insert into "{self.ticket_table}" values (1, '{INTERNAL_STATES.WORKING}', null), (2, '{INTERNAL_STATES.CANCELED}', 0);
+insert into "{self.queue_table}" (eid, enqueued_at, dequeued_at, topic, uid, data, resp, resp_at)
+select gen_random_uuid(), localtimestamp - interval '1 day', localtimestamp - interval '1 day',
+       case when i % 2 = 0 then 'a' else 'b' end, 1000 + i, '{{}}', '{{"ok": true}}', localtimestamp - interval '1 day'
+from generate_series(1, 1000) i;
+insert into "{self.queue_table}" (eid, enqueued_at, dequeued_at, topic, uid, data)
+select gen_random_uuid(), localtimestamp - interval '1 day', localtimestamp - interval '1 day', 'a', 1, '{{}}'
+from generate_series(1, 500) i;
+update "{self.ticket_table}" set last_message_id = (select min(id) + 300 from "{self.queue_table}" where uid = 1)
+where id = 1;
+insert into "{self.queue_table}" (eid, enqueued_at, dequeued_at, topic, uid, data)
+select gen_random_uuid(), localtimestamp - interval '1 day', localtimestamp - interval '1 day', 'b', 2, '{{}}'
+from generate_series(1, 100) i;
+insert into "{self.queue_table}" (eid, topic, uid, data)
+select gen_random_uuid(), 'a', 2000 + i, '{{}}' from generate_series(1, 200) i;
+insert into "{self.queue_table}" (eid, dequeued_at, topic, uid, data, resp, resp_at)
+select gen_random_uuid(), localtimestamp, 'b', 3000 + i, '{{}}', '{{"ok": true}}', localtimestamp
+from generate_series(1, 10) i;""")
+
+    def archive(self, **kwargs):
+        return self.db.archive_queue(queue_table=self.queue_table, ticket_table=self.ticket_table, **kwargs)
+
+    def test_completed_messages_are_archived_in_batches(self):
+        moved = [self.archive(min_age=3600, batch_size=400) for _ in range(5)]
+        self.assertEqual([400, 400, 400, 200, 0], moved)
+
+        stats = {row['topic']: row for row in self.db.queue_stats(queue_table=self.queue_table)}
+        self.assertEqual((200, 200, 0), (stats['a']['pending'], stats['a']['in_flight'], stats['a']['answered']))
+        self.assertEqual((0, 0, 10), (stats['b']['pending'], stats['b']['in_flight'], stats['b']['answered']))
+        self.assertLess(stats['a']['oldest_pending_age'], 3600)
+
+        archived = self.db.fetch_and_commit(f'select count(*) as n, count(resp) as answered '
+                                            f'from "{self.queue_table}_archive"')[0]
+        self.assertEqual((1400, 1000), (archived['n'], archived['answered']))
+
+        # the queue still works
+        self.assertEqual(1, len(self.db.dequeue('a', queue_table=self.queue_table)))
+
+    def test_in_flight_messages_of_live_tickets_are_still_replayed(self):
+        last_message_id = self.db.fetch_and_commit(
+            f'select last_message_id from "{self.ticket_table}" where id = 1')[0]['last_message_id']
+        self.archive(min_age=3600, batch_size=10000)
+
+        replayed = self.db.replay_queue('a', last_message_id, 1, queue_table=self.queue_table)
+        self.assertEqual(200, len(replayed))
+        self.assertEqual(last_message_id, replayed[0]['id'])
+
+        # the ticket is done with them once it moves on
+        self.db.execute_and_commit(f"""update "{self.ticket_table}" set internal_state = '{INTERNAL_STATES.DONE}'
+where id = 1""")
+        self.assertEqual(200, self.archive(min_age=3600, batch_size=10000))
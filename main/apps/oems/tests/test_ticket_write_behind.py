@@ -0,0 +1,96 @@
+from datetime import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from main.apps.oems.backend.db import DbAdaptor
+from main.apps.oems.backend.ticket import Ticket
+
+
+class UpdateManySqlTest(SimpleTestCase):
+
+    def setUp(self):
+        self.db = DbAdaptor(dbtype='POSTGRES', autoconnect=False)
+        self.db.column_type_cache[(None, 'oems_ticket')] = {'id': 'int4', 'amount': 'float8', 'paused': 'bool',
+                                                           'end_time': 'timestamptz'}
+
+    def test_rows_are_grouped_by_field_set(self):
+        rows = {
+            1: {'amount': 10.5, 'paused': True},
+            2: {'paused': False, 'amount': 20.},
+            3: {'end_time': datetime(2024, 1, 2, 3, 4)},
+        }
+        sqls = self.db.update_many_sql(None, 'oems_ticket', rows, 'id')
+
+        self.assertEqual(len(sqls), 2)
+        self.assertEqual(
+            sqls[0],
+            'UPDATE "oems_ticket" AS t SET "amount"=v."amount","paused"=v."paused" '
+            'FROM (VALUES (1::int4,10.5::float8,TRUE::bool),(2::int4,20.0::float8,FALSE::bool)) '
+            'AS v("id","amount","paused") WHERE t."id" = v."id"')
+        self.assertIn("('2024-01-02T03:04:00'::timestamptz)", sqls[1].replace('3::int4,', ''))
+
+    def test_sqlite_falls_back_to_single_updates(self):
+        db = DbAdaptor(dbtype='SQLITE', autoconnect=False)
+        sqls = db.update_many_sql(None, 'oems_ticket', {1: {'amount': 1}, 2: {'amount': 2}}, 'id')
+        self.assertEqual(sqls, [db.update_sql(None, 'oems_ticket', {'amount': 1}, 'id', 1),
+                                db.update_sql(None, 'oems_ticket', {'amount': 2}, 'id', 2)])
+
+
+class TicketWriteBehindTest(SimpleTestCase):
+
+    def setUp(self):
+        self.db = mock.Mock()
+        self.db.update_many_sql.return_value = ['UPDATE ...']
+        # save clears the dirty fields it hands to update_sql, keep a copy
+        self.updates = []
+        self.db.update_sql.side_effect = lambda schema, table, params, key_fld, key: \
+            self.updates.append((table, dict(params), key))
+        patcher = mock.patch.object(Ticket, '_db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_saves_are_flushed_once_per_cycle(self):
+        t1, t2 = Ticket(id=1, amount=1.), Ticket(id=2, amount=2.)
+
+        with Ticket.write_behind():
+            t1.amount = 10.
+            t1.save()
+            t1.paused = True
+            t1.save()
+            t2.amount = 20.
+            t2.save()
+            self.db.execute_and_commit.assert_not_called()
+            self.db.execute_many_and_commit.assert_not_called()
+
+        self.db.update_many_sql.assert_called_once_with(
+            None, 'oems_ticket', {1: {'amount': 10., 'paused': True}, 2: {'amount': 20.}}, 'id')
+        self.db.execute_many_and_commit.assert_called_once_with(['UPDATE ...'])
+        self.assertEqual(t1._dirty, {})
+        self.assertIsNone(Ticket._pending)
+
+    def test_forced_save_writes_the_pending_fields(self):
+        ticket = Ticket(id=1, amount=1.)
+
+        with Ticket.write_behind():
+            ticket.amount = 10.
+            ticket.save()
+            ticket.paused = True
+            ticket.save(force=True)
+            self.db.execute_and_commit.assert_called_once()
+            self.assertEqual(Ticket._pending, {})
+
+        self.assertEqual(self.updates, [('oems_ticket', {'amount': 10., 'paused': True}, 1)])
+        self.db.execute_many_and_commit.assert_not_called()
+
+    def test_failed_flush_falls_back_to_single_updates(self):
+        self.db.execute_many_and_commit.side_effect = RuntimeError
+        ticket = Ticket(id=1, amount=1.)
+
+        with Ticket.write_behind():
+            ticket.amount = 10.
+            ticket.save()
+
+        self.assertEqual(self.updates, [('oems_ticket', {'amount': 10.}, 1)])
+        self.db.execute_and_commit.assert_called_once()
+        self.assertEqual(ticket._dirty, {})
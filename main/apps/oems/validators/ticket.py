@@ -9,8 +9,8 @@ from rest_framework import serializers
 
 from main.apps.account.models import Company
 from main.apps.account.models.user import User
-from main.apps.broker.models import BrokerCompanyInstrument, BrokerInstrument, Broker, \
-    BrokerCompany, BrokerProviderOption
+from main.apps.broker.models import Broker, BrokerProviderOption
+from main.apps.broker.services.permission_matrix import BrokerPermissionMatrixCache
 from main.apps.corpay.models import Beneficiary as CorpayBeneficiary, SettlementAccount, FXBalanceAccount
 from main.apps.currency.models.fxpair import FxPair
 from main.apps.marketdata.models import InstrumentTypes
@@ -575,32 +575,27 @@ def validate_instrument_amount(attrs, check_company=True):
     max_amount_fld = f'max_order_size_{_ls}'
     unit_amount_fld = f'unit_order_size_{_ls}'
 
-    try:
-        broker = Broker.objects.get(broker_provider=broker_key)
-    except:
+    # one lookup per company, the checks below are all in memory
+    matrix = BrokerPermissionMatrixCache.get(company.pk)
+
+    broker = matrix.get_broker(broker_key)
+    if broker is None:
         raise serializers.ValidationError(f"Broker not found: {broker_key}")
 
     # ensure broker is turned on for company
-    try:
-        broker_company = BrokerCompany.objects.get(
-            broker=broker_key, company=company)
-    except:
+    if not matrix.is_broker_configured(broker_key):
         raise serializers.ValidationError(
             f"Broker not configured for company: {broker_key} {company.name}")
 
     if instr_type == InstrumentTypes.NDF:
         instrument_name = f'{market_name}-{tenor.upper()}'
+        broker_instrument = matrix.get_broker_instrument(broker, instrument_name,
+                                                         instrument_type=InstrumentTypes.NDF)
     else:
         instrument_name = f"{market_name}-{instr_type.upper()}"
+        broker_instrument = matrix.get_broker_instrument(broker, instrument_name)
 
-    try:
-        if instr_type == InstrumentTypes.NDF:
-            broker_instrument = BrokerInstrument.objects.get(broker=broker, instrument__name=instrument_name,
-                                                             instrument__instrument_type=InstrumentTypes.NDF)
-        else:
-            broker_instrument = BrokerInstrument.objects.get(
-                broker=broker, instrument__name=instrument_name)
-    except:
+    if broker_instrument is None:
         raise serializers.ValidationError(
             f"Broker is not configured for this instrument: {broker_key} {instrument_name}")
 
@@ -612,10 +607,8 @@ def validate_instrument_amount(attrs, check_company=True):
 
     if check_company:
 
-        try:
-            company_permission = BrokerCompanyInstrument.objects.get(company=company,
-                                                                     broker_instrument=broker_instrument)
-        except:
+        company_permission = matrix.get_permission(broker_instrument)
+        if company_permission is None:
             raise serializers.ValidationError(
                 f"Company permission not found for this instrument: {company.name} {broker_key} {instrument_name}")
 
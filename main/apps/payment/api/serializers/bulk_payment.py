@@ -82,6 +82,20 @@ class BulkRfqStatusSerializer(serializers.Serializer):
     rfqs = BulkDetailedPaymentRfqResponseSerializer(many=True)
 
 
+class BulkPaymentRfqRequestSerializer(BulkPaymentRfqSerializer):
+    status_id = serializers.UUIDField(required=False,
+                                      help_text="Optional id under which the progress of the RFQs can be polled")
+
+
+class BulkRfqProgressSerializer(serializers.Serializer):
+    id = serializers.CharField()
+    state = serializers.CharField()
+    total = serializers.IntegerField()
+    completed = serializers.IntegerField()
+    rfqs = BulkDetailedPaymentRfqResponseSerializer(many=True)
+    error = serializers.CharField(allow_null=True)
+
+
 class BulkPaymentExecutionSerializer(BulkPaymentRfqSerializer):
     pass
 
@@ -1,7 +1,7 @@
 from django.urls import path
 from main.apps.payment.api.views.market_spot_date import MarketSpotDateAPIView
 from main.apps.payment.api.views.payment_rfq import PaymentExecutionAPIView, PaymentRfqAPIView
-from main.apps.payment.api.views.bulk_payment_rfq import BulkPaymentRfqAPIView
+from main.apps.payment.api.views.bulk_payment_rfq import BulkPaymentRfqAPIView, BulkPaymentRfqStatusAPIView
 from main.apps.payment.api.views.bulk_payment_execute import BulkPaymentExecutionAPIView
 
 from main.apps.payment.api.views.payment import (
@@ -47,6 +47,7 @@ urlpatterns = [
          name='bulk-payment-validate'
     ),
     path('bulk-payments-rfq/', BulkPaymentRfqAPIView.as_view(), name='bulk-payment-rfq'),
+    path('bulk-payments-rfq/<str:status_id>/', BulkPaymentRfqStatusAPIView.as_view(), name='bulk-payment-rfq-status'),
     path('bulk-payments-execution/', BulkPaymentExecutionAPIView.as_view(), name='bulk-payment-execution'),
     path('market-spot-dates/', MarketSpotDateAPIView.as_view(), name='market-spot-dates'),
 ]
@@ -9,13 +9,14 @@ from rest_framework import serializers
 
 from main.apps.core.utils.api import HasCompanyAssociated
 from main.apps.payment.api.serializers.bulk_payment import (
-    BulkPaymentRfqSerializer,
+    BulkPaymentRfqRequestSerializer,
+    BulkRfqProgressSerializer,
     BulkRfqStatusSerializer
 )
 from main.apps.payment.models.payment import Payment
 from main.apps.payment.services.batch_response import BatchResponseProvider
 from main.apps.payment.services.error_utils import PaymentResponseUtils
-from main.apps.payment.services.payment_rfq import BulkPaymentRfqService
+from main.apps.payment.services.payment_rfq import BulkPaymentRfqService, BulkPaymentRfqStatus
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +28,25 @@ class BulkPaymentRfqAPIView(APIView):
         return Payment.objects.filter(cashflow_generator__company=self.request.user.company)
 
     @extend_schema(
-        request=BulkPaymentRfqSerializer,
+        request=BulkPaymentRfqRequestSerializer,
         responses={
             status.HTTP_200_OK: BulkRfqStatusSerializer
         }
     )
     def post(self, request):
-        serializer = BulkPaymentRfqSerializer(data=request.data)
+        serializer = BulkPaymentRfqRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
+            payment_ids = serializer.validated_data.get('payment_ids')
+            status_id = serializer.validated_data.get('status_id')
             bulk_rfq_service = BulkPaymentRfqService()
             bulk_rfq_status = bulk_rfq_service.bulk_payment_rfq(
                 request=request,
-                payment_ids=serializer.validated_data.get('payment_ids')
+                payment_ids=payment_ids,
+                rfq_status=BulkPaymentRfqStatus(company_id=request.user.company_id,
+                                                payment_ids=payment_ids,
+                                                status_id=str(status_id) if status_id else None)
             )
             resp = BulkRfqStatusSerializer({'rfqs':bulk_rfq_status})
             return BatchResponseProvider().generate_response(serialized_response=resp.data)
@@ -51,3 +57,20 @@ class BulkPaymentRfqAPIView(APIView):
             logging.error(e, exc_info=True)
             error_resp = PaymentResponseUtils().create_traceback_response(e=e)
             return Response(error_resp, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class BulkPaymentRfqStatusAPIView(APIView):
+    permission_classes = [IsAuthenticated, HasCompanyAssociated]
+
+    @extend_schema(
+        responses={
+            status.HTTP_200_OK: BulkRfqProgressSerializer
+        }
+    )
+    def get(self, request, status_id: str):
+        progress = BulkPaymentRfqStatus.get(company_id=request.user.company_id, status_id=status_id)
+        if progress is None:
+            return Response({'message': 'Bulk payment RFQ not found'}, status=status.HTTP_404_NOT_FOUND)
+        # results are stored already serialized
+        return Response({key: value for key, value in progress.items() if key != 'company_id'},
+                        status=status.HTTP_200_OK)
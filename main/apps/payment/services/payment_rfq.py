@@ -1,8 +1,13 @@
 import json
 import logging
-from typing import List
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterable, List, Optional
 
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework import serializers
@@ -16,6 +21,7 @@ from main.apps.cashflow.models.generator import CashFlowGenerator
 from main.apps.oems.api.utils.response import ErrorResponse, MultiResponse
 from main.apps.oems.models.ticket import Ticket
 from main.apps.oems.services.trading import trading_provider
+from main.apps.payment.api.serializers.bulk_payment import BulkDetailedPaymentRfqResponseSerializer
 from main.apps.payment.models.payment import Payment
 from main.apps.payment.services.converter import PaymentToTicketConverter
 from main.apps.payment.services.ticket_payload import RfqErrorProvider, TicketPayloadProvider
@@ -64,13 +70,16 @@ class PaymentRfqService:
                                         status=status.HTTP_400_BAD_REQUEST, code=status.HTTP_400_BAD_REQUEST)
         return None
 
-    def create_ticket(self, request: Request) -> dict:
+    def validate_rfq(self):
         if not self.payment.execution_timing:
             raise Exception('The execution timing has not been set.')
         if self.payment.execution_timing == Payment.ExecutionTiming.SCHEDULED:
             raise Exception(
                 f'Can not perform RFQ for payment with {Payment.ExecutionTiming.SCHEDULED} timing')
-        resp = self.validate_transaction_limit_and_approval()
+        return self.validate_transaction_limit_and_approval()
+
+    def create_ticket(self, request: Request) -> dict:
+        resp = self.validate_rfq()
         if resp:
             return self.construct_response(responses=MultiResponse([resp]).data)
         return self.create_ticket_with_rfq_api_view(request=request)
@@ -124,29 +133,52 @@ class PaymentRfqService:
         fwd_points_pct = round(ticket.fwd_points / ticket.rate * 100, 2)
         return f"{round(ticket.fwd_points, 5)} / {fwd_points_pct}%"
 
-    def create_ticket_with_rfq_api_view(self, request: Request) -> dict:
+    @staticmethod
+    def get_existing_ticket_ids(cashflow_ids: Iterable) -> Dict[str, str]:
+        """Map each cashflow id (as a string) to the id of its existing ticket, in a single query"""
+        existing_ticket_ids = {}
+        tickets = Ticket.objects.filter(cashflow_id__in=[str(cashflow_id) for cashflow_id in cashflow_ids]) \
+            .order_by('id').values_list('cashflow_id', 'ticket_id')
+        for cashflow_id, ticket_id in tickets:
+            existing_ticket_ids.setdefault(cashflow_id, str(ticket_id))
+        return existing_ticket_ids
+
+    def get_rfq_payloads(self, existing_ticket_ids: Optional[Dict[str, str]] = None) -> List[dict]:
+        cashflows = list(self.get_cashflow())
+        if existing_ticket_ids is None:
+            existing_ticket_ids = self.get_existing_ticket_ids(cf.cashflow_id for cf in cashflows)
+
+        payloads = []
+        for cashflow in cashflows:
+            payload = TicketPayloadProvider.get_create_ticket_rfq_api_payload(
+                payment=self.payment,
+                cashflow=cashflow
+            )
+            ticket_id = existing_ticket_ids.get(str(cashflow.cashflow_id))
+            if ticket_id:
+                payload['ticket_id'] = ticket_id
+            payloads.append(payload)
+        return payloads
+
+    def request_rfq(self, request: Request, existing_ticket_ids: Optional[Dict[str, str]] = None,
+                    deferred: Optional[list] = None) -> List[dict]:
+        """
+        RFQ the cashflows with the broker. The trading provider saves each ticket as its quote comes back, or, with
+        a deferred list, collects the quoted tickets in it for trading_provider.save_rfqs
+        """
+        payloads = self.get_rfq_payloads(existing_ticket_ids=existing_ticket_ids)
+
+        logger.info(json.dumps(payloads))
+        multiple_responses = trading_provider.rfq(
+            user=request.user, request=payloads, deferred=deferred)
+        return multiple_responses.data
+
+    def create_ticket_with_rfq_api_view(self, request: Request,
+                                        existing_ticket_ids: Optional[Dict[str, str]] = None) -> dict:
         try:
             with transaction.atomic():
-                cashflows = self.get_cashflow()
-
-                payloads = []
-                for cashflow in cashflows:
-                    payload = TicketPayloadProvider.get_create_ticket_rfq_api_payload(
-                        payment=self.payment,
-                        cashflow=cashflow
-                    )
-                    try:
-                        existing_ticket = Ticket.objects.get(
-                            cashflow_id=cashflow.cashflow_id)
-                        payload['ticket_id'] = str(existing_ticket.ticket_id)
-                    except Ticket.DoesNotExist as e:
-                        pass
-                    payloads.append(payload)
-
-                logger.info(json.dumps(payloads))
-                multiple_responses = trading_provider.rfq(
-                    user=request.user, request=payloads)
-                return self.construct_response(responses=multiple_responses.data)
+                responses = self.request_rfq(request=request, existing_ticket_ids=existing_ticket_ids)
+                return self.construct_response(responses=responses)
         except Exception as e:
             raise e.with_traceback(e.__traceback__)
 
@@ -163,26 +195,130 @@ class PaymentRfqService:
             raise e.with_traceback(e.__traceback__)
 
 
+class BulkPaymentRfqStatus:
+    """
+    Pollable progress of a bulk payment RFQ, kept in the cache while the RFQs run. Results are added (serialized)
+    as soon as each payment is done.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    key_prefix = 'bulk_payment_rfq'
+    timeout = 60 * 60
+
+    def __init__(self, company_id: int, payment_ids: List[int], status_id: Optional[str] = None):
+        self.status_id = status_id or str(uuid.uuid4())
+        self.data = {
+            'id': self.status_id,
+            'company_id': company_id,
+            'state': self.PENDING,
+            'total': len(payment_ids),
+            'completed': 0,
+            'rfqs': [],
+            'error': None,
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, company_id: int, status_id: str) -> Optional[dict]:
+        return cache.get(cls._key(company_id, status_id))
+
+    def set_state(self, state: str, error: Optional[str] = None):
+        with self._lock:
+            self.data['state'] = state
+            self.data['error'] = error
+            self._save()
+
+    def add_result(self, payment_id: int, rfq_status: dict):
+        rfq = BulkDetailedPaymentRfqResponseSerializer({'payment_id': payment_id, 'rfq_status': rfq_status}).data
+        with self._lock:
+            self.data['rfqs'].append(rfq)
+            self.data['completed'] += 1
+            self._save()
+
+    def _save(self):
+        try:
+            cache.set(self._key(self.data['company_id'], self.status_id), self.data, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Unable to save bulk payment rfq status {self.status_id}: {e}")
+
+    @classmethod
+    def _key(cls, company_id: int, status_id: str) -> str:
+        # status ids may be chosen by the client, they are only unique within a company
+        return f"{cls.key_prefix}:{company_id}:{status_id}"
+
+
 class BulkPaymentRfqService:
+    """
+    RFQs for many payments. Existing tickets of all the cashflows are looked up in one query, the broker RFQs of
+    the payments run concurrently (bounded by MAX_WORKERS), outside of any transaction, then the tickets of each
+    payment are saved in one short transaction, so a failure only affects its own payment. Progress is published through BulkPaymentRfqStatus.
+    """
+    MAX_WORKERS = 4
 
-    @staticmethod
-    def bulk_payment_rfq(request: Request, payment_ids: List[int]) -> List[dict]:
-        with transaction.atomic():
-            scheduled_payments_id = []
-            bulk_rfq_status = []
-            payments = Payment.objects.filter(id__in=payment_ids)
-            for payment in payments:
-                if payment.execution_timing != Payment.ExecutionTiming.IMMEDIATE:
-                    scheduled_payments_id.append(str(payment.pk))
-                    continue
-
-                rfq_service = PaymentRfqService(payment=payment)
-                rfq_status = rfq_service.create_ticket(request=request)
-                bulk_rfq_status.append({
-                    'payment_id': payment.pk,
-                    'rfq_status': rfq_status
-                })
-            if len(scheduled_payments_id) > 0:
-                raise Exception(
-                    f"Scheduled payment exist in the payment id list: {','.join(scheduled_payments_id)}")
-            return bulk_rfq_status
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or self.MAX_WORKERS
+
+    def bulk_payment_rfq(self, request: Request, payment_ids: List[int],
+                         rfq_status: Optional[BulkPaymentRfqStatus] = None) -> List[dict]:
+        payments = list(Payment.objects.filter(id__in=payment_ids).select_related('cashflow_generator'))
+        if rfq_status is None:
+            rfq_status = BulkPaymentRfqStatus(company_id=request.user.company_id, payment_ids=payment_ids)
+
+        scheduled_payments_id = [str(payment.pk) for payment in payments
+                                 if payment.execution_timing != Payment.ExecutionTiming.IMMEDIATE]
+        if len(scheduled_payments_id) > 0:
+            message = f"Scheduled payment exist in the payment id list: {','.join(scheduled_payments_id)}"
+            rfq_status.set_state(BulkPaymentRfqStatus.FAILED, error=message)
+            raise Exception(message)
+
+        cashflow_ids = SingleCashFlow.objects.filter(
+            generator_id__in=[payment.cashflow_generator_id for payment in payments]
+        ).values_list('cashflow_id', flat=True)
+        existing_ticket_ids = PaymentRfqService.get_existing_ticket_ids(cashflow_ids)
+
+        rfq_status.set_state(BulkPaymentRfqStatus.RUNNING)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                bulk_rfq_status = list(executor.map(self._payment_rfq, repeat(request), payments,
+                                                    repeat(existing_ticket_ids), repeat(rfq_status)))
+        except Exception as e:
+            rfq_status.set_state(BulkPaymentRfqStatus.FAILED, error=str(e))
+            raise
+        rfq_status.set_state(BulkPaymentRfqStatus.COMPLETED)
+        return bulk_rfq_status
+
+    def _payment_rfq(self, request: Request, payment: Payment, existing_ticket_ids: Dict[str, str],
+                     rfq_status: BulkPaymentRfqStatus) -> dict:
+        rfq_service = PaymentRfqService(payment=payment)
+        try:
+            try:
+                resp = rfq_service.validate_rfq()
+                if resp:
+                    result = rfq_service.construct_response(responses=MultiResponse([resp]).data)
+                else:
+                    # no transaction around the broker round trip: it would hold a connection (and the row locks
+                    # taken so far) for the network latency. The payment's tickets are saved together afterwards.
+                    quoted = []
+                    responses = rfq_service.request_rfq(request=request, existing_ticket_ids=existing_ticket_ids,
+                                                        deferred=quoted)
+                    trading_provider.save_rfqs(quoted)
+                    result = rfq_service.construct_response(responses=responses)
+            except Exception as e:
+                logger.error(f"Bulk RFQ failed for payment {payment.pk}: {e}", exc_info=True)
+                result = rfq_service.construct_response(responses=MultiResponse([
+                    ErrorResponse(str(e) or 'internal error', status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                  code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                ]).data)
+
+            rfq_status.add_result(payment_id=payment.pk, rfq_status=result)
+        finally:
+            # worker threads have their own connection
+            connection.close()
+
+        return {
+            'payment_id': payment.pk,
+            'rfq_status': result
+        }
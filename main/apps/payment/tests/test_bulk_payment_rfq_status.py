@@ -0,0 +1,153 @@
+import threading
+import time
+from unittest import mock
+
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.response import Response
+
+from main.apps.oems.api.utils.response import MultiResponse
+from main.apps.oems.services.trading import trading_provider
+from main.apps.payment.models.payment import Payment
+from main.apps.payment.services.payment_rfq import BulkPaymentRfqService, BulkPaymentRfqStatus, PaymentRfqService
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class BulkPaymentRfqStatusTest(TestCase):
+
+    @mock.patch('main.apps.payment.services.payment_rfq.BulkDetailedPaymentRfqResponseSerializer')
+    def test_progress_is_pollable(self, mock_serializer):
+        mock_serializer.side_effect = lambda data: mock.Mock(data={'payment_id': data['payment_id']})
+
+        rfq_status = BulkPaymentRfqStatus(company_id=1, payment_ids=[10, 11])
+        rfq_status.set_state(BulkPaymentRfqStatus.RUNNING)
+        rfq_status.add_result(payment_id=10, rfq_status={'success': [], 'failed': []})
+
+        progress = BulkPaymentRfqStatus.get(1, rfq_status.status_id)
+        self.assertEqual(progress['state'], BulkPaymentRfqStatus.RUNNING)
+        self.assertEqual((progress['completed'], progress['total']), (1, 2))
+        self.assertEqual(progress['rfqs'], [{'payment_id': 10}])
+
+        rfq_status.set_state(BulkPaymentRfqStatus.FAILED, error='broker unavailable')
+        progress = BulkPaymentRfqStatus.get(1, rfq_status.status_id)
+        self.assertEqual(progress['state'], BulkPaymentRfqStatus.FAILED)
+        self.assertEqual(progress['error'], 'broker unavailable')
+
+    def test_unknown_status(self):
+        self.assertIsNone(BulkPaymentRfqStatus.get(1, 'unknown'))
+
+    def test_status_ids_are_scoped_by_company(self):
+        BulkPaymentRfqStatus(company_id=1, payment_ids=[10], status_id='batch').set_state(BulkPaymentRfqStatus.RUNNING)
+        BulkPaymentRfqStatus(company_id=2, payment_ids=[20, 21], status_id='batch').set_state(
+            BulkPaymentRfqStatus.FAILED)
+
+        self.assertEqual(BulkPaymentRfqStatus.get(1, 'batch')['state'], BulkPaymentRfqStatus.RUNNING)
+        self.assertEqual(BulkPaymentRfqStatus.get(2, 'batch')['total'], 2)
+        self.assertIsNone(BulkPaymentRfqStatus.get(3, 'batch'))
+
+
+class StubBroker:
+    """
+    Stands in for trading_provider: quotes after a delay, payment 3 is unavailable, and records the tickets saved
+    by save_rfqs
+    """
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = self.peak = 0
+        self.in_atomic_block = []
+        self.saved = []
+
+    def rfq(self, user, request, deferred=None):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.in_atomic_block.append(transaction.get_connection().in_atomic_block)
+        try:
+            time.sleep(self.delay)
+            payment_id = request[0]['payment_id']
+            if payment_id == 3:
+                raise RuntimeError('broker unavailable')
+            deferred.append((f't{payment_id}', True))
+            return MultiResponse([Response({'ticket_id': f't{payment_id}'}, status=201)])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def save_rfqs(self, deferred):
+        with self.lock:
+            self.saved.extend(ticket for ticket, is_new in deferred)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class BulkPaymentRfqServiceTest(SimpleTestCase):
+
+    def test_rfqs_run_concurrently_outside_transactions(self):
+        payments = [mock.Mock(pk=pk, cashflow_generator_id=pk, execution_timing=Payment.ExecutionTiming.IMMEDIATE)
+                    for pk in range(1, 7)]
+        broker = StubBroker()
+        request = mock.Mock()
+        request.user.company_id = 1
+
+        def construct_response(service, responses):
+            return {'success': [response['data']['ticket_id'] for response in responses
+                                if response['status'] == 201],
+                    'failed': [response for response in responses if response['status'] != 201]}
+
+        module = 'main.apps.payment.services.payment_rfq'
+        with mock.patch(f'{module}.Payment.objects.filter') as payment_filter, \
+                mock.patch(f'{module}.SingleCashFlow.objects.filter'), \
+                mock.patch(f'{module}.BulkDetailedPaymentRfqResponseSerializer',
+                           side_effect=lambda data: mock.Mock(data={'payment_id': data['payment_id']})), \
+                mock.patch(f'{module}.trading_provider.rfq', side_effect=broker.rfq), \
+                mock.patch(f'{module}.trading_provider.save_rfqs', side_effect=broker.save_rfqs), \
+                mock.patch.object(PaymentRfqService, 'get_existing_ticket_ids', return_value={}), \
+                mock.patch.object(PaymentRfqService, 'validate_rfq', return_value=None), \
+                mock.patch.object(PaymentRfqService, 'get_rfq_payloads', autospec=True,
+                                  side_effect=lambda service, existing_ticket_ids: [
+                                      {'payment_id': service.payment.pk}]), \
+                mock.patch.object(PaymentRfqService, 'construct_response', autospec=True,
+                                  side_effect=construct_response):
+            payment_filter.return_value.select_related.return_value = payments
+            rfq_status = BulkPaymentRfqStatus(company_id=1, payment_ids=[p.pk for p in payments])
+            results = BulkPaymentRfqService(max_workers=3).bulk_payment_rfq(request, [p.pk for p in payments],
+                                                                            rfq_status=rfq_status)
+
+        self.assertEqual([1, 2, 3, 4, 5, 6], [result['payment_id'] for result in results])
+        self.assertEqual(['t1'], results[0]['rfq_status']['success'])
+        # a broker failure only fails its own payment
+        self.assertEqual([], results[2]['rfq_status']['success'])
+        self.assertEqual(1, len(results[2]['rfq_status']['failed']))
+        # bounded by the pool, and no transaction held over the broker round trip
+        self.assertEqual(3, broker.peak)
+        self.assertEqual([False] * 6, broker.in_atomic_block)
+        # the quoted tickets are saved after the round trip, the failed payment has none
+        self.assertEqual(['t1', 't2', 't4', 't5', 't6'], sorted(broker.saved))
+
+        progress = BulkPaymentRfqStatus.get(1, rfq_status.status_id)
+        self.assertEqual((BulkPaymentRfqStatus.COMPLETED, 6), (progress['state'], progress['completed']))
+
+
+class SaveRfqsTest(SimpleTestCase):
+
+    def test_tickets_are_saved_in_one_transaction_and_published_on_commit(self):
+        calls = mock.Mock()
+        new, refreshed = mock.Mock(cashflow_id=None), mock.Mock()
+        new.save.side_effect = lambda: calls.save('new')
+        refreshed.save.side_effect = lambda: calls.save('refreshed')
+
+        module = 'main.apps.oems.services.trading'
+        with mock.patch(f'{module}.transaction') as db_transaction, \
+                mock.patch(f'{module}.RfqSerializer.publish', side_effect=calls.publish):
+            db_transaction.atomic.return_value.__enter__.side_effect = lambda: calls.begin()
+            db_transaction.atomic.return_value.__exit__.side_effect = lambda *exc: calls.commit()
+            db_transaction.on_commit.side_effect = lambda func: calls.on_commit(func)
+            trading_provider.save_rfqs([(new, True), (refreshed, False)])
+
+            self.assertEqual(['begin', 'save', 'save', 'on_commit', 'commit'], [c[0] for c in calls.mock_calls])
+            new.life_cycle_event.assert_called_once()
+            refreshed.life_cycle_event.assert_not_called()
+
+            calls.on_commit.call_args.args[0]()
+            calls.publish.assert_called_once_with(new)
@@ -1,4 +1,9 @@
+from itertools import islice
+from typing import Dict, Iterable, Mapping, Optional
+
+import numpy as np
 import pandas as pd
+from django.db.models import QuerySet
 
 
 class SEMetrics:
@@ -86,6 +91,182 @@ class SEMetrics:
         return self.max_difference('ex_time', 'start_time').total_seconds() / 3600
 
 
+class RunningStat:
+    """Running count / sum / min / max of a single metric, ignoring NaNs. Mergeable."""
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = float(np.nanmin([self.min, values.min()]))
+        self.max = float(np.nanmax([self.max, values.max()]))
+
+    def merge(self, other: 'RunningStat'):
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = float(np.nanmin([self.min, other.min]))
+        self.max = float(np.nanmax([self.max, other.max]))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else np.nan
+
+
+class SEMetricsAccumulator:
+    """
+    Streaming version of SEMetrics. Execution rows are consumed in chunks, and every metric is computed once per
+    chunk into a running mean / min / max, so the execution history never has to be materialized. Accumulators can be
+    merged, e.g. to combine the reports of several companies or time partitions.
+
+    Rows must have the columns in SEMetrics.REQUIRED_COLUMNS.
+    """
+    METRICS = ('buy', 'sell', 'buy_saved', 'sell_gained', 'execution_spread', 'start_spread', 'wait')
+
+    def __init__(self):
+        self.stats: Dict[str, RunningStat] = {metric: RunningStat() for metric in self.METRICS}
+        self.rows = 0
+
+    # ================
+    # Consuming rows
+    # ================
+
+    def update(self, df: pd.DataFrame) -> 'SEMetricsAccumulator':
+        """Consume one chunk of executions."""
+        SEMetrics.validate_dataframe(df)
+        if df.empty:
+            return self
+        ask_ex = pd.to_numeric(df['rate_ask_ex'], errors='coerce').to_numpy(dtype=float)
+        bid_ex = pd.to_numeric(df['rate_bid_ex'], errors='coerce').to_numpy(dtype=float)
+        ask_start = pd.to_numeric(df['rate_ask_start'], errors='coerce').to_numpy(dtype=float)
+        bid_start = pd.to_numeric(df['rate_bid_start'], errors='coerce').to_numpy(dtype=float)
+        wait = (pd.to_datetime(df['ex_time'], utc=True) - pd.to_datetime(df['start_time'], utc=True))
+
+        values = {
+            'buy': ask_ex,
+            'sell': bid_ex,
+            'buy_saved': ask_start - ask_ex,
+            'sell_gained': bid_ex - bid_start,
+            'execution_spread': ask_ex - bid_ex,
+            'start_spread': ask_start - bid_start,
+            'wait': wait.dt.total_seconds().to_numpy(dtype=float) / 3600,
+        }
+        for metric, stat in self.stats.items():
+            stat.update(values[metric])
+        self.rows += len(df)
+        return self
+
+    def update_rows(self, rows: Iterable[Mapping], chunk_size: int = 5000) -> 'SEMetricsAccumulator':
+        """Consume an iterable of row mappings (e.g. dicts), chunk_size rows at a time."""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return self
+            self.update(pd.DataFrame.from_records(chunk))
+
+    def update_from_queryset(self,
+                             queryset: QuerySet,
+                             field_map: Optional[Dict[str, str]] = None,
+                             chunk_size: int = 5000) -> 'SEMetricsAccumulator':
+        """
+        Consume executions from the database. Rows are streamed with QuerySet.iterator(), which uses a server-side
+        cursor on postgres, so memory stays bounded by the chunk size.
+
+        :param queryset: The executions
+        :param field_map: Maps the required columns to the fields (or annotations) of the queryset, for those
+            that are named differently
+        :param chunk_size: Number of rows fetched from the cursor (and aggregated) at a time
+        """
+        field_map = field_map or {}
+        fields = [field_map.get(column, column) for column in SEMetrics.REQUIRED_COLUMNS]
+        rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return self
+            self.update(pd.DataFrame.from_records(chunk, columns=SEMetrics.REQUIRED_COLUMNS))
+
+    def merge(self, other: 'SEMetricsAccumulator') -> 'SEMetricsAccumulator':
+        """Fold another accumulator (e.g. another company or time partition) into this one."""
+        for metric, stat in self.stats.items():
+            stat.merge(other.stats[metric])
+        self.rows += other.rows
+        return self
+
+    @classmethod
+    def merged(cls, accumulators: Iterable['SEMetricsAccumulator']) -> 'SEMetricsAccumulator':
+        out = cls()
+        for accumulator in accumulators:
+            out.merge(accumulator)
+        return out
+
+    # ================
+    # Metrics, as in SEMetrics
+    # ================
+
+    def average_buy(self) -> float:
+        """lower is good"""
+        return self.stats['buy'].mean
+
+    def average_sell(self) -> float:
+        """higher is good"""
+        return self.stats['sell'].mean
+
+    def average_buy_saved(self) -> float:
+        """Positive is good"""
+        return self.stats['buy_saved'].mean
+
+    def average_sell_gained(self) -> float:
+        """Positive is good"""
+        return self.stats['sell_gained'].mean
+
+    def average_saved(self) -> float:
+        """Positive is good"""
+        return (self.average_buy_saved() + self.average_sell_gained()) / 2
+
+    def min_buy_saved(self) -> float:
+        return self.stats['buy_saved'].min
+
+    def min_sell_gained(self) -> float:
+        return self.stats['sell_gained'].min
+
+    def average_execution_spread(self) -> float:
+        return self.stats['execution_spread'].mean
+
+    def average_start_spread(self) -> float:
+        return self.stats['start_spread'].mean
+
+    def spread_benefit(self) -> float:
+        """Positive is good"""
+        return self.average_start_spread() - self.average_execution_spread()
+
+    def max_execution_spread(self) -> float:
+        return self.stats['execution_spread'].max
+
+    def average_wait(self) -> float:
+        """in hours"""
+        return self.stats['wait'].mean
+
+    def min_wait(self) -> float:
+        """in hours"""
+        return self.stats['wait'].min
+
+    def max_wait(self) -> float:
+        """in hours"""
+        return self.stats['wait'].max
+
+
 if __name__ == '__main__':
     # Example DataFrame with datetime
     data = {
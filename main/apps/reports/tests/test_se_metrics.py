@@ -1,7 +1,7 @@
 import pandas as pd
 from django.test import TestCase
 
-from main.apps.reports.services.stratex.performance import SEMetrics
+from main.apps.reports.services.stratex.performance import SEMetrics, SEMetricsAccumulator
 
 
 class TestSEMetrics(TestCase):
@@ -56,3 +56,32 @@ class TestSEMetrics(TestCase):
     def test_validate_dataframe_exception(self):
         with self.assertRaises(ValueError):
             SEMetrics(pd.DataFrame({'invalid_column': [1, 2, 3]}))
+
+
+class TestSEMetricsAccumulator(TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'rate_ask_ex': [100, 150, 200],
+            'rate_bid_ex': [95, 145, 190],
+            'rate_ask_start': [105, 155, 205],
+            'rate_bid_start': [90, 140, 185],
+            'start_time': pd.to_datetime(['2023-01-01 00:00', '2023-01-02 00:00', '2023-01-03 00:00']),
+            'ex_time': pd.to_datetime(['2023-01-01 03:00', '2023-01-02 03:00', '2023-01-03 05:00'])
+        })
+        self.metrics = SEMetrics(self.df)
+
+    def assert_matches(self, accumulator: SEMetricsAccumulator):
+        for name in ('average_buy', 'average_sell', 'average_saved', 'min_buy_saved', 'min_sell_gained',
+                     'spread_benefit', 'max_execution_spread', 'average_wait', 'min_wait', 'max_wait'):
+            self.assertAlmostEqual(getattr(self.metrics, name)(), getattr(accumulator, name)(), msg=name)
+
+    def test_streamed_rows_match_dataframe(self):
+        accumulator = SEMetricsAccumulator().update_rows(self.df.to_dict('records'), chunk_size=2)
+        self.assertEqual(accumulator.rows, 3)
+        self.assert_matches(accumulator)
+
+    def test_merge_partitions(self):
+        first = SEMetricsAccumulator().update(self.df.iloc[:1])
+        second = SEMetricsAccumulator().update(self.df.iloc[1:])
+        self.assert_matches(SEMetricsAccumulator.merged([first, second, SEMetricsAccumulator()]))
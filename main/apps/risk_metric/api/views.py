@@ -19,10 +19,11 @@ from rest_framework.views import APIView
 from main.apps.account.models import Account, DraftCashFlow, CashFlow
 from main.apps.billing.services.what_if import FeeWhatIfService, FeeDetail
 from main.apps.core.utils.api import HasCompanyAssociated
+from main.apps.core.utils.service_registry import get_service
 from main.apps.currency.models import Currency, CurrencyTypes
 from main.apps.hedge.models import HedgeSettings
 from main.apps.hedge.services.roll_cost_what_if import RollCostWhatIfService, RollCostDetail
-from main.apps.margin.services.margin_service import service as margin_service
+from main.apps.margin.services.margin_service import DefaultMarginProviderService
 from main.apps.margin.services.what_if import DefaultWhatIfMarginInterface
 from main.apps.marketdata.models import FxTypes
 from main.apps.marketdata.services.universe_provider import UniverseProviderService
@@ -223,7 +224,7 @@ def get_margin_and_fee_view(request):
                 cf.update_from_draft(draft)
                 new_cfs.append(cf)
 
-        margin_detail = margin_service.get_margin_detail(
+        margin_detail = get_service(DefaultMarginProviderService).get_margin_detail(
             company=company, date=date)
 
         spot_cache = what_if_service.fx_spot_provider.get_spot_cache(
@@ -361,7 +362,7 @@ def get_margin_health_report(request):
     """
     serializer = MarginHealthRequest(data=request.data)
     serializer.is_valid(raise_exception=True)
-    report = margin_service.get_margin_health_report(company=request.user.company,
+    report = get_service(DefaultMarginProviderService).get_margin_health_report(company=request.user.company,
                                                      custom_amount=serializer.validated_data.get('custom_amount',
                                                                                                  None))
 
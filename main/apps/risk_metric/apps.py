@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RiskMetricConfig(AppConfig):
     name = 'main.apps.risk_metric'
+
+    def ready(self):
+        import main.apps.risk_metric.signals  # noqa
@@ -2,6 +2,7 @@ from collections import defaultdict
 
 from hdlib.Universe.FX.FxUniverseCounterSwitcher import FxUniverseCounterSwitcher
 from main.apps.account.models import CashFlow, iter_active_cashflows
+from main.apps.core.utils.service_registry import service_or_default
 from main.apps.currency.models import FxPair, FxPairTypes
 from main.apps.marketdata.services.data_cut_service import DataCutService
 from main.apps.marketdata.services.fx.fx_option_provider import InterpolatedAtmVolTermStructure, AtmVolTermStructure
@@ -9,11 +10,11 @@ from main.apps.marketdata.services.universe_provider import UniverseProviderServ
 from main.apps.account.models.account import Account, AccountTypes
 from main.apps.account.services.cashflow_pricer import CashFlowPricerService
 from main.apps.currency.models.currency import Currency, CurrencyTypes
+from main.apps.risk_metric.services.risk_cone_cache import CumulativeRisk, RiskConeCache
+from main.apps.risk_metric.services.risk_cone_engine import FxMarketSnapshotProvider, RiskConeEngine
 
 from hdlib.Universe.Universe import Universe
 from hdlib.DateTime.DayCounter import DayCounter_HD
-from hdlib.Hedge.Fx.MinVar.PnLRiskCalculator import PnLRiskCalculator
-from hdlib.DateTime.Calendar.Calendar import CustomCalendar
 from hdlib.DateTime.Date import Date
 from hdlib.Universe.Risk.CashFlowRiskEngine_MC import CashFlowRiskEngine_MC
 from hdlib.Hedge.Fx.HedgeAccount import CashExposures_Cached, HedgeAccountSettings, HedgeMethod
@@ -24,7 +25,6 @@ from hdlib.Core.CompanyInterface import BasicCompany
 from typing import Union, Sequence, Tuple, Optional, Dict, Iterable, List
 import numpy as np
 import pandas as pd
-from scipy.stats import norm
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,9 +32,11 @@ logger = logging.getLogger(__name__)
 
 class FxRiskService(object):
     def __init__(self,
-                 universe_provider_service: UniverseProviderService = UniverseProviderService()):
-        self._universe_provider_service = universe_provider_service
-        self._fx_spot_provider = universe_provider_service.fx_spot_provider
+                 universe_provider_service: Optional[UniverseProviderService] = None,
+                 market_snapshot_provider: Optional[FxMarketSnapshotProvider] = None):
+        self._universe_provider_service = service_or_default(universe_provider_service, UniverseProviderService)
+        self._fx_spot_provider = self._universe_provider_service.fx_spot_provider
+        self._market_snapshot_provider = service_or_default(market_snapshot_provider, FxMarketSnapshotProvider)
 
     def get_single_fx_risk_cones(self,
                                  fx_pair: FxPairTypes,
@@ -102,103 +104,24 @@ class FxRiskService(object):
                                                      1, 2, 3),
                                                  do_std_dev_cones: bool = True
                                                  ) -> Dict[str, list]:
-        usd = Currency.get_currency('USD')
-        domestic = fx_pair.quote
-
-        # Construct the Financial Universe
-        if domestic == usd:
-            usd_pair = fx_pair
-        else:
-            usd_pair = FxPair.get_pair_from_currency(
-                base_currency=fx_pair.quote, quote_currency=usd)
-
-        universe_usd = self._universe_provider_service.make_cntr_currency_universe(
-            ref_date=start_date,
-            domestic=usd,
-            fx_pairs=(usd_pair,),
-            flat_forward=True,
-            flat_discount=True)
+        snapshot = self._market_snapshot_provider.get_snapshot(pair_name=fx_pair.name, ref_date=start_date)
+        spot, vol = snapshot.spot, snapshot.vol
 
-        # NOTE: we dont need to switch universe if pair is of the form XXX/USD or USD/XXX
-        universe = universe_usd
+        dates, num_steps = RiskConeEngine.cone_dates(start_date=start_date, end_date=end_date)
+        daily_var = RiskConeEngine.dt * vol * vol
+        cumulative_var = np.cumsum(np.full(num_steps, daily_var))
 
-        spot = universe.fx_universe.fx_assets.get_fx_spot(pair=fx_pair)
-        vol = universe.fx_universe.fx_vols.vol_spot(pair=fx_pair)
-
-        if np.isnan(vol):
-            raise RuntimeError(
-                f"Nan Vols were retrieved from universe, likely missing data for: {fx_pair}")
-
-        calendar = CustomCalendar.new_western_no_holidays()
-
-        date = start_date
-        dates = [start_date]
-        means = [0.]
-
-        uppers = []
-        lowers = []
-
-        num_levels = len(
-            std_dev_levels) if do_std_dev_cones else len(prob_levels)
-        for i in range(num_levels):
-            uppers.append([0., ])
-            lowers.append([0., ])
-
-        raw_cumulative_var = 0
-        mean_val = 0.  # NOTE: for now we assume means are zero, this could change
+        uppers, lowers = RiskConeEngine.std_dev_cones(cumulative_var=cumulative_var, std_dev_levels=std_dev_levels)
 
         initial_value = spot
-        dt = 1 / 252.
-        daily_var = dt * vol * vol
-
-        while date <= end_date:
-            means.append(mean_val)
-            raw_cumulative_var += daily_var
-
-            if do_std_dev_cones:
-                std_dev = np.sqrt(raw_cumulative_var)
-                for i in range(len(std_dev_levels)):
-                    bound = std_dev_levels[i] * std_dev
-                    uppers[i].append(mean_val + bound)
-                    lowers[i].append(mean_val - bound)
-
-            else:
-                raise NotImplementedError("TODO")
-
-            date = calendar.adjust(date + 1)  # Go to the next date
-            # This is the risk associated with the next date
-            dates.append(date)
-
-        upper_max_exposures, lower_max_exposures = [], []
-        upper_max_exposure_percs, lower_max_exposure_percs = [], []
-        for i in range(num_levels):
-            upper = uppers[i][-1]
-            upper_max_exposures.append(upper)
-            upper_max_exposure_percs.append(
-                100 * np.abs(upper / max(1.0, abs(initial_value))))
-
-            lower = lowers[i][-1]
-            lower_max_exposures.append(lower)
-            lower_max_exposure_percs.append(-100 *
-                                            np.abs(lower / max(1.0, abs(initial_value))))
-
-        out = {"dates": dates,
-               "means": means,
-               "uppers": uppers,
-               "lowers": lowers,
-               "upper_maxs": upper_max_exposures,
-               "upper_max_percents": upper_max_exposure_percs,
-               "lower_maxs": lower_max_exposures,
-               "lower_max_percents": lower_max_exposure_percs,
-               "initial_value": initial_value,
-               "previous_value": initial_value,
-               "update_value": initial_value
-               }
-        if do_std_dev_cones:
-            probs = [1 - 2 * norm.cdf(-std_dev) for std_dev in std_dev_levels]
-            out["std_probs"] = probs
-
-        return out
+        return RiskConeEngine.to_output(dates=dates,
+                                        uppers=uppers,
+                                        lowers=lowers,
+                                        initial_value=initial_value,
+                                        previous_value=initial_value,
+                                        update_value=initial_value,
+                                        min_initial_value=1.0,
+                                        std_dev_levels=std_dev_levels)
 
 
 class CashFlowRiskService(object):
@@ -209,12 +132,14 @@ class CashFlowRiskService(object):
     """
 
     def __init__(self,
-                 cashflow_pricer: CashFlowPricerService = CashFlowPricerService(),
-                 universe_provider_service: UniverseProviderService = UniverseProviderService()):
-        self._cashflow_pricer = cashflow_pricer
-        self._universe_provider_service = universe_provider_service
-        self._fx_spot_provider = universe_provider_service.fx_spot_provider
-        self._fx_option_strategy_provider = universe_provider_service.fx_option_strategy_provider
+                 cashflow_pricer: Optional[CashFlowPricerService] = None,
+                 universe_provider_service: Optional[UniverseProviderService] = None,
+                 risk_cone_cache: Optional[RiskConeCache] = None):
+        self._cashflow_pricer = service_or_default(cashflow_pricer, CashFlowPricerService)
+        self._risk_cone_cache = service_or_default(risk_cone_cache, RiskConeCache)
+        self._universe_provider_service = service_or_default(universe_provider_service, UniverseProviderService)
+        self._fx_spot_provider = self._universe_provider_service.fx_spot_provider
+        self._fx_option_strategy_provider = self._universe_provider_service.fx_option_strategy_provider
 
     def get_simulated_risk_for_account(self,
                                        date: Date,
@@ -392,6 +317,65 @@ class CashFlowRiskService(object):
             raise ValueError(
                 "End date must be the same or after start_date")
 
+        # The cumulative risk does not depend on the cone levels, so it is cached and reused when only those change
+        cache_key = self._risk_cone_cache.make_key(domestic=domestic,
+                                                   cashflows=cashflows,
+                                                   start_date=start_date,
+                                                   end_date=end_date,
+                                                   max_horizon=max_horizon,
+                                                   account_id=account_.id if account_ is not None else None)
+        cumulative_risk = self._risk_cone_cache.get(cache_key)
+        if cumulative_risk is None:
+            cumulative_risk = self._get_cumulative_risk(domestic=domestic,
+                                                        cashflows=cashflows,
+                                                        start_date=start_date,
+                                                        end_date=end_date,
+                                                        max_horizon=max_horizon,
+                                                        account=account_)
+            self._risk_cone_cache.set(cache_key, cumulative_risk)
+        else:
+            logger.debug("Using cached cumulative risk for risk cones")
+
+        mean_val = 0.  # NOTE: for now we assume means are zero, this could change
+        initial_value = cumulative_risk.initial_value
+
+        if do_std_dev_cones:
+            uppers, lowers = RiskConeEngine.std_dev_cones(cumulative_var=cumulative_risk.cumulative_var,
+                                                          std_dev_levels=std_dev_levels,
+                                                          mean_val=mean_val)
+        else:
+            # Note: these are PnL bounds, so they are centered around zero
+            # NOTE: the lower_risk_bound is a negative number
+            lower_risk_bound = abs(initial_value) * (lower_risk_bound_percent / 100.)
+            upper_risk_bound = abs(initial_value) * (upper_risk_bound_percent / 100.)
+            uppers, lowers = RiskConeEngine.risk_reduction_cones(cumulative_var=cumulative_risk.cumulative_var,
+                                                                 risk_reductions=risk_reductions,
+                                                                 lower_risk_bound=lower_risk_bound,
+                                                                 upper_risk_bound=upper_risk_bound,
+                                                                 mean_val=mean_val)
+
+        return RiskConeEngine.to_output(dates=cumulative_risk.dates,
+                                        uppers=uppers,
+                                        lowers=lowers,
+                                        initial_value=initial_value,
+                                        previous_value=cumulative_risk.previous_value,
+                                        update_value=cumulative_risk.update_value,
+                                        min_initial_value=1e-10,
+                                        std_dev_levels=std_dev_levels if do_std_dev_cones else None,
+                                        mean_val=mean_val)
+
+    def _get_cumulative_risk(self,
+                             domestic: Currency,
+                             cashflows: Dict[Currency, Sequence[CashFlow]],
+                             start_date: Date,
+                             end_date: Date,
+                             max_horizon: int = np.inf,
+                             account: Optional[Account] = None) -> CumulativeRisk:
+        """
+        Compute the cumulative PnL variance of the cashflows (new, plus the existing ones of the account if supplied)
+        over every date of the risk window, together with the values of the cash exposures in units of domestic.
+        """
+        account_ = account
         new_cashflows = cashflows
         existing_cashflows = {}
         merged_cashflows = defaultdict(list)
@@ -544,118 +528,45 @@ class CashFlowRiskService(object):
             raise RuntimeError(
                 "Nan Correlations were retrieved from universe, likely missing data")
 
-        # Create risk calculator, keeps everything fixed to its known values today.
-        risk_calc = PnLRiskCalculator(
-            forwards=spots.values, vols=vols.values, correlations=corrs.values)
-
-        calendar = CustomCalendar.new_western_no_holidays()
-
-        date = start_date
-        dates = [start_date]
-        means = [0.]
-
-        uppers = []
-        lowers = []
-
-        num_levels = len(std_dev_levels) if do_std_dev_cones else len(
-            risk_reductions)
-        for i in range(num_levels):
-            uppers.append([0., ])
-            lowers.append([0., ])
-
-        num_std_devs_for_risk_reduction = 3
-        raw_cumulative_var = 0
-        mean_val = 0.  # NOTE: for now we assume means are zero, this could change
-
-        initial_value, previous_value, update_value = None, None, None
-
-        lower_risk_bound, upper_risk_bound = -np.inf, np.inf
-
-        while date <= end_date:
-            means.append(mean_val)
-            exposures = cash_exposures.net_exposures()
-            existing_exposures = existing_cash_exposures.net_exposures()
-            new_exposures = new_cash_exposures.net_exposures()
-
-            if initial_value is None:
-                # Need to convert initial value to domestic.
-                initial_value = 0
-                for key, values in spots.items():
-                    initial_value += values * abs(exposures[key])
-
-                # Note: these are PnL bounds, so they are centered around zero
-                # NOTE: the lower_risk_bound is a negative number
-                lower_risk_bound = abs(initial_value) * \
-                    (lower_risk_bound_percent / 100.)
-                upper_risk_bound = abs(initial_value) * \
-                    (upper_risk_bound_percent / 100.)
-            if previous_value is None:
-                previous_value = 0
-                for key, values in existing_spots.items():
-                    previous_value += values * abs(existing_exposures[key])
-            if update_value is None:
-                update_value = previous_value
-                for key, values in new_spots.items():
-                    update_value += values * abs(new_exposures[key])
-
-            raw_cumulative_var += risk_calc.variance(exposures.values)
-            if np.isnan(raw_cumulative_var):
-                if np.any(np.isnan(exposures)):
-                    raise RuntimeError(
-                        "Nan detected in cash exposures, unexpected error")
+        # Initial values, converted to domestic
+        exposures = cash_exposures.net_exposures()
+        existing_exposures = existing_cash_exposures.net_exposures()
+        new_exposures = new_cash_exposures.net_exposures()
+
+        initial_value = 0
+        for key, values in spots.items():
+            initial_value += values * abs(exposures[key])
+
+        previous_value = 0
+        for key, values in existing_spots.items():
+            previous_value += values * abs(existing_exposures[key])
+
+        update_value = previous_value
+        for key, values in new_spots.items():
+            update_value += values * abs(new_exposures[key])
+
+        # Net exposures on every date in the risk window, one column per fx pair. Risk is kept fixed to its
+        # known values today, so the cumulative variance is computed for all dates at once.
+        dates, num_steps = RiskConeEngine.cone_dates(start_date=start_date, end_date=end_date)
+        exposure_matrix = RiskConeEngine.exposure_matrix(
+            cashflows=[cashflows_hdl.get(pair.get_base_currency()) for pair in fx_pairs],
+            dates=dates[:num_steps],
+            max_horizon=max_horizon)
+
+        covariance = RiskConeEngine.covariance(forwards=spots.values, vols=vols.values, correlations=corrs.values)
+        cumulative_var = RiskConeEngine.cumulative_variance(exposures=exposure_matrix, covariance=covariance)
+        if np.any(np.isnan(cumulative_var)):
+            if np.any(np.isnan(exposure_matrix)):
                 raise RuntimeError(
-                    "Variance is nan, unexpected error as vols and corrs were validated")
-
-            if do_std_dev_cones:
-                std_dev = np.sqrt(raw_cumulative_var)
-                for i in range(len(std_dev_levels)):
-                    bound = std_dev_levels[i] * std_dev
-                    uppers[i].append(mean_val + bound)
-                    lowers[i].append(mean_val - bound)
-
-            else:
-                for i in range(len(risk_reductions)):
-                    bound = num_std_devs_for_risk_reduction * (1 - risk_reductions[i]) * np.sqrt(
-                        raw_cumulative_var)
-                    uppers[i].append(min(upper_risk_bound, mean_val + bound))
-                    lowers[i].append(max(lower_risk_bound, mean_val - bound))
-
-            date = calendar.adjust(date + 1)  # Go to the next date
-            # This is the risk associated with the next date
-            dates.append(date)
-            if date <= end_date:
-                cash_exposures.refresh(date=date)
-
-        upper_max_exposures, lower_max_exposures = [], []
-        upper_max_exposure_percs, lower_max_exposure_percs = [], []
-        for i in range(num_levels):
-            upper = uppers[i][-1]
-            upper_max_exposures.append(upper)
-            upper_max_exposure_percs.append(
-                100 * np.abs(upper / max(1e-10, abs(initial_value))))
-
-            lower = lowers[i][-1]
-            lower_max_exposures.append(lower)
-            lower_max_exposure_percs.append(
-                -100 * np.abs(lower / max(1e-10, abs(initial_value))))
-
-        out = {"dates": dates,
-               "means": means,
-               "uppers": uppers,
-               "lowers": lowers,
-               "upper_maxs": upper_max_exposures,
-               "upper_max_percents": upper_max_exposure_percs,
-               "lower_maxs": lower_max_exposures,
-               "lower_max_percents": lower_max_exposure_percs,
-               "initial_value": initial_value,
-               "previous_value": previous_value,
-               "update_value": update_value}
-
-        if do_std_dev_cones:
-            probs = [1 - 2 * norm.cdf(-std_dev) for std_dev in std_dev_levels]
-            out["std_probs"] = probs
+                    "Nan detected in cash exposures, unexpected error")
+            raise RuntimeError(
+                "Variance is nan, unexpected error as vols and corrs were validated")
 
-        return out
+        return CumulativeRisk(dates=dates,
+                              cumulative_var=cumulative_var,
+                              initial_value=initial_value,
+                              previous_value=previous_value,
+                              update_value=update_value)
 
     def _validate_inputs(self, domestic, cashflows, risk_reductions, std_dev_levels,
                          max_horizon, lower_risk_bound_percent, upper_risk_bound_percent):
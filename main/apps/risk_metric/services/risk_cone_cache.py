@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from django.core.cache import cache
+from hdlib.DateTime.Date import Date
+from hdlib.Instrument.CashFlow import CashFlow as CashFlowHDL
+
+from main.apps.account.models import CashFlow
+from main.apps.marketdata.models import DataCut
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CumulativeRisk:
+    """
+    The part of a risk cone computation that does not depend on the cone levels: the dates of the cone, the
+    cumulative PnL variance as of each date, and the values of the cash exposures. Cones for any std dev levels or
+    risk reductions are cheap to derive from this (see RiskConeEngine).
+    """
+    dates: List[Date]
+    cumulative_var: np.ndarray
+    initial_value: float
+    previous_value: float
+    update_value: float
+
+
+class RiskConeCache(object):
+    """
+    Cache of risk cone results, keyed by a content hash of everything that goes into the cumulative risk:
+    the domestic currency, the cashflows, the risk window, the account (and the version of its cashflows) and the
+    latest EOD data cut. The cone levels are not part of the key, so changing them only recomputes the cones.
+
+    A new EOD cut changes the key, so results computed from stale market data are never served. Edits to an
+    account's cashflows bump the version of the account (see the risk_metric signal handlers).
+    """
+    key_prefix = "risk_cones"
+    timeout = 60 * 60 * 24
+
+    def get(self, key: Optional[str]) -> Optional[CumulativeRisk]:
+        if key is None:
+            return None
+        try:
+            return cache.get(key)
+        except Exception as e:
+            logger.warning(f"Unable to read risk cone cache: {e}")
+            return None
+
+    def set(self, key: Optional[str], value: CumulativeRisk):
+        if key is None:
+            return
+        try:
+            cache.set(key, value, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Unable to write risk cone cache: {e}")
+
+    def make_key(self,
+                 domestic,
+                 cashflows: Dict[object, Sequence[Union[CashFlow, CashFlowHDL]]],
+                 start_date: Date,
+                 end_date: Date,
+                 max_horizon: float,
+                 account_id: Optional[int] = None) -> Optional[str]:
+        """ Content hash of the inputs of the cumulative risk, or None if it can't be computed """
+        try:
+            content = [self._mnemonic(domestic),
+                       start_date.isoformat(),
+                       end_date.isoformat(),
+                       str(max_horizon),
+                       # Existing cashflows of an account are those paid on or after today
+                       Date.today().isoformat(),
+                       str(account_id),
+                       self.account_version(account_id) if account_id else "",
+                       str(self._latest_eod_cut_id())]
+            for currency in sorted(cashflows.keys(), key=self._mnemonic):
+                content.append(self._mnemonic(currency))
+                content.extend(self._fingerprint(cf) for cf in cashflows[currency])
+        except Exception as e:
+            logger.warning(f"Unable to compute the risk cone cache key: {e}")
+            return None
+
+        digest = hashlib.sha256("|".join(content).encode()).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    # ================
+    # Invalidation
+    # ================
+
+    @classmethod
+    def account_version(cls, account_id: int) -> str:
+        return cache.get(cls._account_version_key(account_id)) or "0"
+
+    @classmethod
+    def invalidate_account(cls, account_id: int):
+        """ Invalidate all cached results involving the cashflows of an account """
+        try:
+            cache.set(cls._account_version_key(account_id), uuid.uuid4().hex, timeout=None)
+        except Exception as e:
+            logger.warning(f"Unable to invalidate risk cone cache for account {account_id}: {e}")
+
+    # ================
+    # Private
+    # ================
+
+    @classmethod
+    def _account_version_key(cls, account_id: int) -> str:
+        return f"{cls.key_prefix}:account_version:{account_id}"
+
+    @staticmethod
+    def _latest_eod_cut_id() -> Optional[int]:
+        return DataCut.objects.filter(cut_type=DataCut.CutType.EOD, cut_time__lte=Date.now()) \
+            .order_by("-cut_time").values_list("id", flat=True).first()
+
+    @staticmethod
+    def _mnemonic(currency) -> str:
+        return currency if isinstance(currency, str) else currency.get_mnemonic()
+
+    @staticmethod
+    def _fingerprint(cf: Union[CashFlow, CashFlowHDL]) -> str:
+        if isinstance(cf, CashFlowHDL):
+            return f"{cf.pay_date.isoformat()},{cf.amount}"
+        # Cashflow generators are hashed by their definition, rather than by the cashflows they generate
+        return f"{cf.date},{cf.end_date},{cf.amount},{cf.periodicity},{cf.calendar},{cf.roll_convention}"
@@ -0,0 +1,192 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from hdlib.DateTime.Date import Date
+from hdlib.Instrument.CashFlow import CashFlows
+from scipy.stats import norm
+
+from main.apps.core.utils.cache import redis_func_cache
+from main.apps.core.utils.service_registry import service_or_default
+from main.apps.currency.models import FxPair
+from main.apps.marketdata.models import FxSpotVol
+from main.apps.marketdata.services.fx.fx_provider import FxSpotProvider
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FxMarketSnapshot:
+    """ The spot and (annualized) spot vol of a single pair, as of a reference date """
+    pair_name: str
+    ref_date: Date
+    spot: float
+    vol: float
+
+
+class FxMarketSnapshotProvider(object):
+    """
+    Lightweight provider of spot / vol snapshots for a single pair. Used in place of a full counter currency universe
+    when all that is required is one spot and one vol (e.g. single fx risk cones).
+    """
+
+    def __init__(self, fx_spot_provider: Optional[FxSpotProvider] = None):
+        self._fx_spot_provider = service_or_default(fx_spot_provider, FxSpotProvider)
+
+    @redis_func_cache(key=None, timeout=60 * 60, delete=False)
+    def get_snapshot(self, pair_name: str, ref_date: Date, estimator: str = "Covar-Prod") -> FxMarketSnapshot:
+        """
+        Get the most recent spot and spot vol at or before the reference date. If the pair itself is not stored,
+        the inverse pair is used (the vol is the same under the log return assumption).
+
+        Raises if either the spot or the vol is missing, so that an incomplete snapshot is never cached.
+        """
+        fx_pair = FxPair.get_pair(pair_name)
+        inverse = FxPair.get_inverse_pair(fx_pair)
+
+        spot = self._fx_spot_provider.get_spot_value(fx_pair=fx_pair, date=ref_date)
+        if np.isnan(spot) and inverse is not None:
+            inverse_spot = self._fx_spot_provider.get_spot_value(fx_pair=inverse, date=ref_date)
+            spot = 1. / inverse_spot if inverse_spot else np.nan
+        if np.isnan(spot):
+            raise RuntimeError(f"Nan spot was retrieved from market snapshot, likely missing data for: {fx_pair}")
+
+        vol = FxSpotVol.get_spot_vol(fxpair=fx_pair, estimator=estimator, date=ref_date)
+        if vol is None and inverse is not None:
+            vol = FxSpotVol.get_spot_vol(fxpair=inverse, estimator=estimator, date=ref_date)
+        if vol is None or np.isnan(vol[0]):
+            raise RuntimeError(f"Nan Vols were retrieved from market snapshot, likely missing data for: {fx_pair}")
+
+        return FxMarketSnapshot(pair_name=fx_pair.name, ref_date=ref_date, spot=spot, vol=vol[0])
+
+
+class RiskConeEngine(object):
+    """
+    Closed form, vectorized risk cone computations. All business dates and all cone levels are computed at once
+    from the cumulative variance of the (gaussian) PnL, rather than walking forward one date at a time.
+    """
+    dt = 1 / 252.
+    num_std_devs_for_risk_reduction = 3
+
+    @staticmethod
+    def cone_dates(start_date: Date, end_date: Date) -> Tuple[List[Date], int]:
+        """
+        Get the dates along the x-axis of a cone, using a western calendar with no holidays.
+
+        :param start_date: Date, the first date of the cone
+        :param end_date: Date, the last date in the risk window
+        :return: (dates, num_steps), where dates is the start date followed by every business date after it, up to and
+            including the first business date after the end date. num_steps is the number of dates (starting from the
+            start date) that are within the risk window, so len(dates) == num_steps + 1
+        """
+        if start_date > end_date:
+            return [start_date], 0
+
+        offsets = np.arange(1, Date.days_between(start_date, end_date) + 5)
+        days = np.datetime64(start_date.date(), 'D') + offsets
+        offsets = offsets[np.is_busday(days, weekmask='1111100')]
+        candidates = [start_date + int(offset) for offset in offsets]
+
+        num_steps = 1 + bisect_right(candidates, end_date)
+        return [start_date] + candidates[:num_steps], num_steps
+
+    @staticmethod
+    def exposure_matrix(cashflows: Sequence[Optional[CashFlows]],
+                        dates: Sequence[Date],
+                        max_horizon: float = np.inf) -> np.ndarray:
+        """
+        Net cash exposure of each currency as of each date, i.e. the sum of all cashflows paid strictly after the date
+        and within the max horizon (in days). This matches CashExposures_Cached.net_exposures() after a refresh.
+
+        :param cashflows: the cashflows of each currency, in the order of the output columns
+        :param dates: the dates at which to compute the exposures, in ascending order
+        :param max_horizon: ignore cashflows more than this many days after each date
+        :return: np.ndarray, shape (len(dates), len(cashflows))
+        """
+        date_times = np.array([date.timestamp() for date in dates])
+        date_days = np.array([date.toordinal() for date in dates])
+
+        exposures = np.zeros(shape=(len(dates), len(cashflows)))
+        for j, flows in enumerate(cashflows):
+            if not flows:
+                continue
+            pay_times = np.array([cf.pay_date.timestamp() for cf in flows])
+            order = np.argsort(pay_times, kind='stable')
+            pay_times = pay_times[order]
+            pay_days = np.array([cf.pay_date.toordinal() for cf in flows])[order]
+            cum_amounts = np.concatenate(([0.], np.cumsum(np.array([cf.amount for cf in flows])[order])))
+
+            first = np.searchsorted(pay_times, date_times, side='right')
+            if np.isinf(max_horizon):
+                last = np.full(len(dates), len(pay_times))
+            else:
+                last = np.searchsorted(pay_days, date_days + max_horizon, side='right')
+            last = np.maximum(first, last)
+            exposures[:, j] = cum_amounts[last] - cum_amounts[first]
+
+        return exposures
+
+    @classmethod
+    def covariance(cls, forwards: np.ndarray, vols: np.ndarray, correlations: np.ndarray) -> np.ndarray:
+        """ One day PnL covariance of unit positions, as in PnLRiskCalculator """
+        forwards, vols = np.asarray(forwards, dtype=float), np.asarray(vols, dtype=float)
+        return np.outer(forwards, forwards) * np.expm1(np.asarray(correlations) * np.outer(vols, vols) * cls.dt)
+
+    @staticmethod
+    def cumulative_variance(exposures: np.ndarray, covariance: np.ndarray) -> np.ndarray:
+        """ Cumulative sum over dates of the one day PnL variance of the exposures held on each date """
+        return np.cumsum(np.einsum('ij,jk,ik->i', exposures, covariance, exposures))
+
+    @staticmethod
+    def std_dev_cones(cumulative_var: np.ndarray,
+                      std_dev_levels: Sequence[float],
+                      mean_val: float = 0.) -> Tuple[np.ndarray, np.ndarray]:
+        """ Upper / lower cones (levels x dates), each starting from zero on the start date """
+        bounds = np.outer(np.asarray(std_dev_levels, dtype=float), np.sqrt(cumulative_var))
+        zeros = np.zeros(shape=(len(std_dev_levels), 1))
+        return np.hstack((zeros, mean_val + bounds)), np.hstack((zeros, mean_val - bounds))
+
+    @classmethod
+    def risk_reduction_cones(cls,
+                             cumulative_var: np.ndarray,
+                             risk_reductions: Sequence[float],
+                             lower_risk_bound: float = -np.inf,
+                             upper_risk_bound: float = np.inf,
+                             mean_val: float = 0.) -> Tuple[np.ndarray, np.ndarray]:
+        """ Upper / lower cones (levels x dates) of a hedged position, capped / floored by the risk bounds """
+        scale = cls.num_std_devs_for_risk_reduction * (1 - np.asarray(risk_reductions, dtype=float))
+        bounds = np.outer(scale, np.sqrt(cumulative_var))
+        zeros = np.zeros(shape=(len(risk_reductions), 1))
+        return (np.hstack((zeros, np.minimum(upper_risk_bound, mean_val + bounds))),
+                np.hstack((zeros, np.maximum(lower_risk_bound, mean_val - bounds))))
+
+    @staticmethod
+    def to_output(dates: List[Date],
+                  uppers: np.ndarray,
+                  lowers: np.ndarray,
+                  initial_value: float,
+                  previous_value: float,
+                  update_value: float,
+                  min_initial_value: float,
+                  std_dev_levels: Optional[Sequence[float]] = None,
+                  mean_val: float = 0.) -> Dict[str, list]:
+        """ Format the cones in the form returned by the risk cone endpoints """
+        denom = max(min_initial_value, abs(initial_value))
+        upper_maxs, lower_maxs = uppers[:, -1], lowers[:, -1]
+        out = {"dates": dates,
+               "means": [mean_val] * len(dates),
+               "uppers": uppers.tolist(),
+               "lowers": lowers.tolist(),
+               "upper_maxs": upper_maxs.tolist(),
+               "upper_max_percents": (100 * np.abs(upper_maxs / denom)).tolist(),
+               "lower_maxs": lower_maxs.tolist(),
+               "lower_max_percents": (-100 * np.abs(lower_maxs / denom)).tolist(),
+               "initial_value": initial_value,
+               "previous_value": previous_value,
+               "update_value": update_value}
+        if std_dev_levels is not None:
+            out["std_probs"] = [1 - 2 * norm.cdf(-std_dev) for std_dev in std_dev_levels]
+        return out
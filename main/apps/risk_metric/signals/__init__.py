@@ -0,0 +1 @@
+from .handlers import *
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from main.apps.account.models import CashFlow
+from main.apps.risk_metric.services.risk_cone_cache import RiskConeCache
+
+
+@receiver(post_save, sender=CashFlow, dispatch_uid="invalidate_risk_cones_on_cashflow_save")
+def post_save_cashflow_handler(sender, instance: CashFlow, **kwargs):
+    RiskConeCache.invalidate_account(instance.account_id)
+
+
+@receiver(post_delete, sender=CashFlow, dispatch_uid="invalidate_risk_cones_on_cashflow_delete")
+def post_delete_cashflow_handler(sender, instance: CashFlow, **kwargs):
+    RiskConeCache.invalidate_account(instance.account_id)
@@ -1,3 +1,110 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import TestCase, override_settings
+from hdlib.Core.Currency import CustomCurrency
+from hdlib.DateTime.Date import Date
+from hdlib.Instrument.CashFlow import CashFlow, CashFlows
+
+from main.apps.risk_metric.services.risk_cone_cache import RiskConeCache
+from main.apps.risk_metric.services.risk_cone_engine import FxMarketSnapshotProvider, RiskConeEngine
+
+
+class RiskConeEngineTest(TestCase):
+
+    def test_cone_dates_skip_weekends(self):
+        # Friday to the following Tuesday
+        start_date = Date.create(2024, 1, 5)
+        end_date = Date.create(2024, 1, 9)
+        dates, num_steps = RiskConeEngine.cone_dates(start_date=start_date, end_date=end_date)
+
+        self.assertEqual(num_steps, 3)
+        self.assertEqual(dates, [start_date,
+                                 Date.create(2024, 1, 8),
+                                 Date.create(2024, 1, 9),
+                                 Date.create(2024, 1, 10)])
+
+    def test_cone_dates_start_after_end(self):
+        start_date = Date.create(2024, 1, 5, hour=12)
+        dates, num_steps = RiskConeEngine.cone_dates(start_date=start_date, end_date=Date.create(2024, 1, 5))
+        self.assertEqual(num_steps, 0)
+        self.assertEqual(dates, [start_date])
+
+    def test_exposure_matrix_rolls_off_cashflows(self):
+        eur = CustomCurrency('EUR')
+        flows = CashFlows([CashFlow(amount=100., currency=eur, pay_date=Date.create(2024, 1, 3)),
+                           CashFlow(amount=50., currency=eur, pay_date=Date.create(2024, 1, 10))])
+        dates = [Date.create(2024, 1, 1), Date.create(2024, 1, 3), Date.create(2024, 1, 10)]
+
+        exposures = RiskConeEngine.exposure_matrix(cashflows=[flows, None], dates=dates)
+        np.testing.assert_array_equal(exposures, [[150., 0.], [50., 0.], [0., 0.]])
+
+        exposures = RiskConeEngine.exposure_matrix(cashflows=[flows], dates=dates, max_horizon=7)
+        np.testing.assert_array_equal(exposures[:, 0], [100., 50., 0.])
+
+    def test_std_dev_cones(self):
+        cumulative_var = np.array([1., 4., 9.])
+        uppers, lowers = RiskConeEngine.std_dev_cones(cumulative_var=cumulative_var, std_dev_levels=(1, 2))
+
+        np.testing.assert_array_equal(uppers, [[0., 1., 2., 3.], [0., 2., 4., 6.]])
+        np.testing.assert_array_equal(lowers, -uppers)
+
+    def test_risk_reduction_cones_are_bounded(self):
+        cumulative_var = np.array([1., 4., 9.])
+        uppers, lowers = RiskConeEngine.risk_reduction_cones(cumulative_var=cumulative_var,
+                                                             risk_reductions=(0., 1.),
+                                                             lower_risk_bound=-5.,
+                                                             upper_risk_bound=7.)
+
+        np.testing.assert_array_equal(uppers, [[0., 3., 6., 7.], [0., 0., 0., 0.]])
+        np.testing.assert_array_equal(lowers, [[0., -3., -5., -5.], [0., 0., 0., 0.]])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class RiskConeCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = RiskConeCache()
+        self.eur = CustomCurrency('EUR')
+        self.start_date = Date.create(2024, 1, 5)
+        self.end_date = Date.create(2024, 6, 5)
+
+    def _key(self, amount: float = 100., account_id=None):
+        flows = [CashFlow(amount=amount, currency=self.eur, pay_date=Date.create(2024, 3, 1))]
+        return self.cache.make_key(domestic='USD', cashflows={self.eur: flows}, start_date=self.start_date,
+                                   end_date=self.end_date, max_horizon=np.inf, account_id=account_id)
+
+    def test_key_is_a_content_hash(self):
+        self.assertEqual(self._key(), self._key())
+        self.assertNotEqual(self._key(amount=100.), self._key(amount=101.))
+
+    def test_account_invalidation_changes_key(self):
+        key = self._key(account_id=1)
+        self.assertEqual(key, self._key(account_id=1))
+
+        RiskConeCache.invalidate_account(1)
+        self.assertNotEqual(key, self._key(account_id=1))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FxMarketSnapshotProviderTest(TestCase):
+
+    def test_missing_spot_is_not_cached(self):
+        fx_spot_provider = mock.Mock()
+        fx_spot_provider.get_spot_value.return_value = np.nan
+        provider = FxMarketSnapshotProvider(fx_spot_provider=fx_spot_provider)
+        ref_date = Date.create(2024, 1, 5)
+
+        module = 'main.apps.risk_metric.services.risk_cone_engine'
+        with mock.patch(f'{module}.FxPair') as fx_pair, mock.patch(f'{module}.FxSpotVol') as spot_vol:
+            fx_pair.get_pair.return_value.name = 'EURUSD'
+            fx_pair.get_inverse_pair.return_value = None
+            spot_vol.get_spot_vol.return_value = (0.1, ref_date)
+
+            with self.assertRaises(RuntimeError):
+                provider.get_snapshot(pair_name='EURUSD', ref_date=ref_date)
+
+            fx_spot_provider.get_spot_value.return_value = 1.1
+            snapshot = provider.get_snapshot(pair_name='EURUSD', ref_date=ref_date)
+
+        self.assertEqual((1.1, 0.1), (snapshot.spot, snapshot.vol))
@@ -24,10 +24,8 @@ from main.apps.corpay.services.corpay import CorPayService
 from main.apps.settlement.api.permissions import BeneficiaryBelongsToCompany
 from main.apps.settlement.api.serializers.beneficiary import BeneficiarySerializer, \
     ActivateBeneficiaryRequestSerializer, ValidationSchemaRequestSerializer
-from main.apps.settlement.exceptions.beneficiary import InvalidPayoutMethod
 from main.apps.settlement.models import Beneficiary
-from main.apps.settlement.services.beneficiary import BeneficiaryServiceFactory, BeneficiaryService, \
-    BeneficiarySerializerService
+from main.apps.settlement.services.schema_registry import BeneficiarySchemaRegistry
 from main.apps.settlement.tasks import sync_beneficiary_to_brokers
 
 logger = logging.getLogger(__name__)
@@ -246,39 +244,15 @@ class BeneficiaryViewSet(mixins.CreateModelMixin,
         beneficiary_account_type = request_serializer.validated_data.get('beneficiary_account_type')
         payment_method = request_serializer.validated_data.get('payment_method')
 
-        factory = BeneficiaryServiceFactory(company=request.user.company)
-        services = factory.create_beneficiary_services(currency=bank_currency)
-        schemas = []
-        beneficiary_serializer_service = BeneficiarySerializerService(BeneficiaryViewSet)
-        beneficiary_serializer_schema = beneficiary_serializer_service.get_schema(bank_currency)
-        schemas.append(beneficiary_serializer_schema)
-        for service in services:
-            try:
-                schema = service.get_beneficiary_validation_schema(
-                    destination_country=destination_country,
-                    bank_country=bank_country,
-                    bank_currency=bank_currency,
-                    beneficiary_account_type=beneficiary_account_type,
-                    payment_method=payment_method,
-                )
-                if schema is None:
-                    continue
-                if isinstance(schema, list):
-                    schemas.extend(schema)
-                else:
-                    schemas.append(schema)
-            except InvalidPayoutMethod as e:
-                logger.warning(
-                    f"{request.user.company} requested an invalid validation schema using: "
-                    f"destination country: {destination_country}, bank country: {bank_country}, "
-                    f"bank currency: {bank_currency}, beneficiary_account_type: {beneficiary_account_type}, "
-                    f"payment_method: {payment_method} from broker: {service.broker.name}")
-                logger.warning(e)
-            except Exception as e:
-                logger.exception(e)
-                continue
-        merged = BeneficiaryService.merge_validation_schemas(schemas)
-        response_data = {"schemas": schemas, "merged": merged}
+        schema = BeneficiarySchemaRegistry.get(
+            company=request.user.company,
+            bank_currency=bank_currency,
+            destination_country=destination_country,
+            bank_country=bank_country,
+            beneficiary_account_type=beneficiary_account_type,
+            payment_method=payment_method,
+        )
+        response_data = {"schemas": schema.schemas, "merged": schema.merged}
         return Response(response_data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated])
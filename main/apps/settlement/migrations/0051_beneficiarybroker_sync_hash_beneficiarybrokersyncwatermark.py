@@ -0,0 +1,34 @@
+# Generated by Django 4.2.15 on 2024-10-21 10:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('settlement', '0050_alter_beneficiary_default_purpose'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='beneficiarybroker',
+            name='sync_hash',
+            field=models.CharField(blank=True, help_text="Content hash of the broker's beneficiary data as of the last sync from the broker", max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='BeneficiaryBrokerSyncWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_sync', models.DateTimeField(help_text='Last completed beneficiary sync from the broker', null=True)),
+                ('last_full_sync', models.DateTimeField(help_text='Last sync that processed every beneficiary, changed or not', null=True)),
+                ('rows_seen', models.IntegerField(default=0, help_text='Beneficiaries listed by the broker in the last sync')),
+                ('rows_changed', models.IntegerField(default=0, help_text='Beneficiaries created or updated in the last sync')),
+                ('broker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='broker.broker')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='account.company')),
+            ],
+            options={
+                'unique_together': {('company', 'broker')},
+            },
+        ),
+    ]
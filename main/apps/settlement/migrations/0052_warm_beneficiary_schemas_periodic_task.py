@@ -0,0 +1,43 @@
+# Generated by Django 4.2.15 on 2024-10-22 09:00
+
+from django.db import migrations
+
+
+def create_periodic_task(apps, schema_editor):
+    IntervalSchedule = apps.get_model('django_celery_beat', 'IntervalSchedule')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    # Rebuild the schemas a bit more often than their ttl, so requests keep hitting fresh entries
+    schedule, _ = IntervalSchedule.objects.get_or_create(
+        every=45,
+        period='minutes',
+    )
+
+    PeriodicTask.objects.get_or_create(
+        name='Warm Beneficiary Validation Schemas',
+        defaults={
+            'task': 'main.apps.settlement.tasks.warm_beneficiary_schemas',
+            'interval': schedule,
+            'args': '[]',
+            'kwargs': '{}',
+        }
+    )
+
+
+def delete_periodic_task(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(
+        name='Warm Beneficiary Validation Schemas'
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_celery_beat', '0001_initial'),
+        ('settlement', '0051_beneficiarybroker_sync_hash_beneficiarybrokersyncwatermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_periodic_task, delete_periodic_task),
+    ]
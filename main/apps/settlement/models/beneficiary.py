@@ -466,6 +466,12 @@ class BeneficiaryBroker(models.Model):
         default=False,
         help_text="The brokers's beneficiary deleted status"
     )
+    sync_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text="Content hash of the broker's beneficiary data as of the last sync from the broker"
+    )
 
     class Meta:
         unique_together = ('beneficiary', 'broker')
@@ -565,3 +571,16 @@ class BeneficiaryBrokerSyncResult(models.Model):
     broker = models.ForeignKey(Broker, null=True, on_delete=models.CASCADE)
     last_sync = models.DateTimeField(help_text="Last beneficiary broker sync", null=True)
     sync_errors = models.TextField(help_text="Any Sync error from the last attempt", null=True)
+
+
+class BeneficiaryBrokerSyncWatermark(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    broker = models.ForeignKey(Broker, on_delete=models.CASCADE)
+    last_sync = models.DateTimeField(help_text="Last completed beneficiary sync from the broker", null=True)
+    last_full_sync = models.DateTimeField(help_text="Last sync that processed every beneficiary, changed or not",
+                                          null=True)
+    rows_seen = models.IntegerField(default=0, help_text="Beneficiaries listed by the broker in the last sync")
+    rows_changed = models.IntegerField(default=0, help_text="Beneficiaries created or updated in the last sync")
+
+    class Meta:
+        unique_together = ('company', 'broker')
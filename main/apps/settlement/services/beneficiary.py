@@ -54,6 +54,7 @@ from main.apps.settlement.exceptions.beneficiary import InvalidPayoutMethod
 from main.apps.settlement.models import Beneficiary, BeneficiaryFieldMapping, BeneficiaryFieldConfig, \
     BeneficiaryValueMapping, BeneficiaryBroker
 from main.apps.settlement.models.beneficiary import BeneficiaryBrokerSyncResult
+from main.apps.settlement.services.beneficiary_sync import BeneficiaryBulkSync
 
 logger = logging.getLogger(__name__)
 
@@ -238,19 +239,33 @@ class BeneficiaryService(ABC):
         sync_track.save()
         return sync_track
 
-    def generate_unique_alias(self, company, original_alias):
+    def generate_unique_alias(self, company, original_alias, taken: Optional[set] = None):
+        """
+        Generate an alias not used by any beneficiary of the company. If the aliases taken in the company are given,
+        they are checked instead of the database, and the generated alias is added to them.
+        """
+        def _is_free(alias):
+            if taken is not None:
+                return alias not in taken
+            return not Beneficiary.objects.filter(company=company, beneficiary_alias=alias).exists()
+
+        def _take(alias):
+            if taken is not None:
+                taken.add(alias)
+            return alias
+
         base_alias = original_alias  # Leave more room for the unique suffix
         unique_alias = base_alias
         suffix = 1
         while True:
-            if not Beneficiary.objects.filter(company=company, beneficiary_alias=unique_alias).exists():
-                return unique_alias
+            if _is_free(unique_alias):
+                return _take(unique_alias)
             unique_alias = f"{base_alias}-{suffix}"
             suffix += 1
             if suffix > 999:  # If we've tried 999 times, switch to using a UUID
                 unique_alias = f"{base_alias}-{uuid.uuid4().hex[:8]}"
-                if not Beneficiary.objects.filter(company=company, beneficiary_alias=unique_alias).exists():
-                    return unique_alias
+                if _is_free(unique_alias):
+                    return _take(unique_alias)
 
     @staticmethod
     def camel_to_snake(name):
@@ -515,38 +530,23 @@ class CorpayBeneficiaryService(BeneficiaryService):
                 beneficiary=beneficiary, broker=self.broker, error=str(e))
             raise e
 
-    def sync_beneficiaries_from_broker(self) -> List[Beneficiary]:
-        def _get_or_create_beneficiary(client_integration_id: str) -> Beneficiary:
-            created = True
+    def sync_beneficiaries_from_broker(self, full: Optional[bool] = None) -> List[Beneficiary]:
+        def _fetch_beneficiary(client_integration_id: str) -> Optional[dict]:
             try:
-                beneficiary_broker = BeneficiaryBroker.objects.get(
-                    broker_beneficiary_id=client_integration_id,
-                    broker=self.broker,
-                    beneficiary__company=self.company
-                )
-                created = False
-                return beneficiary_broker.beneficiary, created
-            except BeneficiaryBroker.DoesNotExist:
-                try:
-                    beneficiary = Beneficiary.objects.get(
-                        external_id=client_integration_id)
-                    created = False
-                except Beneficiary.DoesNotExist:
-                    beneficiary = Beneficiary(
-                        external_id=client_integration_id,
-                        company=self.company,
-                        status=Beneficiary.Status.SYNCED
-                    )
-                    beneficiary.save()  # Save the beneficiary before creating BeneficiaryBroker
+                get_response = self.api.get_beneficiary(
+                    client_integration_id=client_integration_id)
+            except Exception as e:
+                logger.exception(
+                    f"Error fetching beneficiary {client_integration_id}: {e}")
+                return None
 
-                    BeneficiaryBroker.objects.create(
-                        broker_beneficiary_id=client_integration_id,
-                        broker=self.broker,
-                        beneficiary=beneficiary
-                    )
-                return beneficiary, created
+            if 'bene' not in get_response:
+                logger.warning(
+                    f"No beneficiary data for {client_integration_id}")
+                return None
+            return get_response['bene']
 
-        def _update_beneficiary_fields(beneficiary: Beneficiary, bene_data: dict, created: bool):
+        def _update_beneficiary_fields(beneficiary: Beneficiary, bene_data: dict, created: bool, aliases: set):
             # Update fields
             beneficiary.destination_country = bene_data.get(
                 'destinationCountry')
@@ -573,7 +573,7 @@ class CorpayBeneficiaryService(BeneficiaryService):
                 # Generate a unique alias
                 original_alias = f"{bene_data.get('beneContactName')}"
                 beneficiary.beneficiary_alias = self.generate_unique_alias(
-                    beneficiary.company, original_alias)
+                    beneficiary.company, original_alias, taken=aliases)
 
             beneficiary.preferred_method = method_map.get(
                 bene_data.get('preferredMethod'))
@@ -646,37 +646,33 @@ class CorpayBeneficiaryService(BeneficiaryService):
             'W': Beneficiary.BankRoutingCodeType.SWIFT,
             'E': Beneficiary.BankRoutingCodeType.ACH_CODE
         }
-        beneficiaries_synced = []
-
-        params = BeneficiaryListQueryParams()
-        list_response = self.api.list_beneficiary(data=params)
-
-        for row in list_response['data']['rows']:
-            client_integration_id = row.get('clientIntegrationId')
-
-            try:
-                get_response = self.api.get_beneficiary(
-                    client_integration_id=client_integration_id)
-            except Exception as e:
-                logger.exception(
-                    f"Error fetching beneficiary {client_integration_id}: {e}")
-                continue
-
-            if 'bene' not in get_response:
-                logger.warning(
-                    f"No beneficiary data for {client_integration_id}")
-                continue
-
-            bene_data = get_response['bene']
-
-            with transaction.atomic():
-                beneficiary, created = _get_or_create_beneficiary(client_integration_id)
-                _update_beneficiary_fields(beneficiary, bene_data, created)
-                beneficiary.save()
 
-                beneficiaries_synced.append(beneficiary)
-
-        return beneficiaries_synced
+        return BeneficiaryBulkSync(
+            company=self.company,
+            broker=self.broker,
+            fetch_detail=_fetch_beneficiary,
+            apply=_update_beneficiary_fields,
+            full=full
+        ).run(self._list_beneficiary_pages())
+
+    def _list_beneficiary_pages(self, take: int = 100) -> Iterator[List[Tuple[str, dict]]]:
+        """ Page through the beneficiary list, yielding (client integration id, row) """
+        skip, seen = 0, set()
+        while True:
+            list_response = self.api.list_beneficiary(data=BeneficiaryListQueryParams(skip=skip, take=take))
+            rows = list_response['data']['rows']
+            page = []
+            for row in rows:
+                client_integration_id = row.get('clientIntegrationId')
+                if client_integration_id and client_integration_id not in seen:
+                    seen.add(client_integration_id)
+                    page.append((client_integration_id, row))
+            if page:
+                yield page
+            # Stop on the last page, or if the broker ignores paging and keeps returning the same rows
+            if len(rows) < take or not page:
+                return
+            skip += len(rows)
 
     def get_beneficiary_validation_schema(self, destination_country: str, bank_country: str, bank_currency: str,
                                           beneficiary_account_type: str, payment_method: str) -> Dict:
@@ -1345,37 +1341,27 @@ class MonexBeneficiaryService(BeneficiaryService):
                 beneficiary=beneficiary, broker=self.broker, error=str(e))
             raise e
 
-    def sync_beneficiaries_from_broker(self) -> List[Beneficiary]:
-        def _get_or_create_beneficiary(bene_id):
-            logger.info(f"Getting or creating beneficiary with ID: {bene_id}")
+    def sync_beneficiaries_from_broker(self, full: Optional[bool] = None) -> List[Beneficiary]:
+        def _fetch_beneficiary(bene_id: str) -> Optional[dict]:
             try:
-                beneficiary_broker = BeneficiaryBroker.objects.get(
-                    broker_beneficiary_id=bene_id,
-                    broker=self.broker,
-                    beneficiary__company=self.company
-                )
-                return beneficiary_broker.beneficiary
-            except BeneficiaryBroker.DoesNotExist:
-                logger.info(
-                    f"BeneficiaryBroker with ID {bene_id} does not exist")
-                try:
-                    beneficiary = Beneficiary.objects.get(external_id=bene_id)
-                except Beneficiary.DoesNotExist:
-                    logger.info(
-                        f"Beneficiary with ID {bene_id} does not exist")
-                    beneficiary = Beneficiary(
-                        external_id=bene_id,
-                        company=self.company,
-                        status=Beneficiary.Status.SYNCED
-                    )
-                    logger.debug(f"Created beneficiary with ID {bene_id}")
-                return beneficiary
+                get_response = self.api.beneficiary_view(self.company, bene_id)
+            except Exception as e:
+                logger.exception(
+                    f"Error fetching beneficiary for {bene_id}: {e}")
+                return None
+
+            if 'bene' not in get_response:
+                logger.warning(f"No beneficiary data for {bene_id}")
+                return None
+            return get_response['bene']
 
-        def _update_beneficiary_fields(beneficiary, bene_data):
+        def _update_beneficiary_fields(beneficiary, bene_data, created, aliases):
             logger.info(
                 f"Updating beneficiary fields for beneficiary ID: {beneficiary.id}")
+            # The current alias of the beneficiary is not taken by another one
+            aliases.discard(beneficiary.beneficiary_alias)
             beneficiary_alias = self.generate_unique_alias(
-                beneficiary.company, bene_data.get('nickname'))
+                beneficiary.company, bene_data.get('nickname'), taken=aliases)
 
             beneficiary.beneficiary_name = bene_data.get('name')
             beneficiary.beneficiary_alias = beneficiary_alias
@@ -1431,49 +1417,22 @@ class MonexBeneficiaryService(BeneficiaryService):
 
         logger.info(
             f"Starting bene sync from Monex for company {self.company.pk} - {self.company.name}")
-        beneficiaries_synced = []
         list_response = self.api.beneficiary_list(self.company)
-
+        page = []
         for row in list_response.get('rows', []):
             bene_id = row.get('id')
             if not bene_id:
                 logger.warning(f"No beneficiary ID found in row: {row}")
                 continue
-
-            try:
-                get_response = self.api.beneficiary_view(self.company, bene_id)
-            except Exception as e:
-                logger.exception(
-                    f"Error fetching beneficiary for {bene_id}: {e}")
-                continue
-
-            if 'bene' not in get_response:
-                logger.warning(f"No beneficiary data for {bene_id}")
-                continue
-
-            bene_data = get_response['bene']
-
-            with transaction.atomic():
-                try:
-                    beneficiary = _get_or_create_beneficiary(bene_id)
-                    beneficiary = _update_beneficiary_fields(
-                        beneficiary, bene_data)
-                    beneficiary.save()
-
-                    bene_broker, created = BeneficiaryBroker.objects.update_or_create(
-                        beneficiary=beneficiary,
-                        broker=self.broker,
-                        defaults={'broker_beneficiary_id': str(bene_id)}
-                    )
-
-                    self.track_beneficiary_broker_sync(
-                        beneficiary=beneficiary, broker=self.broker)
-                    beneficiaries_synced.append(beneficiary)
-                except Exception as e:
-                    logger.exception(
-                        f"Error creating or updating beneficiary {bene_id}: {e}")
-
-        return beneficiaries_synced
+            page.append((str(bene_id), row))
+
+        return BeneficiaryBulkSync(
+            company=self.company,
+            broker=self.broker,
+            fetch_detail=_fetch_beneficiary,
+            apply=_update_beneficiary_fields,
+            full=full
+        ).run([page])
 
     def get_beneficiary_validation_schema(self, **kwargs) -> Optional[Dict]:
         cache_key = 'monex_beneficiary_schema'
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from main.apps.account.models import Company
+from main.apps.broker.models import Broker
+from main.apps.settlement.models import Beneficiary, BeneficiaryBroker
+from main.apps.settlement.models.beneficiary import BeneficiaryBrokerSyncResult, BeneficiaryBrokerSyncWatermark
+
+logger = logging.getLogger(__name__)
+
+# (broker beneficiary id, row of the broker's beneficiary list)
+ListRow = Tuple[str, dict]
+
+
+def content_hash(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class BeneficiaryBulkSync:
+    """
+    Bulk, incremental sync of the beneficiaries of a company from a broker.
+
+    The broker's beneficiary list is consumed page by page. Each row of the list is hashed, and rows whose hash
+    matches the one stored on their BeneficiaryBroker at the last sync are skipped, without fetching their details
+    from the broker. The other rows are fetched, mapped onto beneficiaries and written with bulk_create /
+    bulk_update, one transaction per page. Existing mappings are loaded in one query up front.
+
+    Changes that only show in a beneficiary's details (and not in the list) are picked up by a full sync, which
+    ignores the hashes and runs at least every FULL_SYNC_INTERVAL (see BeneficiaryBrokerSyncWatermark).
+    """
+    FULL_SYNC_INTERVAL = timedelta(days=1)
+
+    def __init__(self,
+                 company: Company,
+                 broker: Broker,
+                 fetch_detail: Callable[[str], Optional[dict]],
+                 apply: Callable[[Beneficiary, dict, bool, Set[str]], None],
+                 full: Optional[bool] = None):
+        """
+        :param company: The company whose beneficiaries are synced
+        :param broker: The broker to sync from
+        :param fetch_detail: Fetches the details of a beneficiary from the broker, None if unavailable
+        :param apply: Maps the broker details onto a beneficiary: apply(beneficiary, details, created, aliases),
+            where aliases are the aliases taken in the company (to generate unique aliases without a query)
+        :param full: Force (or prevent) a full sync, by default a full sync runs every FULL_SYNC_INTERVAL
+        """
+        self.company = company
+        self.broker = broker
+        self.fetch_detail = fetch_detail
+        self.apply = apply
+        self.full = full
+
+    def run(self, pages: Iterable[List[ListRow]]) -> List[Beneficiary]:
+        now = datetime.now(timezone.utc)
+        watermark, _ = BeneficiaryBrokerSyncWatermark.objects.get_or_create(company=self.company, broker=self.broker)
+        full = self.full
+        if full is None:
+            full = watermark.last_full_sync is None or now - watermark.last_full_sync >= self.FULL_SYNC_INTERVAL
+
+        mappings = {bb.broker_beneficiary_id: bb for bb in BeneficiaryBroker.objects.filter(
+            broker=self.broker, beneficiary__company=self.company).select_related('beneficiary')}
+        aliases = set(Beneficiary.objects.filter(company=self.company)
+                      .exclude(beneficiary_alias__isnull=True).values_list('beneficiary_alias', flat=True))
+
+        synced, rows_seen = [], 0
+        for page in pages:
+            rows_seen += len(page)
+            synced.extend(self._sync_page(page, mappings=mappings, aliases=aliases, full=full))
+
+        watermark.last_sync = now
+        if full:
+            watermark.last_full_sync = now
+        watermark.rows_seen = rows_seen
+        watermark.rows_changed = len(synced)
+        watermark.save()
+
+        logger.info(f"Synced {len(synced)} of {rows_seen} beneficiaries from {self.broker.broker_provider} "
+                    f"for company {self.company.pk} (full={full})")
+        return synced
+
+    # ================
+    # Private
+    # ================
+
+    def _sync_page(self, page: List[ListRow], mappings: Dict[str, BeneficiaryBroker], aliases: Set[str],
+                   full: bool) -> List[Beneficiary]:
+        changed = []
+        for bene_id, row in page:
+            bene_id = str(bene_id)
+            row_hash = content_hash(row)
+            mapping = mappings.get(bene_id)
+            if not full and mapping is not None and mapping.sync_hash == row_hash:
+                continue
+            details = self.fetch_detail(bene_id)
+            if details is not None:
+                changed.append((bene_id, row_hash, details))
+        if not changed:
+            return []
+
+        # beneficiaries known by external id, but not yet mapped to this broker
+        unmapped_ids = [bene_id for bene_id, _, _ in changed if bene_id not in mappings]
+        by_external_id = {}
+        if unmapped_ids:
+            for beneficiary in Beneficiary.objects.filter(company=self.company, external_id__in=unmapped_ids):
+                by_external_id.setdefault(beneficiary.external_id, beneficiary)
+
+        try:
+            return self._write(changed, mappings=mappings, by_external_id=by_external_id, aliases=aliases)
+        except Exception as e:
+            logger.exception(f"Bulk beneficiary sync failed, syncing one by one: {e}")
+            synced = []
+            for item in changed:
+                try:
+                    synced.extend(self._write([item], mappings=mappings, by_external_id=by_external_id,
+                                              aliases=aliases))
+                except Exception as e:
+                    logger.exception(f"Error creating or updating beneficiary {item[0]}: {e}")
+            return synced
+
+    def _write(self, changed: List[Tuple[str, str, dict]], mappings: Dict[str, BeneficiaryBroker],
+               by_external_id: Dict[str, Beneficiary], aliases: Set[str]) -> List[Beneficiary]:
+        # mappings and aliases are only updated once the transaction commits, so that a failed write can be retried
+        now = datetime.now(timezone.utc)
+        taken_aliases = set(aliases)
+        to_create: List[Beneficiary] = []
+        to_update: List[Beneficiary] = []
+        new_mappings: List[Tuple[Beneficiary, str, str]] = []
+        updated_mappings: List[BeneficiaryBroker] = []
+
+        for bene_id, row_hash, details in changed:
+            mapping = mappings.get(bene_id)
+            if mapping is not None:
+                beneficiary, created = mapping.beneficiary, False
+            elif bene_id in by_external_id:
+                beneficiary, created = by_external_id[bene_id], False
+            else:
+                beneficiary, created = Beneficiary(external_id=bene_id, company=self.company,
+                                                   status=Beneficiary.Status.SYNCED), True
+
+            self.apply(beneficiary, details, created, taken_aliases)
+            beneficiary.modified = now
+            (to_create if created else to_update).append(beneficiary)
+
+            if mapping is not None:
+                mapping.sync_hash = row_hash
+                updated_mappings.append(mapping)
+            else:
+                new_mappings.append((beneficiary, bene_id, row_hash))
+
+        with transaction.atomic():
+            Beneficiary.objects.bulk_create(to_create)
+            if to_update:
+                Beneficiary.objects.bulk_update(to_update, fields=self._beneficiary_fields())
+            if updated_mappings:
+                BeneficiaryBroker.objects.bulk_update(updated_mappings, fields=['sync_hash'])
+
+            # a beneficiary found by external id may already be mapped to this broker under another id
+            remapped = {bb.beneficiary_id: bb for bb in BeneficiaryBroker.objects.filter(
+                broker=self.broker, beneficiary__in=[b for b, _, _ in new_mappings if b.pk])}
+            created_mappings, written_mappings = [], {}
+            for beneficiary, bene_id, row_hash in new_mappings:
+                mapping = remapped.get(beneficiary.pk)
+                if mapping is not None:
+                    mapping.broker_beneficiary_id, mapping.sync_hash = bene_id, row_hash
+                    mapping.save(update_fields=['broker_beneficiary_id', 'sync_hash'])
+                else:
+                    mapping = BeneficiaryBroker(beneficiary=beneficiary, broker=self.broker,
+                                                broker_beneficiary_id=bene_id, sync_hash=row_hash)
+                    created_mappings.append(mapping)
+                written_mappings[bene_id] = mapping
+            BeneficiaryBroker.objects.bulk_create(created_mappings)
+
+            self._track_sync(to_create + to_update, now=now)
+
+        mappings.update(written_mappings)
+        aliases.update(taken_aliases)
+
+        # bulk writes skip the model signals (e.g. the beneficiary webhooks), send them for what changed
+        for beneficiary in to_create:
+            post_save.send(sender=Beneficiary, instance=beneficiary, created=True, update_fields=None, raw=False,
+                           using=Beneficiary.objects.db)
+        for beneficiary in to_update:
+            post_save.send(sender=Beneficiary, instance=beneficiary, created=False, update_fields=None, raw=False,
+                           using=Beneficiary.objects.db)
+
+        return to_create + to_update
+
+    def _track_sync(self, beneficiaries: List[Beneficiary], now: datetime):
+        results = {r.beneficiary_id: r for r in BeneficiaryBrokerSyncResult.objects.filter(
+            broker=self.broker, beneficiary__in=beneficiaries)}
+        to_create, to_update = [], []
+        for beneficiary in beneficiaries:
+            result = results.get(beneficiary.pk)
+            if result is None:
+                to_create.append(BeneficiaryBrokerSyncResult(beneficiary=beneficiary, broker=self.broker,
+                                                             last_sync=now, sync_errors=None))
+            else:
+                result.last_sync, result.sync_errors = now, None
+                to_update.append(result)
+        BeneficiaryBrokerSyncResult.objects.bulk_create(to_create)
+        BeneficiaryBrokerSyncResult.objects.bulk_update(to_update, fields=['last_sync', 'sync_errors'])
+
+    @staticmethod
+    def _beneficiary_fields() -> List[str]:
+        return [field.name for field in Beneficiary._meta.concrete_fields
+                if not field.primary_key and field.name != 'created']
@@ -0,0 +1,343 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db import connection
+
+from main.apps.account.models import Company
+from main.apps.settlement.exceptions.beneficiary import InvalidPayoutMethod
+from main.apps.settlement.services.beneficiary import BeneficiaryService, BeneficiaryServiceFactory, \
+    BeneficiarySerializerService
+
+logger = logging.getLogger(__name__)
+
+
+class BeneficiarySchemaKey(NamedTuple):
+    """
+    Everything a beneficiary validation schema depends on. Besides the company, brokers, currency, destination country
+    and payment method, the Corpay rules also depend on the bank country and the account type. The company is part of
+    the key because the brokers answer with the rules of the company's own account.
+    """
+    company_id: int
+    brokers: Tuple[str, ...]
+    bank_currency: str
+    destination_country: Optional[str] = None
+    bank_country: Optional[str] = None
+    beneficiary_account_type: Optional[str] = None
+    payment_method: Optional[str] = None
+
+    def digest(self) -> str:
+        return hashlib.md5("|".join(str(part) for part in self).encode()).hexdigest()
+
+
+class CompiledBeneficiarySchema:
+    """ The broker schemas of a key and their merged schema """
+
+    def __init__(self, key: BeneficiarySchemaKey, schemas: List[Dict], merged: Dict, complete: bool = True,
+                 built_at: Optional[float] = None):
+        self.key = key
+        self.schemas = schemas
+        self.merged = merged
+        # False if some broker failed to return a schema, such entries are rebuilt sooner
+        self.complete = complete
+        self.built_at = time.time() if built_at is None else built_at
+
+    def is_fresh(self, ttl: float, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self.built_at < (ttl if self.complete else min(ttl, 60))
+
+    def to_dict(self) -> Dict:
+        return {"schemas": self.schemas, "merged": self.merged, "complete": self.complete, "built_at": self.built_at}
+
+    @classmethod
+    def from_dict(cls, key: BeneficiarySchemaKey, data: Dict) -> 'CompiledBeneficiarySchema':
+        return cls(key=key, schemas=data["schemas"], merged=data["merged"], complete=data["complete"],
+                   built_at=data["built_at"])
+
+
+class BeneficiarySchemaRegistry:
+    """
+    Registry of beneficiary validation schemas, so that the validation schema endpoint does not rebuild them from
+    the broker responses (and the Monex YAML spec) on every request.
+
+    Compiled schemas are kept in memory, per process, and shared between processes through the django cache.
+    Stale schemas are still served while they are rebuilt in the background. Every key that was requested is
+    remembered, so that warm() (see the warm_beneficiary_schemas periodic task) can rebuild them ahead of requests.
+
+    The brokers of a company and currency, which are part of the key, are cached for brokers_ttl, so that a request
+    served from the registry doesn't query the broker configuration. The broker services are only created to
+    build a schema.
+
+    Changes to the beneficiary field mappings, configs and value mappings invalidate all schemas (see the
+    settlement signal handlers).
+    """
+    key_prefix = "beneficiary_schema_registry"
+    ttl = 60 * 60
+    brokers_ttl = 5 * 60
+    known_keys_timeout = 60 * 60 * 24 * 7
+    version_check_interval = 5.
+
+    _entries: Dict[BeneficiarySchemaKey, CompiledBeneficiarySchema] = {}
+    _brokers: Dict[Tuple[int, str], Tuple[float, Tuple[str, ...]]] = {}
+    _version: Optional[str] = None
+    _version_checked_at = 0.
+    _refreshing = set()
+    _lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def get(cls,
+            company: Company,
+            bank_currency: str,
+            destination_country: Optional[str] = None,
+            bank_country: Optional[str] = None,
+            beneficiary_account_type: Optional[str] = None,
+            payment_method: Optional[str] = None) -> CompiledBeneficiarySchema:
+        cls._check_version()
+
+        services = None
+        brokers = cls._get_brokers(company.pk, bank_currency)
+        if brokers is None:
+            services = BeneficiaryServiceFactory(company=company).create_beneficiary_services(currency=bank_currency)
+            brokers = tuple(sorted(service.broker.broker_provider for service in services))
+            cls._set_brokers(company.pk, bank_currency, brokers)
+        key = BeneficiarySchemaKey(company_id=company.pk,
+                                   brokers=brokers,
+                                   bank_currency=bank_currency,
+                                   destination_country=destination_country,
+                                   bank_country=bank_country,
+                                   beneficiary_account_type=beneficiary_account_type,
+                                   payment_method=payment_method)
+
+        entry = cls._entries.get(key) or cls._load(key)
+        if entry is None:
+            entry = cls.build(key, services=services if services is not None else cls._services(key, company),
+                              company=company)
+            cls._remember(key)
+        elif not entry.is_fresh(cls.ttl):
+            cls._refresh_in_background(key)
+        return entry
+
+    @classmethod
+    def build(cls, key: BeneficiarySchemaKey, services: Iterable[BeneficiaryService],
+              company: Company) -> CompiledBeneficiarySchema:
+        """ Build the schema of a key from the brokers, and store it """
+        schemas, complete = [cls._serializer_schema(key.bank_currency)], True
+        for service in services:
+            try:
+                schema = service.get_beneficiary_validation_schema(
+                    destination_country=key.destination_country,
+                    bank_country=key.bank_country,
+                    bank_currency=key.bank_currency,
+                    beneficiary_account_type=key.beneficiary_account_type,
+                    payment_method=key.payment_method,
+                )
+                if schema is None:
+                    continue
+                if isinstance(schema, list):
+                    schemas.extend(schema)
+                else:
+                    schemas.append(schema)
+            except InvalidPayoutMethod as e:
+                logger.warning(
+                    f"{company} requested an invalid validation schema using: "
+                    f"destination country: {key.destination_country}, bank country: {key.bank_country}, "
+                    f"bank currency: {key.bank_currency}, beneficiary_account_type: {key.beneficiary_account_type}, "
+                    f"payment_method: {key.payment_method} from broker: {service.broker.name}")
+                logger.warning(e)
+            except Exception as e:
+                logger.exception(e)
+                complete = False
+
+        entry = CompiledBeneficiarySchema(key=key, schemas=schemas,
+                                          merged=BeneficiaryService.merge_validation_schemas(schemas),
+                                          complete=complete)
+        cls._store(entry)
+        return entry
+
+    @classmethod
+    def warm(cls, company_id: Optional[int] = None):
+        """ Rebuild the schemas of every key requested recently (optionally only those requested by a company) """
+        keys = [key for key in cls._known_keys() if company_id in (None, key.company_id)]
+        companies = Company.objects.in_bulk({key.company_id for key in keys})
+        for key in keys:
+            company = companies.get(key.company_id)
+            if company is None:
+                continue
+            try:
+                cls._rebuild(key, company=company)
+            except Exception as e:
+                logger.exception(f"Unable to warm beneficiary schema {key}: {e}")
+
+    @classmethod
+    def invalidate(cls):
+        try:
+            cache.set(cls._version_key(), str(time.time()), timeout=None)
+        except Exception as e:
+            logger.warning(f"Unable to invalidate beneficiary schemas: {e}")
+        with cls._lock:
+            cls._entries.clear()
+            cls._brokers.clear()
+            cls._version_checked_at = 0.
+
+    @classmethod
+    def clear(cls):
+        """ Drop the schemas of this process """
+        with cls._lock:
+            cls._entries.clear()
+            cls._brokers.clear()
+            cls._version, cls._version_checked_at = None, 0.
+
+    # ================
+    # Private
+    # ================
+
+    @classmethod
+    def _rebuild(cls, key: BeneficiarySchemaKey, company: Company) -> CompiledBeneficiarySchema:
+        return cls.build(key, services=cls._services(key, company), company=company)
+
+    @staticmethod
+    def _services(key: BeneficiarySchemaKey, company: Company) -> List[BeneficiaryService]:
+        """ The broker services of a key """
+        return [service for service in BeneficiaryServiceFactory(company=company)
+                .create_beneficiary_services(currency=key.bank_currency)
+                if service.broker.broker_provider in key.brokers]
+
+    @classmethod
+    def _get_brokers(cls, company_id: int, bank_currency: str) -> Optional[Tuple[str, ...]]:
+        now = time.time()
+        cached = cls._brokers.get((company_id, bank_currency))
+        if cached is not None and now - cached[0] < cls.brokers_ttl:
+            return cached[1]
+        try:
+            cached = cache.get(cls._brokers_key(company_id, bank_currency))
+        except Exception as e:
+            logger.warning(f"Unable to read beneficiary schema brokers: {e}")
+            return None
+        if cached is None:
+            return None
+        with cls._lock:
+            cls._brokers[(company_id, bank_currency)] = (cached[0], tuple(cached[1]))
+        return tuple(cached[1])
+
+    @classmethod
+    def _set_brokers(cls, company_id: int, bank_currency: str, brokers: Tuple[str, ...]):
+        now = time.time()
+        with cls._lock:
+            cls._brokers[(company_id, bank_currency)] = (now, brokers)
+        try:
+            cache.set(cls._brokers_key(company_id, bank_currency), (now, brokers), timeout=cls.brokers_ttl)
+        except Exception as e:
+            logger.warning(f"Unable to store beneficiary schema brokers: {e}")
+
+    @classmethod
+    def _refresh_in_background(cls, key: BeneficiarySchemaKey):
+        with cls._lock:
+            if key in cls._refreshing:
+                return
+            cls._refreshing.add(key)
+
+        def _refresh():
+            try:
+                cls._rebuild(key, company=Company.objects.get(pk=key.company_id))
+            except Exception as e:
+                logger.exception(f"Unable to refresh beneficiary schema {key}: {e}")
+            finally:
+                with cls._lock:
+                    cls._refreshing.discard(key)
+                connection.close()
+
+        cls._get_executor().submit(_refresh)
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        """ The background refresh threads, only started by the first stale schema """
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="beneficiary-schema")
+            return cls._executor
+
+    @staticmethod
+    def _serializer_schema(bank_currency: str) -> Dict:
+        from main.apps.settlement.api.views.beneficiary import BeneficiaryViewSet
+        return BeneficiarySerializerService(BeneficiaryViewSet).get_schema(bank_currency)
+
+    @classmethod
+    def _check_version(cls):
+        now = time.monotonic()
+        if now - cls._version_checked_at < cls.version_check_interval:
+            return
+        try:
+            version = cache.get(cls._version_key())
+        except Exception as e:
+            logger.warning(f"Unable to read beneficiary schema version: {e}")
+            return
+        with cls._lock:
+            if version != cls._version:
+                cls._entries.clear()
+                cls._brokers.clear()
+                cls._version = version
+            cls._version_checked_at = now
+
+    @classmethod
+    def _store(cls, entry: CompiledBeneficiarySchema):
+        with cls._lock:
+            cls._entries[entry.key] = entry
+        try:
+            cache.set(cls._entry_key(entry.key), entry.to_dict(), timeout=cls.known_keys_timeout)
+        except Exception as e:
+            logger.warning(f"Unable to store beneficiary schema: {e}")
+
+    @classmethod
+    def _load(cls, key: BeneficiarySchemaKey) -> Optional[CompiledBeneficiarySchema]:
+        try:
+            data = cache.get(cls._entry_key(key))
+        except Exception as e:
+            logger.warning(f"Unable to read beneficiary schema: {e}")
+            return None
+        if data is None:
+            return None
+        entry = CompiledBeneficiarySchema.from_dict(key, data)
+        with cls._lock:
+            cls._entries[key] = entry
+        return entry
+
+    @classmethod
+    def _known_keys(cls) -> Set[BeneficiarySchemaKey]:
+        try:
+            known = cache.get(cls._known_keys_key()) or set()
+        except Exception as e:
+            logger.warning(f"Unable to read beneficiary schema keys: {e}")
+            return set()
+        return {BeneficiarySchemaKey(*key) for key in known}
+
+    @classmethod
+    def _remember(cls, key: BeneficiarySchemaKey):
+        known = cls._known_keys()
+        if key in known:
+            return
+        known.add(key)
+        try:
+            cache.set(cls._known_keys_key(), {tuple(k) for k in known}, timeout=cls.known_keys_timeout)
+        except Exception as e:
+            logger.warning(f"Unable to store beneficiary schema keys: {e}")
+
+    @classmethod
+    def _version_key(cls) -> str:
+        return f"{cls.key_prefix}:version"
+
+    @classmethod
+    def _known_keys_key(cls) -> str:
+        return f"{cls.key_prefix}:known_keys"
+
+    @classmethod
+    def _brokers_key(cls, company_id: int, bank_currency: str) -> str:
+        return f"{cls.key_prefix}:{cls._version}:brokers:{company_id}:{bank_currency}"
+
+    @classmethod
+    def _entry_key(cls, key: BeneficiarySchemaKey) -> str:
+        return f"{cls.key_prefix}:{cls._version}:{key.digest()}"
@@ -3,7 +3,9 @@ from django.dispatch import receiver
 
 from main.apps.oems.backend.webhook import WEBHOOK_EVENTS
 from main.apps.settlement.api.serializers.beneficiary import BeneficiarySerializer
-from main.apps.settlement.models import Beneficiary
+from main.apps.settlement.models import Beneficiary, BeneficiaryFieldConfig, BeneficiaryFieldMapping, \
+    BeneficiaryValueMapping
+from main.apps.settlement.services.schema_registry import BeneficiarySchemaRegistry
 from main.apps.webhook.models import Webhook
 
 
@@ -22,3 +24,13 @@ def post_delete_beneficiary_handler(sender, instance: Beneficiary, **kwargs):
     serializer = BeneficiarySerializer(instance)
     payload = serializer.data
     Webhook.dispatch_event(instance.company, WEBHOOK_EVENTS.BENEFICIARY_DELETED, payload)
+
+
+@receiver(post_save, sender=BeneficiaryFieldMapping)
+@receiver(post_delete, sender=BeneficiaryFieldMapping)
+@receiver(post_save, sender=BeneficiaryFieldConfig)
+@receiver(post_delete, sender=BeneficiaryFieldConfig)
+@receiver(post_save, sender=BeneficiaryValueMapping)
+@receiver(post_delete, sender=BeneficiaryValueMapping)
+def beneficiary_schema_config_changed_handler(sender, **kwargs):
+    BeneficiarySchemaRegistry.invalidate()
@@ -6,6 +6,7 @@ from main.apps.account.models import Company
 from main.apps.core.utils.slack import send_exception_to_slack
 from main.apps.settlement.models import Beneficiary
 from main.apps.settlement.services.beneficiary import BeneficiaryServiceFactory
+from main.apps.settlement.services.schema_registry import BeneficiarySchemaRegistry
 from main.apps.settlement.services.wallet import WalletServiceFactory
 
 logger = logging.getLogger(__name__)
@@ -123,3 +124,12 @@ def sync_beneficiary_from_brokers(company_id=None):
     except Exception as e:
         logger.error(e, exc_info=True)
         send_exception_to_slack(str(e))
+
+
+@shared_task
+def warm_beneficiary_schemas(company_id=None):
+    try:
+        BeneficiarySchemaRegistry.warm(company_id=company_id)
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        send_exception_to_slack(str(e))
@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from main.apps.account.models import Company
+from main.apps.broker.models import Broker, BrokerProviderOption
+from main.apps.currency.models import Currency
+from main.apps.settlement.models import Beneficiary, BeneficiaryBroker
+from main.apps.settlement.services.beneficiary_sync import BeneficiaryBulkSync, content_hash
+
+
+class BeneficiaryBulkSyncTestCase(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(mnemonic='USD')
+        self.company = Company.objects.create(name="Company 1", currency=self.currency)
+        self.broker = Broker.objects.create(name="Monex", broker_provider=BrokerProviderOption.MONEX)
+        self.fetched = []
+
+    def _fetch(self, bene_id):
+        self.fetched.append(bene_id)
+        return {'name': f"Bene {bene_id}"}
+
+    @staticmethod
+    def _apply(beneficiary, data, created, aliases):
+        beneficiary.beneficiary_name = data['name']
+        aliases.add(data['name'])
+        beneficiary.beneficiary_alias = data['name']
+
+    def _sync(self, pages, full=False):
+        return BeneficiaryBulkSync(company=self.company, broker=self.broker, fetch_detail=self._fetch,
+                                   apply=self._apply, full=full).run(pages)
+
+    def test_content_hash_ignores_key_order(self):
+        self.assertEqual(content_hash({'a': 1, 'b': 2}), content_hash({'b': 2, 'a': 1}))
+        self.assertNotEqual(content_hash({'a': 1}), content_hash({'a': 2}))
+
+    def test_only_changed_rows_are_synced(self):
+        pages = [[('1', {'id': 1}), ('2', {'id': 2})], [('3', {'id': 3})]]
+        self.assertEqual(len(self._sync(pages)), 3)
+        self.assertEqual(Beneficiary.objects.filter(company=self.company).count(), 3)
+        self.assertEqual(BeneficiaryBroker.objects.filter(broker=self.broker).count(), 3)
+
+        self.fetched.clear()
+        pages = [[('1', {'id': 1}), ('2', {'id': 2, 'nickname': 'new'})], [('3', {'id': 3})]]
+        synced = self._sync(pages)
+        self.assertEqual(self.fetched, ['2'])
+        self.assertEqual([b.external_id for b in synced], ['2'])
+        self.assertEqual(Beneficiary.objects.filter(company=self.company).count(), 3)
+
+    def test_full_sync_ignores_hashes(self):
+        pages = [[('1', {'id': 1})]]
+        self._sync(pages)
+        self.fetched.clear()
+        self._sync(pages, full=True)
+        self.assertEqual(self.fetched, ['1'])
+
+    def test_failed_bulk_write_is_retried_one_by_one(self):
+        self._sync([[('1', {'id': 1})]])
+
+        def apply(beneficiary, data, created, aliases):
+            beneficiary.beneficiary_name = data['name']
+            if created:
+                alias = data['name'] if data['name'] not in aliases else f"{data['name']} (2)"
+                aliases.add(alias)
+                beneficiary.beneficiary_alias = alias
+
+        track_sync = BeneficiaryBulkSync._track_sync
+        calls = []
+
+        def fail_once(sync, beneficiaries, now):
+            calls.append(len(beneficiaries))
+            if len(calls) == 1:
+                raise RuntimeError("bulk write failed")
+            return track_sync(sync, beneficiaries, now=now)
+
+        pages = [[('1', {'id': 1, 'nickname': 'new'}), ('2', {'id': 2}), ('3', {'id': 3})]]
+        with mock.patch.object(BeneficiaryBulkSync, '_track_sync', autospec=True, side_effect=fail_once):
+            synced = BeneficiaryBulkSync(company=self.company, broker=self.broker, fetch_detail=self._fetch,
+                                         apply=apply, full=False).run(pages)
+
+        self.assertEqual([3, 1, 1, 1], calls)
+        self.assertEqual(['1', '2', '3'], [b.external_id for b in synced])
+        self.assertEqual(3, Beneficiary.objects.filter(company=self.company).count())
+        self.assertEqual({'1', '2', '3'}, set(BeneficiaryBroker.objects.filter(broker=self.broker)
+                                              .values_list('broker_beneficiary_id', flat=True)))
+        # the aliases taken by the failed attempt are free again
+        self.assertEqual('Bene 2', Beneficiary.objects.get(company=self.company, external_id='2').beneficiary_alias)
@@ -0,0 +1,84 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from main.apps.settlement.services.schema_registry import BeneficiarySchemaKey, BeneficiarySchemaRegistry, \
+    CompiledBeneficiarySchema
+
+
+class CompiledBeneficiarySchemaTestCase(SimpleTestCase):
+    def setUp(self):
+        self.key = BeneficiarySchemaKey(company_id=1, brokers=('corpay', 'monex'), bank_currency='USD',
+                                        destination_country='US')
+        self.merged = {
+            "type": "object",
+            "properties": {"beneficiary_name": {"type": "string"}, "bank_name": {"type": "string"}},
+            "required": ["beneficiary_name"],
+        }
+
+    def test_key_digest(self):
+        self.assertEqual(self.key.digest(), BeneficiarySchemaKey(*tuple(self.key)).digest())
+        self.assertNotEqual(self.key.digest(), self.key._replace(payment_method='swift').digest())
+        self.assertNotEqual(self.key.digest(), self.key._replace(company_id=2).digest())
+
+    def test_incomplete_schemas_expire_sooner(self):
+        schema = CompiledBeneficiarySchema(key=self.key, schemas=[], merged=self.merged, built_at=0.)
+        self.assertTrue(schema.is_fresh(ttl=3600, now=100.))
+
+        schema = CompiledBeneficiarySchema(key=self.key, schemas=[], merged=self.merged, complete=False, built_at=0.)
+        self.assertFalse(schema.is_fresh(ttl=3600, now=100.))
+
+    def test_round_trip(self):
+        schema = CompiledBeneficiarySchema(key=self.key, schemas=[self.merged], merged=self.merged, built_at=1.)
+        loaded = CompiledBeneficiarySchema.from_dict(self.key, schema.to_dict())
+        self.assertEqual(loaded.merged, self.merged)
+        self.assertEqual(loaded.built_at, 1.)
+        self.assertTrue(loaded.complete)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class BeneficiarySchemaRegistryTestCase(SimpleTestCase):
+
+    def test_warm_rebuilds_known_keys_per_company(self):
+        keys = [BeneficiarySchemaKey(company_id=company_id, brokers=('corpay',), bank_currency='USD')
+                for company_id in (1, 2)]
+        for key in keys + keys:
+            BeneficiarySchemaRegistry._remember(key)
+        companies = {1: mock.Mock(pk=1), 2: mock.Mock(pk=2)}
+
+        module = 'main.apps.settlement.services.schema_registry'
+        with mock.patch(f'{module}.Company.objects.in_bulk',
+                        side_effect=lambda ids: {pk: companies[pk] for pk in ids}), \
+                mock.patch.object(BeneficiarySchemaRegistry, '_rebuild') as rebuild:
+            BeneficiarySchemaRegistry.warm(company_id=2)
+            rebuild.assert_called_once_with(keys[1], company=companies[2])
+
+            rebuild.reset_mock()
+            BeneficiarySchemaRegistry.warm()
+            self.assertEqual(2, rebuild.call_count)
+
+    def test_served_schemas_do_not_create_broker_services(self):
+        BeneficiarySchemaRegistry.clear()
+        self.addCleanup(BeneficiarySchemaRegistry.clear)
+        self.addCleanup(cache.clear)
+        company = mock.Mock(pk=3)
+        service = mock.Mock(**{'broker.broker_provider': 'corpay', 'get_beneficiary_validation_schema.return_value': None})
+
+        module = 'main.apps.settlement.services.schema_registry'
+        with mock.patch(f'{module}.BeneficiaryServiceFactory') as factory, \
+                mock.patch.object(BeneficiarySchemaRegistry, '_serializer_schema', return_value={}), \
+                mock.patch(f'{module}.BeneficiaryService.merge_validation_schemas', return_value={}):
+            factory.return_value.create_beneficiary_services.return_value = [service]
+
+            entry = BeneficiarySchemaRegistry.get(company, 'USD', destination_country='US')
+            self.assertEqual(('corpay',), entry.key.brokers)
+            self.assertEqual(1, factory.return_value.create_beneficiary_services.call_count)
+
+            self.assertIs(entry, BeneficiarySchemaRegistry.get(company, 'USD', destination_country='US'))
+            self.assertEqual(1, factory.return_value.create_beneficiary_services.call_count)
+
+            # a new key reuses the brokers, the services are only created to build its schema
+            other = BeneficiarySchemaRegistry.get(company, 'USD', destination_country='CA')
+            self.assertEqual(('corpay',), other.key.brokers)
+            self.assertEqual(2, factory.return_value.create_beneficiary_services.call_count)
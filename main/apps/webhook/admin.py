@@ -5,7 +5,7 @@ from django.contrib import admin
 from rest_framework.authtoken.admin import TokenAdmin
 
 from main.apps.webhook.models.proxy import Token
-from .models.webhook import Event, EventGroup, Webhook
+from .models.webhook import Event, EventGroup, Webhook, WebhookDeadLetter, WebhookOutbox
 
 
 @admin.register(Event)
@@ -35,4 +35,31 @@ class WebhookAdmin(admin.ModelAdmin):
     filter_horizontal = ('events', 'groups')
 
 
+@admin.register(WebhookOutbox)
+class WebhookOutboxAdmin(admin.ModelAdmin):
+    list_display = ('url', 'webhook', 'attempts', 'next_attempt_at', 'created')
+    search_fields = ('url',)
+    readonly_fields = ('webhook', 'url', 'payload', 'headers', 'attempts', 'next_attempt_at')
+
+
+@admin.register(WebhookDeadLetter)
+class WebhookDeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('event_type', 'url', 'webhook', 'attempts', 'status_code', 'created')
+    search_fields = ('url', 'event_type', 'error')
+    list_filter = ('event_type', 'status_code')
+    readonly_fields = ('webhook', 'url', 'event_type', 'payload', 'headers', 'attempts', 'status_code', 'error')
+    actions = ['redeliver']
+
+    @admin.action(description="Redeliver selected events")
+    def redeliver(self, request, queryset):
+        redelivered = 0
+        for dead_letter in queryset.select_related('webhook'):
+            try:
+                dead_letter.redeliver()
+                redelivered += 1
+            except ValueError as e:
+                self.message_user(request, f"{dead_letter}: {e}", level='warning')
+        self.message_user(request, f"Redelivered {redelivered} events")
+
+
 admin.site.register(Token, TokenAdmin)
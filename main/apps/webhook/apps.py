@@ -5,3 +5,6 @@ class WebhookConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main.apps.webhook'
     verbose_name = 'API & Webhooks'
+
+    def ready(self):
+        import main.apps.webhook.signals  # noqa: F401
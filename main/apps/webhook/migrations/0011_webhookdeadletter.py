@@ -0,0 +1,35 @@
+# Generated by Django 4.2.15 on 2024-10-21 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhook', '0010_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('url', models.URLField(help_text='The URL the event was delivered to.')),
+                ('event_type', models.CharField(blank=True, help_text='The type of the event.', max_length=32, null=True)),
+                ('payload', models.JSONField(help_text='The webhook payload.')),
+                ('headers', models.JSONField(default=dict, help_text='The headers of the last attempt.')),
+                ('attempts', models.IntegerField(default=0, help_text='The number of delivery attempts.')),
+                ('status_code', models.IntegerField(blank=True, help_text='The HTTP status of the last attempt.', null=True)),
+                ('error', models.TextField(blank=True, default='', help_text='The error of the last attempt.')),
+                ('webhook', models.ForeignKey(blank=True, help_text='The webhook the event was delivered for.', null=True, on_delete=django.db.models.deletion.SET_NULL, to='webhook.webhook')),
+            ],
+            options={
+                'get_latest_by': 'modified',
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.15 on 2024-10-22 10:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+def create_periodic_task(apps, schema_editor):
+    IntervalSchedule = apps.get_model('django_celery_beat', 'IntervalSchedule')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    # the events of an endpoint that arrive within this interval are delivered as one batch
+    schedule, _ = IntervalSchedule.objects.get_or_create(
+        every=1,
+        period='seconds',
+    )
+
+    PeriodicTask.objects.get_or_create(
+        name='Drain Webhook Outbox',
+        defaults={
+            'task': 'main.apps.webhook.tasks.drain_webhook_outbox',
+            'interval': schedule,
+            'args': '[]',
+            'kwargs': '{}',
+        }
+    )
+
+
+def delete_periodic_task(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(
+        name='Drain Webhook Outbox'
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_celery_beat', '0001_initial'),
+        ('webhook', '0011_webhookdeadletter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('url', models.URLField(db_index=True, help_text='The URL the event is delivered to.')),
+                ('payload', models.JSONField(help_text='The webhook payload.')),
+                ('headers', models.JSONField(default=dict, help_text='The signed headers of the delivery.')),
+                ('attempts', models.IntegerField(default=0, help_text='The number of failed delivery attempts.')),
+                ('next_attempt_at', models.DateTimeField(blank=True, db_index=True, help_text='When a failed delivery is retried. The later deliveries to the same URL wait for it.', null=True)),
+                ('webhook', models.ForeignKey(blank=True, help_text='The webhook the event is delivered for.', null=True, on_delete=django.db.models.deletion.SET_NULL, to='webhook.webhook')),
+            ],
+            options={
+                'get_latest_by': 'modified',
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(create_periodic_task, delete_periodic_task),
+    ]
@@ -1,9 +1,5 @@
-import hashlib
-import hmac
-import json
 import logging
 import secrets
-import time
 import uuid
 
 from django.db import models
@@ -13,7 +9,7 @@ from django_extensions.db.models import TimeStampedModel
 
 from main.apps.account.models import Company, User
 from main.apps.core.utils.json_serializable import json_serializable
-from main.apps.webhook.tasks import dispatch_webhook_event
+from main.apps.webhook.services.delivery import enqueue_deliveries, make_delivery, sign_webhook_payload
 
 logger = logging.getLogger(__name__)
 
@@ -79,44 +75,73 @@ class Webhook(TimeStampedModel):
         """
         Dispatches the specified event to all URLs associated with that event or event group for the given company.
         Optionally, you can filter the webhooks by user.
+
+        Subscriptions are resolved from WebhookSubscriptionCache and the signed deliveries written to the
+        WebhookOutbox, from where the outbox drainer delivers them in batches per endpoint (see services/delivery.py).
+        Failing to queue a delivery is logged and never raised to the caller.
         """
-        webhooks = Webhook.objects.filter(company=company)
-        if user:
-            webhooks = webhooks.filter(created_by=user)
+        from main.apps.webhook.services.subscriptions import WebhookSubscriptionCache
 
-        webhooks = webhooks.filter(
-            Q(events__type=event_type) | Q(groups__events__type=event_type)
-        ).distinct()
+        company_id = company.pk if isinstance(company, Company) else company
+        subscriptions = WebhookSubscriptionCache.resolve(company_id, event_type, user_id=user.pk if user else None)
+        if not subscriptions:
+            return []
 
-        dispatched_urls = []
+        webhook_payload = {
+            "event_type": event_type,
+            "payload": json_serializable(payload)
+        }
+        deliveries = []
 
-        for webhook in webhooks:
-            url = webhook.url
-            signing_secret = webhook.signing_secret
+        for subscription in subscriptions:
+            url = subscription.url
             try:
-                timestamp = int(time.time())
-                serializable_payload = json_serializable(payload)
-                webhook_payload = {
-                    "event_type": event_type,
-                    "payload": serializable_payload
-                }
-                json_payload = json.dumps(webhook_payload)
-                signed_payload = f"{timestamp}.{json_payload}"
-
-                # Generate the signature using the signing secret
-                signature = hmac.new(signing_secret.encode('utf-8'), signed_payload.encode('utf-8'),
-                                     hashlib.sha256).hexdigest()
-
-                # Include the timestamp and signature in the headers
-                headers = {
-                    'Content-Type': 'application/json',
-                    'Pangea-Signature': f"t={timestamp},v1={signature}"
-                }
-
-                dispatch_webhook_event.delay(url, webhook_payload, headers)
-                dispatched_urls.append(url)
-                logger.info(f"Webhook dispatched to {url} for event {event_type}")
+                headers = sign_webhook_payload(subscription.signing_secret, webhook_payload)
+                deliveries.append((url, make_delivery(subscription.webhook_id, webhook_payload, headers)))
             except Exception as e:
                 logger.error(f"Error dispatching event to {url}: {e}")
 
+        dispatched_urls = enqueue_deliveries(deliveries)
+        for url in dispatched_urls:
+            logger.info(f"Webhook dispatched to {url} for event {event_type}")
         return dispatched_urls
+
+
+class WebhookOutbox(TimeStampedModel):
+    """ A webhook delivery waiting for the outbox drainer, in order of id per url """
+    webhook = models.ForeignKey(Webhook, null=True, blank=True, on_delete=models.SET_NULL,
+                                help_text="The webhook the event is delivered for.")
+    url = models.URLField(db_index=True, help_text="The URL the event is delivered to.")
+    payload = models.JSONField(help_text="The webhook payload.")
+    headers = models.JSONField(default=dict, help_text="The signed headers of the delivery.")
+    attempts = models.IntegerField(default=0, help_text="The number of failed delivery attempts.")
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True,
+                                           help_text="When a failed delivery is retried. The later deliveries "
+                                                     "to the same URL wait for it.")
+
+    def __str__(self):
+        return f"{self.payload.get('event_type')} to {self.url}"
+
+
+class WebhookDeadLetter(TimeStampedModel):
+    """ A webhook delivery that failed after all its retries """
+    webhook = models.ForeignKey(Webhook, null=True, blank=True, on_delete=models.SET_NULL,
+                                help_text="The webhook the event was delivered for.")
+    url = models.URLField(help_text="The URL the event was delivered to.")
+    event_type = models.CharField(max_length=32, null=True, blank=True, help_text="The type of the event.")
+    payload = models.JSONField(help_text="The webhook payload.")
+    headers = models.JSONField(default=dict, help_text="The headers of the last attempt.")
+    attempts = models.IntegerField(default=0, help_text="The number of delivery attempts.")
+    status_code = models.IntegerField(null=True, blank=True, help_text="The HTTP status of the last attempt.")
+    error = models.TextField(blank=True, default="", help_text="The error of the last attempt.")
+
+    def __str__(self):
+        return f"{self.event_type} to {self.url}"
+
+    def redeliver(self):
+        """ Re-signs the payload and queues it again for delivery """
+        if self.webhook is None:
+            raise ValueError("Cannot redeliver the event of a deleted webhook")
+        headers = sign_webhook_payload(self.webhook.signing_secret, self.payload)
+        enqueue_deliveries([(self.url, make_delivery(self.webhook_id, self.payload, headers))])
+        self.delete()
@@ -0,0 +1,332 @@
+"""
+
+Webhook delivery engine.
+
+Webhook.dispatch_event signs one payload per subscribed webhook and writes the deliveries to the WebhookOutbox table,
+so a delivery is durable as soon as dispatch_event returns (and is dropped with the caller's transaction if that rolls
+back). Nothing is queued on the broker per event.
+
+The drain_webhook_outbox periodic task runs a WebhookOutboxDrainer, one at a time. It coalesces everything waiting in
+the outbox per endpoint, and delivers the endpoints on a bounded pool of threads (MAX_CONCURRENCY). Each endpoint gets
+batches of up to MAX_BATCH deliveries, one POST per event (the wire format and the signatures are unchanged), over a
+keep-alive session per host.
+
+A delivery that fails on a connection error, a timeout, a 429 or a 5xx stays in the outbox with its attempts counted
+and a next_attempt_at with exponential backoff. The later deliveries of its endpoint wait for it, so order is kept. A
+delivery that still fails after MAX_ATTEMPTS is written to WebhookDeadLetter, from where the admin can redeliver it.
+
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_BATCH": 100,
+    "MAX_CONCURRENCY": 8,
+    "DRAIN_LIMIT": 1000,
+    "DRAIN_SECONDS": 50.,
+    "POOL_MAXSIZE": 10,
+    "MAX_ATTEMPTS": 4,
+    "BACKOFF": 0.5,
+    "TIMEOUT": 10.,
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def delivery_settings() -> Dict:
+    return {**DEFAULTS, **getattr(settings, "WEBHOOK_DELIVERY", {})}
+
+
+def sign_webhook_payload(signing_secret: str, webhook_payload: Dict, timestamp: Optional[int] = None) -> Dict:
+    """ Headers of a webhook POST, with the Pangea-Signature of the payload """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed_payload = f"{timestamp}.{json.dumps(webhook_payload)}"
+    signature = hmac.new(signing_secret.encode('utf-8'), signed_payload.encode('utf-8'),
+                         hashlib.sha256).hexdigest()
+    return {
+        'Content-Type': 'application/json',
+        'Pangea-Signature': f"t={timestamp},v1={signature}"
+    }
+
+
+def make_delivery(webhook_id: Optional[int], webhook_payload: Dict, headers: Dict) -> Dict:
+    # attempts counts the failed attempts so far
+    return {"webhook_id": webhook_id, "payload": webhook_payload, "headers": headers, "attempts": 0}
+
+
+# ==================
+
+class WebhookSessionPool:
+    """ One keep-alive requests.Session per scheme and host """
+
+    def __init__(self, pool_maxsize: int = 10):
+        self.pool_maxsize = pool_maxsize
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    # retries are done by the deliverer, with backoff
+                    session.mount(key, HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0))
+                    self._sessions[key] = session
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class WebhookDeliverer:
+    """
+    Delivers batches of deliveries to an endpoint, in order, one attempt per delivery. deliver returns the deliveries
+    to retry: from the first one that failed on a retryable error (with its attempts counted), before max_attempts.
+    """
+
+    def __init__(self, sessions: Optional[WebhookSessionPool] = None, max_attempts: int = 4, backoff: float = 0.5,
+                 timeout: float = 10., dead_letter: Optional[Callable] = None):
+        self.sessions = sessions or WebhookSessionPool()
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.dead_letter = dead_letter or write_dead_letter
+
+    def deliver(self, url: str, deliveries: List[Dict]) -> List[Dict]:
+        """ Returns the deliveries to retry later, in order """
+        delivered = 0
+        for i, delivery in enumerate(deliveries):
+            ok, retryable, status_code, error = self._post(url, delivery)
+            if ok:
+                delivered += 1
+                continue
+            attempts = delivery.get("attempts", 0) + 1
+            if retryable and attempts < self.max_attempts:
+                logger.warning(f"Webhook event to {url} failed (attempt {attempts}), retrying later: {error}")
+                return [{**delivery, "attempts": attempts}] + deliveries[i + 1:]
+            if retryable:
+                logger.error(f"Failed to dispatch webhook event to {url} after {attempts} attempts. Error: {error}")
+            self.dead_letter(url, delivery, attempts=attempts, status_code=status_code, error=error)
+        logger.debug(f"Delivered {delivered}/{len(deliveries)} webhook events to {url}")
+        return []
+
+    def retry_delay(self, deliveries: List[Dict]) -> float:
+        """ Seconds before retrying deliveries returned by deliver, exponential in the attempts of the first one """
+        attempts = deliveries[0].get("attempts", 1) if deliveries else 1
+        return self.backoff * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+
+    def _post(self, url: str, delivery: Dict):
+        session = self.sessions.get(url)
+        try:
+            response = session.post(url, json=delivery["payload"], headers=delivery["headers"], timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return False, True, None, str(e)
+        if response.ok:
+            return True, False, response.status_code, None
+        return False, response.status_code in RETRY_STATUS_CODES, response.status_code, f"HTTP {response.status_code}"
+
+
+def write_dead_letter(url: str, delivery: Dict, attempts: int, status_code: Optional[int], error: Optional[str]):
+    from main.apps.webhook.models import WebhookDeadLetter
+
+    try:
+        WebhookDeadLetter.objects.create(
+            webhook_id=delivery.get("webhook_id"),
+            url=url,
+            event_type=delivery["payload"].get("event_type"),
+            payload=delivery["payload"],
+            headers=delivery["headers"],
+            attempts=attempts,
+            status_code=status_code,
+            error=error or "",
+        )
+    except Exception as e:
+        logger.exception(f"Unable to dead-letter webhook event to {url}: {e}")
+
+
+# ==================
+
+_deliverer: Optional[WebhookDeliverer] = None
+_lock = threading.Lock()
+
+
+def get_deliverer() -> WebhookDeliverer:
+    global _deliverer
+    if _deliverer is None:
+        with _lock:
+            if _deliverer is None:
+                conf = delivery_settings()
+                _deliverer = WebhookDeliverer(sessions=WebhookSessionPool(pool_maxsize=conf["POOL_MAXSIZE"]),
+                                              max_attempts=conf["MAX_ATTEMPTS"], backoff=conf["BACKOFF"],
+                                              timeout=conf["TIMEOUT"])
+    return _deliverer
+
+
+def enqueue_deliveries(deliveries: Iterable[Tuple[str, Dict]]) -> List[str]:
+    """
+    Writes (url, delivery) pairs to the WebhookOutbox. Never raises: a delivery that can't be written is logged and
+    left out of the returned urls.
+
+    :return: The urls of the deliveries queued, in order
+    """
+    from main.apps.webhook.models import WebhookOutbox
+
+    rows = [WebhookOutbox(webhook_id=delivery.get("webhook_id"), url=url, payload=delivery["payload"],
+                          headers=delivery["headers"], attempts=delivery.get("attempts", 0))
+            for url, delivery in deliveries]
+    if not rows:
+        return []
+    try:
+        # a savepoint, so a failure does not break the transaction of the caller
+        with transaction.atomic():
+            WebhookOutbox.objects.bulk_create(rows)
+        return [row.url for row in rows]
+    except Exception as e:
+        logger.warning(f"Unable to queue {len(rows)} webhook deliveries at once, queuing them one by one: {e}")
+
+    queued = []
+    for row in rows:
+        try:
+            with transaction.atomic():
+                row.pk = None
+                row.save()
+            queued.append(row.url)
+        except Exception as e:
+            logger.error(f"Unable to queue webhook event {row.payload.get('event_type')} to {row.url}: {e}")
+    return queued
+
+
+class WebhookOutboxDrainer:
+    """
+    Delivers what is waiting in the WebhookOutbox, coalesced per endpoint: the endpoints are delivered concurrently
+    (at most max_concurrency at a time), the deliveries of an endpoint in order of id, in batches of max_batch.
+
+    Only one drainer runs at a time (a lock in the django cache), since two would break the order of an endpoint.
+    Rows are deleted once delivered or dead-lettered, so a drainer that dies part way delivers them again.
+    """
+    lock_key = "webhook_outbox_drainer"
+
+    def __init__(self, deliverer: Optional[WebhookDeliverer] = None, max_concurrency: int = 8,
+                 max_batch: int = 100, limit: int = 1000, max_seconds: float = 50.):
+        self.deliverer = deliverer or get_deliverer()
+        self.max_concurrency = max_concurrency
+        self.max_batch = max_batch
+        self.limit = limit
+        self.max_seconds = max_seconds
+
+    def drain(self) -> int:
+        """ Drain until the outbox has nothing due or max_seconds have passed. Returns the number of rows done """
+        if not cache.add(self.lock_key, 1, timeout=int(self.max_seconds + 2 * self.deliverer.timeout + 10)):
+            logger.debug("Webhook outbox is already being drained")
+            return 0
+        done = 0
+        try:
+            start = time.monotonic()
+            while time.monotonic() - start < self.max_seconds:
+                by_url = self._due()
+                if not by_url:
+                    break
+                done += self._deliver_all(by_url)
+        finally:
+            cache.delete(self.lock_key)
+        return done
+
+    # ================
+
+    def _due(self) -> Dict[str, List[Dict]]:
+        """ The due deliveries, per url, skipping the urls whose oldest delivery waits for a retry """
+        from main.apps.webhook.models import WebhookOutbox
+
+        now = timezone.now()
+        waiting = WebhookOutbox.objects.filter(next_attempt_at__gt=now).values('url')
+        rows = WebhookOutbox.objects.filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)) \
+            .exclude(url__in=waiting) \
+            .order_by('id') \
+            .values('id', 'webhook_id', 'url', 'payload', 'headers', 'attempts')[:self.limit]
+        by_url = defaultdict(list)
+        for row in rows:
+            url = row.pop('url')
+            by_url[url].append(row)
+        return by_url
+
+    def _deliver_all(self, by_url: Dict[str, List[Dict]]) -> int:
+        if self.max_concurrency <= 1 or len(by_url) == 1:
+            results = [self._deliver(url, deliveries) for url, deliveries in by_url.items()]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(by_url)),
+                                    thread_name_prefix="webhook-delivery") as executor:
+                results = list(executor.map(self._deliver_in_thread, by_url.keys(), by_url.values()))
+
+        done = 0
+        for url, deliveries, remaining in results:
+            done += self._record(deliveries, remaining)
+        return done
+
+    def _deliver_in_thread(self, url: str, deliveries: List[Dict]):
+        try:
+            return self._deliver(url, deliveries)
+        finally:
+            # dead letters are written from this thread
+            connection.close()
+
+    def _deliver(self, url: str, deliveries: List[Dict]) -> Tuple[str, List[Dict], List[Dict]]:
+        """ Deliver the batches of an endpoint, stopping at the first batch with a delivery to retry """
+        for start in range(0, len(deliveries), self.max_batch):
+            try:
+                remaining = self.deliverer.deliver(url, deliveries[start:start + self.max_batch])
+            except Exception as e:
+                logger.exception(f"Error delivering webhook events to {url}: {e}")
+                batch = deliveries[start:start + self.max_batch]
+                remaining = [{**batch[0], "attempts": batch[0].get("attempts", 0) + 1}] + batch[1:]
+            if remaining:
+                return url, deliveries[:start + self.max_batch], remaining
+        return url, deliveries, []
+
+    def _record(self, deliveries: List[Dict], remaining: List[Dict]) -> int:
+        """ Delete the deliveries that are done, and schedule the retry of the first remaining one """
+        from main.apps.webhook.models import WebhookOutbox
+
+        remaining_ids = {delivery["id"] for delivery in remaining}
+        done_ids = [delivery["id"] for delivery in deliveries if delivery["id"] not in remaining_ids]
+        WebhookOutbox.objects.filter(id__in=done_ids).delete()
+        if remaining:
+            retry = remaining[0]
+            next_attempt_at = timezone.now() + timedelta(seconds=self.deliverer.retry_delay(remaining))
+            WebhookOutbox.objects.filter(id=retry["id"]).update(attempts=retry.get("attempts", 0),
+                                                                next_attempt_at=next_attempt_at)
+        return len(done_ids)
+
+
+def get_drainer() -> WebhookOutboxDrainer:
+    conf = delivery_settings()
+    return WebhookOutboxDrainer(deliverer=get_deliverer(), max_concurrency=conf["MAX_CONCURRENCY"],
+                                max_batch=conf["MAX_BATCH"], limit=conf["DRAIN_LIMIT"],
+                                max_seconds=conf["DRAIN_SECONDS"])
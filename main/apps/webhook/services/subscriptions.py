@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from main.apps.core.utils.cache import bump_cache_version, get_cache_versions
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookSubscription(NamedTuple):
+    webhook_id: int
+    url: str
+    signing_secret: str
+    created_by_id: int
+    event_types: FrozenSet[str]
+
+
+class CompanySubscriptions:
+    """ The webhooks of one company with the event types each is subscribed to, directly or through its groups """
+
+    def __init__(self, company_id: int, version: Tuple[str, str]):
+        from main.apps.webhook.models import Webhook
+
+        self.company_id = company_id
+        self.version = version
+
+        webhooks = Webhook.objects.filter(company_id=company_id).prefetch_related('events', 'groups__events')
+        self.subscriptions: List[WebhookSubscription] = []
+        for webhook in webhooks:
+            event_types = {event.type for event in webhook.events.all()}
+            for group in webhook.groups.all():
+                event_types.update(event.type for event in group.events.all())
+            self.subscriptions.append(WebhookSubscription(webhook_id=webhook.pk, url=webhook.url,
+                                                          signing_secret=webhook.signing_secret,
+                                                          created_by_id=webhook.created_by_id,
+                                                          event_types=frozenset(event_types)))
+
+    def resolve(self, event_type: str, user_id: Optional[int] = None) -> List[WebhookSubscription]:
+        return [subscription for subscription in self.subscriptions
+                if event_type in subscription.event_types
+                and (user_id is None or subscription.created_by_id == user_id)]
+
+
+class WebhookSubscriptionCache:
+    """
+    Process level cache of the webhook subscriptions of each company, so that dispatching an event does not re-run
+    the events/groups join.
+
+    Versioned by a global version (events and event groups) and a company version (the company webhooks), bumped by
+    the webhook signal handlers. Versions are re-read at most every version_check_interval seconds.
+    """
+    key_prefix = "webhook_subscriptions"
+    version_check_interval = 5.
+
+    _subscriptions: Dict[int, CompanySubscriptions] = {}
+    _checked_at: Dict[int, float] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def resolve(cls, company_id: int, event_type: str, user_id: Optional[int] = None) -> List[WebhookSubscription]:
+        return cls.get(company_id).resolve(event_type, user_id=user_id)
+
+    @classmethod
+    def get(cls, company_id: int) -> CompanySubscriptions:
+        subscriptions = cls._subscriptions.get(company_id)
+        now = time.monotonic()
+        if subscriptions is not None and now - cls._checked_at.get(company_id, 0.) < cls.version_check_interval:
+            return subscriptions
+
+        version = get_cache_versions("webhook subscriptions", cls._global_version_key(),
+                                     cls._company_version_key(company_id))
+        if subscriptions is None or subscriptions.version != version:
+            logger.debug(f"Loading webhook subscriptions of company {company_id}")
+            subscriptions = CompanySubscriptions(company_id=company_id, version=version)
+            with cls._lock:
+                cls._subscriptions[company_id] = subscriptions
+        cls._checked_at[company_id] = now
+        return subscriptions
+
+    @classmethod
+    def invalidate_company(cls, company_id: int):
+        bump_cache_version("webhook subscriptions", cls._company_version_key(company_id))
+        with cls._lock:
+            cls._subscriptions.pop(company_id, None)
+
+    @classmethod
+    def invalidate_all(cls):
+        bump_cache_version("webhook subscriptions", cls._global_version_key())
+        with cls._lock:
+            cls._subscriptions.clear()
+
+    @classmethod
+    def clear(cls):
+        """ Drop the subscriptions of this process """
+        with cls._lock:
+            cls._subscriptions.clear()
+            cls._checked_at.clear()
+
+    # ================
+    # Private
+    # ================
+
+    @classmethod
+    def _global_version_key(cls) -> str:
+        return f"{cls.key_prefix}:version"
+
+    @classmethod
+    def _company_version_key(cls, company_id: int) -> str:
+        return f"{cls.key_prefix}:version:{company_id}"
@@ -0,0 +1,29 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from main.apps.webhook.models import Event, EventGroup, Webhook
+from main.apps.webhook.services.subscriptions import WebhookSubscriptionCache
+
+
+@receiver([post_save, post_delete], sender=Event, dispatch_uid='webhook_subscriptions_event')
+@receiver([post_save, post_delete], sender=EventGroup, dispatch_uid='webhook_subscriptions_event_group')
+@receiver(m2m_changed, sender=EventGroup.events.through, dispatch_uid='webhook_subscriptions_event_group_events')
+def invalidate_webhook_subscriptions(sender, instance, **kwargs):
+    WebhookSubscriptionCache.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=Webhook, dispatch_uid='webhook_subscriptions_webhook')
+def invalidate_company_webhook_subscriptions(sender, instance, **kwargs):
+    WebhookSubscriptionCache.invalidate_company(instance.company_id)
+
+
+@receiver(m2m_changed, sender=Webhook.events.through, dispatch_uid='webhook_subscriptions_webhook_events')
+@receiver(m2m_changed, sender=Webhook.groups.through, dispatch_uid='webhook_subscriptions_webhook_groups')
+def invalidate_webhook_subscriptions_m2m(sender, instance, action, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Webhook):
+        WebhookSubscriptionCache.invalidate_company(instance.company_id)
+    else:
+        # changed from the event or group side
+        WebhookSubscriptionCache.invalidate_all()
@@ -1,9 +1,11 @@
 from celery import shared_task
-import requests
 import logging
 
+from main.apps.webhook.services.delivery import get_deliverer, get_drainer, make_delivery
+
 logger = logging.getLogger(__name__)
 
+
 @shared_task
 def dispatch_webhook_event(url: str, payload: dict, headers: dict):
     """
@@ -13,9 +15,40 @@ def dispatch_webhook_event(url: str, payload: dict, headers: dict):
         url (str): The URL to which the webhook event will be dispatched.
         payload (dict): The payload to be sent as part of the webhook event.
     """
+    deliverer = get_deliverer()
+    remaining = deliverer.deliver(url, [make_delivery(None, payload, headers)])
+    if remaining:
+        dispatch_webhook_batch.apply_async((url, remaining), countdown=deliverer.retry_delay(remaining))
+
+
+@shared_task
+def drain_webhook_outbox():
+    """
+    Periodic task delivering the webhook events waiting in the WebhookOutbox, in batches per endpoint and on a bounded
+    number of threads (see services/delivery.py). Runs that overlap a running drain return right away.
+    """
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()  # Raise an exception for any HTTP error status codes
-        logger.debug(f"Webhook event dispatched successfully to {url}.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to dispatch webhook event to {url}. Error: {e}")
+        done = get_drainer().drain()
+        if done:
+            logger.info(f"Delivered {done} webhook events from the outbox")
+    except Exception as e:
+        logger.exception(f"Error draining the webhook outbox: {e}")
+
+
+@shared_task(bind=True, max_retries=None)
+def dispatch_webhook_batch(self, url: str, deliveries: list):
+    """
+    Celery task to dispatch a batch of webhook events to a given URL, in order, over the keep-alive session of the
+    worker. Failed events are retried by the task with backoff, those that still fail after their attempts are
+    written to WebhookDeadLetter. Events are now queued through the WebhookOutbox, this task delivers the batches
+    queued before that.
+
+    Args:
+        url (str): The URL to which the webhook events will be dispatched.
+        deliveries (list): The deliveries, see services.delivery.make_delivery.
+    """
+    deliverer = get_deliverer()
+    remaining = deliverer.deliver(url, deliveries)
+    if remaining:
+        # the failed delivery is retried with the ones after it, to keep the order
+        raise self.retry(args=(url, remaining), countdown=deliverer.retry_delay(remaining))
@@ -1,3 +1,216 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import threading
+import time
+
+import requests
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from main.apps.account.models import Company, User
+from main.apps.currency.models.currency import Currency
+from main.apps.webhook.models import Event, EventGroup, Webhook, WebhookOutbox
+from main.apps.webhook.services.delivery import WebhookDeliverer, WebhookOutboxDrainer, enqueue_deliveries, \
+    make_delivery, sign_webhook_payload
+from main.apps.webhook.services.subscriptions import WebhookSubscriptionCache
+from main.apps.webhook.tasks import dispatch_webhook_batch
+
+
+class FakeSession:
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts.append(json)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return SimpleNamespace(status_code=response, ok=response < 400)
+
+
+class WebhookDelivererTest(SimpleTestCase):
+
+    def _deliverer(self, *responses):
+        self.session = FakeSession(responses)
+        self.dead_letters = []
+        return WebhookDeliverer(sessions=mock.Mock(get=lambda url: self.session), max_attempts=3,
+                                dead_letter=lambda url, delivery, **kwargs: self.dead_letters.append(kwargs))
+
+    def _deliveries(self, n):
+        return [make_delivery(1, {"event_type": "ticket.updated", "payload": {"i": i}}, {}) for i in range(n)]
+
+    def test_failed_delivery_is_retried_with_the_rest_of_the_batch(self):
+        deliverer = self._deliverer(200, 503, requests.exceptions.ConnectionError("reset"), 200, 200)
+        deliveries = self._deliveries(3)
+
+        remaining = deliverer.deliver("https://example.com/hook", deliveries)
+        self.assertEqual([d["payload"]["payload"]["i"] for d in remaining], [1, 2])
+        self.assertEqual([d["attempts"] for d in remaining], [1, 0])
+        remaining = deliverer.deliver("https://example.com/hook", remaining)
+        self.assertEqual(remaining[0]["attempts"], 2)
+        self.assertEqual(deliverer.deliver("https://example.com/hook", remaining), [])
+
+        self.assertEqual(len(self.session.posts), 5)
+        self.assertEqual(self.dead_letters, [])
+
+    def test_client_errors_are_not_retried(self):
+        deliverer = self._deliverer(400, 200)
+        self.assertEqual(deliverer.deliver("https://example.com/hook", self._deliveries(2)), [])
+        self.assertEqual(self.dead_letters, [dict(attempts=1, status_code=400, error="HTTP 400")])
+
+    def test_exhausted_delivery_is_dead_lettered_and_the_rest_carries_on(self):
+        deliverer = self._deliverer(500, 200, 500)
+        deliveries = self._deliveries(3)
+        deliveries[0]["attempts"] = 2
+
+        remaining = deliverer.deliver("https://example.com/hook", deliveries)
+        self.assertEqual(self.dead_letters, [dict(attempts=3, status_code=500, error="HTTP 500")])
+        # the last one starts its own attempts
+        self.assertEqual([(d["payload"]["payload"]["i"], d["attempts"]) for d in remaining], [(2, 1)])
+
+    def test_retry_delay_backs_off(self):
+        deliverer = self._deliverer()
+        delivery = self._deliveries(1)[0]
+        delays = [deliverer.retry_delay([{**delivery, "attempts": attempts}]) for attempts in (1, 2, 3)]
+        self.assertTrue(0.4 <= delays[0] <= 0.6 and 0.8 <= delays[1] <= 1.2 and 1.6 <= delays[2] <= 2.4)
+
+    def test_signature(self):
+        headers = sign_webhook_payload("secret", {"event_type": "ticket.updated"}, timestamp=1700000000)
+        self.assertTrue(headers['Pangea-Signature'].startswith("t=1700000000,v1="))
+
+
+class WebhookDeliveryTaskTest(SimpleTestCase):
+
+    def test_failures_are_retried_through_celery(self):
+        remaining = [make_delivery(1, {"event_type": "ticket.updated"}, {})]
+        deliverer = mock.Mock(deliver=mock.Mock(return_value=remaining), retry_delay=mock.Mock(return_value=2.))
+        with mock.patch('main.apps.webhook.tasks.get_deliverer', return_value=deliverer), \
+                mock.patch.object(dispatch_webhook_batch, 'retry', side_effect=RuntimeError("retry")) as retry:
+            with self.assertRaisesMessage(RuntimeError, "retry"):
+                dispatch_webhook_batch("https://example.com/hook", remaining + remaining)
+        retry.assert_called_once_with(args=("https://example.com/hook", remaining), countdown=2.)
+
+
+class FakeDeliverer:
+    """ Fails the first delivery of every url in fail_once, records the batches delivered """
+    timeout = 1.
+
+    def __init__(self, fail_once=(), delay=0.):
+        self.fail_once = set(fail_once)
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+        self.in_flight = self.peak = 0
+
+    def deliver(self, url, deliveries):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if url in self.fail_once:
+                self.fail_once.discard(url)
+                return [{**deliveries[0], "attempts": deliveries[0]["attempts"] + 1}] + deliveries[1:]
+            self.batches.append((url, [d["payload"]["i"] for d in deliveries]))
+            return []
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def retry_delay(self, deliveries):
+        return 60.
+
+
+class WebhookOutboxTest(TestCase):
+
+    def _enqueue(self, *urls):
+        return enqueue_deliveries([(url, make_delivery(None, {"event_type": "ticket.updated", "i": i}, {}))
+                                   for i, url in enumerate(urls)])
+
+    def test_deliveries_are_coalesced_per_endpoint(self):
+        a, b = "https://a.example.com/hook", "https://b.example.com/hook"
+        self.assertEqual(self._enqueue(a, b, a, a, b), [a, b, a, a, b])
+
+        deliverer = FakeDeliverer(delay=0.05)
+        drainer = WebhookOutboxDrainer(deliverer=deliverer, max_concurrency=2, max_batch=2)
+        self.assertEqual(drainer.drain(), 5)
+
+        self.assertEqual(sorted(deliverer.batches), [(a, [0, 2]), (a, [3]), (b, [1, 4])])
+        self.assertEqual(deliverer.peak, 2)
+        self.assertFalse(WebhookOutbox.objects.exists())
+
+    def test_failed_delivery_holds_back_its_endpoint(self):
+        a, b = "https://a.example.com/hook", "https://b.example.com/hook"
+        self._enqueue(a, a, b)
+
+        deliverer = FakeDeliverer(fail_once=[a])
+        self.assertEqual(WebhookOutboxDrainer(deliverer=deliverer, max_concurrency=1).drain(), 1)
+        self.assertEqual(deliverer.batches, [(b, [2])])
+
+        first, second = WebhookOutbox.objects.order_by('id')
+        self.assertEqual((first.attempts, second.attempts), (1, 0))
+        self.assertGreater(first.next_attempt_at, timezone.now())
+        # the endpoint waits for the retry of its first delivery
+        self.assertEqual(WebhookOutboxDrainer(deliverer=deliverer).drain(), 0)
+
+        WebhookOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(WebhookOutboxDrainer(deliverer=deliverer).drain(), 2)
+        self.assertEqual(deliverer.batches[-1], (a, [0, 1]))
+
+    def test_queue_failures_are_logged_not_raised(self):
+        with mock.patch.object(WebhookOutbox.objects, 'bulk_create', side_effect=RuntimeError("db down")), \
+                mock.patch.object(WebhookOutbox, 'save', side_effect=RuntimeError("db down")), \
+                self.assertLogs('main.apps.webhook.services.delivery', level='ERROR') as logs:
+            self.assertEqual(self._enqueue("https://a.example.com/hook"), [])
+        self.assertIn("Unable to queue webhook event ticket.updated", logs.output[0])
+
+
+class WebhookSubscriptionCacheTest(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        WebhookSubscriptionCache.clear()
+
+        usd = Currency.objects.create(mnemonic='USD', name="US Dollar")
+        self.company = Company.objects.create(name="Test Company", currency=usd)
+        self.user = User.objects.create_user(email='user@test.dev', password='12345', company=self.company)
+        self.created = Event.objects.create(name="Ticket Created", type="ticket.created")
+        self.updated = Event.objects.create(name="Ticket Updated", type="ticket.updated")
+        self.webhook = Webhook.objects.create(company=self.company, created_by=self.user,
+                                              url="https://example.com/hook")
+        self.webhook.events.add(self.created)
+
+    def tearDown(self) -> None:
+        WebhookSubscriptionCache.clear()
+        super().tearDown()
+
+    def test_resolve(self):
+        (subscription,) = WebhookSubscriptionCache.resolve(self.company.pk, "ticket.created")
+        self.assertEqual(subscription.url, "https://example.com/hook")
+        self.assertEqual(WebhookSubscriptionCache.resolve(self.company.pk, "ticket.updated"), [])
+        self.assertEqual(WebhookSubscriptionCache.resolve(self.company.pk, "ticket.created",
+                                                          user_id=self.user.pk + 1), [])
+
+    def test_group_changes_invalidate(self):
+        self.assertEqual(WebhookSubscriptionCache.resolve(self.company.pk, "ticket.updated"), [])
+
+        group = EventGroup.objects.create(name="Trade")
+        group.events.add(self.updated)
+        self.webhook.groups.add(group)
+
+        self.assertEqual(len(WebhookSubscriptionCache.resolve(self.company.pk, "ticket.updated")), 1)
+
+    def test_dispatch_event(self):
+        urls = Webhook.dispatch_event(self.company, "ticket.created", {"id": 1})
+        self.assertEqual(urls, ["https://example.com/hook"])
+        delivery = WebhookOutbox.objects.get()
+        self.assertEqual(delivery.webhook_id, self.webhook.pk)
+        self.assertEqual(delivery.payload, {"event_type": "ticket.created", "payload": {"id": 1}})
+
+    def test_dispatch_event_survives_queue_failures(self):
+        with mock.patch.object(WebhookOutbox.objects, 'bulk_create', side_effect=RuntimeError("db down")), \
+                mock.patch.object(WebhookOutbox, 'save', side_effect=RuntimeError("db down")):
+            self.assertEqual(Webhook.dispatch_event(self.company, "ticket.created", {"id": 1}), [])
@@ -46,6 +46,12 @@ class GooglePubSubConfig(Config):
         self._gc_project_id = pubsub_settings.get('GC_PROJECT_ID', None)
         self._gc_credentials_path = pubsub_settings.get('GC_CREDENTIALS_PATH', None)
         self._credentials = None  # This will be initialized later.
+        self._batch_settings = {
+            key: pubsub_settings[setting]
+            for key, setting in (('max_messages', 'BATCH_MAX_MESSAGES'), ('max_bytes', 'BATCH_MAX_BYTES'),
+                                 ('max_latency', 'BATCH_MAX_LATENCY'))
+            if pubsub_settings.get(setting) is not None
+        }
 
     @property
     def credentials_path(self):
@@ -93,6 +99,14 @@ class GooglePubSubConfig(Config):
         else:
             return None
 
+    @property
+    def batch_settings(self) -> Dict[str, 'Any']:
+        """
+        The client batching from 'BATCH_MAX_MESSAGES', 'BATCH_MAX_BYTES' and 'BATCH_MAX_LATENCY' (seconds), only the
+        ones that are set.
+        """
+        return self._batch_settings
+
     @property
     def topic_id(self) -> str:
         return self._topic_id
@@ -103,16 +117,26 @@ def init(pubsub_settings: 'settings', **kwargs):
     Initialize the pubsub module.
 
     Note that this method uses the presence of the TOPIC_ID setting to determine whether we should  instantiate a
-    Google Cloud Pub/Sub or a mock one.
+    Google Cloud Pub/Sub or a mock one, unless a 'BACKEND' is set: 'memory' or 'file' (appending to 'PATH') publish
+    locally, to test and benchmark publishers offline.
     Use this method if you intend to use global variables for pub/sub rather than dependency injection.
 
     :param pubsub_settings: The pubsub settings.
     :param kwargs: Any additional keyword arguments that should be passed to the middleware layer.
     """
     # TODO(Ghais) Use dynamic loading to instantiate this object by configuring a provider class in the settings.
-    if pubsub_settings is None or pubsub_settings.get('TOPIC_ID', None):
+    backend = pubsub_settings.get('BACKEND') if pubsub_settings else None
+    if backend in ('memory', 'file'):
+        config = Config(pubsub_settings)
+        if backend == 'memory':
+            publisher.init_memory(config)
+        else:
+            publisher.init_file(pubsub_settings['PATH'])
+        publisher.set_default_topic_id(pubsub_settings.get('TOPIC_ID') or 'local')
+        middleware.register_middleware(config, **kwargs)
+    elif pubsub_settings is None or pubsub_settings.get('TOPIC_ID', None):
         config = GooglePubSubConfig(pubsub_settings)
-        publisher.init_google(config.google_project_id, config.google_credentials)
+        publisher.init_google(config.google_project_id, config.google_credentials, config.batch_settings)
         publisher.set_default_topic_id(config.topic_id)
         middleware.register_middleware(config, **kwargs)
     else:
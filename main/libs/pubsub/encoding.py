@@ -0,0 +1,60 @@
+"""
+Message encoding for the publishers.
+
+Uses the fastest JSON encoder installed: orjson, then msgspec, then the standard library. orjson and msgspec also
+encode typed messages natively (dataclasses, msgspec Structs, datetimes, UUIDs). With the standard library,
+dataclasses are encoded as dicts and the other types go to the encoder of the pubsub ENCODER_PATH setting (the DRF
+JSONEncoder by default), as do the types orjson and msgspec do not know.
+"""
+import dataclasses
+import json
+from functools import lru_cache
+from typing import Callable, Iterable, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+DEFAULT_ENCODER_PATH = "rest_framework.utils.encoders.JSONEncoder"
+
+
+@lru_cache(maxsize=None)
+def _fallback_encoder() -> json.JSONEncoder:
+    from django.utils.module_loading import import_string
+    import main.settings.base as settings
+    return import_string(settings.pubsub.get("ENCODER_PATH") or DEFAULT_ENCODER_PATH)()
+
+
+def _fallback_default(obj):
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    return _fallback_encoder().default(obj)
+
+
+def _get_encoder() -> Callable[[object], bytes]:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        return lambda data: orjson.dumps(data, default=_fallback_default, option=option)
+    if msgspec is not None:
+        return msgspec.json.Encoder(enc_hook=_fallback_default).encode
+    encoder = json.JSONEncoder(default=_fallback_default)
+    return lambda data: encoder.encode(data).encode("utf-8")
+
+
+encode = _get_encoder()
+
+
+def encode_many(messages: Iterable['JSON']) -> List[bytes]:
+    """ Encodes messages in one pass """
+    return [encode(data) for data in messages]
+
+
+def encoder_name() -> str:
+    return "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
@@ -22,5 +22,5 @@ class LoggingMiddleware(MiddlewareInterface):
     def post_publish_failure(self, topic, routing_key, exception, message):
         self._logger.exception(f"Exception raised while publishing message "
                                f"for {topic}: {str(exception.__class__.__name__)}",
-                               exc_info = True,
-                               extra={"message":message})
+                               exc_info = exception,
+                               extra={"pubsub_message":message})
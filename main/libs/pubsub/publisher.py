@@ -1,13 +1,17 @@
 import abc
+import base64
 import concurrent.futures
 import json
 import logging
+import threading
 import time
+from collections import defaultdict, deque
 from concurrent.futures import Future
 
 from google.cloud import pubsub_v1
-from typing import Union, Dict, List, Any, Type
+from typing import Union, Dict, List, Any, Type, Iterable, Optional
 
+from main.libs.pubsub.encoding import encode, encode_many
 from main.libs.pubsub.middleware import run_middleware_hook
 
 # Python doesn't have a way to describe serializable objects, this is a workaround type as described in
@@ -31,6 +35,21 @@ def publish(routing_key: str, data: 'JSON', blocking=False, timeout=None, raise_
         logging.error(e)
 
 
+def publish_many(routing_key: str, messages: Iterable['JSON'], blocking=False, timeout=None, raise_exception=True,
+                 **attrs):
+    """
+    Publish a batch of messages to the queue under the default topic.
+
+    For full description see :meth:`PublisherInterface.publish_many`
+    """
+    global _default_topic_id
+    try:
+        return _publisher.publish_many(_default_topic_id, routing_key, messages, blocking, timeout, raise_exception,
+                                       **attrs)
+    except Exception as e:
+        logging.error(e)
+
+
 class PublisherInterface(metaclass=abc.ABCMeta):
     """
     Interface definition for all publisher.
@@ -72,7 +91,7 @@ class PublisherInterface(metaclass=abc.ABCMeta):
 
         attrs["published_at"] = str(time.time())
         run_middleware_hook("pre_publish", topic, routing_key, data, attrs)
-        payload = json.dumps(data).encode("utf-8")
+        payload = encode(data)
         future = self._publish(topic, routing_key, payload, **attrs)
         if not blocking:
             return future
@@ -80,14 +99,58 @@ class PublisherInterface(metaclass=abc.ABCMeta):
         try:
             future.result(timeout=timeout or self.timeout())
         except TimeoutError as e:
-            run_middleware_hook("post_publish_failure", topic, e, data)
+            run_middleware_hook("post_publish_failure", topic, routing_key, e, data)
             if raise_exception:
                 raise e
         else:
-            run_middleware_hook("post_publish_success", topic, data, attrs)
+            run_middleware_hook("post_publish_success", topic, routing_key, data, attrs)
 
         return future
 
+    def publish_many(self, topic, routing_key, messages, blocking=False, timeout=None, raise_exception=True, **attrs):
+        """
+        Publishes a batch of messages to a queue, with the same routing key and attrs.
+        Usage::
+            publisher = Publisher()
+            futures = publisher.publish_many('topic_name', 'routing_key', [{'foo': 'bar'}, {'foo': 'baz'}])
+
+        Unlike calling :meth:`publish` in a loop, the messages are serialized in one pass (see
+        :mod:`main.libs.pubsub.encoding`), the middleware hooks run once per batch with the list of messages, and the
+        implementation may hand the whole batch to its client at once.
+
+        :param topic: string topic to publish the data.
+        :param routing_key: string key used to route messages to different consumers.
+        :param messages: list of the message contents.
+        :param blocking: boolean, wait for all the messages to be published.
+        :param timeout: float, default None falls back to :ref:`settings_publisher_timeout`, for the whole batch
+        :param raise_exception: boolean. If True, exceptions coming from PubSub will be raised
+        :param attrs: additional string parameters to be published with every message.
+        :return: The futures of the results, in order.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+
+        attrs["published_at"] = str(time.time())
+        run_middleware_hook("pre_publish", topic, routing_key, messages, attrs)
+        payloads = encode_many(messages)
+        futures = self._publish_many(topic, routing_key, payloads, **attrs)
+        if not blocking:
+            return futures
+
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout or self.timeout())
+        errors = [future.exception() for future in done if future.exception() is not None]
+        if not_done:
+            errors.append(TimeoutError(f"{len(not_done)} of {len(futures)} messages not published in time"))
+        if errors:
+            run_middleware_hook("post_publish_failure", topic, routing_key, errors[0], messages)
+            if raise_exception:
+                raise errors[0]
+        else:
+            run_middleware_hook("post_publish_success", topic, routing_key, messages, attrs)
+
+        return futures
+
     def timeout(self) -> float:
         """
         Default timeout to use. Default value if not implemented is 10.0
@@ -106,6 +169,16 @@ class PublisherInterface(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def _publish_many(self, topic: str, routing_key: str, payloads: List[bytes], **attrs) -> List['Future']:
+        """
+        Do the actual publishing of a batch of encoded messages to the topic. Defaults to one _publish per message.
+        :param topic: The topic id
+        :param routing_key: The routing key
+        :param payloads: The encoded messages to send.
+        :param attrs: Additional attributes, shared by all the messages
+        """
+        return [self._publish(topic, routing_key, payload, **attrs) for payload in payloads]
+
 
 class NullPubSub(PublisherInterface):
     """
@@ -124,19 +197,113 @@ class GooglePubSub(PublisherInterface):
 
      Note that `routing_key` is converted to an attribute and sent to the topic.
     """
-    def __init__(self, gc_project_id, credentials):
+    def __init__(self, gc_project_id, credentials, batch_settings: Optional[Dict[str, Any]] = None):
+        """
+        :param batch_settings: the client batching, any of `max_messages`, `max_bytes` and `max_latency` (seconds):
+            a batch is sent as soon as one of them is reached. Defaults to the client defaults.
+        """
         self._gc_project_id = gc_project_id
-        self._client = pubsub_v1.PublisherClient(credentials=credentials)
+        self._topic_paths = {}
+        if batch_settings:
+            self._client = pubsub_v1.PublisherClient(batch_settings=pubsub_v1.types.BatchSettings(**batch_settings),
+                                                     credentials=credentials)
+        else:
+            self._client = pubsub_v1.PublisherClient(credentials=credentials)
+
+    def _topic_path(self, topic):
+        path = self._topic_paths.get(topic)
+        if path is None:
+            path = self._topic_paths[topic] = self._client.topic_path(self._gc_project_id, topic)
+        return path
 
     def _publish(self, topic, routing_key, payload, **attrs):
         attrs["routing_key"] = routing_key
-        topic_path = self._client.topic_path(self._gc_project_id, topic)
-        return self._client.publish(topic_path, payload, **attrs)
+        return self._client.publish(self._topic_path(topic), payload, **attrs)
+
+    def _publish_many(self, topic, routing_key, payloads, **attrs):
+        # the client batches the messages per its batch settings
+        attrs["routing_key"] = routing_key
+        topic_path = self._topic_path(topic)
+        return [self._client.publish(topic_path, payload, **attrs) for payload in payloads]
+
+
+def _done_futures(n):
+    # the local backends publish synchronously, the messages of a batch share one completed future
+    f = concurrent.futures.Future()
+    f.set_result("")
+    return [f] * n
+
+
+class MemoryPubSub(PublisherInterface):
+    """
+    A :class:`PublisherInterface` implementation that keeps the last `max_messages` published messages of every topic
+    in memory, as (routing_key, payload, attrs), to test and benchmark publishers offline.
+    """
+
+    def __init__(self, max_messages=100_000):
+        self.messages = defaultdict(lambda: deque(maxlen=max_messages))
+
+    def _publish(self, topic, routing_key, payload, **attrs) -> 'Future':
+        return self._publish_many(topic, routing_key, [payload], **attrs)[0]
+
+    def _publish_many(self, topic, routing_key, payloads, **attrs):
+        self.messages[topic].extend((routing_key, payload, attrs) for payload in payloads)
+        return _done_futures(len(payloads))
+
+
+class FilePubSub(PublisherInterface):
+    """
+    A :class:`PublisherInterface` implementation that appends the published messages to a JSON lines file, one
+    {"topic", "routing_key", "attrs", "data"} object per message with data the base64 encoded payload.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def _line(self, topic, routing_key, payload, attrs):
+        return json.dumps({"topic": topic, "routing_key": routing_key, "attrs": attrs,
+                           "data": base64.b64encode(payload).decode("ascii")}) + "\n"
+
+    def _publish(self, topic, routing_key, payload, **attrs) -> 'Future':
+        return self._publish_many(topic, routing_key, [payload], **attrs)[0]
+
+    def _publish_many(self, topic, routing_key, payloads, **attrs):
+        lines = "".join(self._line(topic, routing_key, payload, attrs) for payload in payloads)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+        return _done_futures(len(payloads))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_messages(path):
+    """ The messages written by :class:`FilePubSub`, with the payloads decoded """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                message = json.loads(line)
+                message["data"] = json.loads(base64.b64decode(message["data"]))
+                yield message
+
+
+def init_google(google_project_id, credentials, batch_settings=None):
+    global _publisher
+    _publisher = GooglePubSub(google_project_id, credentials, batch_settings=batch_settings)
+
+
+def init_memory(config=None):
+    global _publisher
+    _publisher = MemoryPubSub()
 
 
-def init_google(google_project_id, credentials):
+def init_file(path):
     global _publisher
-    _publisher = GooglePubSub(google_project_id, credentials)
+    _publisher = FilePubSub(path)
 
 
 def init_null(config):
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from main.libs.pubsub import encoding, middleware
+from main.libs.pubsub.encoding import encode
+from main.libs.pubsub.publisher import FilePubSub, MemoryPubSub, read_messages
+
+
+@dataclass
+class Quote:
+    instrument: str
+    bid: float
+    time: datetime
+
+
+class TaggingEncoder(json.JSONEncoder):
+
+    def default(self, obj):
+        return type(obj).__name__
+
+
+class PublishManyTest(SimpleTestCase):
+
+    def test_messages_are_published_in_order(self):
+        publisher = MemoryPubSub()
+        messages = [{"i": i} for i in range(5)]
+
+        futures = publisher.publish_many("topic", "quotes", messages, blocking=True, source="test")
+
+        self.assertEqual(len(futures), 5)
+        self.assertTrue(all(future.done() for future in futures))
+        published = publisher.messages["topic"]
+        self.assertEqual([payload for _, payload, _ in published], [encode(message) for message in messages])
+        routing_key, _, attrs = published[0]
+        self.assertEqual(routing_key, "quotes")
+        self.assertEqual(attrs["source"], "test")
+        self.assertIn("published_at", attrs)
+
+    def use_logging_middleware(self):
+        patcher = mock.patch.object(middleware, "_middlewares", [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        middleware.register_middleware(SimpleNamespace(middleware=["main.libs.pubsub.middleware.LoggingMiddleware"]))
+
+    def test_middleware_runs_once_per_batch(self):
+        self.use_logging_middleware()
+        with self.assertLogs("main.libs.pubsub.middleware.logging_middleware", "DEBUG") as logs:
+            MemoryPubSub().publish_many("topic", "quotes", [{"i": i} for i in range(3)], blocking=True)
+        self.assertEqual([record.getMessage() for record in logs.records],
+                         ["Publishing to topic#quotes", "Successfully published to topic#quotes"])
+
+    def test_middleware_logs_failures(self):
+        self.use_logging_middleware()
+        publisher = MemoryPubSub()
+        failed = Future()
+        failed.set_exception(RuntimeError("rejected"))
+        with mock.patch.object(publisher, "_publish_many", return_value=[failed]), \
+                self.assertLogs("main.libs.pubsub.middleware.logging_middleware", "DEBUG") as logs:
+            publisher.publish_many("topic", "quotes", [{"i": 0}], blocking=True, raise_exception=False)
+        failure = logs.records[-1]
+        self.assertEqual(failure.getMessage(), "Exception raised while publishing message for topic: RuntimeError")
+        self.assertEqual(failure.pubsub_message, [{"i": 0}])
+        self.assertEqual(str(failure.exc_info[1]), "rejected")
+
+    def test_failures_raise(self):
+        publisher = MemoryPubSub()
+        failed = Future()
+        failed.set_exception(RuntimeError("rejected"))
+        with mock.patch.object(publisher, "_publish_many", return_value=[failed]):
+            with self.assertRaises(RuntimeError):
+                publisher.publish_many("topic", "quotes", [{"i": 0}], blocking=True)
+            self.assertEqual(len(publisher.publish_many("topic", "quotes", [{"i": 0}], blocking=True,
+                                                        raise_exception=False)), 1)
+
+    def test_typed_messages(self):
+        quote = Quote(instrument="EURUSD", bid=1.07, time=datetime(2024, 6, 10, 6, 13, 20))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "messages.jsonl")
+            publisher = FilePubSub(path)
+            publisher.publish_many("topic", "quotes", [quote, {"instrument": "USDJPY"}])
+            publisher.close()
+
+            first, second = read_messages(path)
+        self.assertEqual(first["data"], {"instrument": "EURUSD", "bid": 1.07, "time": "2024-06-10T06:13:20"})
+        self.assertEqual(second["routing_key"], "quotes")
+        self.assertEqual(second["data"], {"instrument": "USDJPY"})
+
+
+class EncodingTest(SimpleTestCase):
+
+    def setUp(self):
+        encoding._fallback_encoder.cache_clear()
+        self.addCleanup(encoding._fallback_encoder.cache_clear)
+
+    def test_standard_library_encodes_typed_messages(self):
+        with mock.patch.object(encoding, "orjson", None), mock.patch.object(encoding, "msgspec", None):
+            encode_json = encoding._get_encoder()
+            data = encode_json({"quote": Quote(instrument="EURUSD", bid=1.07, time=datetime(2024, 6, 10, 6, 13, 20)),
+                                "amount": Decimal("1.5")})
+        self.assertEqual(json.loads(data), {"quote": {"instrument": "EURUSD", "bid": 1.07,
+                                                      "time": "2024-06-10T06:13:20"}, "amount": 1.5})
+
+    def test_encoder_path_setting(self):
+        import main.settings.base as settings
+
+        with mock.patch.dict(settings.pubsub, {"ENCODER_PATH": "main.libs.pubsub.tests.TaggingEncoder"}):
+            self.assertEqual(encoding._fallback_default(Decimal("1.5")), "Decimal")
@@ -484,7 +484,29 @@ pubsub = {
     "GC_CREDENTIALS_PATH": config("GC_CREDENTIALS", default="", cast=str),
     "GC_PROJECT_ID": GCP_PROJECT_ID,
     "ENCODER_PATH": "rest_framework.utils.encoders.JSONEncoder",
-    "TOPIC_ID": config("TOPIC_ID", default="", cast=str)
+    "TOPIC_ID": config("TOPIC_ID", default="", cast=str),
+    # client batching, a batch is sent as soon as one is reached
+    "BATCH_MAX_MESSAGES": config("PUBSUB_BATCH_MAX_MESSAGES", default=100, cast=int),
+    "BATCH_MAX_BYTES": config("PUBSUB_BATCH_MAX_BYTES", default=1_000_000, cast=int),
+    "BATCH_MAX_LATENCY": config("PUBSUB_BATCH_MAX_LATENCY", default=0.01, cast=float),
+}
+
+# ==============================================================================
+# WEBHOOK DELIVERY SETTINGS
+# ==============================================================================
+
+WEBHOOK_DELIVERY = {
+    # deliveries of an endpoint per batch
+    "MAX_BATCH": config("WEBHOOK_MAX_BATCH", default=100, cast=int),
+    # endpoints the outbox drainer delivers at the same time
+    "MAX_CONCURRENCY": config("WEBHOOK_MAX_CONCURRENCY", default=8, cast=int),
+    # outbox rows read at a time, and seconds a drain runs for at most
+    "DRAIN_LIMIT": config("WEBHOOK_DRAIN_LIMIT", default=1000, cast=int),
+    "DRAIN_SECONDS": config("WEBHOOK_DRAIN_SECONDS", default=50., cast=float),
+    "POOL_MAXSIZE": config("WEBHOOK_POOL_MAXSIZE", default=10, cast=int),
+    "MAX_ATTEMPTS": config("WEBHOOK_MAX_ATTEMPTS", default=4, cast=int),
+    "BACKOFF": config("WEBHOOK_BACKOFF", default=0.5, cast=float),
+    "TIMEOUT": config("WEBHOOK_TIMEOUT", default=10., cast=float),
 }
 
 # ==============================================================================
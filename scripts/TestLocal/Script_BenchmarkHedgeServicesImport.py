@@ -0,0 +1,82 @@
+import os
+import re
+import subprocess
+import sys
+from typing import List, Tuple
+
+from hdlib.AppUtils.log_util import get_logger, logging
+
+logger = get_logger(level=logging.INFO)
+
+"""
+Cold start benchmark for the hedge services. Imports every module of main.apps.hedge.services (subpackages included) in a fresh interpreter
+with "python -X importtime" and reports the total import time, together with the slowest modules (cumulative time).
+
+Services are constructed lazily (see main.apps.core.utils.service_registry), so nothing beyond module level code
+should show up here. A regression (e.g. a service constructed as a default argument again) shows up as a jump in the
+cumulative import time of the offending module.
+
+Usage:
+    python scripts/TestLocal/Script_BenchmarkHedgeServicesImport.py [num_runs] [num_modules_to_show]
+"""
+
+PACKAGE = "main.apps.hedge.services"
+
+CHILD_CODE = f"""
+import importlib, pkgutil, time
+import django
+django.setup()
+start = time.perf_counter()
+package = importlib.import_module("{PACKAGE}")
+for module in pkgutil.walk_packages(package.__path__, prefix="{PACKAGE}."):
+    importlib.import_module(module.name)
+print("WALL_TIME_US", int(1e6 * (time.perf_counter() - start)))
+"""
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def run_once(settings_module: str) -> Tuple[int, List[Tuple[str, int, int]]]:
+    """
+    Import the package in a fresh interpreter.
+    :return: (wall time of the package import in microseconds, [(module, self_us, cumulative_us), ...])
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD_CODE],
+                          cwd=os.getcwd(), env=env, capture_output=True, text=True, check=True)
+
+    wall_time = int(re.search(r"WALL_TIME_US (\d+)", proc.stdout).group(1))
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return wall_time, modules
+
+
+def run(num_runs: int = 5, num_modules: int = 20):
+    settings_module = os.environ.get("DJANGO_SETTINGS_MODULE", "main.settings.local")
+
+    wall_times = []
+    modules = []
+    for i in range(num_runs):
+        wall_time, modules = run_once(settings_module=settings_module)
+        wall_times.append(wall_time)
+        logger.info(f"Run {i + 1}/{num_runs}: imported {PACKAGE} in {wall_time / 1e3:.1f} ms")
+
+    wall_times = sorted(wall_times)
+    logger.info(f"Import time of {PACKAGE} over {num_runs} runs: "
+                f"min={wall_times[0] / 1e3:.1f} ms, median={wall_times[len(wall_times) // 2] / 1e3:.1f} ms, "
+                f"max={wall_times[-1] / 1e3:.1f} ms")
+
+    logger.info(f"Slowest {num_modules} main.* modules of the last run (cumulative / self, ms):")
+    ours = [m for m in modules if m[0].startswith("main.")]
+    for name, self_us, cumulative_us in sorted(ours, key=lambda m: -m[2])[:num_modules]:
+        logger.info(f"  {cumulative_us / 1e3:10.1f} {self_us / 1e3:10.1f}  {name}")
+
+
+if __name__ == '__main__':
+    sys.path.append(os.getcwd())
+
+    run(num_runs=int(sys.argv[1]) if len(sys.argv) > 1 else 5,
+        num_modules=int(sys.argv[2]) if len(sys.argv) > 2 else 20)